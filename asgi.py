@@ -0,0 +1,267 @@
+"""
+ASGI entry point for serving /ask streams from an event loop.
+
+Run with:
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 asgi:application
+
+/ask is handled natively with the async GenAI streaming API, so a worker
+can hold hundreds of open streams instead of one per thread. Every other
+route is served by the regular Flask app (main:app) through a WSGI
+adapter, so the blueprints behave exactly as under gunicorn's sync workers.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from main import app
+from src.services.genai_services import GENERATION_ERROR_PREFIX
+from src.services.chat_service import prepare_exchange, replay_cached_answer, complete_exchange
+from src.services.single_flight import stream_answer_async
+from src.services.sse_service import (
+    SSE_CONTENT_TYPE, SSE_HEADERS, wants_sse, parse_last_event_id, find_stream,
+    start_stream_async, aiter_sse
+)
+from src.services.admission_service import AdmissionRejected, admit_request_async, client_address
+from src.services.auth_service import verified_user_id
+from src.services.metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION
+from src.services.tracing import start_trace
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread, which serialises the Flask
+    # routes and, when a keep-alive connection sends its next request while the
+    # previous one finishes, fails with "Single thread executor already being used"
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that serves each request from the event loop's thread pool."""
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+flask_application = ThreadPoolWsgiToAsgi(app)
+
+STREAM_PATH_PREFIX = '/ask/stream/'
+
+# Same CORS headers the Flask app adds in after_request
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type,Authorization'),
+    (b'access-control-allow-methods', b'GET,PUT,POST,DELETE,OPTIONS'),
+    (b'access-control-expose-headers', b'X-Chat-Id,X-Stream-Id'),
+]
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def _send_json(send, status, payload, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')] + list(headers) + CORS_HEADERS,
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode('utf-8')})
+
+def _header(scope, name):
+    """Value of a request header, or None."""
+    name = name.lower().encode('latin-1')
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+def _json_body(content_type, body):
+    """The parsed body of a JSON request, or None if it is not one."""
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    if mimetype != 'application/json' and not (mimetype.startswith('application/') and mimetype.endswith('+json')):
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+async def _watch_disconnect(receive, stream_task):
+    """Cancel the stream when the client goes away."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            stream_task.cancel()
+            return
+
+async def ask_legal_question(scope, receive, send):
+    """Async equivalent of the /ask route in src/routes/legal_assistant.py."""
+    body = await _read_body(receive)
+    if body is None:
+        return
+
+    # Like request.get_json(silent=True): prepare_exchange answers 400 for
+    # a body that is not JSON, so both servers give the same response
+    data = _json_body(_header(scope, 'content-type'), body)
+    sse = wants_sse(_header(scope, 'accept'), data if isinstance(data, dict) else None)
+    if sse:
+        # Resuming a buffered stream does no new work, so it skips admission
+        stream_id, after = parse_last_event_id(_header(scope, 'last-event-id'))
+        buffer = find_stream(stream_id)
+        if buffer is not None:
+            await _send_sse(receive, send, buffer, after)
+            return
+
+    # Verifying a token may fetch Google's signing keys, so it runs off the event loop
+    authorization = _header(scope, 'authorization')
+    identity = await asyncio.to_thread(verified_user_id, authorization) if authorization else None
+    address = client_address(_header(scope, 'x-forwarded-for'), (scope.get('client') or [None])[0])
+    try:
+        permit = await admit_request_async(identity, address)
+    except AdmissionRejected as e:
+        await _send_json(send, e.status, {"error": str(e)}, [(b'retry-after', str(e.retry_after).encode('latin-1'))])
+        return
+
+    try:
+        # Firestore reads, media decoding and cache lookups are blocking
+        exchange = await asyncio.to_thread(prepare_exchange, data)
+    except ValueError as e:
+        permit.release()
+        await _send_json(send, 400, {"error": str(e)})
+        return
+    except Exception as e:
+        permit.release()
+        await _send_json(send, 500, {"error": str(e)})
+        return
+
+    if sse:
+        await _send_sse(
+            receive, send, start_stream_async(exchange, on_finish=permit.release), chat_id=exchange['chat_id']
+        )
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        # The chat ID goes out with the headers, before the first token, so
+        # clients can send follow-up questions to the same chat
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                    (b'x-chat-id', exchange['chat_id'].encode('latin-1'))] + CORS_HEADERS,
+    })
+
+    async def stream():
+        # Store the complete response for saving to Firestore
+        complete_response = ""
+        try:
+            if exchange['cached_answer'] is not None:
+                for chunk in replay_cached_answer(exchange['cached_answer']):
+                    complete_response += chunk
+                    await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+            else:
+                async for chunk in stream_answer_async(exchange):
+                    complete_response += chunk
+                    await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        except Exception as e:
+            # Shown to the client but never saved as part of the answer
+            error_msg = f"{GENERATION_ERROR_PREFIX} {str(e)}"
+            await send({'type': 'http.response.body', 'body': error_msg.encode('utf-8')})
+            return None
+        await send({'type': 'http.response.body', 'body': b''})
+        return complete_response
+
+    stream_task = asyncio.ensure_future(stream())
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, stream_task))
+    try:
+        complete_response = await stream_task
+    except asyncio.CancelledError:
+        # Client disconnected; like the Flask route, nothing is saved
+        return
+    finally:
+        watcher.cancel()
+        permit.release()
+
+    if complete_response is not None:
+        await asyncio.to_thread(complete_exchange, exchange, complete_response)
+
+async def _send_sse(receive, send, buffer, after=0, chat_id=None):
+    """Stream a buffer as SSE until it finishes or the client disconnects."""
+    headers = [(b'content-type', SSE_CONTENT_TYPE.encode('latin-1')),
+               (b'x-stream-id', buffer.stream_id.encode('latin-1'))]
+    if chat_id:
+        headers.append((b'x-chat-id', chat_id.encode('latin-1')))
+    headers += [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in SSE_HEADERS.items()]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers + CORS_HEADERS})
+
+    async def stream():
+        async for frame in aiter_sse(buffer, after):
+            await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # The producer keeps going after a disconnect; only this reader stops
+    stream_task = asyncio.ensure_future(stream())
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, stream_task))
+    try:
+        await stream_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        watcher.cancel()
+
+async def resume_stream(scope, receive, send, stream_id):
+    """Async equivalent of GET /ask/stream/<stream_id>."""
+    last_event_id = _header(scope, 'last-event-id')
+    if not last_event_id:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        last_event_id = (query.get('last_event_id') or [None])[0]
+    last_stream_id, after = parse_last_event_id(last_event_id)
+    buffer = find_stream(stream_id)
+    if buffer is None:
+        await _send_json(send, 404, {"error": "Stream not found or expired"})
+    elif last_stream_id not in (None, stream_id):
+        await _send_json(send, 400, {"error": "Last-Event-ID belongs to a different stream"})
+    else:
+        await _send_sse(receive, send, buffer, after)
+
+async def _instrumented(scope, receive, send, route, handler, *args):
+    """Request metrics and the request span for the routes served here, as main.py adds them for Flask."""
+    started_at = time.perf_counter()
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            HTTP_REQUESTS.labels(route=route, method=scope['method'], status=message['status']).inc()
+            HTTP_REQUEST_DURATION.labels(route=route, method=scope['method']).observe(time.perf_counter() - started_at)
+            request_span.set(status=message['status'])
+        await send(message)
+
+    # Tasks started by the handler copy the context, so their spans nest under this one
+    with start_trace(f"{scope['method']} {route}", _header(scope, 'traceparent')) as request_span:
+        await handler(scope, receive, send_and_record, *args)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    """Route /ask and stream resumes to the async handlers and everything else to Flask."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/ask' and scope['method'] == 'POST':
+        await _instrumented(scope, receive, send, '/ask', ask_legal_question)
+    elif (scope['type'] == 'http' and scope['method'] == 'GET'
+          and scope['path'].startswith(STREAM_PATH_PREFIX)
+          and '/' not in scope['path'][len(STREAM_PATH_PREFIX):]):
+        await _instrumented(
+            scope, receive, send, '/ask/stream/<stream_id>', resume_stream, scope['path'][len(STREAM_PATH_PREFIX):]
+        )
+    else:
+        await flask_application(scope, receive, send)
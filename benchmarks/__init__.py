@@ -0,0 +1 @@
+# Offline load tests and benchmarks. Run modules with `python -m benchmarks.<name>`.
@@ -0,0 +1,93 @@
+"""
+Measure how many concurrent /ask streams a single worker can hold.
+
+Starts the app against the fake slow-streaming model (GENAI_BACKEND=fake),
+opens N concurrent streams and reports time to first byte and total stream
+time. Compare the threaded WSGI server with the ASGI entry point:
+
+    python -m benchmarks.ask_concurrency --server wsgi --concurrency 200
+    python -m benchmarks.ask_concurrency --server asgi --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+from benchmarks.common import SERVER_COMMANDS, free_port, percentile, start_server, stop_server
+
+async def _one_stream(client, url, index):
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    payload = {'question': f'What is the limitation period for filing suit number {index}?'}
+    try:
+        async with client.stream('POST', url, json=payload) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+            ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return {'ok': ok, 'ttfb': first_byte, 'total': time.perf_counter() - started, 'bytes': size}
+
+async def run_load(base_url, concurrency, timeout):
+    """Open `concurrency` streams at once and collect per-stream timings."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            _one_stream(client, f'{base_url}/ask', index) for index in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    completed = [r for r in results if r['ok']]
+    ttfbs = [r['ttfb'] for r in completed if r['ttfb'] is not None]
+    totals = [r['total'] for r in completed]
+    return {
+        'concurrency': concurrency,
+        'completed': len(completed),
+        'failed': len(results) - len(completed),
+        'wall_seconds': round(elapsed, 3),
+        'streams_per_second': round(len(completed) / elapsed, 2) if elapsed else None,
+        'ttfb_p50': percentile(ttfbs, 0.50),
+        'ttfb_p95': percentile(ttfbs, 0.95),
+        'total_p50': percentile(totals, 0.50),
+        'total_p95': percentile(totals, 0.95),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--ttft', type=float, default=0.5, help="Fake model seconds to first chunk")
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help="Fake model seconds between chunks")
+    parser.add_argument('--chunks', type=int, default=40, help="Fake model chunks per answer")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--url', help="Benchmark an already running server instead of starting one")
+    args = parser.parse_args(argv)
+
+    process = None
+    base_url = args.url
+    if not base_url:
+        port = free_port()
+        process = start_server(args.server, port, {
+            'FAKE_GENAI_TTFT': str(args.ttft),
+            'FAKE_GENAI_CHUNK_DELAY': str(args.chunk_delay),
+            'FAKE_GENAI_CHUNKS': str(args.chunks),
+        })
+        base_url = f'http://127.0.0.1:{port}'
+
+    try:
+        result = asyncio.run(run_load(base_url, args.concurrency, args.timeout))
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    result['server'] = args.url or args.server
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Helpers shared by the benchmarks: starting the app in a subprocess against
+the fake model and Firestore, and summarising timings.
+"""
+import os
+import socket
+import subprocess
+import time
+import httpx
+
+SERVER_COMMANDS = {
+    # Mirrors the Dockerfile, with one worker so results are per worker
+    'wsgi': ['gunicorn', '--workers', '1', '--threads', '8', '--timeout', '300', 'main:app'],
+    'asgi': ['gunicorn', '-k', 'uvicorn.workers.UvicornWorker', '--workers', '1', '--timeout', '300', 'asgi:application'],
+}
+
+# Keeps runs offline and makes every request do the full amount of work
+SERVER_ENV = {
+    'GENAI_BACKEND': 'fake',
+    'FIRESTORE_BACKEND': 'memory',
+    'EMBEDDING_BACKEND': 'hashing',
+    'CONTEXT_CACHE_BACKEND': 'off',
+    'RESPONSE_CACHE_ENABLED': 'false',
+    'SINGLE_FLIGHT_ENABLED': 'false',
+    # Load tests measure the worker, not the rate limits in front of it
+    'ADMISSION_ENABLED': 'false',
+    'METRICS_MULTIPROCESS_DIR': '',
+    'LOG_LEVEL': 'WARNING',
+    'FLASK_ENV': 'production',
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+def latency_summary(values):
+    """p50/p90/p95/p99/max of a list of seconds."""
+    return {
+        'p50': percentile(values, 0.50),
+        'p90': percentile(values, 0.90),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': round(max(values), 3) if values else None,
+    }
+
+def start_server(server, port, env_overrides, poll_interval=0.2):
+    """Start the app in a subprocess and wait until it accepts requests."""
+    env = dict(os.environ)
+    env.update(SERVER_ENV)
+    env.update(env_overrides)
+    command = SERVER_COMMANDS[server] + ['--bind', f'127.0.0.1:{port}']
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(poll_interval)
+    process.terminate()
+    raise RuntimeError(f"{server} server did not start on port {port}")
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+def _process_tree(pid):
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f'/proc/{parent}/task/{parent}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def peak_rss_bytes(pid):
+    """
+    Largest peak resident set size (VmHWM) in a process tree, in bytes.
+
+    With one gunicorn worker this is the worker's peak. Read before the
+    server is stopped; None where /proc is not available.
+    """
+    peaks = []
+    for process_id in _process_tree(pid):
+        try:
+            with open(f'/proc/{process_id}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peaks.append(int(line.split()[1]) * 1024)
+                        break
+        except OSError:
+            continue
+    return max(peaks) if peaks else None
+
+def git_commit():
+    """Short hash of the checked-out commit, recorded in reports."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _lookup(result, path):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+def compare(results, baseline, metrics, max_regression):
+    """
+    Compare named results with the same names in a baseline report.
+
+    Args:
+        results (dict): Name -> result of this run
+        baseline (dict): Name -> result of the earlier run
+        metrics (list): (key path, True when higher is better) to compare
+        max_regression (float): Allowed relative change for the worse
+
+    Returns:
+        tuple: (lines describing each metric, whether any regressed)
+    """
+    lines = []
+    regressed = False
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for path, higher_is_better in metrics:
+            old, new = _lookup(previous, path), _lookup(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSION' if worse > max_regression else 'ok'
+            regressed = regressed or flag == 'REGRESSION'
+            lines.append(f"{name:14} {'.'.join(path):28} {old:>14} -> {new:<14} {change:+.1%}  {flag}")
+    return lines, regressed
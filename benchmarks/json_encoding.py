@@ -0,0 +1,128 @@
+"""
+Micro-benchmark of the JSON encoding of /chat_history pages.
+
+Serialises a page of messages with Firestore timestamps using Flask's
+default provider (what jsonify used before) and FastJSONProvider with
+each backend and timestamp format. Reports the time per page and the
+body size, raw and compressed:
+
+    python -m benchmarks.json_encoding
+    python -m benchmarks.json_encoding --messages 200 --output json.json
+"""
+import argparse
+import gzip
+import json
+import platform
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from benchmarks.common import git_commit
+from src.routes.fetch_data.fetch_history import ROLE_CODES
+from src.utils.compression import brotli
+from src.utils.json_provider import FastJSONProvider, orjson
+
+WORDS = (
+    "the limitation period runs from the date of the cause of action under section 3 of the act "
+    "and the court may condone delay on sufficient cause being shown by the applicant"
+).split()
+
+
+def chat_page(messages, words, compact=False):
+    """A /chat_history page shaped like the route's payload."""
+    rng = random.Random(0)
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def timestamp(seconds):
+        value = started + timedelta(seconds=seconds, microseconds=rng.randrange(1000000))
+        return DatetimeWithNanoseconds(*value.timetuple()[:6], value.microsecond, tzinfo=timezone.utc)
+
+    page = []
+    for index in range(messages):
+        role = 'user' if index % 2 == 0 else 'ai'
+        page.append({
+            'role': ROLE_CODES[role] if compact else role,
+            'message': ' '.join(rng.choice(WORDS) for _ in range(words if role == 'ai' else words // 8)),
+            'timestamp': timestamp(index * 30),
+            'id': f'{rng.getrandbits(80):020x}',
+        })
+    return {
+        'status': 'success',
+        'chat': {
+            'id': 'chat-0', 'title': 'Limitation for a money suit', 'createdAt': timestamp(0),
+            'last_updated': timestamp(messages * 30), 'message_count': messages, 'messages': page,
+        },
+        'next_before': page[0]['id'],
+    }
+
+def _encoders(app):
+    """(name, callable returning bytes, compact payload) for each configuration compared."""
+    default = DefaultJSONProvider(app)
+    encoders = [
+        ('flask_default', lambda obj: default.dumps(obj, separators=(',', ':')).encode('utf-8'), False),
+    ]
+    backends = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    for backend in backends:
+        provider = FastJSONProvider(app, backend=backend)
+        for datetime_format in ('http', 'iso', 'epoch_ms'):
+            encoders.append((
+                f'{backend}_{datetime_format}',
+                lambda obj, provider=provider, datetime_format=datetime_format: provider.dump_bytes(obj, datetime_format),
+                False,
+            ))
+        encoders.append((
+            f'{backend}_compact',
+            lambda obj, provider=provider: provider.dump_bytes(obj, 'epoch_ms'),
+            True,
+        ))
+    return encoders
+
+def run(messages, words, repeat):
+    app = Flask(__name__)
+    pages = {False: chat_page(messages, words), True: chat_page(messages, words, compact=True)}
+    results = {}
+    for name, encode, compact in _encoders(app):
+        page = pages[compact]
+        body = encode(page)
+        timer = timeit.Timer(lambda: encode(page))
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(repeat, number)) / number
+        results[name] = {
+            'milliseconds_per_page': round(seconds * 1000, 3),
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body, 6)),
+            'brotli_bytes': len(brotli.compress(body, quality=5)) if brotli is not None else None,
+        }
+    baseline = results['flask_default']['milliseconds_per_page']
+    for result in results.values():
+        result['speedup'] = round(baseline / result['milliseconds_per_page'], 2)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200, help="Messages in the page")
+    parser.add_argument('--words', type=int, default=250, help="Words per AI message")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing runs; the fastest is reported")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'orjson': orjson.__version__ if orjson is not None else None,
+        'messages': args.messages,
+        'encoders': run(args.messages, args.words, args.repeat),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Profile the app's cold start.
+
+Imports main in fresh interpreters under `python -X importtime` and
+reports the import time and the slowest libraries each app module pulls
+in. With --server, it also starts a server and reports the time until it
+answers its first request and its first /ask:
+
+    python -m benchmarks.startup --server asgi
+    python -m benchmarks.startup --startup-mode eager
+
+Two checks guard against import-time regressions. --check fails when
+importing main loads a library that is meant to load on first use
+(DEFERRED_MODULES). --baseline fails when a metric is more than
+--max-regression worse than in an earlier report.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+from benchmarks.common import (
+    SERVER_COMMANDS, SERVER_ENV, compare, free_port, git_commit, peak_rss_bytes, start_server, stop_server
+)
+
+# Client libraries that STARTUP_MODE=lazy/background keep out of `import main`
+DEFERRED_MODULES = [
+    'google.genai',
+    'google.cloud.firestore',
+    'firebase_admin',
+    'google.auth.transport.requests',
+]
+
+# Modules of the app itself; anything else they import is a library
+APP_MODULES = ('main', 'asgi', 'config')
+APP_PACKAGES = ('src.',)
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def parse_importtime(output):
+    """
+    Entries of `python -X importtime` output, in the order printed.
+
+    Each entry is {'module', 'importer', 'seconds'}, where `seconds` is
+    the cumulative import time and `importer` the module whose import
+    triggered it (None at the top level).
+    """
+    entries = []
+    children = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Modules are printed after everything they import, indented one step deeper
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = {'module': name.strip(), 'importer': None, 'seconds': int(cumulative) / 1e6}
+        for index in children.pop(depth + 1, []):
+            entries[index]['importer'] = entry['module']
+        children.setdefault(depth, []).append(len(entries))
+        entries.append(entry)
+    return entries
+
+def _is_app_module(name):
+    return name in APP_MODULES or name.startswith(APP_PACKAGES)
+
+def slowest_libraries(entries, count):
+    """The slowest libraries imported directly by app modules."""
+    libraries = [
+        entry for entry in entries
+        if entry['importer'] and _is_app_module(entry['importer']) and not _is_app_module(entry['module'])
+    ]
+    libraries.sort(key=lambda entry: entry['seconds'], reverse=True)
+    return [
+        {'module': entry['module'], 'imported_by': entry['importer'], 'seconds': round(entry['seconds'], 3)}
+        for entry in libraries[:count]
+    ]
+
+def profile_import(env, runs, top):
+    """Import main `runs` times in fresh interpreters and summarise the import times."""
+    durations = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+            env=env, capture_output=True, text=True, check=True
+        )
+        # The app may log to stdout while importing; the timing is the last line
+        durations.append(float(result.stdout.strip().splitlines()[-1]))
+        entries = parse_importtime(result.stderr)
+
+    loaded = {entry['module'] for entry in entries}
+    return {
+        'runs': runs,
+        'median_seconds': round(statistics.median(durations), 3),
+        'min_seconds': round(min(durations), 3),
+        'modules_loaded': len(loaded),
+        'deferred_modules_loaded': [
+            name for name in DEFERRED_MODULES
+            if any(module == name or module.startswith(name + '.') for module in loaded)
+        ],
+        'slowest_libraries': slowest_libraries(entries, top),
+    }
+
+def measure_cold_start(server, env_overrides):
+    """
+    Time a new server's first response and its first /ask, sent right
+    after, against an immediate fake model. Both are measured from the
+    server's launch, so they are comparable across start-up modes.
+    """
+    port = free_port()
+    started = time.perf_counter()
+    process = start_server(server, port, env_overrides, poll_interval=0.01)
+    first_response = time.perf_counter() - started
+    try:
+        first_byte = None
+        with httpx.stream('POST', f'http://127.0.0.1:{port}/ask', timeout=60,
+                          json={'question': 'What is the limitation period for a money suit?'}) as response:
+            for _ in response.iter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+            response.raise_for_status()
+        peak_rss = peak_rss_bytes(process.pid)
+    finally:
+        stop_server(process)
+    return {
+        'server': server,
+        'first_response_seconds': round(first_response, 3),
+        'first_ask_ttfb_seconds': round(first_byte, 3) if first_byte is not None else None,
+        'peak_rss_bytes': peak_rss,
+    }
+
+# Regression comparison: (metric path, True when higher is better)
+COMPARED_METRICS = [
+    (('median_seconds',), False),
+    (('first_response_seconds',), False),
+    (('first_ask_ttfb_seconds',), False),
+]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--startup-mode', choices=['background', 'lazy', 'eager'],
+                        default=os.environ.get('STARTUP_MODE', 'background'))
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to import main in")
+    parser.add_argument('--top', type=int, default=15, help="Libraries to list in the breakdown")
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS),
+                        help="Also measure a cold server's first response and first /ask")
+    parser.add_argument('--check', action='store_true',
+                        help="Fail if importing main loads one of DEFERRED_MODULES")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="A previous report to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Allowed relative slowdown per metric before the run fails")
+    args = parser.parse_args(argv)
+
+    env_overrides = {'STARTUP_MODE': args.startup_mode, 'FAKE_GENAI_TTFT': '0', 'FAKE_GENAI_CHUNK_DELAY': '0'}
+    env = dict(os.environ)
+    env.update(SERVER_ENV)
+    env.update(env_overrides)
+    if args.startup_mode == 'background':
+        # The warm-up thread starts once main is imported; its imports would
+        # interleave with the profile, and it is the lazy mode's profile anyway
+        env['STARTUP_MODE'] = 'lazy'
+
+    report = {
+        'git_commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'startup_mode': args.startup_mode,
+        'import': profile_import(env, args.runs, args.top),
+    }
+    if args.server:
+        report['cold_start'] = measure_cold_start(args.server, env_overrides)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    failed = False
+    if args.check and args.startup_mode != 'eager' and report['import']['deferred_modules_loaded']:
+        print("Importing main loads: " + ', '.join(report['import']['deferred_modules_loaded']), file=sys.stderr)
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sections = ('import', 'cold_start')
+        lines, regressed = compare(
+            {name: report[name] for name in sections if name in report},
+            {name: baseline[name] for name in sections if name in baseline},
+            COMPARED_METRICS, args.max_regression
+        )
+        print('\n'.join(lines), file=sys.stderr)
+        failed = failed or regressed
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Offline benchmark suite for regression comparison.
+
+Each scenario starts its own server against the fake model
+(GENAI_BACKEND=fake) and the in-memory Firestore (FIRESTORE_BACKEND=memory,
+seeded with FAKE_FIRESTORE_SEED), drives it with concurrent requests and
+reports throughput, latency percentiles and the worker's peak RSS:
+
+    ask_streams    concurrent /ask streams against a slow-streaming model
+    chat_history   paging through a chat with thousands of messages
+    chat_titles    paging the chat list of a user with hundreds of chats
+    media_upload   /ask with base64 images and documents in the body
+
+Save a run and compare a later one against it; the command exits with
+status 1 when a scenario regresses by more than --max-regression:
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --output current.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import httpx
+from benchmarks.common import (
+    SERVER_COMMANDS, compare, free_port, git_commit, latency_summary, peak_rss_bytes, start_server,
+    stop_server
+)
+
+# Seeded users and chats are named bench-user-N and chat-N
+SEED_USER = 'bench-user-0'
+
+# File signatures, so the uploads are sniffed as the types they claim to be
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PDF_SIGNATURE = b'%PDF-1.4\n'
+
+
+async def _timed(client, method, url, **kwargs):
+    """Send one request, reading the body as it arrives."""
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+            ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return {'ok': ok, 'latency': time.perf_counter() - started, 'ttfb': first_byte, 'bytes': size}
+
+async def _walk_cursors(client, url, params, key='next_before'):
+    """Page through a listing once and return the `before` cursor of every page."""
+    cursors = [None]
+    while True:
+        query = dict(params)
+        if cursors[-1]:
+            query['before'] = cursors[-1]
+        response = await client.get(url, params=query)
+        response.raise_for_status()
+        cursor = response.json().get(key)
+        if not cursor:
+            return cursors
+        cursors.append(cursor)
+
+def _query(params, cursor):
+    return dict(params, before=cursor) if cursor else params
+
+
+# Scenarios: each returns the server's environment and a coroutine that,
+# given a client, returns the function issuing request number `index`
+
+def ask_streams(args):
+    env = {
+        'FAKE_GENAI_TTFT': str(args.ttft),
+        'FAKE_GENAI_CHUNK_DELAY': str(args.chunk_delay),
+        'FAKE_GENAI_CHUNKS': str(args.chunks),
+    }
+
+    async def prepare(client, base_url):
+        def request(index):
+            payload = {'question': f'What is the limitation period for filing suit number {index}?'}
+            return _timed(client, 'POST', f'{base_url}/ask', json=payload)
+        return request
+
+    return env, prepare
+
+def chat_history(args):
+    env = {'FAKE_FIRESTORE_SEED': f'users=1,chats=3,messages={args.history_messages}'}
+    params = {'user_id': SEED_USER, 'chat_id': 'chat-0', 'limit': args.page_size}
+
+    async def prepare(client, base_url):
+        url = f'{base_url}/chat_history'
+        cursors = await _walk_cursors(client, url, params)
+
+        def request(index):
+            # Cycle through every page, so older pages are read as often as the newest
+            return _timed(client, 'GET', url, params=_query(params, cursors[index % len(cursors)]))
+        return request
+
+    return env, prepare
+
+def chat_titles(args):
+    env = {'FAKE_FIRESTORE_SEED': f'users=1,chats={args.chats},messages=2'}
+    params = {'user_id': SEED_USER, 'limit': args.titles_limit}
+
+    async def prepare(client, base_url):
+        url = f'{base_url}/chat_titles'
+        cursors = await _walk_cursors(client, url, params)
+
+        def request(index):
+            return _timed(client, 'GET', url, params=_query(params, cursors[index % len(cursors)]))
+        return request
+
+    return env, prepare
+
+def media_upload(args):
+    # An immediate model, so the time is spent receiving and storing attachments
+    env = {
+        'FAKE_GENAI_TTFT': '0',
+        'FAKE_GENAI_CHUNK_DELAY': '0',
+        'FAKE_GENAI_CHUNKS': '5',
+        'DOCUMENT_RETRIEVAL_ENABLED': 'false',
+    }
+    size = args.media_kb * 1024
+
+    def encode(prefix, index, kind):
+        # Different bytes per request, so the attachment store cannot deduplicate them
+        data = prefix + random.Random(f'{kind}-{index}').randbytes(size - len(prefix))
+        return base64.b64encode(data).decode('ascii')
+
+    async def prepare(client, base_url):
+        def request(index):
+            payload = {
+                'question': f'Summarise the attached notice number {index}.',
+                'images': [f"data:image/png;base64,{encode(PNG_SIGNATURE, index, 'image')}"],
+                'documents': [encode(PDF_SIGNATURE, index, 'document')],
+            }
+            return _timed(client, 'POST', f'{base_url}/ask', json=payload)
+        return request
+
+    return env, prepare
+
+SCENARIOS = {
+    'ask_streams': ask_streams,
+    'chat_history': chat_history,
+    'chat_titles': chat_titles,
+    'media_upload': media_upload,
+}
+
+
+async def drive(request, total, concurrency):
+    """Issue `total` requests with at most `concurrency` in flight and summarise them."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            return await request(index)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[one(index) for index in range(total)])
+    elapsed = time.perf_counter() - started
+
+    completed = [r for r in results if r['ok']]
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'completed': len(completed),
+        'failed': total - len(completed),
+        'wall_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(completed) / elapsed, 2) if elapsed else None,
+        'latency_seconds': latency_summary([r['latency'] for r in completed]),
+        'ttfb_seconds': latency_summary([r['ttfb'] for r in completed if r['ttfb'] is not None]),
+        'response_bytes': sum(r['bytes'] for r in completed),
+    }
+
+async def _run(prepare, base_url, total, concurrency, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        request = await prepare(client, base_url)
+        return await drive(request, total, concurrency)
+
+def run_scenario(name, args, attachment_dir):
+    env, prepare = SCENARIOS[name](args)
+    env['ATTACHMENT_CACHE_DIR'] = attachment_dir
+    port = free_port()
+    process = start_server(args.server, port, env)
+    try:
+        result = asyncio.run(_run(prepare, f'http://127.0.0.1:{port}', args.requests, args.concurrency, args.timeout))
+        result['peak_rss_bytes'] = peak_rss_bytes(process.pid)
+    finally:
+        stop_server(process)
+    result['server_env'] = env
+    return result
+
+
+# Regression comparison: (metric path, True when higher is better)
+COMPARED_METRICS = [
+    (('throughput_rps',), True),
+    (('latency_seconds', 'p95'), False),
+    (('peak_rss_bytes',), False),
+]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--requests', type=int, default=400, help="Requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--ttft', type=float, default=0.5, help="ask_streams: fake model seconds to first chunk")
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help="ask_streams: fake model seconds between chunks")
+    parser.add_argument('--chunks', type=int, default=40, help="ask_streams: fake model chunks per answer")
+    parser.add_argument('--history-messages', type=int, default=5000, help="chat_history: messages in the chat")
+    parser.add_argument('--page-size', type=int, default=50, help="chat_history: messages per page")
+    parser.add_argument('--chats', type=int, default=500, help="chat_titles: chats of the user")
+    parser.add_argument('--titles-limit', type=int, default=100, help="chat_titles: titles per page")
+    parser.add_argument('--media-kb', type=int, default=256, help="media_upload: size of each image and document")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="A previous report to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.15,
+                        help="Allowed relative slowdown per metric before the run fails")
+    args = parser.parse_args(argv)
+
+    report = {
+        'git_commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'server': args.server,
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='benchmark-attachments-') as attachment_dir:
+        for name in args.scenario or list(SCENARIOS):
+            print(f"Running {name}...", file=sys.stderr)
+            report['scenarios'][name] = run_scenario(name, args, attachment_dir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(
+            report['scenarios'], baseline.get('scenarios', {}), COMPARED_METRICS, args.max_regression
+        )
+        print('\n'.join(lines), file=sys.stderr)
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
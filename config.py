@@ -2,6 +2,8 @@ import os
 
 # Application configuration
 DEBUG = os.environ.get("FLASK_ENV", "development") != "production"
+# Cloud Run sets K_SERVICE in every container it starts
+ON_CLOUD_RUN = bool(os.environ.get("K_SERVICE"))
 PORT = int(os.environ.get("PORT", 8080))
 HOST = "0.0.0.0"
 
@@ -10,6 +12,336 @@ PROJECT_ID = os.environ.get('PROJECT_ID')
 LOCATION = os.environ.get('LOCATION')
 MODEL_NAME = "gemini-2.0-flash"
 
+# "vertex" talks to Gemini on Vertex AI, "fake" uses a local slow-streaming stand-in
+GENAI_BACKEND = os.environ.get("GENAI_BACKEND", "vertex")
+# Fake model behaviour (seconds to first chunk, seconds between chunks, chunks per answer)
+FAKE_GENAI_TTFT = float(os.environ.get("FAKE_GENAI_TTFT", 0.5))
+FAKE_GENAI_CHUNK_DELAY = float(os.environ.get("FAKE_GENAI_CHUNK_DELAY", 0.05))
+FAKE_GENAI_CHUNKS = int(os.environ.get("FAKE_GENAI_CHUNKS", 40))
+FAKE_GENAI_ERROR_RATE = float(os.environ.get("FAKE_GENAI_ERROR_RATE", 0.0))
+
+def _per_model(name):
+    """Parse a "model=value,model=value" setting into a dict of floats."""
+    return {
+        model.strip(): float(value)
+        for model, _, value in (item.partition("=") for item in os.environ.get(name, "").split(",") if item.strip())
+    }
+
+# Per-model overrides, e.g. FAKE_GENAI_MODEL_TTFT="gemini-2.5-pro=3,gemini-2.0-flash-lite=0.2"
+FAKE_GENAI_MODEL_TTFT = _per_model("FAKE_GENAI_MODEL_TTFT")
+FAKE_GENAI_MODEL_ERROR_RATE = _per_model("FAKE_GENAI_MODEL_ERROR_RATE")
+
+# GenAI client lifecycle
+# Local credentials file used when running in DEBUG mode
+GENAI_CREDENTIALS_PATH = os.environ.get("GENAI_CREDENTIALS_PATH", "./secrets/application_default_credentials.json")
+# Refresh the OAuth token this many seconds before it expires
+GENAI_TOKEN_REFRESH_MARGIN = int(os.environ.get("GENAI_TOKEN_REFRESH_MARGIN", 300))
+# How often the background refresher wakes up to check the token expiry
+GENAI_TOKEN_CHECK_INTERVAL = int(os.environ.get("GENAI_TOKEN_CHECK_INTERVAL", 60))
+
+# Context caching of the system prompt and attached documents
+# "genai" uses the model-side caches API, "local" an in-memory stub, "off" disables it
+CONTEXT_CACHE_BACKEND = os.environ.get("CONTEXT_CACHE_BACKEND", "genai")
+CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", 3600))
+# Extend the TTL when a cache entry is used this close to expiry
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.environ.get("CONTEXT_CACHE_REFRESH_MARGIN", 300))
+# The model rejects cached content below this size, so smaller prompts are sent inline
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 2048))
+# After a failed create, send content inline for this many seconds before retrying
+CONTEXT_CACHE_RETRY_AFTER = int(os.environ.get("CONTEXT_CACHE_RETRY_AFTER", 60))
+# Cache entries tracked per process; the least recently used are forgotten and left to expire
+CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get("CONTEXT_CACHE_MAX_ENTRIES", 1024))
+# Rough size of one token of inline media (PDF pages, audio), for the minimum size check
+CONTEXT_CACHE_MEDIA_BYTES_PER_TOKEN = int(os.environ.get("CONTEXT_CACHE_MEDIA_BYTES_PER_TOKEN", 64))
+
+# Embeddings
+# "genai" uses the embeddings API, "hashing" a deterministic local embedder
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "genai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-005")
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", 256))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+
+# Response cache for repeated single-turn questions
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 2000))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 86400))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", 64 * 1024))
+# Minimum cosine similarity for a semantic hit; 1 disables the semantic tier
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.95))
+# Size of the chunks a cached answer is replayed in
+RESPONSE_CACHE_REPLAY_CHUNK = int(os.environ.get("RESPONSE_CACHE_REPLAY_CHUNK", 256))
+
+# File uploads (/upload)
+# "gcs" streams to a Cloud Storage bucket (Vertex AI reads gs:// URIs), "files" uses
+# the GenAI Files API (Gemini Developer API only), "local" a temp-dir stub for development.
+# On Cloud Run /tmp is memory and not shared between instances, so "local" is refused there
+UPLOAD_BACKEND = os.environ.get("UPLOAD_BACKEND", "gcs" if ON_CLOUD_RUN else "local")
+UPLOAD_BUCKET = os.environ.get("UPLOAD_BUCKET")
+UPLOAD_LOCAL_DIR = os.environ.get("UPLOAD_LOCAL_DIR", "/tmp/legal-assistant-uploads")
+# The local backend deletes uploads older than MAX_AGE seconds, and the oldest ones beyond MAX_BYTES
+UPLOAD_LOCAL_MAX_BYTES = int(os.environ.get("UPLOAD_LOCAL_MAX_BYTES", 512 * 1024 * 1024))
+UPLOAD_LOCAL_MAX_AGE = int(os.environ.get("UPLOAD_LOCAL_MAX_AGE", 24 * 3600))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+# Uploads larger than this are spooled to disk instead of held in memory
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get("UPLOAD_SPOOL_MEMORY_BYTES", 1024 * 1024))
+UPLOAD_ALLOWED_MIME_TYPES = [
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+    "image/heic",
+]
+
+# Content-addressed attachment store, so repeated files can be sent by SHA-256
+ATTACHMENT_CACHE_ENABLED = os.environ.get("ATTACHMENT_CACHE_ENABLED", "true").lower() == "true"
+ATTACHMENT_CACHE_MEMORY_BYTES = int(os.environ.get("ATTACHMENT_CACHE_MEMORY_BYTES", 128 * 1024 * 1024))
+# 0 disables the disk tier. On Cloud Run /tmp is memory, so the disk tier is off there by
+# default; set a budget only when ATTACHMENT_CACHE_DIR is a mounted volume
+ATTACHMENT_CACHE_DISK_BYTES = int(os.environ.get(
+    "ATTACHMENT_CACHE_DISK_BYTES", 0 if ON_CLOUD_RUN else 1024 * 1024 * 1024
+))
+ATTACHMENT_CACHE_DIR = os.environ.get("ATTACHMENT_CACHE_DIR", "/tmp/legal-assistant-attachments")
+
+# Retrieval over large attached documents
+# PDFs/DOCX of at least MIN_BYTES are chunked and indexed per chat instead of sent whole
+DOCUMENT_RETRIEVAL_ENABLED = os.environ.get("DOCUMENT_RETRIEVAL_ENABLED", "true").lower() == "true"
+DOCUMENT_RETRIEVAL_MIN_BYTES = int(os.environ.get("DOCUMENT_RETRIEVAL_MIN_BYTES", 512 * 1024))
+DOCUMENT_RETRIEVAL_TOP_K = int(os.environ.get("DOCUMENT_RETRIEVAL_TOP_K", 8))
+DOCUMENT_CHUNK_MAX_CHARS = int(os.environ.get("DOCUMENT_CHUNK_MAX_CHARS", 2000))
+DOCUMENT_INDEX_DIR = os.environ.get("DOCUMENT_INDEX_DIR", "/tmp/legal-assistant-doc-index")
+# Vectors, chunk text and chat manifests beyond this are evicted least-recently-used first.
+# On Cloud Run /tmp is memory, so the default there is small unless DIR is a mounted volume
+DOCUMENT_INDEX_MAX_BYTES = int(os.environ.get(
+    "DOCUMENT_INDEX_MAX_BYTES", (64 if ON_CLOUD_RUN else 1024) * 1024 * 1024
+))
+# Number of document indexes kept memory-mapped at once
+DOCUMENT_INDEX_OPEN_MAX = int(os.environ.get("DOCUMENT_INDEX_OPEN_MAX", 64))
+
+# Statute index used to ground citations (built with `flask build-statute-index`)
+STATUTE_INDEX_DIR = os.environ.get("STATUTE_INDEX_DIR", "./data/statute_index")
+# Sections added to the prompt per question
+STATUTE_TOP_K = int(os.environ.get("STATUTE_TOP_K", 3))
+# A section must clear one of these to be added to the prompt
+STATUTE_MIN_BM25 = float(os.environ.get("STATUTE_MIN_BM25", 6.0))
+STATUTE_MIN_SIMILARITY = float(os.environ.get("STATUTE_MIN_SIMILARITY", 0.6))
+# Answer "Section 302 IPC"-style questions from the index without calling the model
+STATUTE_DIRECT_ANSWERS = os.environ.get("STATUTE_DIRECT_ANSWERS", "true").lower() == "true"
+
+# Server-Sent Events mode of /ask (Accept: text/event-stream)
+# Seconds of silence after which a heartbeat comment is sent
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT_INTERVAL", 15))
+# Reconnection delay suggested to EventSource clients
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", 3000))
+# Threads generating SSE answers under the WSGI server
+SSE_PRODUCER_WORKERS = int(os.environ.get("SSE_PRODUCER_WORKERS", 32))
+# Finished streams stay resumable (Last-Event-ID) for this many seconds
+STREAM_BUFFER_TTL = int(os.environ.get("STREAM_BUFFER_TTL", 120))
+STREAM_BUFFER_MAX_STREAMS = int(os.environ.get("STREAM_BUFFER_MAX_STREAMS", 1000))
+
+# Coalesce identical in-flight single-turn questions onto one model call
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Model routing
+# Each request is classified locally and sent to a tier; set a tier's model to "" to disable it
+MODEL_ROUTER_ENABLED = os.environ.get("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+MODEL_TIERS = {
+    'fast': {
+        'model': os.environ.get("MODEL_TIER_FAST", "gemini-2.0-flash-lite"),
+        'max_output_tokens': int(os.environ.get("MODEL_TIER_FAST_MAX_TOKENS", 2048)),
+        # p95 seconds to first token above which the tier counts as degraded
+        'p95_budget': float(os.environ.get("MODEL_TIER_FAST_P95_BUDGET", 2.0)),
+        # Prompt + completion tokens per window before traffic shifts away; 0 is unlimited
+        'token_budget': int(os.environ.get("MODEL_TIER_FAST_TOKEN_BUDGET", 0)),
+    },
+    'standard': {
+        'model': os.environ.get("MODEL_TIER_STANDARD", MODEL_NAME),
+        'max_output_tokens': int(os.environ.get("MODEL_TIER_STANDARD_MAX_TOKENS", 8192)),
+        'p95_budget': float(os.environ.get("MODEL_TIER_STANDARD_P95_BUDGET", 4.0)),
+        'token_budget': int(os.environ.get("MODEL_TIER_STANDARD_TOKEN_BUDGET", 0)),
+    },
+    'heavy': {
+        'model': os.environ.get("MODEL_TIER_HEAVY", "gemini-2.5-pro"),
+        'max_output_tokens': int(os.environ.get("MODEL_TIER_HEAVY_MAX_TOKENS", 8192)),
+        'p95_budget': float(os.environ.get("MODEL_TIER_HEAVY_P95_BUDGET", 12.0)),
+        'token_budget': int(os.environ.get("MODEL_TIER_HEAVY_TOKEN_BUDGET", 5000000)),
+    },
+}
+# Sliding window of per-tier calls used for the latency, error and token checks
+MODEL_ROUTER_WINDOW_SECONDS = int(os.environ.get("MODEL_ROUTER_WINDOW_SECONDS", 300))
+MODEL_ROUTER_WINDOW_SIZE = int(os.environ.get("MODEL_ROUTER_WINDOW_SIZE", 500))
+# A tier is only judged once it has this many calls in the window
+MODEL_ROUTER_MIN_SAMPLES = int(os.environ.get("MODEL_ROUTER_MIN_SAMPLES", 20))
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.environ.get("MODEL_ROUTER_MAX_ERROR_RATE", 0.2))
+# Share of a degraded tier's traffic still sent to it, so recovery is noticed
+MODEL_ROUTER_PROBE_RATE = float(os.environ.get("MODEL_ROUTER_PROBE_RATE", 0.05))
+
+# Resilience of model calls
+# Retries of 429/5xx failures before the first token, with jittered exponential backoff
+GENAI_MAX_RETRIES = int(os.environ.get("GENAI_MAX_RETRIES", 2))
+GENAI_RETRY_BASE_DELAY = float(os.environ.get("GENAI_RETRY_BASE_DELAY", 0.5))
+GENAI_RETRY_MAX_DELAY = float(os.environ.get("GENAI_RETRY_MAX_DELAY", 4.0))
+# Send a second, identical request when the first token is slower than the tier's p95
+GENAI_HEDGE_ENABLED = os.environ.get("GENAI_HEDGE_ENABLED", "true").lower() == "true"
+# Hedge delay until the router has p95 data for the tier, and its lower bound
+GENAI_HEDGE_DEFAULT_DELAY = float(os.environ.get("GENAI_HEDGE_DEFAULT_DELAY", 3.0))
+GENAI_HEDGE_MIN_DELAY = float(os.environ.get("GENAI_HEDGE_MIN_DELAY", 0.5))
+# Give up on a request with no first token after this many times its tier's p95 budget;
+# the timeout is retried like any other. 0 waits for as long as the model takes
+GENAI_FIRST_TOKEN_TIMEOUT_FACTOR = float(os.environ.get("GENAI_FIRST_TOKEN_TIMEOUT_FACTOR", 3.0))
+GENAI_HEDGE_MAX_IN_FLIGHT = int(os.environ.get("GENAI_HEDGE_MAX_IN_FLIGHT", 8))
+# Threads waiting for first tokens under the WSGI server
+GENAI_HEDGE_WORKERS = int(os.environ.get("GENAI_HEDGE_WORKERS", 64))
+# Circuit breaker per model and region, over the last WINDOW calls
+GENAI_BREAKER_WINDOW = int(os.environ.get("GENAI_BREAKER_WINDOW", 20))
+GENAI_BREAKER_MIN_CALLS = int(os.environ.get("GENAI_BREAKER_MIN_CALLS", 10))
+GENAI_BREAKER_FAILURE_RATE = float(os.environ.get("GENAI_BREAKER_FAILURE_RATE", 0.5))
+GENAI_BREAKER_OPEN_SECONDS = float(os.environ.get("GENAI_BREAKER_OPEN_SECONDS", 30))
+# Used while the routed model's breaker is open; "" disables either fallback
+GENAI_FALLBACK_MODEL = os.environ.get("GENAI_FALLBACK_MODEL", MODEL_TIERS['fast']['model'])
+GENAI_FALLBACK_LOCATION = os.environ.get("GENAI_FALLBACK_LOCATION", "")
+
+# Admission control for /ask
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+# gunicorn threads per worker in WSGI mode; the Dockerfile passes the same variable to --threads
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", 8))
+# /ask requests a WSGI worker answers at once; each holds a thread for the whole stream,
+# so leave threads free for the other routes
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", max(1, WSGI_THREADS - 2)))
+# Requests that may wait for a slot before a 503. Waiting also holds a thread, so this is
+# capped below WSGI_THREADS - ADMISSION_MAX_CONCURRENT
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", max(0, WSGI_THREADS - ADMISSION_MAX_CONCURRENT - 1)))
+# The same limits in ASGI mode, where a stream holds no thread and waiting is free
+ADMISSION_ASGI_MAX_CONCURRENT = int(os.environ.get("ADMISSION_ASGI_MAX_CONCURRENT", 500))
+ADMISSION_ASGI_MAX_QUEUE = int(os.environ.get("ADMISSION_ASGI_MAX_QUEUE", 200))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", 10))
+# Retry-After (seconds) sent with a 503
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+# Per-caller token buckets: "memory" is per instance, "redis" is shared by all instances
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100000))
+# Requests per second and burst size; 0 disables. Users signed in with a Firebase ID token
+# (Authorization: Bearer) are limited by uid, everyone else by IP
+RATE_LIMIT_USER_RATE = float(os.environ.get("RATE_LIMIT_USER_RATE", 0.5))
+RATE_LIMIT_USER_BURST = int(os.environ.get("RATE_LIMIT_USER_BURST", 10))
+RATE_LIMIT_ANONYMOUS_RATE = float(os.environ.get("RATE_LIMIT_ANONYMOUS_RATE", 0.2))
+RATE_LIMIT_ANONYMOUS_BURST = int(os.environ.get("RATE_LIMIT_ANONYMOUS_BURST", 5))
+# Applied to every request by IP as well, signed in or not
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", 1.0))
+RATE_LIMIT_IP_BURST = int(os.environ.get("RATE_LIMIT_IP_BURST", 20))
+
+# Observability
+# "json" writes one object per line for Cloud Logging, "text" plain lines for local development
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Prometheus text-format metrics of each worker process on /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Gunicorn workers share their metrics through this directory so /metrics covers all of
+# them; empty reports only the worker that serves the scrape
+METRICS_MULTIPROCESS_DIR = os.environ.get("METRICS_MULTIPROCESS_DIR", "/tmp/legal-assistant-metrics")
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", 5))
+# Nested spans (route -> model / Firestore calls) are logged for this share of requests;
+# a caller's W3C traceparent header decides for itself
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.05))
+
+# Start-up
+# The Google client libraries load and the shared clients are built on first use.
+# "background" warms them in a thread as soon as the app is created, "lazy" leaves
+# them to the first request that needs them, "eager" warms them before the app is returned
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+# JSON responses
+# "orjson" when it is installed (falls back to the standard library), or "stdlib"
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson")
+# Timestamps as "http" dates (Flask's format, whole seconds), "iso" (RFC 3339) or "epoch_ms";
+# clients can ask /chat_history and /chat_titles for the compact format per request instead
+JSON_DATETIME_FORMAT = os.environ.get("JSON_DATETIME_FORMAT", "http")
+# gzip/brotli for JSON responses the client accepts compressed; never for the /ask streams
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 5))
+COMPRESSION_EXCLUDED_PATHS = tuple(
+    path.strip() for path in os.environ.get("COMPRESSION_EXCLUDED_PATHS", "/ask").split(",") if path.strip()
+)
+
+# Firestore
+# "firestore" uses Firebase, "memory" an in-process fake for offline development
+FIRESTORE_BACKEND = os.environ.get("FIRESTORE_BACKEND", "firestore")
+FAKE_FIRESTORE_READ_LATENCY = float(os.environ.get("FAKE_FIRESTORE_READ_LATENCY", 0.0))
+FAKE_FIRESTORE_WRITE_LATENCY = float(os.environ.get("FAKE_FIRESTORE_WRITE_LATENCY", 0.0))
+# Chats to create in the fake at start-up, e.g. FAKE_FIRESTORE_SEED="users=1,chats=300,messages=40"
+# (users bench-user-0.., chats chat-0.., messages per chat); empty starts with no data
+FAKE_FIRESTORE_SEED = {key: int(value) for key, value in _per_model("FAKE_FIRESTORE_SEED").items()}
+
+# /chat_history pagination
+CHAT_HISTORY_DEFAULT_LIMIT = int(os.environ.get("CHAT_HISTORY_DEFAULT_LIMIT", 50))
+CHAT_HISTORY_MAX_LIMIT = int(os.environ.get("CHAT_HISTORY_MAX_LIMIT", 200))
+
+# /chat_titles pagination (the app drawer)
+CHAT_TITLES_DEFAULT_LIMIT = int(os.environ.get("CHAT_TITLES_DEFAULT_LIMIT", 50))
+CHAT_TITLES_MAX_LIMIT = int(os.environ.get("CHAT_TITLES_MAX_LIMIT", 500))
+
+# Cache of /chat_history and /chat_titles pages, invalidated when an exchange is saved
+HISTORY_CACHE_ENABLED = os.environ.get("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+HISTORY_CACHE_MAX_ENTRIES = int(os.environ.get("HISTORY_CACHE_MAX_ENTRIES", 5000))
+HISTORY_CACHE_MAX_BYTES = int(os.environ.get("HISTORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Larger pages are served but not cached
+HISTORY_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("HISTORY_CACHE_MAX_ENTRY_BYTES", 2 * 1024 * 1024))
+# Writes only invalidate the worker that saved them unless the backend is "redis";
+# the TTL bounds how stale the other workers' chat pages can be. Chat listings are
+# only cached with "redis"
+HISTORY_CACHE_TTL = int(os.environ.get("HISTORY_CACHE_TTL", 30))
+HISTORY_CACHE_BACKEND = os.environ.get("HISTORY_CACHE_BACKEND", "memory")
+HISTORY_CACHE_REDIS_URL = os.environ.get("HISTORY_CACHE_REDIS_URL", RATE_LIMIT_REDIS_URL)
+
+# Write-behind chat persistence
+CHAT_WRITER_ENABLED = os.environ.get("CHAT_WRITER_ENABLED", "true").lower() == "true"
+# Flush when this many exchanges are queued, or the oldest has waited FLUSH_INTERVAL seconds
+CHAT_WRITER_BATCH_SIZE = int(os.environ.get("CHAT_WRITER_BATCH_SIZE", 50))
+CHAT_WRITER_FLUSH_INTERVAL = float(os.environ.get("CHAT_WRITER_FLUSH_INTERVAL", 0.5))
+CHAT_WRITER_MAX_RETRIES = int(os.environ.get("CHAT_WRITER_MAX_RETRIES", 5))
+CHAT_WRITER_RETRY_BASE_DELAY = float(os.environ.get("CHAT_WRITER_RETRY_BASE_DELAY", 0.5))
+# Exchanges beyond this many pending are dropped rather than growing memory
+CHAT_WRITER_MAX_QUEUE = int(os.environ.get("CHAT_WRITER_MAX_QUEUE", 10000))
+
+# Chat titles
+# New chats get a provisional title from the first question; a background job replaces it.
+# "genai" asks CHAT_TITLE_MODEL, "stub" keeps the first words of the question (no model calls,
+# for tests and load tests), "off" keeps the provisional title
+CHAT_TITLE_BACKEND = os.environ.get("CHAT_TITLE_BACKEND", "stub" if GENAI_BACKEND == "fake" else "genai")
+CHAT_TITLE_MODEL = os.environ.get("CHAT_TITLE_MODEL", MODEL_TIERS['fast']['model'] or MODEL_NAME)
+# Titles are generated together, one model call per batch of up to BATCH_SIZE chats,
+# once BATCH_SIZE chats are waiting or the oldest has waited BATCH_INTERVAL seconds
+CHAT_TITLE_BATCH_SIZE = int(os.environ.get("CHAT_TITLE_BATCH_SIZE", 20))
+CHAT_TITLE_BATCH_INTERVAL = float(os.environ.get("CHAT_TITLE_BATCH_INTERVAL", 2.0))
+# Chats beyond this many waiting keep their provisional title
+CHAT_TITLE_MAX_QUEUE = int(os.environ.get("CHAT_TITLE_MAX_QUEUE", 1000))
+CHAT_TITLE_MAX_CHARS = int(os.environ.get("CHAT_TITLE_MAX_CHARS", 60))
+
+# Bulk export and import of chats (data requests, backups)
+# Bearer token for GET /export and POST /import; empty leaves the endpoints off (the CLI always works)
+DATA_TRANSFER_TOKEN = os.environ.get("DATA_TRANSFER_TOKEN", "")
+# Documents read per Firestore query while exporting
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 500))
+# export-chats/import-chats: users (or files) handled in parallel, and records per archive part
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 4))
+EXPORT_PART_RECORDS = int(os.environ.get("EXPORT_PART_RECORDS", 100000))
+# Firestore writes per second while importing, shared by all import workers; 0 for no limit
+IMPORT_MAX_WRITES_PER_SECOND = float(os.environ.get("IMPORT_MAX_WRITES_PER_SECOND", 500))
+
+# Conversation history
+# Approximate token budget for past turns sent with each /ask request
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 6000))
+# Most recent messages loaded from Firestore when building the history
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", 60))
+# Summarise older turns once this many messages have fallen out of the window
+HISTORY_SUMMARY_MIN_MESSAGES = int(os.environ.get("HISTORY_SUMMARY_MIN_MESSAGES", 6))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.environ.get("HISTORY_SUMMARY_MAX_TOKENS", 512))
+
 # System prompts
 LAW_ASSISTANT_INSTRUCTION = """You are Litigence AI 🤖⚖️ an Indian law legal AI Assistant
 
@@ -24,6 +356,18 @@ LAW_ASSISTANT_INSTRUCTION = """You are Litigence AI 🤖⚖️ an Indian law leg
 9. Avoid providing personal opinions or advice. Stick to the facts and the law.
 """
 
+SUMMARY_INSTRUCTION = """You maintain a running summary of a conversation between a user and an Indian law legal AI assistant.
+Combine the existing summary with the new messages into one updated summary.
+Keep the facts of the user's situation, the legal questions asked, the statutes and cases cited, and any conclusions reached.
+Write in plain text, in the third person, in no more than 200 words.
+"""
+
+TITLE_INSTRUCTION = """You name conversations between users and an Indian law legal AI assistant.
+You are given a JSON array of conversations, each with the user's first question and the assistant's answer.
+Reply with a JSON array holding one title per conversation, in the same order.
+Each title is 3 to 8 words in plain text, in the language of the question, naming the legal topic, without quotes or a final full stop.
+"""
+
 # Safety settings
 SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
@@ -1,16 +1,33 @@
-from flask import Flask
+import time
+from flask import Flask, g, request
 from flask_cors import CORS
 import config
 from src.routes.health import health_bp
 from src.routes.legal_assistant import legal_bp
+from src.routes.upload import upload_bp
 from src.routes.fetch_data import fetch_bp
-from src.services.firebase_services import initialize_firebase
+from src.routes.metrics import metrics_bp
+from src.routes.data_transfer import transfer_bp
+from src.services.warmup import start_warm_up
+from src.services.upload_service import check_upload_config
+from src.services.metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION, start_snapshot_writer
+from src.services.tracing import start_trace
+from src.utils.logging_utils import configure_logging
+from src.utils.json_provider import FastJSONProvider
+from src.utils.compression import compress_response
+from src.cli import register_commands
 
 def create_app():
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
 
-    # Initialize Firebase
-    initialize_firebase()
+    # Structured logs on stdout, one JSON object per line
+    configure_logging()
+    check_upload_config()
+
+    # Load the client libraries, initialize Firebase and memory-map the statute
+    # index; by default in the background, so a cold worker can answer at once
+    start_warm_up()
     
     # Configure CORS
     CORS(app, resources={
@@ -26,15 +43,58 @@ def create_app():
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        # Browsers only let scripts read these response headers once exposed
+        response.headers.add('Access-Control-Expose-Headers', 'X-Chat-Id,X-Stream-Id')
+        return response
+
+    @app.before_request
+    def start_request_trace():
+        # The span stays current until teardown, which for streamed answers is the end of the stream
+        g.request_started_at = time.perf_counter()
+        g.request_span = start_trace(
+            f"{request.method} {_route_label()}", request.headers.get('traceparent')
+        ).activate()
+
+    @app.after_request
+    def record_request_metrics(response):
+        route = _route_label()
+        HTTP_REQUESTS.labels(route=route, method=request.method, status=response.status_code).inc()
+        HTTP_REQUEST_DURATION.labels(route=route, method=request.method).observe(
+            time.perf_counter() - g.request_started_at
+        )
+        g.request_span.set(status=response.status_code)
         return response
+
+    # after_request hooks run last-registered first, so the recorded duration includes compression
+    app.after_request(compress_response)
+
+    @app.teardown_request
+    def finish_request_trace(error=None):
+        request_span = g.pop('request_span', None)
+        if request_span is not None:
+            request_span.deactivate()
+            request_span.finish(error)
     
     # Register blueprints
     app.register_blueprint(health_bp)
     app.register_blueprint(legal_bp)
+    app.register_blueprint(upload_bp)
     app.register_blueprint(fetch_bp, url_prefix='')
+    if config.METRICS_ENABLED:
+        app.register_blueprint(metrics_bp)
+        start_snapshot_writer()
+    if config.DATA_TRANSFER_TOKEN:
+        app.register_blueprint(transfer_bp)
+
+    # Register maintenance commands (flask --app main.py <command>)
+    register_commands(app)
     
     return app
 
+def _route_label():
+    """The matched URL rule, so metrics are not labelled with every chat or stream ID."""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
 app = create_app()
 if __name__ == "__main__":
     app.run(
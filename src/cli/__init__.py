@@ -0,0 +1,14 @@
+# Maintenance commands, run through the Flask CLI:
+#   flask --app main.py <command> --help
+from src.cli.migrate_messages import migrate_chat_messages_command
+from src.cli.backfill_titles import backfill_chat_titles_command
+from src.cli.build_statute_index import build_statute_index_command
+from src.cli.export_chats import export_chats_command, import_chats_command
+
+def register_commands(app):
+    """Register the maintenance commands on the Flask app."""
+    app.cli.add_command(migrate_chat_messages_command)
+    app.cli.add_command(backfill_chat_titles_command)
+    app.cli.add_command(build_statute_index_command)
+    app.cli.add_command(export_chats_command)
+    app.cli.add_command(import_chats_command)
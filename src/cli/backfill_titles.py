@@ -0,0 +1,67 @@
+import click
+from src.services.firebase_services import get_firestore_client, firestore
+
+# Firestore rejects batches with more than 500 writes
+BATCH_LIMIT = 500
+
+def _latest_message_timestamp(chat):
+    """Timestamp of the newest message, from the subcollection or legacy array."""
+    messages_ref = chat.reference.collection('messages')
+    latest = list(messages_ref.order_by('timestamp', direction=firestore.Query.DESCENDING)
+                              .select(['timestamp']).limit(1).stream())
+    if latest:
+        return latest[0].to_dict().get('timestamp')
+    legacy = chat.reference.get(field_paths=['messages']).to_dict() or {}
+    timestamps = [m.get('timestamp') for m in legacy.get('messages') or [] if m.get('timestamp')]
+    return max(timestamps) if timestamps else None
+
+@click.command('backfill-chat-titles')
+@click.option('--user-id', help="Only backfill this user's chats.")
+@click.option('--dry-run', is_flag=True, help="Report what would change without writing.")
+def backfill_chat_titles_command(user_id, dry_run):
+    """
+    Make every chat visible to the /chat_titles index query.
+
+    /chat_titles orders by last_updated on the server, and Firestore leaves
+    documents without that field out of the results. This fills in
+    last_updated (from createdAt or the newest message) and title for chats
+    that lack them.
+    """
+    db = get_firestore_client()
+    users_ref = db.collection('users')
+    # User documents are never written, only their chats, so list references
+    user_refs = [users_ref.document(user_id)] if user_id else users_ref.list_documents()
+
+    batch = db.batch()
+    pending = 0
+    updated = 0
+    for user_ref in user_refs:
+        chats = user_ref.collection('chats').select(['title', 'last_updated', 'createdAt']).stream()
+        for chat in chats:
+            chat_data = chat.to_dict()
+            update = {}
+            if chat_data.get('last_updated') is None:
+                last_updated = chat_data.get('createdAt') or _latest_message_timestamp(chat)
+                if last_updated is None:
+                    click.echo(f"Skipping {user_ref.id}/{chat.id}: no timestamp to backfill from")
+                    continue
+                update['last_updated'] = last_updated
+            if not chat_data.get('title'):
+                update['title'] = chat.id
+            if not update:
+                continue
+
+            updated += 1
+            click.echo(f"{'Would update' if dry_run else 'Updating'} {user_ref.id}/{chat.id}: {sorted(update)}")
+            if dry_run:
+                continue
+            batch.set(chat.reference, update, merge=True)
+            pending += 1
+            if pending == BATCH_LIMIT:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+
+    if pending:
+        batch.commit()
+    click.echo(f"{'Would update' if dry_run else 'Updated'} {updated} chats")
@@ -0,0 +1,44 @@
+import json
+import click
+from config import STATUTE_INDEX_DIR
+from src.services.statute_index import build_statute_index
+
+def _read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            missing = [field for field in ('act', 'section', 'text') if not record.get(field)]
+            if missing:
+                raise click.ClickException(f"{path}:{line_number} is missing {', '.join(missing)}")
+            yield record
+
+@click.command('build-statute-index')
+@click.option('--source', required=True, type=click.Path(exists=True, dir_okay=False),
+              help="JSONL corpus, one section per line.")
+@click.option('--output', default=STATUTE_INDEX_DIR, show_default=True,
+              help="Directory to write the index to.")
+@click.option('--dense/--no-dense', default=True, show_default=True,
+              help="Also embed every section for the dense tier.")
+def build_statute_index_command(source, output, dense):
+    """
+    Build the statute index from a corpus of bare acts.
+
+    Each line of the corpus is one section:
+
+    {"act": "IPC", "act_name": "Indian Penal Code, 1860", "section": "302",
+     "title": "Punishment for murder", "text": "..."}
+
+    An optional "aliases" list adds names the act is asked about by, and
+    "doc_type": "constitution" numbers its provisions as Articles (the
+    default for act "COI").
+    Workers load the index from STATUTE_INDEX_DIR at start-up.
+    """
+    embedder = None
+    if dense:
+        from src.services.embedding_service import get_embedder
+        embedder = get_embedder()
+    count = build_statute_index(_read_records(source), output, embedder)
+    click.echo(f"Indexed {count} sections into {output}")
@@ -0,0 +1,168 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote
+import click
+from config import EXPORT_WORKERS, EXPORT_PART_RECORDS, IMPORT_MAX_WRITES_PER_SECOND
+from src.services.export_service import (
+    ChatImporter, WriteThrottle, dump_record, export_user, header_record, list_user_ids, read_records
+)
+
+PROGRESS_FILE = 'progress.json'
+ARCHIVE_SUFFIXES = ('.ndjson.gz', '.ndjson')
+
+
+def _read_progress(user_dir):
+    try:
+        with open(os.path.join(user_dir, PROGRESS_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'parts': 0, 'cursor': None, 'complete': False, 'records': 0}
+
+def _write_progress(user_dir, progress):
+    path = os.path.join(user_dir, PROGRESS_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(progress, f)
+    os.replace(path + '.tmp', path)
+
+def export_user_to_directory(user_id, output_dir, part_records=EXPORT_PART_RECORDS):
+    """
+    Export one user's chats to <output_dir>/<user_id>/part-NNNNN.ndjson.gz.
+
+    A part is closed at the first cursor after `part_records` records,
+    renamed into place and recorded in progress.json with that cursor. A
+    later run skips finished users and resumes the others after their
+    last finished part; records of an unfinished part are written again.
+
+    Returns:
+        int: Records written by this run, or None if the user was already done
+    """
+    user_dir = os.path.join(output_dir, quote(user_id, safe=''))
+    os.makedirs(user_dir, exist_ok=True)
+    progress = _read_progress(user_dir)
+    if progress['complete']:
+        return None
+
+    written = 0
+    part = None
+    part_count = 0
+    for record in export_user(user_id, cursor=progress['cursor']):
+        if part is None:
+            part_path = os.path.join(user_dir, f"part-{progress['parts']:05d}.ndjson.gz")
+            part = gzip.open(part_path + '.tmp', 'wb')
+            part.write(dump_record(header_record()))
+        part.write(dump_record(record))
+        part_count += 1
+        if record['type'] == 'cursor' and part_count >= part_records:
+            part.close()
+            os.replace(part_path + '.tmp', part_path)
+            progress.update(parts=progress['parts'] + 1, cursor=record['cursor'],
+                            records=progress['records'] + part_count)
+            _write_progress(user_dir, progress)
+            written += part_count
+            part, part_count = None, 0
+
+    if part is not None:
+        part.close()
+        os.replace(part_path + '.tmp', part_path)
+        progress.update(parts=progress['parts'] + 1, records=progress['records'] + part_count)
+        written += part_count
+    progress['complete'] = True
+    _write_progress(user_dir, progress)
+    return written
+
+@click.command('export-chats')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False),
+              help="Directory to write one subdirectory of archive parts per user into.")
+@click.option('--user-id', 'user_ids', multiple=True, help="Only export this user; repeat for several.")
+@click.option('--workers', default=EXPORT_WORKERS, show_default=True, help="Users exported in parallel.")
+@click.option('--part-records', default=EXPORT_PART_RECORDS, show_default=True,
+              help="Records per archive part before a new part is started.")
+def export_chats_command(output_dir, user_ids, workers, part_records):
+    """
+    Export chats and messages as gzip NDJSON archives.
+
+    Users are exported in parallel, each into its own directory. Re-running
+    the command with the same --output-dir resumes an interrupted export.
+    """
+    user_ids = user_ids or list_user_ids()
+    exported = skipped = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+
+        def collect(done):
+            nonlocal exported, skipped, failed
+            for future in done:
+                user_id = in_flight.pop(future)
+                try:
+                    written = future.result()
+                except Exception as e:
+                    failed += 1
+                    click.echo(f"Failed to export {user_id}: {e}", err=True)
+                    continue
+                if written is None:
+                    skipped += 1
+                else:
+                    exported += 1
+                    click.echo(f"Exported {written} records of {user_id}")
+
+        # Keep a bounded number of users queued, however many there are
+        for user_id in user_ids:
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(export_user_to_directory, user_id, output_dir, part_records)] = user_id
+        collect(wait(in_flight).done)
+
+    click.echo(f"Exported {exported} users, {skipped} already exported, {failed} failed")
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+def _archive_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(ARCHIVE_SUFFIXES):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def import_file(path, throttle):
+    with open(path, 'rb') as f:
+        return ChatImporter(throttle).import_records(read_records(f))
+
+@click.command('import-chats')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--workers', default=EXPORT_WORKERS, show_default=True, help="Archive files imported in parallel.")
+@click.option('--max-writes-per-second', default=IMPORT_MAX_WRITES_PER_SECOND, show_default=True,
+              help="Firestore writes per second across all workers; 0 for no limit.")
+def import_chats_command(paths, workers, max_writes_per_second):
+    """
+    Import archives written by export-chats (or GET /export).
+
+    PATHS are archive files or directories searched for them. Documents
+    keep their exported IDs, so an interrupted import can be run again.
+    """
+    throttle = WriteThrottle(max_writes_per_second)
+    totals = {'chats': 0, 'messages': 0}
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(import_file, path, throttle): path for path in _archive_files(paths)}
+        for future, path in futures.items():
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                click.echo(f"Failed to import {path}: {e}", err=True)
+                continue
+            totals['chats'] += stats['chats']
+            totals['messages'] += stats['messages']
+            click.echo(f"Imported {stats['chats']} chats and {stats['messages']} messages from {path}")
+
+    click.echo(f"Imported {totals['chats']} chats and {totals['messages']} messages, {failed} files failed")
+    if failed:
+        raise click.exceptions.Exit(1)
@@ -0,0 +1,71 @@
+import click
+from src.services.firebase_services import get_firestore_client, firestore
+
+# Firestore rejects batches with more than 500 writes
+BATCH_LIMIT = 500
+
+def migrate_chat(chat_ref, chat_data, dry_run=False):
+    """
+    Move a chat's legacy `messages` array into its messages subcollection.
+
+    Message documents get deterministic IDs (legacy-000000, ...), so the
+    migration can be re-run safely after a partial failure. The array is
+    removed from the chat document only after every message is written.
+
+    Args:
+        chat_ref: Reference to the chat document
+        chat_data (dict): The chat document data
+        dry_run (bool): Only count what would be migrated
+
+    Returns:
+        int: Number of messages migrated
+    """
+    messages = chat_data.get('messages') or []
+    if dry_run or not messages:
+        return len(messages)
+
+    db = get_firestore_client()
+    messages_ref = chat_ref.collection('messages')
+    for start in range(0, len(messages), BATCH_LIMIT):
+        batch = db.batch()
+        for index in range(start, min(start + BATCH_LIMIT, len(messages))):
+            batch.set(messages_ref.document(f"legacy-{index:06d}"), messages[index])
+        batch.commit()
+
+    # Messages written since the deploy are already in the subcollection
+    newer_count = len(list(messages_ref.select([]).stream())) - len(messages)
+    update = {
+        'messages': firestore.DELETE_FIELD,
+        'message_count': len(messages) + max(newer_count, 0),
+    }
+    summarized_count = chat_data.get('summarized_count')
+    if summarized_count:
+        # Summaries now record the timestamp of the last summarised message
+        update['summarized_until'] = messages[min(summarized_count, len(messages)) - 1].get('timestamp')
+        update['summarized_count'] = firestore.DELETE_FIELD
+    chat_ref.update(update)
+    return len(messages)
+
+@click.command('migrate-chat-messages')
+@click.option('--user-id', help="Only migrate this user's chats.")
+@click.option('--dry-run', is_flag=True, help="Report what would be migrated without writing.")
+def migrate_chat_messages_command(user_id, dry_run):
+    """Move array-based chat messages into per-chat messages subcollections."""
+    db = get_firestore_client()
+    users_ref = db.collection('users')
+    # User documents are never written, only their chats, so list references
+    user_refs = [users_ref.document(user_id)] if user_id else users_ref.list_documents()
+
+    chats_migrated = 0
+    messages_migrated = 0
+    for user_ref in user_refs:
+        for chat in user_ref.collection('chats').stream():
+            chat_data = chat.to_dict()
+            if not chat_data.get('messages'):
+                continue
+            count = migrate_chat(chat.reference, chat_data, dry_run=dry_run)
+            chats_migrated += 1
+            messages_migrated += count
+            click.echo(f"{'Would migrate' if dry_run else 'Migrated'} {count} messages in {user_ref.id}/{chat.id}")
+
+    click.echo(f"{'Would migrate' if dry_run else 'Migrated'} {messages_migrated} messages in {chats_migrated} chats")
@@ -0,0 +1,17 @@
+from flask import jsonify, request
+from src.services.admission_service import admit_request, client_address
+from src.services.auth_service import verified_user_id
+
+
+def admit():
+    """Rate limit the caller and wait for a slot; returns the permit to release."""
+    identity = verified_user_id(request.headers.get('Authorization'))
+    address = client_address(request.headers.get('X-Forwarded-For'), request.remote_addr)
+    return admit_request(identity, address)
+
+def admission_rejected(error):
+    """The 429/503 response for an AdmissionRejected, with its Retry-After."""
+    response = jsonify({"error": str(error)})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
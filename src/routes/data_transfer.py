@@ -0,0 +1,67 @@
+import hmac
+from urllib.parse import quote
+from flask import Blueprint, Response, jsonify, request
+from src.services.export_service import ChatImporter, export_user, gzip_ndjson, header_record, read_records
+from config import DATA_TRANSFER_TOKEN
+
+# Bulk export and import of a user's chats; registered only when DATA_TRANSFER_TOKEN is set
+transfer_bp = Blueprint('data_transfer', __name__)
+
+@transfer_bp.before_request
+def require_token():
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode('utf-8'), DATA_TRANSFER_TOKEN.encode('utf-8')):
+        return jsonify({"status": "error", "error": "Unauthorized"}), 401
+
+@transfer_bp.route("/export", methods=["GET"])
+def export_chats():
+    """
+    Stream all of a user's chats and messages as a gzip NDJSON archive.
+
+    The archive is produced page by page while it is sent, so memory use
+    does not depend on how much the user has. Cursor records mark the
+    points the export can be resumed from: pass the last one received as
+    `cursor` to continue an interrupted download.
+
+    Query parameters: user_id, cursor
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"status": "error", "error": "user_id is required"}), 400
+    try:
+        records = export_user(user_id, cursor=request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+    def generate():
+        yield header_record()
+        yield from records
+
+    return Response(gzip_ndjson(generate()), mimetype='application/gzip', headers={
+        'Content-Disposition': f"attachment; filename*=UTF-8''chats-{quote(user_id, safe='')}.ndjson.gz",
+        'X-Accel-Buffering': 'no',
+    })
+
+@transfer_bp.route("/import", methods=["POST"])
+def import_chats():
+    """
+    Import an archive from GET /export (gzip-compressed or plain NDJSON).
+
+    The body is read and written to Firestore in batches as it arrives.
+    Every record must belong to `user_id`. Documents keep their exported
+    IDs, so a failed import can be sent again.
+
+    Query parameters: user_id
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"status": "error", "error": "user_id is required"}), 400
+    importer = ChatImporter(user_id=user_id)
+    try:
+        stats = importer.import_records(read_records(request.stream))
+    except (ValueError, EOFError, OSError) as e:
+        # Batches committed before the error stay written
+        return jsonify({"status": "error", "error": str(e), "imported": importer.stats}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "error": f"Error importing chats: {str(e)}", "imported": importer.stats}), 500
+    return jsonify({"status": "success", "imported": stats})
@@ -0,0 +1,49 @@
+from flask import current_app, request
+from src.services.history_cache import get_history_cache, etag_for
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names the ETag (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(','))
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+def cached_json_response(kind, user_id, chat_id, params, load, datetime_format=None):
+    """
+    Serve a JSON page through the history cache, with ETag revalidation.
+
+    Args:
+        kind (str): The endpoint, e.g. "chat_history"
+        user_id (str): The ID of the user
+        chat_id (str): The chat the page belongs to, or None for a listing
+        params (tuple): Everything else the page depends on
+        load (callable): Returns (payload dict, HTTP status) from Firestore
+        datetime_format (str, optional): Overrides JSON_DATETIME_FORMAT; it
+            must be reflected in `params`, as the body is cached
+
+    Returns:
+        Response: The page, or an empty 304 if the client's copy is current
+    """
+    def load_body():
+        payload, status = load()
+        return current_app.json.dump_bytes(payload, datetime_format) + b'\n', status
+
+    cache = get_history_cache()
+    if cache is not None:
+        body, status, etag = cache.get_or_load(kind, user_id, chat_id, params, load_body)
+    else:
+        body, status = load_body()
+        etag = etag_for(body) if status == 200 else None
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, status=status, mimetype='application/json')
+    if etag:
+        response.headers['ETag'] = etag
+        # Clients may keep the page but must revalidate it before reuse
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
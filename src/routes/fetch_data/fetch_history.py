@@ -1,56 +1,125 @@
 from flask import Blueprint, jsonify, request
-from firebase_admin import firestore
-import traceback
-from datetime import datetime
+from src.services.firebase_services import (
+    get_firestore_client, get_chat_ref, get_chat_messages, firestore_call, firestore
+)
+from src.utils.request_utils import parse_limit, parse_format
+from src.routes.fetch_data.cached_response import cached_json_response
+from config import CHAT_HISTORY_DEFAULT_LIMIT, CHAT_HISTORY_MAX_LIMIT
 
 # Import the blueprint from wherever you've defined it
 from . import fetch_bp  # Adjust this path as needed
 
+# Chat document fields returned when listing chats (messages are paged separately)
+CHAT_SUMMARY_FIELDS = ['title', 'createdAt', 'last_updated', 'message_count']
+
+# Roles in the compact format
+ROLE_CODES = {'user': 'u', 'ai': 'a'}
+
+def compact_datetime_format(response_format):
+    """The datetime format a response format needs, or None for the app's default."""
+    return 'epoch_ms' if response_format == 'compact' else None
+
 @fetch_bp.route("/chat_history", methods=["GET"])
 def get_chat_history():
-    """Retrieve chat history for a user"""
+    """
+    Retrieve chat history for a user.
+
+    With `chat_id` (or the older `chat_title`), returns one page of that
+    chat's messages, oldest first. Pass the returned `next_before` as
+    `before` to load the previous page. Without it, returns one page of
+    the user's chats (metadata only), most recently updated first.
+
+    Pages are served from the history cache with an ETag; a request whose
+    If-None-Match still matches gets an empty 304. With format=compact,
+    timestamps are epoch milliseconds and roles are "u"/"a".
+
+    Query parameters: user_id, chat_id, limit, before, format
+    """
     user_id = request.args.get("user_id")
-    chat_title = request.args.get("chat_title")
+    chat_id = request.args.get("chat_id") or request.args.get("chat_title")
+    before = request.args.get("before")
     
     if not user_id:
         return jsonify({"status": "error", "error": "user_id is required"}), 400
+
+    try:
+        limit = parse_limit(request.args, CHAT_HISTORY_DEFAULT_LIMIT, CHAT_HISTORY_MAX_LIMIT)
+        response_format = parse_format(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
     
+    params = (limit, before, response_format)
+    datetime_format = compact_datetime_format(response_format)
     try:
-        db = firestore.client()
-        
-        if chat_title:
-            # Get a specific chat
-            chat_ref = db.collection('users').document(user_id) \
-                         .collection('chats').document(chat_title)
-            chat_doc = chat_ref.get()
-            
-            if not chat_doc.exists:
-                return jsonify({"status": "error", "error": "Chat not found"}), 404
-                
-            return jsonify({
-                "status": "success",
-                "chat": chat_doc.to_dict()
-            })
-        else:
-            # Get all chats for the user
-            chats_ref = db.collection('users').document(user_id) \
-                          .collection('chats')
-            chats = chats_ref.get()
-            
-            chat_list = []
-            for chat in chats:
-                chat_data = chat.to_dict()
-                chat_data['id'] = chat.id  # Add the document ID
-                chat_list.append(chat_data)
-                
-            return jsonify({
-                "status": "success",
-                "chats": chat_list
-            })
-            
+        if chat_id:
+            return cached_json_response(
+                'chat_history', user_id, chat_id, params,
+                lambda: _load_chat_page(user_id, chat_id, limit, before, compact=response_format == 'compact'),
+                datetime_format
+            )
+        return cached_json_response(
+            'chat_history', user_id, None, params,
+            lambda: _load_chat_list(user_id, limit, before),
+            datetime_format
+        )
     except Exception as e:
         return jsonify({
             "status": "error in fetch_history",
             "error": str(e)
         }), 500
 
+def _load_chat_page(user_id, chat_id, limit, before, compact=False):
+    """One page of a chat's messages, as (payload, status)."""
+    with firestore_call('chat_history', 'read'):
+        chat_doc = get_chat_ref(user_id, chat_id).get()
+
+    if not chat_doc.exists:
+        return {"status": "error", "error": "Chat not found"}, 404
+
+    chat_data = chat_doc.to_dict()
+    try:
+        messages, next_before = get_chat_messages(
+            user_id, chat_id, limit, before=before, chat_data=chat_data
+        )
+    except ValueError as e:
+        return {"status": "error", "error": str(e)}, 400
+    if compact:
+        for message in messages:
+            message['role'] = ROLE_CODES.get(message.get('role'), message.get('role'))
+
+    chat = {field: chat_data[field] for field in CHAT_SUMMARY_FIELDS + ['summary'] if field in chat_data}
+    chat['id'] = chat_id
+    chat['messages'] = messages
+    return {
+        "status": "success",
+        "chat": chat,
+        "next_before": next_before
+    }, 200
+
+def _load_chat_list(user_id, limit, before):
+    """One page of the user's chats, without their messages, as (payload, status)."""
+    db = get_firestore_client()
+    chats_ref = db.collection('users').document(user_id) \
+                  .collection('chats')
+    query = chats_ref.select(CHAT_SUMMARY_FIELDS) \
+                     .order_by('last_updated', direction=firestore.Query.DESCENDING)
+    if before:
+        with firestore_call('chat_history', 'read'):
+            cursor = chats_ref.document(before).get(field_paths=['last_updated'])
+        if not cursor.exists:
+            return {"status": "error", "error": "Invalid cursor: before"}, 400
+        query = query.start_after(cursor)
+    with firestore_call('chat_history', 'read'):
+        chats = list(query.limit(limit + 1).stream())
+
+    chat_list = []
+    for chat in chats[:limit]:
+        chat_data = chat.to_dict()
+        chat_data['id'] = chat.id  # Add the document ID
+        chat_list.append(chat_data)
+
+    return {
+        "status": "success",
+        "chats": chat_list,
+        "next_before": chat_list[-1]['id'] if len(chats) > limit else None
+    }, 200
@@ -1,47 +1,81 @@
 from flask import jsonify, request
-from firebase_admin import firestore
+from src.services.firebase_services import get_firestore_client, firestore_call, firestore
+from src.utils.request_utils import parse_limit, parse_format
+from src.routes.fetch_data.cached_response import cached_json_response
+from src.routes.fetch_data.fetch_history import compact_datetime_format
+from config import CHAT_TITLES_DEFAULT_LIMIT, CHAT_TITLES_MAX_LIMIT
 
 # Import the blueprint from wherever you've defined it
 from . import fetch_bp  # Adjust this path as needed
 
 @fetch_bp.route("/chat_titles", methods=["GET"])
 def get_chat_titles():
-    """Retrieve just the chat titles for a user"""
+    """
+    Retrieve just the chat titles for a user, newest first.
+
+    Query parameters: user_id, limit, before (the `next_before` of the
+    previous page), format. Served from the history cache with an ETag,
+    like /chat_history; format=compact gives epoch-millisecond timestamps.
+    """
     user_id = request.args.get("user_id")
+    before = request.args.get("before")
     
     if not user_id:
         return jsonify({"status": "error", "error": "user_id is required"}), 400
+
+    try:
+        limit = parse_limit(request.args, CHAT_TITLES_DEFAULT_LIMIT, CHAT_TITLES_MAX_LIMIT)
+        response_format = parse_format(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
     
     try:
-        db = firestore.client()
-        
-        # Query all chats for the user but only get minimal data
-        chats_ref = db.collection('users').document(user_id) \
-                      .collection('chats')
-        
-        # Get only the title and last_updated fields for efficiency
-        chats = chats_ref.get()
-        
-        chat_titles = []
-        for chat in chats:
-            chat_data = chat.to_dict()
-            # Only include the necessary fields for the drawer
-            chat_titles.append({
-                'id': chat.id,
-                'title': chat_data.get('title', 'Untitled Chat'),
-                'last_updated': chat_data.get('last_updated', None)
-            })
-                
-        # Sort by last_updated (newest first)
-        chat_titles.sort(key=lambda x: x.get('last_updated', 0), reverse=True)
-            
-        return jsonify({
-            "status": "success",
-            "chat_titles": chat_titles
-        })
-            
+        return cached_json_response(
+            'chat_titles', user_id, None, (limit, before, response_format),
+            lambda: _load_titles(user_id, limit, before),
+            compact_datetime_format(response_format)
+        )
     except Exception as e:
         return jsonify({
             "status": "error in response util",
             "error": str(e)
         }), 500
+
+def _load_titles(user_id, limit, before):
+    """One page of the user's chat titles, as (payload, status)."""
+    db = get_firestore_client()
+
+    # Query all chats for the user but only get minimal data
+    chats_ref = db.collection('users').document(user_id) \
+                  .collection('chats')
+
+    # Project only the title and last_updated fields, sorted and paged by Firestore.
+    # Chats without last_updated are skipped by order_by; run backfill-chat-titles once.
+    query = chats_ref.select(['title', 'last_updated']) \
+                     .order_by('last_updated', direction=firestore.Query.DESCENDING)
+    if before:
+        with firestore_call('chat_titles', 'read'):
+            cursor = chats_ref.document(before).get(field_paths=['last_updated'])
+        if not cursor.exists:
+            return {"status": "error", "error": "Invalid cursor: before"}, 400
+        query = query.start_after(cursor)
+
+    # Fetch one extra chat to know whether another page exists
+    with firestore_call('chat_titles', 'read'):
+        chats = list(query.limit(limit + 1).stream())
+
+    chat_titles = []
+    for chat in chats[:limit]:
+        chat_data = chat.to_dict()
+        # Only include the necessary fields for the drawer
+        chat_titles.append({
+            'id': chat.id,
+            'title': chat_data.get('title', 'Untitled Chat'),
+            'last_updated': chat_data.get('last_updated', None)
+        })
+
+    return {
+        "status": "success",
+        "chat_titles": chat_titles,
+        "next_before": chat_titles[-1]['id'] if len(chats) > limit else None
+    }, 200
@@ -1,4 +1,8 @@
 from flask import Blueprint, jsonify
+from src.services.genai_services import get_genai_client_status
+from src.services.model_router import get_model_router
+from src.services.admission_service import get_admission_controller
+from src.services.resilience import circuit_breaker_stats, hedge_budget
 
 # Create a blueprint for the health check
 health_bp = Blueprint('health', __name__)
@@ -7,8 +11,21 @@ health_bp = Blueprint('health', __name__)
 def health_check():
     """
     Health check endpoint to verify the service is running.
+
+    Also reports the state of the worker's shared GenAI client. The client
+    is built lazily, so "ready" is false until the first /ask request.
+    With model routing enabled, per-tier latency and token usage over the
+    router's sliding window are reported under "model_tiers".
     """
+    genai_status = get_genai_client_status()
+    router = get_model_router()
+    admission = get_admission_controller()
     return jsonify({
-        "status": "healthy",
-        "service": "legal-assistant-api"
+        "status": "healthy" if genai_status["healthy"] else "degraded",
+        "service": "legal-assistant-api",
+        "genai_client": genai_status,
+        "model_tiers": router.report() if router is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "circuit_breakers": circuit_breaker_stats(),
+        "hedged_requests": hedge_budget.stats()
     })
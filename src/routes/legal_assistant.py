@@ -1,20 +1,44 @@
 from flask import Blueprint, jsonify, request, Response, stream_with_context
-from src.services.genai_services import generate_legal_response
-from src.services.firebase_services import save_chat_to_firestore
+from src.services.genai_services import GENERATION_ERROR_PREFIX
+from src.services.chat_service import prepare_exchange, replay_cached_answer, complete_exchange
+from src.services.single_flight import stream_answer
+from src.services.sse_service import (
+    SSE_CONTENT_TYPE, SSE_HEADERS, wants_sse, parse_last_event_id, find_stream, start_stream, iter_sse
+)
+from src.services.admission_service import AdmissionRejected
+from src.routes.admission import admit, admission_rejected
 
 legal_bp = Blueprint('legal', __name__)
 
 @legal_bp.route("/ask", methods=["POST"])
 def ask_legal_question():
     try:
-        # Get the question from the request
-        data = request.get_json()
-        if not data or 'question' not in data:
-            return jsonify({"error": "Missing required field: question"}), 400
-            
-        question = data.get('question')
-        user_id = data.get('user_id', 'anonymous')
-        chat_title = "Static Chat Title 1"
+        # Get the question from the request; prepare_exchange rejects a missing
+        # or unparsable body with a 400
+        data = request.get_json(silent=True)
+        sse = wants_sse(request.headers.get('Accept'), data)
+        if sse:
+            # Resuming a buffered stream does no new work, so it skips admission
+            resumed = _resume_sse()
+            if resumed is not None:
+                return resumed
+
+        try:
+            permit = admit()
+        except AdmissionRejected as e:
+            return admission_rejected(e)
+
+        try:
+            exchange = prepare_exchange(data)
+        except ValueError as e:
+            permit.release()
+            return jsonify({"error": str(e)}), 400
+        except Exception:
+            permit.release()
+            raise
+
+        if sse:
+            return _sse_response(start_stream(exchange, on_finish=permit.release), chat_id=exchange['chat_id'])
         
         # Define the streaming response generator function
         def generate():
@@ -22,30 +46,67 @@ def ask_legal_question():
             complete_response = ""
             
             try:
-                # Use the streaming service to generate a response
-                for chunk in generate_legal_response(question):
+                if exchange['cached_answer'] is not None:
+                    chunks = replay_cached_answer(exchange['cached_answer'])
+                else:
+                    # Use the streaming service to generate a response; identical
+                    # questions already being answered share that model call
+                    chunks = stream_answer(exchange)
+                for chunk in chunks:
                     complete_response += chunk
                     yield chunk
-                    
-                # Save to Firebase after stream is complete
-                if user_id != 'anonymous':
-                    try:
-                        save_chat_to_firestore(user_id, chat_title, question, complete_response)
-                    except Exception as e:
-                        print(f"Warning: Failed to save chat to Firestore: {str(e)}")
+
+                complete_exchange(exchange, complete_response)
                         
             except Exception as e:
-                error_msg = f"Error generating response: {str(e)}"
+                # Shown to the client but never saved as part of the answer
+                error_msg = f"{GENERATION_ERROR_PREFIX} {str(e)}"
                 yield error_msg
         
-        # Return a streaming response
-        return Response(stream_with_context(generate()), content_type='text/plain')
+        # Return a streaming response; the slot is freed once it is closed,
+        # including when the client disconnects
+        # The chat ID is sent with the headers, before the first token, so
+        # clients can send follow-up questions to the same chat
+        response = Response(
+            stream_with_context(generate()), content_type='text/plain', headers={'X-Chat-Id': exchange['chat_id']}
+        )
+        response.call_on_close(permit.release)
+        return response
 
     except Exception as e:
         return jsonify({
             "error": str(e)
         }), 500
 
+def _sse_response(buffer, after=0, chat_id=None):
+    headers = dict(SSE_HEADERS, **{'X-Stream-Id': buffer.stream_id})
+    if chat_id:
+        headers['X-Chat-Id'] = chat_id
+    return Response(iter_sse(buffer, after), content_type=SSE_CONTENT_TYPE, headers=headers)
+
+def _resume_sse():
+    """
+    An SSE request carrying the Last-Event-ID of a stream that is still
+    buffered resumes it instead of asking the model again; None otherwise.
+    """
+    stream_id, after = parse_last_event_id(request.headers.get('Last-Event-ID'))
+    buffer = find_stream(stream_id)
+    if buffer is None:
+        return None
+    return _sse_response(buffer, after)
+
+@legal_bp.route("/ask/stream/<stream_id>", methods=["GET"])
+def resume_stream(stream_id):
+    """Resume an SSE answer after the event given in Last-Event-ID (or ?last_event_id=)."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_stream_id, after = parse_last_event_id(last_event_id)
+    buffer = find_stream(stream_id)
+    if buffer is None:
+        return jsonify({"error": "Stream not found or expired"}), 404
+    if last_stream_id not in (None, stream_id):
+        return jsonify({"error": "Last-Event-ID belongs to a different stream"}), 400
+    return _sse_response(buffer, after)
+
 # Non-streaming endpoint (commented out as streaming is now the standard)
 """
 @legal_bp.route("/ask_non_stream", methods=["POST"])
@@ -0,0 +1,16 @@
+from flask import Blueprint, Response
+from src.services.metrics import CONTENT_TYPE, render_metrics
+
+# Create a blueprint for the Prometheus scrape endpoint
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """
+    Prometheus text-format metrics.
+
+    Gunicorn workers share their metrics through METRICS_MULTIPROCESS_DIR,
+    so a scrape covers the whole instance whichever worker serves it.
+    With the directory unset, only that worker's metrics are reported.
+    """
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,56 @@
+from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from src.services.upload_service import store_upload, upload_config_error, UploadError
+from src.services.admission_service import AdmissionRejected
+from src.routes.admission import admit, admission_rejected
+from config import UPLOAD_MAX_BYTES
+
+upload_bp = Blueprint('upload', __name__)
+
+@upload_bp.route("/upload", methods=["POST"])
+def upload_file():
+    """
+    Upload a large document or image once and get a reference back.
+
+    Accepts either multipart/form-data with a "file" field or the raw file
+    as the request body (filename in the X-Filename header). The body is
+    streamed to a spooled temporary file in chunks rather than read into
+    memory, and the type is detected from the file's magic bytes.
+
+    The returned file object can be passed to /ask in the "files" list.
+    Uploads pass the same rate limits and concurrency gate as /ask, and
+    answer 503 when no upload backend is configured.
+    """
+    if upload_config_error():
+        return jsonify({"error": "File uploads are not available on this server"}), 503
+    # Reject oversized multipart bodies before werkzeug parses them
+    request.max_content_length = UPLOAD_MAX_BYTES + 64 * 1024
+
+    try:
+        permit = admit()
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+
+    try:
+        if request.mimetype == 'multipart/form-data':
+            uploaded = request.files.get('file')
+            if uploaded is None:
+                return jsonify({"error": "Missing required file field: file"}), 400
+            stream, filename = uploaded.stream, uploaded.filename
+        else:
+            stream, filename = request.stream, request.headers.get('X-Filename')
+
+        file_ref = store_upload(stream, filename)
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"File exceeds the {UPLOAD_MAX_BYTES} byte upload limit"}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"Error uploading file: {str(e)}"}), 500
+    finally:
+        permit.release()
+
+    return jsonify({
+        "status": "success",
+        "file": file_ref
+    })
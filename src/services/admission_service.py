@@ -0,0 +1,392 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    ADMISSION_ENABLED, ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT,
+    ADMISSION_RETRY_AFTER, ADMISSION_ASGI_MAX_CONCURRENT, ADMISSION_ASGI_MAX_QUEUE, WSGI_THREADS, RATE_LIMIT_BACKEND, RATE_LIMIT_REDIS_URL, RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_ANONYMOUS_RATE, RATE_LIMIT_ANONYMOUS_BURST,
+    RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST
+)
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_USER = 0
+PRIORITY_ANONYMOUS = 1
+
+
+class AdmissionRejected(Exception):
+    """A request turned away before any work was done, with the HTTP status and Retry-After to send."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def client_address(forwarded_for, remote_addr):
+    """
+    The caller's IP address for anonymous rate limiting.
+
+    Cloud Run's front end appends the address it saw to X-Forwarded-For,
+    so the last entry is the one a client cannot forge.
+    """
+    if forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+    return remote_addr or 'unknown'
+
+
+class MemoryRateLimitBackend:
+    """Token buckets held in this process; each instance limits on its own."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> (tokens, updated at), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """
+        Take one token from a bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# Atomic token bucket on a Redis hash, timed by the Redis clock so all instances agree
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by every instance through Redis (e.g. Memorystore)."""
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL, prefix="litigence:ratelimit:"):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    def take(self, key, rate, burst):
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst]))
+
+
+class RateLimiter:
+    """
+    Per-caller token buckets.
+
+    Every request takes a token from its IP's bucket. Authenticated users
+    also take one from their uid's bucket, everyone else from the stricter
+    anonymous bucket of their IP. A client cannot get a fresh bucket by
+    changing the user_id it sends, as that plays no part here.
+
+    If the backend fails, the request is let through; an unavailable
+    shared store must not take /ask down with it.
+    """
+
+    def __init__(self, backend, user_rate=RATE_LIMIT_USER_RATE, user_burst=RATE_LIMIT_USER_BURST,
+                 anonymous_rate=RATE_LIMIT_ANONYMOUS_RATE, anonymous_burst=RATE_LIMIT_ANONYMOUS_BURST,
+                 ip_rate=RATE_LIMIT_IP_RATE, ip_burst=RATE_LIMIT_IP_BURST):
+        self.backend = backend
+        self.user_limit = (user_rate, user_burst)
+        self.anonymous_limit = (anonymous_rate, anonymous_burst)
+        self.ip_limit = (ip_rate, ip_burst)
+
+    def buckets(self, identity, address):
+        """(key, rate, burst) of each bucket a request draws from."""
+        buckets = [(f"ip:{address}", *self.ip_limit)]
+        if identity:
+            buckets.append((f"user:{identity}", *self.user_limit))
+        else:
+            buckets.append((f"anon:{address}", *self.anonymous_limit))
+        return [bucket for bucket in buckets if bucket[1] > 0]
+
+    def check(self, identity, address):
+        """Raise AdmissionRejected (429) if any of the caller's buckets is empty."""
+        wait = 0.0
+        for key, rate, burst in self.buckets(identity, address):
+            try:
+                wait = max(wait, self.backend.take(key, rate, burst))
+            except Exception as e:
+                logger.warning("Rate limit check failed: %s", e)
+        if wait > 0:
+            raise AdmissionRejected("Too many requests", 429, wait)
+
+
+class _Waiter:
+    """A request queued at the gate, woken from whichever thread frees a slot."""
+
+    def __init__(self, loop=None):
+        self.admitted = False
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+
+    def wake(self, admitted):
+        self.admitted = admitted
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class Permit:
+    """A slot at the gate; release() is idempotent."""
+
+    def __init__(self, gate):
+        self._gate = gate
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if self._gate is not None:
+            self._gate.release()
+
+
+class ConcurrencyGate:
+    """
+    Caps the /ask requests a worker answers at once.
+
+    Requests beyond `max_concurrent` wait in a priority queue of at most
+    `max_queue` entries, for up to `max_wait` seconds. Authenticated users
+    are admitted before anonymous callers, and when the queue is full an
+    authenticated user takes the place of the newest anonymous waiter.
+    Everything else is rejected immediately with 503.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait=ADMISSION_MAX_WAIT, retry_after=ADMISSION_RETRY_AFTER):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        # (priority, arrival, waiter)
+        self._queue = []
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enter(self, priority, loop=None):
+        """Take a free slot or join the queue (lock held); returns the waiter or None."""
+        if self.active < self.max_concurrent and not self._queue:
+            self.active += 1
+            return None
+        if len(self._queue) >= self.max_queue:
+            displaced = max(self._queue, default=None)
+            if displaced is None or displaced[0] <= priority:
+                self.rejected += 1
+                raise AdmissionRejected("Server is busy", 503, self.retry_after)
+            self._queue.remove(displaced)
+            heapq.heapify(self._queue)
+            self.rejected += 1
+            displaced[2].wake(False)
+        waiter = _Waiter(loop)
+        heapq.heappush(self._queue, (priority, next(self._arrivals), waiter))
+        return waiter
+
+    def _leave(self, waiter):
+        """Settle a waiter whose wait ended (lock held); True if it holds a slot."""
+        if waiter.admitted:
+            return True
+        for index, entry in enumerate(self._queue):
+            if entry[2] is waiter:
+                self._queue.pop(index)
+                heapq.heapify(self._queue)
+                self.rejected += 1
+                break
+        return False
+
+    def acquire(self, priority):
+        """
+        Wait for a slot.
+
+        Raises:
+            AdmissionRejected: 503 if the queue is full or the wait timed out
+        """
+        with self._lock:
+            waiter = self._enter(priority)
+        if waiter is None:
+            return Permit(self)
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if self._leave(waiter):
+                return Permit(self)
+        raise AdmissionRejected("Server is busy", 503, self.retry_after)
+
+    async def acquire_async(self, priority):
+        """acquire() for the ASGI server; waiting holds no thread."""
+        with self._lock:
+            waiter = self._enter(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return Permit(self)
+        try:
+            await asyncio.wait_for(waiter.event.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # The client went away while waiting; give back a slot handed over meanwhile
+            with self._lock:
+                admitted = self._leave(waiter)
+            if admitted:
+                self.release()
+            raise
+        with self._lock:
+            admitted = self._leave(waiter)
+        if admitted:
+            return Permit(self)
+        raise AdmissionRejected("Server is busy", 503, self.retry_after)
+
+    def release(self):
+        """Hand the slot to the best waiter, or free it."""
+        with self._lock:
+            if self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                waiter.wake(True)
+            else:
+                self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'queued': len(self._queue), 'rejected': self.rejected}
+
+
+class AdmissionController:
+    """
+    Rate limit, then gate: every /ask request passes both before any work is done.
+
+    Each serving mode has its own gate. Under gunicorn's threads a stream
+    holds a thread, so `gate` is sized to the thread pool. In ASGI mode
+    (`admit_async`) streams are tasks, so `async_gate` allows far more.
+    """
+
+    def __init__(self, limiter, gate, async_gate=None):
+        self.limiter = limiter
+        self.gate = gate
+        self.async_gate = async_gate or gate
+
+    @staticmethod
+    def _priority(identity):
+        return PRIORITY_USER if identity else PRIORITY_ANONYMOUS
+
+    def admit(self, identity, address):
+        self.limiter.check(identity, address)
+        return self.gate.acquire(self._priority(identity))
+
+    async def admit_async(self, identity, address):
+        if isinstance(self.limiter.backend, MemoryRateLimitBackend):
+            self.limiter.check(identity, address)
+        else:
+            await asyncio.to_thread(self.limiter.check, identity, address)
+        return await self.async_gate.acquire_async(self._priority(identity))
+
+    def stats(self):
+        """Gate statistics by serving mode."""
+        return {'wsgi': self.gate.stats(), 'asgi': self.async_gate.stats()}
+
+
+def create_rate_limit_backend():
+    if RATE_LIMIT_BACKEND == 'redis':
+        return RedisRateLimitBackend()
+    return MemoryRateLimitBackend()
+
+def create_wsgi_gate():
+    """
+    The gate for the threaded server. Queued requests hold a thread too, so
+    the queue is kept below the threads left over by the /ask slots, and
+    /chat_history and the other routes always have a thread.
+    """
+    if ADMISSION_MAX_CONCURRENT >= WSGI_THREADS:
+        logger.warning("ADMISSION_MAX_CONCURRENT (%d) leaves none of the %d WSGI threads for other routes",
+                       ADMISSION_MAX_CONCURRENT, WSGI_THREADS)
+    max_queue = min(ADMISSION_MAX_QUEUE, max(0, WSGI_THREADS - ADMISSION_MAX_CONCURRENT - 1))
+    if max_queue < ADMISSION_MAX_QUEUE:
+        logger.warning("ADMISSION_MAX_QUEUE lowered from %d to %d to keep WSGI threads free",
+                       ADMISSION_MAX_QUEUE, max_queue)
+    return ConcurrencyGate(ADMISSION_MAX_CONCURRENT, max_queue)
+
+def create_asgi_gate():
+    return ConcurrencyGate(ADMISSION_ASGI_MAX_CONCURRENT, ADMISSION_ASGI_MAX_QUEUE)
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller():
+    """Return the process-wide admission controller, or None if admission control is disabled."""
+    global _controller
+    if not ADMISSION_ENABLED:
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(
+                    RateLimiter(create_rate_limit_backend()), create_wsgi_gate(), create_asgi_gate()
+                )
+    return _controller
+
+def admit_request(identity, address):
+    """
+    Admit an /ask request, waiting for a slot if needed.
+
+    Args:
+        identity (str): The authenticated uid (see auth_service), or None;
+            never the user_id of the request body
+        address (str): The client's IP address, from client_address()
+
+    Returns:
+        Permit: Must be released when the answer has been produced
+
+    Raises:
+        AdmissionRejected: With status 429 or 503 and a Retry-After
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        return Permit(None)
+    return controller.admit(identity, address)
+
+async def admit_request_async(identity, address):
+    """Async version of admit_request() for the ASGI server."""
+    controller = get_admission_controller()
+    if controller is None:
+        return Permit(None)
+    return await controller.admit_async(identity, address)
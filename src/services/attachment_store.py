@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from config import (
+    ATTACHMENT_CACHE_ENABLED, ATTACHMENT_CACHE_MEMORY_BYTES,
+    ATTACHMENT_CACHE_DISK_BYTES, ATTACHMENT_CACHE_DIR
+)
+from src.services.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+_SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AttachmentNotFound(ValueError):
+    """Raised when a client refers to an attachment hash the store does not have."""
+
+
+def content_hash(data):
+    """SHA-256 hex digest identifying an attachment's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def is_content_hash(value):
+    return isinstance(value, str) and bool(_SHA256_HEX.match(value))
+
+
+class AttachmentStore:
+    """
+    Content-addressed store of decoded attachments.
+
+    Entries are keyed by the SHA-256 of their bytes and hold the bytes, the
+    detected MIME type and, once the file has been uploaded, its storage
+    URI (the "handle"). A handle lets the model read the file from storage
+    instead of the bytes being sent inline again.
+
+    Clients that have sent a file once can refer to it by its hash.
+
+    The memory tier is an LRU bounded by total bytes. The disk tier keeps
+    each entry as a data file plus a small JSON metadata file, also
+    bounded by total bytes and evicted least-recently-used first. Entries
+    that only have a handle cost no data bytes.
+    """
+
+    def __init__(self, memory_max_bytes=ATTACHMENT_CACHE_MEMORY_BYTES,
+                 disk_max_bytes=ATTACHMENT_CACHE_DISK_BYTES, directory=ATTACHMENT_CACHE_DIR):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.directory = directory if disk_max_bytes > 0 else None
+
+        # hash -> {'data', 'mime_type', 'file_uri', 'size'}, in LRU order
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # hash -> bytes used on disk, in LRU order
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    def put(self, data, mime_type, file_uri=None):
+        """
+        Add an attachment, or refresh it if it is already stored.
+
+        Args:
+            data (bytes): The decoded file contents
+            mime_type (str): The MIME type sniffed from the contents
+            file_uri (str, optional): Storage URI the file was uploaded to
+
+        Returns:
+            tuple: (content hash, stored entry). The entry carries the
+            handle of an earlier upload of the same content, if any.
+        """
+        digest = content_hash(data)
+        existing = self._lookup(digest)
+        if existing is not None and existing['data'] is not None:
+            with self._lock:
+                new_handle = bool(file_uri and not existing['file_uri'])
+                if new_handle:
+                    existing['file_uri'] = file_uri
+                self._add_to_memory(digest, existing)
+            if new_handle:
+                self._write_disk_entry(digest, existing, write_data=False)
+            return digest, existing
+
+        entry = {
+            'data': data,
+            'mime_type': mime_type,
+            'file_uri': file_uri or (existing and existing['file_uri']),
+            'size': len(data),
+        }
+        with self._lock:
+            self._add_to_memory(digest, entry)
+        self._write_disk_entry(digest, entry, write_data=True)
+        return digest, entry
+
+    def put_handle(self, digest, mime_type, size, file_uri):
+        """Record that content with this hash was uploaded, without keeping its bytes."""
+        entry = self._lookup(digest)
+        with self._lock:
+            if entry is None:
+                entry = {'data': None, 'mime_type': mime_type, 'file_uri': file_uri, 'size': size}
+                changed = True
+            else:
+                changed = not entry['file_uri']
+                if changed:
+                    entry['file_uri'] = file_uri
+            self._add_to_memory(digest, entry)
+        if changed:
+            self._write_disk_entry(digest, entry, write_data=False)
+
+    def get(self, digest):
+        """
+        Look up an attachment by hash.
+
+        Returns:
+            dict: The entry (data, mime_type, file_uri, size), or None
+        """
+        with self._lock:
+            entry = self._memory.get(digest)
+            if entry is not None:
+                self._memory.move_to_end(digest)
+                self.hits['memory'] += 1
+                CACHE_LOOKUPS.labels(cache='attachment', result='memory_hit').inc()
+                return entry
+        entry = self._read_disk_entry(digest)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels(cache='attachment', result='miss').inc()
+                return None
+            self.hits['disk'] += 1
+            CACHE_LOOKUPS.labels(cache='attachment', result='disk_hit').inc()
+            self._add_to_memory(digest, entry)
+            return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+            }
+
+    def _lookup(self, digest):
+        """The entry from memory, else from disk, without counting a lookup."""
+        with self._lock:
+            entry = self._memory.get(digest)
+        return entry if entry is not None else self._read_disk_entry(digest)
+
+    # Memory tier (lock held)
+
+    def _add_to_memory(self, digest, entry):
+        cost = len(entry['data'] or b'')
+        if cost > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(digest, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous['data'] or b'')
+        self._memory[digest] = entry
+        self._memory_bytes += cost
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted['data'] or b'')
+
+    # Disk tier. Files are read and written without the lock, which only
+    # guards the index; writes are atomic renames, so a reader sees either
+    # the old file or the new one, and a file evicted under a reader turns
+    # into a miss.
+
+    def _paths(self, digest):
+        base = os.path.join(self.directory, digest[:2], digest)
+        return base, base + '.json'
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU from the files left by earlier processes."""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json') or not is_content_hash(name[:-5]):
+                    continue
+                digest = name[:-5]
+                found.append((os.path.getmtime(os.path.join(root, name)), digest, self._disk_usage(digest)))
+        for _, digest, used in sorted(found):
+            self._disk[digest] = used
+            self._disk_bytes += used
+        self._remove_files(self._evict_disk())
+
+    def _disk_usage(self, digest):
+        used = 0
+        for path in self._paths(digest):
+            if os.path.exists(path):
+                used += os.path.getsize(path)
+        return used
+
+    def _write_disk_entry(self, digest, entry, write_data):
+        if not self.directory:
+            return
+        data_path, meta_path = self._paths(digest)
+        if entry['data'] is not None and entry['size'] > self.disk_max_bytes:
+            return
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            if write_data and entry['data'] is not None:
+                _atomic_write(data_path, entry['data'])
+            meta = {'mime_type': entry['mime_type'], 'file_uri': entry['file_uri'], 'size': entry['size']}
+            _atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+            used = self._disk_usage(digest)
+        except OSError as e:
+            logger.warning("Failed to write attachment %s to disk: %s", digest, e)
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(digest, 0)
+            self._disk[digest] = used
+            self._disk_bytes += used
+            evicted = self._evict_disk()
+        self._remove_files(evicted)
+
+    def _read_disk_entry(self, digest):
+        if not self.directory:
+            return None
+        with self._lock:
+            if digest not in self._disk:
+                return None
+        data_path, meta_path = self._paths(digest)
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = json.loads(f.read())
+            data = None
+            if os.path.exists(data_path):
+                with open(data_path, 'rb') as f:
+                    data = f.read()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            meta, data = None, None
+
+        with self._lock:
+            if meta is None or (data is None and not meta.get('file_uri')):
+                self._disk_bytes -= self._disk.pop(digest, 0)
+                stale = True
+            else:
+                if digest in self._disk:
+                    self._disk.move_to_end(digest)
+                stale = False
+        if stale:
+            self._remove_files([digest])
+            return None
+        return {'data': data, 'mime_type': meta['mime_type'], 'file_uri': meta.get('file_uri'),
+                'size': meta['size']}
+
+    def _evict_disk(self):
+        """Drop the least recently used entries from the index; returns their hashes (lock held)."""
+        evicted = []
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            digest, used = self._disk.popitem(last=False)
+            self._disk_bytes -= used
+            evicted.append(digest)
+        return evicted
+
+    def _remove_files(self, digests):
+        for digest in digests:
+            for path in self._paths(digest):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _atomic_write(path, data):
+    """Write via a temp file and rename so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_attachment_store():
+    """
+    Return the process-wide attachment store.
+
+    Returns:
+        AttachmentStore: The store, or None when it is disabled
+    """
+    global _store
+    if not ATTACHMENT_CACHE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AttachmentStore()
+    return _store
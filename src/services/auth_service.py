@@ -0,0 +1,69 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import FIRESTORE_BACKEND
+from src.services.firebase_services import initialize_firebase
+from src.utils.lazy_import import lazy_import
+
+logger = logging.getLogger(__name__)
+
+firebase_auth = lazy_import('firebase_admin.auth')
+
+# Verified tokens remembered until they expire, so a stream of requests pays for one check
+MAX_CACHED_TOKENS = 10000
+
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+def bearer_token(authorization):
+    """The token of an `Authorization: Bearer <token>` header, or None."""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+def verified_user_id(authorization):
+    """
+    The user a request is authenticated as, from a Firebase ID token.
+
+    The `user_id` in an /ask body is whatever the client sends, so only
+    this identity may be trusted for rate limiting and priority.
+
+    Args:
+        authorization (str): The Authorization header, if any
+
+    Returns:
+        str: The Firebase uid, or None if the header is missing or the
+        token does not verify (always None with FIRESTORE_BACKEND=memory,
+        which has no Firebase project to verify against)
+    """
+    token = bearer_token(authorization)
+    if token is None or FIRESTORE_BACKEND == 'memory':
+        return None
+
+    now = time.time()
+    with _verified_lock:
+        cached = _verified.get(token)
+        if cached is not None:
+            uid, expires_at = cached
+            if expires_at > now:
+                _verified.move_to_end(token)
+                return uid
+            del _verified[token]
+
+    if not initialize_firebase():
+        return None
+    try:
+        claims = firebase_auth.verify_id_token(token)
+    except Exception as e:
+        logger.info("Rejected ID token: %s", type(e).__name__)
+        return None
+
+    uid = claims['uid']
+    with _verified_lock:
+        _verified[token] = (uid, claims.get('exp', now))
+        while len(_verified) > MAX_CACHED_TOKENS:
+            _verified.popitem(last=False)
+    return uid
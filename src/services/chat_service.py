@@ -0,0 +1,222 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from src.services.genai_services import summarize_conversation
+from src.services.firebase_services import (
+    save_chat_to_firestore, get_chat_document, save_chat_summary, build_exchange_messages
+)
+from src.services.chat_writer import get_chat_writer
+from src.services.title_service import stub_title, request_chat_title
+from src.services.history_service import build_history_contents, pending_summary_messages
+from src.services.media_service import process_image, process_document
+from src.services.upload_service import resolve_file_reference
+from src.services.document_service import retrieve_document_context
+from src.services.statute_index import get_statute_index, answer_section_lookup
+from src.services.response_cache import get_response_cache
+from config import RESPONSE_CACHE_REPLAY_CHUNK
+
+logger = logging.getLogger(__name__)
+
+# Summaries call the model, so they run off the request thread
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+# Firestore document IDs are at most 1,500 bytes; client IDs are kept far shorter
+MAX_CHAT_ID_LENGTH = 128
+
+def new_chat_id():
+    """A fresh, unguessable chat document ID."""
+    return uuid.uuid4().hex
+
+def _resolve_chat_id(data):
+    """
+    The chat an /ask payload belongs to, and whether the ID was generated here.
+
+    Clients start a chat by omitting `chat_id` and continue it with the ID
+    returned in the X-Chat-Id header of the first answer.
+
+    Raises:
+        ValueError: If the supplied chat_id cannot be a Firestore document ID
+    """
+    chat_id = data.get('chat_id')
+    if chat_id is None or chat_id == '':
+        return new_chat_id(), True
+    if (not isinstance(chat_id, str) or len(chat_id) > MAX_CHAT_ID_LENGTH
+            or not chat_id.isascii() or not chat_id.isprintable()
+            or '/' in chat_id or chat_id in ('.', '..')
+            or (chat_id.startswith('__') and chat_id.endswith('__'))):
+        raise ValueError("Invalid chat_id")
+    return chat_id, False
+
+def prepare_exchange(data):
+    """
+    Validate an /ask payload and load everything needed to answer it.
+
+    Shared by the Flask route and the ASGI entry point so both serving
+    modes behave the same. Blocking I/O (Firestore, embeddings) happens
+    here, before the response starts streaming.
+
+    Args:
+        data (dict): The parsed JSON request body
+
+    Returns:
+        dict: The exchange (question, user, chat, history, attachments,
+        document excerpts, statutes and any cached or looked-up answer)
+
+    Raises:
+        ValueError: If the payload is invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    if 'question' not in data:
+        raise ValueError("Missing required field: question")
+    question = data['question']
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("question must be a non-empty string")
+    user_id = data.get('user_id', 'anonymous')
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError("user_id must be a non-empty string")
+    for field in ('images', 'documents', 'files'):
+        if not isinstance(data.get(field, []), list):
+            raise ValueError(f"{field} must be a list")
+
+    asked_at = datetime.now(timezone.utc)
+    chat_id, is_new_chat = _resolve_chat_id(data)
+
+    # Load earlier turns of the chat so follow-up questions have context
+    chat = None
+    if user_id != 'anonymous' and not is_new_chat:
+        # A chat_id from the client is never treated as new: its first
+        # exchange may still be queued by another worker
+        try:
+            chat = get_chat_document(user_id, chat_id)
+        except Exception as e:
+            logger.warning("Failed to load chat history: %s", e)
+        chat = _with_pending_messages(user_id, chat_id, chat)
+    history = build_history_contents(chat)
+    # New chats are saved with the start of the question as their title until
+    # the title job names them; the model is never asked on the request path
+    chat_title = stub_title(question) if is_new_chat else None
+
+    # Decode attached media up front so bad input is reported as a 400
+    attachments = [process_image(img) for img in data.get('images', [])]
+    attachments += [process_document(doc) for doc in data.get('documents', [])]
+    # Large files are uploaded separately through /upload and referenced here
+    attachments += [resolve_file_reference(ref) for ref in data.get('files', [])]
+
+    # Large documents are indexed for the chat; only their relevant chunks are sent
+    try:
+        attachments, excerpts = retrieve_document_context(
+            user_id, chat_id, question, attachments, chat_documents=(chat or {}).get('documents')
+        )
+    except Exception as e:
+        logger.warning("Document retrieval failed: %s", e)
+        excerpts = []
+
+    # "Section 302 IPC"-style lookups are answered from the statute index without the model
+    statute_index = get_statute_index()
+    cached_answer, question_embedding = None, None
+    if statute_index is not None and not attachments and not excerpts:
+        cached_answer = answer_section_lookup(statute_index, question)
+
+    # Only single-turn, attachment-free questions can be answered from the cache
+    response_cache = None
+    if cached_answer is None and not history and not attachments and not excerpts:
+        response_cache = get_response_cache()
+    if response_cache is not None:
+        cached_answer, question_embedding = response_cache.lookup(question)
+
+    # Ground citations in the text of the most relevant sections
+    statutes = []
+    if statute_index is not None and cached_answer is None:
+        try:
+            statutes = statute_index.search(question, query_vector=question_embedding)
+        except Exception as e:
+            logger.warning("Statute search failed: %s", e)
+
+    return {
+        'question': question,
+        'asked_at': asked_at,
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'chat_title': chat_title,
+        'chat': chat,
+        'is_new_chat': is_new_chat,
+        'history': history,
+        'attachments': attachments,
+        'excerpts': excerpts,
+        'statutes': statutes,
+        'response_cache': response_cache,
+        'cached_answer': cached_answer,
+        'question_embedding': question_embedding,
+    }
+
+def _with_pending_messages(user_id, chat_id, chat):
+    """Add exchanges still queued in the write-behind writer to a loaded chat."""
+    writer = get_chat_writer()
+    pending = writer.pending_messages(user_id, chat_id) if writer else []
+    if not pending:
+        return chat
+    chat = dict(chat or {})
+    messages = list(chat.get('messages') or [])
+    # A batch committed between our read and this check shows up in both
+    seen = {(m.get('role'), m.get('message'), m.get('timestamp')) for m in messages}
+    messages += [m for m in pending if (m['role'], m['message'], m['timestamp']) not in seen]
+    chat['messages'] = messages
+    return chat
+
+def replay_cached_answer(answer):
+    """Yield a cached answer in chunks, like a live stream."""
+    for start in range(0, len(answer), RESPONSE_CACHE_REPLAY_CHUNK):
+        yield answer[start:start + RESPONSE_CACHE_REPLAY_CHUNK]
+
+def complete_exchange(exchange, answer):
+    """
+    Cache and queue an answered exchange for persistence once the stream ends.
+
+    Only complete answers get here: a failed generation raises
+    GenerationError, so error text is never cached or saved.
+
+    Args:
+        exchange (dict): The exchange returned by prepare_exchange
+        answer (str): The complete response text sent to the client
+    """
+    response_cache = exchange['response_cache']
+    if response_cache is not None and exchange['cached_answer'] is None:
+        response_cache.store(exchange['question'], answer, exchange['question_embedding'])
+
+    if exchange['user_id'] == 'anonymous':
+        return
+
+    # Queue the exchange for the background writer so the request thread
+    # is released as soon as the stream ends
+    writer = get_chat_writer()
+    if writer is not None:
+        writer.enqueue(
+            exchange['user_id'], exchange['chat_id'], exchange['chat_title'],
+            exchange['question'], answer,
+            asked_at=exchange['asked_at'], is_new_chat=exchange['is_new_chat']
+        )
+    else:
+        saved = save_chat_to_firestore(
+            exchange['user_id'], exchange['chat_id'], exchange['question'], answer,
+            asked_at=exchange['asked_at'], is_new_chat=exchange['is_new_chat'],
+            chat_title=exchange['chat_title']
+        )
+        if saved and exchange['is_new_chat']:
+            request_chat_title(exchange['user_id'], exchange['chat_id'], exchange['question'], answer)
+    _summary_executor.submit(_refresh_chat_summary, exchange, answer)
+
+def _refresh_chat_summary(exchange, answer):
+    """Fold turns that have left the history window into the cached summary."""
+    updated_chat = dict(exchange['chat'] or {})
+    updated_chat['messages'] = list(updated_chat.get('messages') or []) + \
+        build_exchange_messages(exchange['question'], answer, exchange['asked_at'])
+    pending, summarized_until = pending_summary_messages(updated_chat)
+    if not pending:
+        return
+    try:
+        summary = summarize_conversation(updated_chat.get('summary'), pending)
+        save_chat_summary(exchange['user_id'], exchange['chat_id'], summary, summarized_until)
+    except Exception as e:
+        logger.warning("Failed to update chat summary: %s", e)
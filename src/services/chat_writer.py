@@ -0,0 +1,269 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    CHAT_WRITER_ENABLED, CHAT_WRITER_BATCH_SIZE, CHAT_WRITER_FLUSH_INTERVAL,
+    CHAT_WRITER_MAX_RETRIES, CHAT_WRITER_RETRY_BASE_DELAY, CHAT_WRITER_MAX_QUEUE
+)
+from src.services.firebase_services import (
+    get_firestore_client, build_exchange_messages, add_chat_messages_to_batch, batch_committed, firestore_call
+)
+from src.services.history_cache import invalidate_history
+from src.services.title_service import request_chat_title, stop_title_generator
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+
+class ChatWriter:
+    """
+    Write-behind queue for chat exchanges.
+
+    Exchanges are queued by the request thread and written by a background
+    thread. Exchanges for the same chat are coalesced into a single write,
+    and writes are committed together in a Firestore batch once
+    `batch_size` exchanges are pending or the oldest one has waited
+    `flush_interval` seconds. Failed batches are retried with jittered
+    exponential backoff, once it is clear the failed commit did not land.
+    stop() drains everything still queued.
+    """
+
+    def __init__(self, db_factory=get_firestore_client, batch_size=CHAT_WRITER_BATCH_SIZE,
+                 flush_interval=CHAT_WRITER_FLUSH_INTERVAL, max_retries=CHAT_WRITER_MAX_RETRIES,
+                 retry_base_delay=CHAT_WRITER_RETRY_BASE_DELAY, max_queue=CHAT_WRITER_MAX_QUEUE):
+        self._db_factory = db_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.max_queue = max_queue
+
+        # (user_id, chat_id) -> {'title', 'is_new_chat', 'messages'}, oldest chat first
+        self._pending = OrderedDict()
+        # Chats taken by the writer but not yet committed
+        self._inflight = {}
+        self._pending_count = 0
+        self._oldest_at = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'retries': 0, 'dropped': 0}
+
+    def start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, user_id, chat_id, chat_title, user_message, ai_response,
+                asked_at=None, is_new_chat=False):
+        """
+        Queue an exchange for writing.
+
+        Args:
+            user_id (str): The ID of the user
+            chat_id (str): The ID of the chat document
+            chat_title (str): The provisional title of a new chat, or None
+            user_message (str): The message sent by the user
+            ai_response (str): The response generated by the AI
+            asked_at (datetime, optional): When the question was received
+            is_new_chat (bool): Whether the server created the chat with this exchange
+
+        Returns:
+            bool: False if the queue is full and the exchange was dropped
+        """
+        messages = build_exchange_messages(user_message, ai_response, asked_at)
+        with self._condition:
+            if self._pending_count >= self.max_queue:
+                self.stats['dropped'] += 1
+                logger.warning("Chat write queue full, dropping exchange for chat %s", chat_id)
+                return False
+
+            key = (user_id, chat_id)
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'title': chat_title, 'is_new_chat': False, 'messages': []}
+            entry['title'] = entry['title'] or chat_title
+            entry['is_new_chat'] = entry['is_new_chat'] or is_new_chat
+            entry['messages'].extend(messages)
+
+            self._pending_count += 1
+            self.stats['queued'] += 1
+            if self._oldest_at is None:
+                # Wake the writer so it starts the flush timer
+                self._oldest_at = time.monotonic()
+                self._condition.notify()
+            elif self._pending_count >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def pending_messages(self, user_id, chat_id):
+        """Messages queued for a chat but not yet written, oldest first."""
+        key = (user_id, chat_id)
+        with self._condition:
+            messages = list(self._inflight.get(key, []))
+            entry = self._pending.get(key)
+            if entry:
+                messages.extend(entry['messages'])
+            return messages
+
+    def queue_depth(self):
+        """Exchanges queued but not yet taken for writing."""
+        with self._condition:
+            return self._pending_count
+
+    def flush(self):
+        """Write everything currently queued, blocking until done."""
+        while True:
+            with self._condition:
+                chats = self._take_batch()
+            if not chats:
+                return
+            self._write(chats)
+
+    def stop(self, timeout=10):
+        """Stop the background thread after draining the queue."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        # Anything left (e.g. the thread never started) is written here
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._should_flush():
+                    if self._stopping and not self._pending:
+                        return
+                    self._condition.wait(self._time_to_flush())
+                chats = self._take_batch()
+            if chats:
+                self._write(chats)
+
+    def _should_flush(self):
+        """Check the size/time triggers (lock held)."""
+        if not self._pending:
+            return False
+        if self._stopping or self._pending_count >= self.batch_size:
+            return True
+        return time.monotonic() - self._oldest_at >= self.flush_interval
+
+    def _time_to_flush(self):
+        if self._oldest_at is None:
+            return None if not self._stopping else 0.1
+        return max(0.0, self.flush_interval - (time.monotonic() - self._oldest_at))
+
+    def _take_batch(self):
+        """Remove up to one Firestore batch worth of chats from the queue (lock held)."""
+        chats = []
+        writes = 0
+        while self._pending:
+            key, entry = next(iter(self._pending.items()))
+            # One write for the chat document plus one per message
+            entry_writes = 1 + len(entry['messages'])
+            if chats and writes + entry_writes > FIRESTORE_MAX_BATCH_WRITES:
+                break
+            writes += entry_writes
+            self._pending.popitem(last=False)
+            chats.append((key, entry))
+            self._inflight[key] = self._inflight.get(key, []) + entry['messages']
+            self._pending_count -= len(entry['messages']) // 2
+        self._oldest_at = time.monotonic() if self._pending else None
+        return chats
+
+    def _write(self, chats):
+        """Commit one batch, retrying with backoff, then queue new chats for titling."""
+        try:
+            written = self._commit_with_retries(chats)
+            if written:
+                # Only once saved, so the generated title lands after the provisional one
+                for (user_id, chat_id), entry in chats:
+                    if entry['is_new_chat']:
+                        question, answer = entry['messages'][:2]
+                        request_chat_title(user_id, chat_id, question['message'], answer['message'])
+            return written
+        finally:
+            with self._condition:
+                for key, _ in chats:
+                    self._inflight.pop(key, None)
+
+    def _commit_with_retries(self, chats):
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                # A failed commit may still have been applied; committing it
+                # again would increment message_count twice
+                (user_id, chat_id), entry = chats[0]
+                if attempt == 0 or not batch_committed(user_id, chat_id, entry['messages']):
+                    db = self._db_factory()
+                    batch = db.batch()
+                    for (user_id, chat_id), entry in chats:
+                        add_chat_messages_to_batch(
+                            batch, user_id, chat_id, entry['title'], entry['messages'], entry['is_new_chat']
+                        )
+                    with firestore_call('chat_writer', 'write'):
+                        batch.commit()
+                for (user_id, chat_id), _ in chats:
+                    invalidate_history(user_id, chat_id)
+                exchanges = sum(len(entry['messages']) // 2 for _, entry in chats)
+                with self._condition:
+                    self.stats['written'] += exchanges
+                    self.stats['batches'] += 1
+                return True
+            except Exception as e:
+                last_error = e
+                if attempt == self.max_retries:
+                    break
+                delay = self.retry_base_delay * (2 ** attempt)
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                logger.warning("Chat batch write failed (attempt %d), retrying in %.2fs: %s", attempt + 1, delay, e)
+                with self._condition:
+                    self.stats['retries'] += 1
+                time.sleep(delay)
+
+        with self._condition:
+            self.stats['dropped'] += sum(len(entry['messages']) // 2 for _, entry in chats)
+        logger.error("Error saving chat batch to Firestore after %d attempts: %s", self.max_retries + 1, last_error)
+        return False
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_chat_writer():
+    """
+    Return the process-wide chat writer, starting it on first use.
+
+    Returns:
+        ChatWriter: The writer, or None when write-behind is disabled
+    """
+    global _writer
+    if not CHAT_WRITER_ENABLED:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ChatWriter()
+                _writer.start()
+                # Drain queued exchanges when the worker shuts down
+                atexit.register(_shutdown)
+    return _writer
+
+def _shutdown():
+    """
+    Drain the writer, then the title generator.
+
+    The generator is created after the writer, so its own exit hook runs
+    first; stopping it again titles the chats the final flush queued.
+    """
+    _writer.stop()
+    stop_title_generator()
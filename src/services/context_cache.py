@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from config import (
+    CONTEXT_CACHE_BACKEND, CONTEXT_CACHE_TTL, CONTEXT_CACHE_REFRESH_MARGIN,
+    CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_RETRY_AFTER, CONTEXT_CACHE_MAX_ENTRIES,
+    CONTEXT_CACHE_MEDIA_BYTES_PER_TOKEN
+)
+from src.services.history_service import estimate_tokens
+from src.services.metrics import CACHE_LOOKUPS
+from src.utils.lazy_import import lazy_import
+
+types = lazy_import('google.genai.types')
+
+logger = logging.getLogger(__name__)
+
+# The model bills every image or document page at no less than this
+MEDIA_PART_MIN_TOKENS = 258
+# Creates and refreshes of the same entry are serialised on one of these
+KEY_LOCK_STRIPES = 64
+
+def _part_fingerprint(part):
+    """Hash the payload of a content part without keeping a copy of it."""
+    digest = hashlib.sha256()
+    if part.text is not None:
+        digest.update(b'text:' + part.text.encode('utf-8'))
+    elif part.inline_data is not None:
+        digest.update(f"inline:{part.inline_data.mime_type}:".encode('utf-8'))
+        digest.update(part.inline_data.data or b'')
+    elif part.file_data is not None:
+        digest.update(f"file:{part.file_data.mime_type}:{part.file_data.file_uri}".encode('utf-8'))
+    else:
+        digest.update(repr(part).encode('utf-8'))
+    return digest.hexdigest()
+
+def cache_key(model, system_instruction, documents=None):
+    """
+    Build the cache key for a system prompt and set of documents.
+
+    Args:
+        model (str): Model the cached content is created for
+        system_instruction (str): The system prompt text
+        documents (list, optional): types.Part objects to cache with it
+
+    Returns:
+        str: Hex SHA-256 key
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(system_instruction.encode('utf-8'))
+    for part in documents or []:
+        digest.update(b'\0')
+        digest.update(_part_fingerprint(part).encode('utf-8'))
+    return digest.hexdigest()
+
+def _estimate_part_tokens(part):
+    if part.text is not None:
+        return estimate_tokens(part.text)
+    if part.inline_data is not None:
+        data = part.inline_data.data or b''
+        if (part.inline_data.mime_type or '').startswith('text/'):
+            return estimate_tokens(data.decode('utf-8', errors='replace'))
+        return max(MEDIA_PART_MIN_TOKENS, len(data) // CONTEXT_CACHE_MEDIA_BYTES_PER_TOKEN)
+    if part.file_data is not None:
+        # Only files too large to send inline go through /upload, and their
+        # size is not known here; if the model rejects one as too small the
+        # failure backoff sends it inline until CONTEXT_CACHE_RETRY_AFTER
+        return CONTEXT_CACHE_MIN_TOKENS
+    return 0
+
+def _estimate_cached_tokens(system_instruction, documents):
+    return estimate_tokens(system_instruction) + sum(_estimate_part_tokens(part) for part in documents or [])
+
+
+class GenAICacheBackend:
+    """Creates cached content on the model side through the GenAI caches API."""
+
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+
+    def create(self, model, system_instruction, documents, ttl_seconds, display_name):
+        contents = None
+        if documents:
+            contents = [types.Content(role="user", parts=list(documents))]
+        cached = self._client_factory().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=contents,
+                ttl=f"{ttl_seconds}s",
+                display_name=display_name,
+            ),
+        )
+        return cached.name, cached.expire_time
+
+    def refresh(self, name, ttl_seconds):
+        cached = self._client_factory().caches.update(
+            name=name,
+            config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"),
+        )
+        return cached.expire_time
+
+    def delete(self, name):
+        self._client_factory().caches.delete(name=name)
+
+
+class LocalCacheBackend:
+    """In-memory stand-in for the caches API, for offline development."""
+
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def create(self, model, system_instruction, documents, ttl_seconds, display_name):
+        name = f"cachedContents/local-{uuid.uuid4().hex}"
+        expire_time = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        with self._lock:
+            self.entries[name] = {
+                'model': model,
+                'system_instruction': system_instruction,
+                'documents': list(documents or []),
+                'display_name': display_name,
+                'expire_time': expire_time,
+            }
+        return name, expire_time
+
+    def refresh(self, name, ttl_seconds):
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None or entry['expire_time'] <= datetime.now(timezone.utc):
+                self.entries.pop(name, None)
+                raise KeyError(f"Cached content not found: {name}")
+            entry['expire_time'] = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+            return entry['expire_time']
+
+    def delete(self, name):
+        with self._lock:
+            self.entries.pop(name, None)
+
+
+class ContextCacheManager:
+    """
+    Create, reuse and TTL-refresh cached content keyed by prompt/document hash.
+
+    get() returns None whenever caching is not possible (content too small,
+    backend error, cache recently failed), in which case the caller sends the
+    system prompt and documents inline as before. At most `max_entries`
+    entries and failures are remembered; the least recently used are
+    forgotten and their cached content left to expire on the model side.
+    """
+
+    def __init__(self, backend, ttl_seconds=CONTEXT_CACHE_TTL,
+                 refresh_margin=CONTEXT_CACHE_REFRESH_MARGIN,
+                 min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+                 retry_after=CONTEXT_CACHE_RETRY_AFTER,
+                 max_entries=CONTEXT_CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        # key -> entry / retry deadline, in LRU order
+        self._entries = OrderedDict()
+        self._failures = OrderedDict()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._lock = threading.Lock()
+
+    def get(self, model, system_instruction, documents=None):
+        """
+        Return the cached content name for this prompt, creating it if needed.
+
+        Args:
+            model (str): Model name the request will use
+            system_instruction (str): The system prompt text
+            documents (list, optional): types.Part objects to cache with it
+
+        Returns:
+            str: Cached content name, or None to fall back to inline content
+        """
+        if _estimate_cached_tokens(system_instruction, documents) < self.min_tokens:
+            return None
+
+        key = cache_key(model, system_instruction, documents)
+
+        with self._lock:
+            if self._failures.get(key, 0) > time.monotonic():
+                CACHE_LOOKUPS.labels(cache='context', result='unavailable').inc()
+                return None
+            name = self._fresh_name(key)
+            if name:
+                CACHE_LOOKUPS.labels(cache='context', result='hit').inc()
+                return name
+        key_lock = self._key_locks[int(key[:8], 16) % KEY_LOCK_STRIPES]
+
+        # Only one thread creates or refreshes a given entry; requests for
+        # other prompts are not held up by the backend round trip.
+        with key_lock:
+            with self._lock:
+                name = self._fresh_name(key)
+                entry = self._entries.get(key)
+            if name:
+                CACHE_LOOKUPS.labels(cache='context', result='hit').inc()
+                return name
+
+            try:
+                if entry is not None:
+                    try:
+                        expire_time = self.backend.refresh(entry['name'], self.ttl_seconds)
+                        with self._lock:
+                            entry['expire_time'] = expire_time
+                        CACHE_LOOKUPS.labels(cache='context', result='refreshed').inc()
+                        return entry['name']
+                    except Exception as e:
+                        logger.info("Cached content %s could not be refreshed, recreating: %s", entry['name'], e)
+
+                name, expire_time = self.backend.create(
+                    model, system_instruction, documents, self.ttl_seconds, f"litigence-{key[:16]}"
+                )
+                with self._lock:
+                    self._entries[key] = {'name': name, 'expire_time': expire_time}
+                    self._entries.move_to_end(key)
+                    self._failures.pop(key, None)
+                    self._evict()
+                CACHE_LOOKUPS.labels(cache='context', result='created').inc()
+                return name
+            except Exception as e:
+                logger.warning("Context cache unavailable, sending content inline: %s", e)
+                CACHE_LOOKUPS.labels(cache='context', result='unavailable').inc()
+                with self._lock:
+                    self._entries.pop(key, None)
+                    self._failures[key] = time.monotonic() + self.retry_after
+                    self._failures.move_to_end(key)
+                    self._evict()
+                return None
+
+    def _fresh_name(self, key):
+        """Return the entry name if it is not close to expiry (lock held)."""
+        entry = self._entries.get(key)
+        if entry is None or entry['expire_time'] is None:
+            return None
+        self._entries.move_to_end(key)
+        remaining = entry['expire_time'] - datetime.now(timezone.utc)
+        if remaining > timedelta(seconds=self.refresh_margin):
+            return entry['name']
+        return None
+
+    def _evict(self):
+        """Drop expired entries and failures, then the least recently used (lock held)."""
+        now = datetime.now(timezone.utc)
+        for key, entry in list(self._entries.items()):
+            if entry['expire_time'] is not None and entry['expire_time'] <= now:
+                del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        deadline = time.monotonic()
+        for key, retry_at in list(self._failures.items()):
+            if retry_at <= deadline:
+                del self._failures[key]
+        while len(self._failures) > self.max_entries:
+            self._failures.popitem(last=False)
+
+    def invalidate(self, name):
+        """Forget a cached content entry the model reported as missing."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['name'] == name:
+                    del self._entries[key]
+
+    def clear(self):
+        """Delete all cached content created by this process."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            try:
+                self.backend.delete(entry['name'])
+            except Exception as e:
+                logger.warning("Failed to delete cached content %s: %s", entry['name'], e)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_context_cache(client_factory):
+    """
+    Return the process-wide context cache manager.
+
+    Args:
+        client_factory (callable): Returns the shared genai.Client
+
+    Returns:
+        ContextCacheManager: The manager, or None when caching is disabled
+    """
+    global _manager
+    if CONTEXT_CACHE_BACKEND == 'off':
+        return None
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                if CONTEXT_CACHE_BACKEND == 'local':
+                    backend = LocalCacheBackend()
+                else:
+                    backend = GenAICacheBackend(client_factory)
+                _manager = ContextCacheManager(backend)
+    return _manager
@@ -0,0 +1,623 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from xml.etree import ElementTree
+import numpy as np
+from config import (
+    DOCUMENT_RETRIEVAL_ENABLED, DOCUMENT_RETRIEVAL_MIN_BYTES, DOCUMENT_RETRIEVAL_TOP_K,
+    DOCUMENT_CHUNK_MAX_CHARS, DOCUMENT_INDEX_DIR, DOCUMENT_INDEX_MAX_BYTES, DOCUMENT_INDEX_OPEN_MAX,
+    EMBEDDING_BATCH_SIZE
+)
+from src.services.attachment_store import content_hash, get_attachment_store
+from src.services.embedding_service import get_embedder
+from src.services.firebase_services import save_chat_documents
+from src.services.media_service import DOCX_MIME_TYPE
+from src.services.upload_service import read_uploaded_file, resolve_file_reference, store_upload
+
+logger = logging.getLogger(__name__)
+
+PDF_MIME_TYPE = "application/pdf"
+INDEXABLE_MIME_TYPES = (PDF_MIME_TYPE, DOCX_MIME_TYPE)
+
+# Ingests of documents whose hashes fall in the same stripe run one at a time
+DOC_LOCK_STRIPES = 64
+# Upload URIs remembered with the hash of their contents, so a file sent again is not downloaded again
+URI_CACHE_MAX = 4096
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Headings that start a new chunk: "Section 302.", "302. Punishment for murder", "Article 21", "CHAPTER XVI"
+SECTION_HEADING = re.compile(
+    r"^\s*(?:(?:section|sec\.|article|art\.|rule|order)\s+\d+[a-z]*|chapter\s+[ivxlcdm\d]+|\d+[a-z]?\.\s+[A-Z])",
+    re.IGNORECASE,
+)
+
+
+def iter_document_pages(data, mime_type):
+    """
+    Extract text from a document one page at a time.
+
+    Args:
+        data (bytes): The document contents
+        mime_type (str): application/pdf or the DOCX MIME type
+
+    Yields:
+        tuple: (page number starting at 1, page text)
+    """
+    if mime_type == PDF_MIME_TYPE:
+        # Imported here so the app starts without pypdf when retrieval is disabled
+        from pypdf import PdfReader
+        reader = PdfReader(io.BytesIO(data))
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+    elif mime_type == DOCX_MIME_TYPE:
+        yield from _iter_docx_pages(data)
+
+def _iter_docx_pages(data):
+    """DOCX has no fixed pages; split on explicit page breaks instead."""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        with archive.open("word/document.xml") as document:
+            number, paragraphs, current = 1, [], []
+            for event, element in ElementTree.iterparse(document, events=("start", "end")):
+                if event == "start":
+                    continue
+                if element.tag == _WORD_NS + "t" and element.text:
+                    current.append(element.text)
+                elif element.tag == _WORD_NS + "tab":
+                    current.append("\t")
+                elif element.tag == _WORD_NS + "br" and element.get(_WORD_NS + "type") == "page":
+                    paragraphs.append("".join(current))
+                    current = []
+                    yield number, "\n\n".join(paragraphs)
+                    number, paragraphs = number + 1, []
+                elif element.tag == _WORD_NS + "p":
+                    paragraphs.append("".join(current))
+                    current = []
+                    element.clear()
+            if paragraphs or current:
+                paragraphs.append("".join(current))
+                yield number, "\n\n".join(paragraphs)
+
+def split_paragraphs(text, max_chars=DOCUMENT_CHUNK_MAX_CHARS):
+    """
+    Split page text into paragraphs.
+
+    PDF text comes out one line per line of print, so paragraphs end at
+    blank lines, a heading line always starts a paragraph of its own, and
+    runs of lines longer than max_chars are broken between lines.
+
+    Yields:
+        tuple: (paragraph text, its heading line or None)
+    """
+    lines, heading, length = [], None, 0
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line or SECTION_HEADING.match(line):
+            if lines:
+                yield " ".join(lines), heading
+            lines, heading, length = ([line], line, len(line)) if line else ([], None, 0)
+        elif lines and length + len(line) > max_chars:
+            yield " ".join(lines), heading
+            lines, heading, length = [line], None, len(line)
+        else:
+            lines.append(line)
+            length += len(line) + 1
+    if lines:
+        yield " ".join(lines), heading
+
+def chunk_pages(pages, max_chars=DOCUMENT_CHUNK_MAX_CHARS):
+    """
+    Group page text into retrieval chunks.
+
+    Paragraphs are packed into chunks of up to max_chars. A section,
+    article or chapter heading always starts a new chunk, so a chunk
+    never mixes two provisions, and each chunk remembers the heading it
+    falls under.
+
+    Args:
+        pages (iterable): (page number, text) pairs
+        max_chars (int): Maximum chunk length
+
+    Yields:
+        dict: {'text', 'page', 'section'}
+    """
+    section = None
+    buffer, buffer_page, length = [], None, 0
+
+    for page_number, text in pages:
+        for paragraph, heading in split_paragraphs(text, max_chars):
+            if buffer and (heading or length + len(paragraph) > max_chars):
+                yield {'text': "\n\n".join(buffer), 'page': buffer_page, 'section': section}
+                buffer, length = [], 0
+            if heading:
+                section = heading[:80]
+            # Single lines longer than a chunk are split on sentence boundaries
+            while len(paragraph) > max_chars:
+                cut = paragraph.rfind(". ", 0, max_chars) + 1 or max_chars
+                yield {'text': paragraph[:cut].strip(), 'page': page_number, 'section': section}
+                paragraph = paragraph[cut:].strip()
+            if not buffer:
+                buffer_page = page_number
+            buffer.append(paragraph)
+            length += len(paragraph) + 2
+    if buffer:
+        yield {'text': "\n\n".join(buffer), 'page': buffer_page, 'section': section}
+
+class DocumentIndex:
+    """
+    Vector index of document chunks, persisted on disk and read with mmap.
+
+    Documents are indexed once per content hash, so the same judgment
+    attached in several chats is embedded only once. Each document has a
+    raw float32 matrix (one L2-normalised row per chunk) and a JSON file
+    with the chunk texts. A chat has a small manifest listing the hashes
+    of the documents attached to it; searching a chat scores the query
+    against the memory-mapped matrices of those documents.
+
+    The files of documents and manifests are bounded by total bytes and
+    evicted least-recently-used first, like the attachment store's disk
+    tier. A chat whose documents were evicted indexes them again from
+    their uploads.
+    """
+
+    def __init__(self, embedder, directory=DOCUMENT_INDEX_DIR, open_max=DOCUMENT_INDEX_OPEN_MAX,
+                 max_bytes=DOCUMENT_INDEX_MAX_BYTES):
+        self.embedder = embedder
+        self.directory = directory
+        self.open_max = open_max
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, "documents"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "chats"), exist_ok=True)
+        # digest -> (vectors memmap, metadata with the chunks), in LRU order
+        self._open = OrderedDict()
+        self._doc_locks = [threading.Lock() for _ in range(DOC_LOCK_STRIPES)]
+        # upload URI -> digest, in LRU order
+        self._uri_digests = OrderedDict()
+        # ("documents", digest) or ("chats", manifest key) -> bytes on disk, in LRU order
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_disk_index()
+
+    def _document_paths(self, digest):
+        base = os.path.join(self.directory, "documents", digest)
+        return base + ".f32", base + ".json"
+
+    def _manifest_key(self, user_id, chat_id):
+        return hashlib.sha256(f"{user_id}\0{chat_id}".encode('utf-8')).hexdigest()[:32]
+
+    def _manifest_path(self, key):
+        return os.path.join(self.directory, "chats", key + ".json")
+
+    def _entry_paths(self, entry):
+        kind, name = entry
+        return self._document_paths(name) if kind == "documents" else (self._manifest_path(name),)
+
+    def ingest(self, data, mime_type):
+        """
+        Extract, chunk and embed a document unless it is already indexed.
+
+        Returns:
+            tuple: (content hash, number of chunks). Zero chunks means no
+            text could be extracted, e.g. a scanned PDF.
+        """
+        digest = content_hash(data)
+        # Only one thread embeds a given document
+        with self._doc_locks[int(digest[:8], 16) % DOC_LOCK_STRIPES]:
+            loaded = self._load(digest)
+            if loaded is not None:
+                return digest, loaded[1]['count']
+
+            vectors_path, meta_path = self._document_paths(digest)
+            chunks = []
+            fd, tmp_vectors = tempfile.mkstemp(dir=os.path.dirname(vectors_path))
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    batch = []
+                    for chunk in chunk_pages(iter_document_pages(data, mime_type)):
+                        batch.append(chunk)
+                        if len(batch) == EMBEDDING_BATCH_SIZE:
+                            out.write(self._embed_chunks(batch).tobytes())
+                            chunks += batch
+                            batch = []
+                    if batch:
+                        out.write(self._embed_chunks(batch).tobytes())
+                        chunks += batch
+                os.replace(tmp_vectors, vectors_path)
+            except BaseException:
+                os.unlink(tmp_vectors)
+                raise
+
+            meta = {
+                'mime_type': mime_type,
+                'count': len(chunks),
+                'dimensions': self.embedder.dimensions,
+                'chunks': chunks,
+            }
+            # The JSON file is written last; its presence marks the document as indexed
+            _atomic_write_json(meta_path, meta)
+            self._track(("documents", digest))
+            return digest, len(chunks)
+
+    def _embed_chunks(self, chunks):
+        texts = [chunk['text'] for chunk in chunks]
+        return np.ascontiguousarray(self.embedder.embed(texts, task_type="RETRIEVAL_DOCUMENT"), dtype=np.float32)
+
+    def _read_meta(self, digest):
+        _, meta_path = self._document_paths(digest)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Vectors from a different embedder cannot be compared with ours
+        if meta.get('dimensions') != self.embedder.dimensions:
+            return None
+        return meta
+
+    def _load(self, digest):
+        """Return (vectors, meta) for an indexed document, memory-mapping the vectors."""
+        with self._lock:
+            loaded = self._open.get(digest)
+            if loaded is not None:
+                self._open.move_to_end(digest)
+                return loaded
+
+        meta = self._read_meta(digest)
+        if meta is None:
+            return None
+        vectors_path, meta_path = self._document_paths(digest)
+        self._touch(("documents", digest), meta_path)
+        if meta['count'] == 0:
+            vectors = np.zeros((0, meta['dimensions']), dtype=np.float32)
+        else:
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode='r',
+                                shape=(meta['count'], meta['dimensions']))
+        loaded = (vectors, meta)
+        with self._lock:
+            self._open[digest] = loaded
+            while len(self._open) > self.open_max:
+                self._open.popitem(last=False)
+        return loaded
+
+    def is_indexed(self, digest):
+        loaded = self._load(digest)
+        return loaded is not None and loaded[1]['count'] > 0
+
+    def digest_for_uri(self, uri):
+        """The hash of an upload indexed before by this process, or None."""
+        with self._lock:
+            digest = self._uri_digests.get(uri)
+            if digest is not None:
+                self._uri_digests.move_to_end(uri)
+            return digest
+
+    def remember_uri(self, uri, digest):
+        with self._lock:
+            self._uri_digests[uri] = digest
+            self._uri_digests.move_to_end(uri)
+            while len(self._uri_digests) > URI_CACHE_MAX:
+                self._uri_digests.popitem(last=False)
+
+    def attach(self, user_id, chat_id, digest):
+        """Add an indexed document to a chat's manifest."""
+        key = self._manifest_key(user_id, chat_id)
+        path = self._manifest_path(key)
+        with self._lock:
+            digests = self._read_manifest(path)
+            if digest in digests:
+                return
+            _atomic_write_json(path, {'documents': digests + [digest]})
+        self._track(("chats", key))
+
+    def chat_documents(self, user_id, chat_id):
+        """The hashes of the chat's documents that are still indexed here."""
+        key = self._manifest_key(user_id, chat_id)
+        path = self._manifest_path(key)
+        with self._lock:
+            digests = self._read_manifest(path)
+            indexed = [digest for digest in digests if ("documents", digest) in self._files]
+        if digests:
+            self._touch(("chats", key), path)
+        return indexed
+
+    def _read_manifest(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['documents']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def search(self, digests, query, top_k=DOCUMENT_RETRIEVAL_TOP_K):
+        """
+        Find the chunks most similar to a query across several documents.
+
+        Args:
+            digests (list): Content hashes of the documents to search
+            query (str): The user's question
+            top_k (int): Number of chunks to return
+
+        Returns:
+            list: Chunk dicts (text, page, section, score), best first
+        """
+        loaded = [(digest, self._load(digest)) for digest in digests]
+        loaded = [(digest, item) for digest, item in loaded if item is not None and item[1]['count']]
+        if not loaded:
+            return []
+
+        query_vector = self.embedder.embed([query])[0]
+        candidates = []
+        for digest, (vectors, meta) in loaded:
+            scores = np.asarray(vectors @ query_vector)
+            count = min(top_k, len(scores))
+            best = np.argpartition(-scores, count - 1)[:count]
+            for index in best:
+                candidates.append((float(scores[index]), meta, int(index)))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        results = []
+        for score, meta, index in candidates[:top_k]:
+            chunk = dict(meta['chunks'][index])
+            chunk['score'] = score
+            results.append(chunk)
+        return results
+
+
+    # Disk budget. The lock only guards the LRU; a file evicted under a
+    # reader that already mapped it stays readable until it is unmapped.
+
+    def _load_disk_index(self):
+        """Rebuild the LRU from the files left by earlier processes."""
+        found = []
+        for kind in ("documents", "chats"):
+            for name in os.listdir(os.path.join(self.directory, kind)):
+                if not name.endswith(".json"):
+                    continue
+                entry = (kind, name[:-5])
+                path = os.path.join(self.directory, kind, name)
+                found.append((os.path.getmtime(path), entry, self._disk_usage(entry)))
+        for _, entry, used in sorted(found):
+            self._files[entry] = used
+            self._bytes += used
+        self._remove_files(self._evict())
+
+    def _disk_usage(self, entry):
+        used = 0
+        for path in self._entry_paths(entry):
+            try:
+                used += os.path.getsize(path)
+            except OSError:
+                pass
+        return used
+
+    def _track(self, entry):
+        """Record the files just written for an entry and evict beyond the budget."""
+        used = self._disk_usage(entry)
+        with self._lock:
+            self._bytes -= self._files.pop(entry, 0)
+            self._files[entry] = used
+            self._bytes += used
+            evicted = self._evict(keep=entry)
+        self._remove_files(evicted)
+
+    def _touch(self, entry, path):
+        """Mark an entry as used, so it survives a restart in the same LRU position."""
+        with self._lock:
+            if entry not in self._files:
+                return
+            self._files.move_to_end(entry)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        """Drop least recently used entries from the LRU; returns them (lock held)."""
+        evicted = []
+        while self._bytes > self.max_bytes and self._files:
+            entry, used = next(iter(self._files.items()))
+            if entry == keep:
+                # The entry just written is kept even if it alone exceeds the budget
+                break
+            del self._files[entry]
+            self._bytes -= used
+            if entry[0] == "documents":
+                self._open.pop(entry[1], None)
+            evicted.append(entry)
+        return evicted
+
+    def _remove_files(self, entries):
+        for entry in entries:
+            # The JSON file goes last, as it marks a document as indexed
+            for path in self._entry_paths(entry):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _atomic_write_json(path, value):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def format_excerpts(chunks):
+    """Render retrieved chunks as the text passed to the model with the question."""
+    lines = ["Relevant excerpts from the documents attached to this conversation:"]
+    for chunk in chunks:
+        source = [f"page {chunk['page']}"]
+        if chunk.get('section'):
+            source.append(chunk['section'])
+        lines.append(f"[{', '.join(source)}]\n{chunk['text']}")
+    return "\n\n".join(lines)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_document_index():
+    """
+    Return the process-wide document index.
+
+    Returns:
+        DocumentIndex: The index, or None when retrieval is disabled
+    """
+    global _index
+    if not DOCUMENT_RETRIEVAL_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DocumentIndex(get_embedder())
+    return _index
+
+def retrieve_document_context(user_id, chat_id, question, attachments, chat_documents=None):
+    """
+    Index large attached documents and retrieve the chunks relevant to a question.
+
+    PDFs and DOCX files of at least DOCUMENT_RETRIEVAL_MIN_BYTES, sent
+    inline or by /upload reference, are indexed for the chat and removed
+    from the attachments; the model gets the top-k chunks instead of the
+    whole file. Documents attached earlier in the chat are searched too,
+    so follow-up questions do not need the file again. Documents with no
+    extractable text stay attached as they are.
+
+    The index lives on this instance's disk, so the documents of a saved
+    chat are also listed on its Firestore document, with the upload URI
+    they can be read back from. A follow-up served by another instance
+    indexes them again from there, or sends them whole if that fails.
+
+    Args:
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat
+        question (str): The user's question
+        attachments (list): types.Part objects built from the request
+        chat_documents (list, optional): The `documents` field of the
+            stored chat, dicts of sha256, mime_type and uri
+
+    Returns:
+        tuple: (attachments still to send whole, retrieved chunk dicts)
+    """
+    index = get_document_index()
+    if index is None:
+        return attachments, []
+
+    persist = user_id != 'anonymous'
+    known = {document['sha256'] for document in chat_documents or []}
+    remaining, added = [], []
+    for part in attachments:
+        try:
+            document = _index_part(index, part, durable=persist)
+        except Exception as e:
+            logger.warning("Failed to index document, sending it whole: %s", e)
+            document = None
+        if document is None:
+            remaining.append(part)
+            continue
+        index.attach(user_id, chat_id, document['sha256'])
+        if document['sha256'] not in known:
+            added.append(document)
+    if persist and added:
+        save_chat_documents(user_id, chat_id, added)
+
+    digests = index.chat_documents(user_id, chat_id)
+    for document in chat_documents or []:
+        if document['sha256'] in digests:
+            continue
+        if _restore_document(index, document):
+            index.attach(user_id, chat_id, document['sha256'])
+            digests.append(document['sha256'])
+        else:
+            part = _whole_document_part(document)
+            if part is not None:
+                remaining.append(part)
+
+    if not digests:
+        return remaining, []
+    return remaining, index.search(digests, question)
+
+def _index_part(index, part, durable=False):
+    """
+    Index an attachment if it is a large enough document.
+
+    Returns:
+        dict: The chat's record of the document (sha256, mime_type, uri),
+        or None if the part is to be sent as it is
+    """
+    inline, file_data = part.inline_data, part.file_data
+    if inline is not None:
+        if inline.mime_type not in INDEXABLE_MIME_TYPES or len(inline.data or b'') < DOCUMENT_RETRIEVAL_MIN_BYTES:
+            return None
+        data, mime_type, uri = inline.data, inline.mime_type, None
+    elif file_data is not None and file_data.mime_type in INDEXABLE_MIME_TYPES:
+        mime_type, uri = file_data.mime_type, file_data.file_uri
+        digest = index.digest_for_uri(uri)
+        if digest is not None and index.is_indexed(digest):
+            return {'sha256': digest, 'mime_type': mime_type, 'uri': uri}
+        data = read_uploaded_file(uri, DOCUMENT_RETRIEVAL_MIN_BYTES)
+        if data is None:
+            return None
+    else:
+        return None
+
+    digest, count = index.ingest(data, mime_type)
+    if count == 0:
+        return None
+    if uri is None and durable:
+        uri = _durable_uri(digest, data)
+    if uri is not None:
+        index.remember_uri(uri, digest)
+    return {'sha256': digest, 'mime_type': mime_type, 'uri': uri}
+
+def _durable_uri(digest, data):
+    """Store an inline document through the upload backend, so other instances can read it back."""
+    store = get_attachment_store()
+    entry = store.get(digest) if store is not None else None
+    if entry is not None and entry['file_uri']:
+        return entry['file_uri']
+    try:
+        return store_upload(io.BytesIO(data))['uri']
+    except Exception as e:
+        logger.warning("Failed to store document %s for other instances: %s", digest, e)
+        return None
+
+def _restore_document(index, document):
+    """Index a document of the chat that this instance has not seen, from its upload or the store."""
+    if index.is_indexed(document['sha256']):
+        return True
+    data = None
+    try:
+        if document.get('uri'):
+            data = read_uploaded_file(document['uri'])
+        if data is None:
+            store = get_attachment_store()
+            entry = store.get(document['sha256']) if store is not None else None
+            data = entry['data'] if entry is not None else None
+        if data is None:
+            return False
+        _, count = index.ingest(data, document['mime_type'])
+        return count > 0
+    except Exception as e:
+        logger.warning("Failed to restore document %s: %s", document['sha256'], e)
+        return False
+
+def _whole_document_part(document):
+    """The document itself, when its chunks cannot be searched here; None if it is gone."""
+    if document.get('uri'):
+        try:
+            return resolve_file_reference({'uri': document['uri'], 'mime_type': document['mime_type']})
+        except Exception as e:
+            logger.warning("Failed to attach document %s: %s", document['sha256'], e)
+    logger.warning("Document %s of the chat is no longer available", document['sha256'])
+    return None
@@ -0,0 +1,100 @@
+import hashlib
+import re
+import threading
+import numpy as np
+from config import EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_BATCH_SIZE
+from src.utils.lazy_import import lazy_import
+
+types = lazy_import('google.genai.types')
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class GenAIEmbedder:
+    """Embeds text with the GenAI embeddings API."""
+
+    def __init__(self, client_factory, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+        self._client_factory = client_factory
+        self.model = model
+        self.dimensions = dimensions
+
+    def embed(self, texts, task_type="RETRIEVAL_QUERY"):
+        """
+        Embed a list of texts.
+
+        Args:
+            texts (list): Strings to embed
+            task_type (str): Embedding task hint for the model
+
+        Returns:
+            numpy.ndarray: float32 array of shape (len(texts), dimensions),
+            each row L2-normalised
+        """
+        vectors = []
+        client = self._client_factory()
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = client.models.embed_content(
+                model=self.model,
+                contents=texts[start:start + EMBEDDING_BATCH_SIZE],
+                config=types.EmbedContentConfig(
+                    task_type=task_type,
+                    output_dimensionality=self.dimensions,
+                ),
+            )
+            vectors.extend(embedding.values for embedding in response.embeddings)
+        return normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions))
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder for offline development.
+
+    Hashes word unigrams and bigrams into a fixed number of buckets, so
+    texts sharing most of their words end up close together. It has no
+    notion of meaning, but is good enough to exercise similarity search.
+    """
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed(self, texts, task_type="RETRIEVAL_QUERY"):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dimensions
+                sign = 1.0 if digest[4] & 1 else -1.0
+                matrix[row, bucket] += sign
+        return normalize_rows(matrix)
+
+
+def normalize_rows(matrix):
+    """L2-normalise each row so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """
+    Return the process-wide embedder selected by EMBEDDING_BACKEND.
+
+    Returns:
+        GenAIEmbedder or HashingEmbedder: The shared embedder
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                if EMBEDDING_BACKEND == 'hashing':
+                    _embedder = HashingEmbedder()
+                else:
+                    # Imported here to avoid a circular import with genai_services
+                    from src.services.genai_services import get_genai_client
+                    _embedder = GenAIEmbedder(get_genai_client)
+    return _embedder
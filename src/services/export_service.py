@@ -0,0 +1,294 @@
+import base64
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from config import EXPORT_PAGE_SIZE, IMPORT_MAX_WRITES_PER_SECOND
+from src.services.chat_writer import FIRESTORE_MAX_BATCH_WRITES
+from src.services.firebase_services import get_firestore_client, get_chat_ref, firestore_call
+from src.services.history_cache import invalidate_history
+
+logger = logging.getLogger(__name__)
+
+# Archives are NDJSON, one record per line:
+#   {"type": "export", "version": 1, "exported_at": ...}       once per archive (or part)
+#   {"type": "chat", "user_id", "chat_id", "data": {...}}       the chat document
+#   {"type": "message", "user_id", "chat_id", "message_id", "data": {...}}
+#   {"type": "cursor", "cursor": "..."}                          everything before it is complete
+# Timestamps are written as {"$timestamp": "<ISO 8601>"}.
+ARCHIVE_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$timestamp': value.isoformat()}
+    raise TypeError(f"Cannot export a value of type {type(value).__name__}")
+
+def _decode_object(obj):
+    if len(obj) == 1 and '$timestamp' in obj:
+        return datetime.fromisoformat(obj['$timestamp'])
+    return obj
+
+def dump_record(record):
+    """One NDJSON line."""
+    return json.dumps(record, default=_encode_value, ensure_ascii=False).encode('utf-8') + b'\n'
+
+def encode_cursor(user_id, chat_id, message_id=None):
+    """
+    Opaque position in an export: the chat (and, within it, the message)
+    after which to resume. A cursor without a message means the chat is done.
+    """
+    raw = json.dumps([user_id, chat_id, message_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (user_id, chat_id, message_id or None)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        user_id, chat_id, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeEncodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(user_id, str) or not isinstance(chat_id, str):
+        raise ValueError("Invalid cursor")
+    return user_id, chat_id, message_id
+
+def header_record():
+    return {'type': 'export', 'version': ARCHIVE_VERSION, 'exported_at': datetime.now(timezone.utc)}
+
+
+def _scan(collection_ref, page_size, start_after=None):
+    """
+    Pages of a collection in document ID order.
+
+    Each page is one query resuming after the last document of the
+    previous one, so memory stays at one page however large the
+    collection is, and no composite index is needed.
+    """
+    while True:
+        query = collection_ref.limit(page_size)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        with firestore_call('export', 'read'):
+            page = list(query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        start_after = page[-1]
+
+def _cursor_snapshot(reference):
+    with firestore_call('export', 'read'):
+        snapshot = reference.get()
+    if not snapshot.exists:
+        raise ValueError("Invalid cursor: the document it points to no longer exists")
+    return snapshot
+
+def _export_messages(user_id, chat_id, page_size, start_after=None):
+    messages_ref = get_chat_ref(user_id, chat_id).collection('messages')
+    for page in _scan(messages_ref, page_size, start_after):
+        for message in page:
+            yield {
+                'type': 'message', 'user_id': user_id, 'chat_id': chat_id,
+                'message_id': message.id, 'data': message.to_dict(),
+            }
+        yield {'type': 'cursor', 'cursor': encode_cursor(user_id, chat_id, page[-1].id)}
+
+def export_user(user_id, cursor=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Stream the records of a user's chats and their messages.
+
+    A cursor record follows every page of messages and every finished
+    chat; passing the last one received resumes the export after it.
+    The cursor is checked before this returns, so a bad one fails before
+    anything is streamed.
+
+    Args:
+        user_id (str): The ID of the user
+        cursor (str, optional): A cursor from an earlier export of this user
+        page_size (int): Documents read per Firestore query
+
+    Returns:
+        generator: Archive records (without the header)
+
+    Raises:
+        ValueError: If the cursor is invalid or belongs to another user
+    """
+    chats_ref = get_firestore_client().collection('users').document(user_id).collection('chats')
+    chat_after = message_after = None
+    if cursor:
+        cursor_user, chat_id, message_id = decode_cursor(cursor)
+        if cursor_user != user_id:
+            raise ValueError("Invalid cursor: it belongs to another user")
+        chat_after = _cursor_snapshot(chats_ref.document(chat_id))
+        if message_id:
+            message_after = _cursor_snapshot(chats_ref.document(chat_id).collection('messages').document(message_id))
+    return _export_user_records(user_id, chats_ref, page_size, chat_after, message_after)
+
+def _export_user_records(user_id, chats_ref, page_size, chat_after, message_after):
+    if message_after is not None:
+        # Finish the chat the previous export stopped in
+        yield from _export_messages(user_id, chat_after.id, page_size, message_after)
+        yield {'type': 'cursor', 'cursor': encode_cursor(user_id, chat_after.id)}
+
+    for page in _scan(chats_ref, page_size, chat_after):
+        for chat in page:
+            yield {'type': 'chat', 'user_id': user_id, 'chat_id': chat.id, 'data': chat.to_dict()}
+            yield from _export_messages(user_id, chat.id, page_size)
+            yield {'type': 'cursor', 'cursor': encode_cursor(user_id, chat.id)}
+
+def list_user_ids():
+    """IDs of every user with chats, in document ID order."""
+    # User documents are never written, only their chats, so list references
+    for user_ref in get_firestore_client().collection('users').list_documents():
+        yield user_ref.id
+
+def gzip_ndjson(records):
+    """
+    Compress records into gzip NDJSON chunks as they are produced.
+
+    The compressor is flushed after every cursor record, so a client
+    reading the stream can decompress everything up to the last cursor
+    even if the connection drops.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for record in records:
+        chunk = compressor.compress(dump_record(record))
+        if record['type'] == 'cursor':
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+def read_records(stream):
+    """
+    Parse an archive, gzip-compressed or not, one line at a time.
+
+    Args:
+        stream: A binary file object
+
+    Yields:
+        dict: Archive records, with timestamps decoded
+
+    Raises:
+        ValueError: On a line that is not a JSON object
+    """
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line, object_hook=_decode_object)
+        except ValueError:
+            raise ValueError(f"Line {number} is not valid JSON")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number} is not a JSON object")
+        yield record
+
+
+class WriteThrottle:
+    """Paces Firestore writes to a rate shared by every thread using it."""
+
+    def __init__(self, writes_per_second=IMPORT_MAX_WRITES_PER_SECOND):
+        self.writes_per_second = writes_per_second
+        self._next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, writes):
+        if self.writes_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + writes / self.writes_per_second
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+class ChatImporter:
+    """
+    Writes archive records back to Firestore in batches.
+
+    Documents keep their exported IDs and chat documents are replaced, so
+    an interrupted import can simply be run again.
+    """
+
+    def __init__(self, throttle=None, user_id=None, batch_size=FIRESTORE_MAX_BATCH_WRITES):
+        self.throttle = throttle or WriteThrottle()
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.stats = {'chats': 0, 'messages': 0, 'batches': 0}
+        self._db = get_firestore_client()
+        self._batch = self._db.batch()
+        self._pending = 0
+        self._pending_chats = set()
+
+    def add(self, record):
+        """
+        Queue one record's write, committing when the batch is full.
+
+        Raises:
+            ValueError: On an unknown or malformed record, or one for
+                another user when the importer is limited to one
+        """
+        kind = record.get('type')
+        if kind in ('export', 'cursor'):
+            if kind == 'export' and record.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported archive version: {record.get('version')}")
+            return
+        if kind not in ('chat', 'message'):
+            raise ValueError(f"Unknown record type: {kind}")
+        user_id, chat_id, data = record.get('user_id'), record.get('chat_id'), record.get('data')
+        if not isinstance(user_id, str) or not isinstance(chat_id, str) or not isinstance(data, dict):
+            raise ValueError(f"Malformed {kind} record")
+        if self.user_id is not None and user_id != self.user_id:
+            raise ValueError("The archive contains another user's chats")
+
+        chat_ref = get_chat_ref(user_id, chat_id)
+        if kind == 'chat':
+            self._batch.set(chat_ref, data)
+            self.stats['chats'] += 1
+        else:
+            message_id = record.get('message_id')
+            if not isinstance(message_id, str):
+                raise ValueError("Malformed message record")
+            self._batch.set(chat_ref.collection('messages').document(message_id), data)
+            self.stats['messages'] += 1
+        self._pending += 1
+        self._pending_chats.add((user_id, chat_id))
+        if self._pending >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if not self._pending:
+            return
+        self.throttle.wait(self._pending)
+        with firestore_call('import', 'write'):
+            self._batch.commit()
+        for user_id, chat_id in self._pending_chats:
+            invalidate_history(user_id, chat_id)
+        self.stats['batches'] += 1
+        self._batch = self._db.batch()
+        self._pending = 0
+        self._pending_chats = set()
+
+    def import_records(self, records):
+        """Import every record and commit the last batch; returns the stats."""
+        for record in records:
+            self.add(record)
+        self.commit()
+        return self.stats
@@ -1,11 +1,50 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
 import os
 import json
+import logging
+import threading
+import time
+from config import (
+    FIRESTORE_BACKEND, FAKE_FIRESTORE_READ_LATENCY, FAKE_FIRESTORE_WRITE_LATENCY, FAKE_FIRESTORE_SEED,
+    HISTORY_MAX_MESSAGES
+)
+from src.services.history_cache import invalidate_history
+from src.services.metrics import FIRESTORE_LATENCY, FIRESTORE_ERRORS
+from src.services.tracing import span
+from src.utils.lazy_import import lazy_import
+
+logger = logging.getLogger(__name__)
+
+# firebase_admin pulls in the Firestore and Google auth libraries, so it loads on first use
+firebase_admin = lazy_import('firebase_admin')
+credentials = lazy_import('firebase_admin.credentials')
+firestore = lazy_import('firebase_admin.firestore')
+
+_firebase_lock = threading.Lock()
+_firebase_ready = False
 
-# Initialize Firebase
 def initialize_firebase():
+    """
+    Initialize the Firebase app once per process.
+
+    Called by get_firestore_client() on first use, or ahead of time by the
+    start-up warm-up (see src.services.warmup); safe to call from several
+    threads at once.
+
+    Returns:
+        bool: Whether Firebase is ready
+    """
+    global _firebase_ready
+    if _firebase_ready:
+        return True
+    with _firebase_lock:
+        if not _firebase_ready:
+            _firebase_ready = _initialize_firebase_app()
+    return _firebase_ready
+
+def _initialize_firebase_app():
     """Initialize Firebase with credentials from environment variables or files
     
     For Google Cloud Run, we use environment variables populated from Secret Manager.
@@ -15,10 +54,14 @@ def initialize_firebase():
     1. FIREBASE_CREDENTIALS environment variable (JSON string set via Secret Manager in Cloud Run)
     2. Local file in /secrets directory (for local development)
     """
+    if FIRESTORE_BACKEND == 'memory':
+        logger.info('Using in-memory Firestore, skipping Firebase initialization')
+        return True
+
     try:
         # Check if already initialized
         firebase_admin.get_app()
-        print('Firebase already initialized')
+        logger.info('Firebase already initialized')
         return True
     except ValueError:
         # Attempt to get credentials from various sources
@@ -30,10 +73,10 @@ def initialize_firebase():
             try:
                 cred_dict = json.loads(firebase_creds_json)
                 cred = credentials.Certificate(cred_dict)
-                print('Firebase credentials loaded from FIREBASE_CREDENTIALS environment variable (Secret Manager)')
-                print(cred)
+                logger.info('Firebase credentials loaded from FIREBASE_CREDENTIALS environment variable (Secret Manager)')
             except Exception as e:
-                print(f"Error parsing Firebase credentials from environment: {e}")
+                # The message can quote the secret, so only its type is logged
+                logger.error("Error parsing Firebase credentials from environment: %s", type(e).__name__)
         
         # Option 2: Local file in project (for local development)
         if cred is None:
@@ -48,94 +91,318 @@ def initialize_firebase():
                 if os.path.exists(path):
                     try:
                         cred = credentials.Certificate(path)
-                        print(f'Firebase credentials loaded from file: {path}')
+                        logger.info('Firebase credentials loaded from file: %s', path)
                         break
                     except Exception as e:
-                        print(f"Error loading credentials from {path}: {e}")
+                        logger.error("Error loading credentials from %s: %s", path, e)
         
         # Initialize Firebase if credentials were found
         if cred:
             firebase_admin.initialize_app(cred)
             return True
         else:
-            print('Failed to initialize Firebase: No valid credentials found')
+            logger.error('Failed to initialize Firebase: No valid credentials found')
             return False
 
 
 
-def save_chat_to_firestore(user_id, chat_title, user_message, ai_response):
+_fake_db = None
+
+def get_firestore_client():
     """
-    Save a chat exchange (user message and AI response) to Firestore.
+    Return the Firestore client, initializing Firebase on first use.
+    
+    With FIRESTORE_BACKEND=memory, a process-wide in-memory fake is
+    returned instead, for offline development and load tests. It starts
+    with the chats described by FAKE_FIRESTORE_SEED, if any.
+    """
+    global _fake_db
+    if FIRESTORE_BACKEND == 'memory':
+        if _fake_db is None:
+            from src.testing.fake_firestore import FakeFirestore
+            _fake_db = FakeFirestore(
+                read_latency=FAKE_FIRESTORE_READ_LATENCY,
+                write_latency=FAKE_FIRESTORE_WRITE_LATENCY
+            )
+            if FAKE_FIRESTORE_SEED:
+                _fake_db.seed_chats(**FAKE_FIRESTORE_SEED)
+        return _fake_db
+    initialize_firebase()
+    return firestore.client()
+
+@contextmanager
+def firestore_call(site, operation):
+    """
+    Time the Firestore round trips in a block, in a span of the current trace.
+
+    Args:
+        site (str): The call site, the `site` label of the latency metric
+        operation (str): "read" or "write"
+    """
+    with span(f"firestore.{site}", operation=operation):
+        started_at = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            FIRESTORE_ERRORS.labels(site=site, operation=operation).inc()
+            raise
+        finally:
+            FIRESTORE_LATENCY.labels(site=site, operation=operation).observe(time.perf_counter() - started_at)
+
+def get_chat_ref(user_id, chat_id):
+    """Return the reference to a user's chat document."""
+    db = get_firestore_client()
+    return db.collection('users').document(user_id) \
+             .collection('chats').document(chat_id)
+
+def get_chat_messages(user_id, chat_id, limit, before=None, chat_data=None):
+    """
+    Fetch one page of a chat's messages, newest page first.
+    
+    Messages live in the users/{uid}/chats/{cid}/messages subcollection,
+    ordered by timestamp. Chats still using the legacy `messages` array
+    (see the migrate-chat-messages command) are paged from the array.
     
     Args:
         user_id (str): The ID of the user
-        chat_title (str): The title of the chat session
-        user_message (str): The message sent by the user
-        ai_response (str): The response generated by the AI
+        chat_id (str): The ID of the chat document
+        limit (int): Maximum number of messages to return
+        before (str, optional): Cursor from a previous page; only older
+            messages are returned
+        chat_data (dict, optional): The already loaded chat document
+    
+    Returns:
+        tuple: (messages oldest first, cursor for the next older page or None)
+    """
+    messages_ref = get_chat_ref(user_id, chat_id).collection('messages')
+    if chat_data and chat_data.get('messages'):
+        # Not migrated yet: newer messages may already be in the subcollection
+        with firestore_call('get_chat_messages', 'read'):
+            newer = [doc.to_dict() for doc in messages_ref.order_by('timestamp').stream()]
+        return _page_legacy_messages(chat_data['messages'] + newer, limit, before)
+
+    query = messages_ref.order_by('timestamp', direction=firestore.Query.DESCENDING)
+    if before:
+        with firestore_call('get_chat_messages', 'read'):
+            cursor = messages_ref.document(before).get()
+        if not cursor.exists:
+            raise ValueError("Invalid cursor: before")
+        query = query.start_after(cursor)
+
+    # Fetch one extra message to know whether an older page exists
+    with firestore_call('get_chat_messages', 'read'):
+        docs = list(query.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    messages = []
+    for doc in reversed(docs):
+        message = doc.to_dict()
+        message['id'] = doc.id
+        messages.append(message)
+    next_before = docs[-1].id if has_more else None
+    return messages, next_before
+
+def _page_legacy_messages(messages, limit, before):
+    """Page an array-based chat the same way as the subcollection."""
+    end = len(messages)
+    if before:
+        if not before.startswith('legacy-') or not before[len('legacy-'):].isdigit():
+            raise ValueError("Invalid cursor: before")
+        end = min(end, int(before[len('legacy-'):]))
+    start = max(0, end - limit)
+    # The IDs migrate-chat-messages gives these messages, so cursors survive the migration
+    page = []
+    for index in range(start, end):
+        message = dict(messages[index])
+        message['id'] = f"legacy-{index:06d}"
+        page.append(message)
+    next_before = f"legacy-{start:06d}" if start > 0 else None
+    return page, next_before
+
+def get_chat_document(user_id, chat_id, message_limit=HISTORY_MAX_MESSAGES):
+    """
+    Fetch a chat document and its most recent messages for building context.
+    
+    Args:
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat document
+        message_limit (int): Maximum number of recent messages to load
+    
+    Returns:
+        dict: The chat data with `messages` holding the recent messages
+        (oldest first), or None if the chat does not exist
+    """
+    with firestore_call('get_chat_document', 'read'):
+        chat_doc = get_chat_ref(user_id, chat_id).get()
+    if not chat_doc.exists:
+        return None
+    chat = chat_doc.to_dict()
+    chat['messages'], _ = get_chat_messages(user_id, chat_id, message_limit, chat_data=chat)
+    return chat
+
+def save_chat_summary(user_id, chat_id, summary, summarized_until):
+    """
+    Cache the rolling summary of older turns on the chat document.
+    
+    Args:
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat document
+        summary (str): Summary of all messages up to `summarized_until`
+        summarized_until (datetime): Timestamp of the last summarised message
     
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        db = firestore.client()
-        try:
-            current_timestamp = datetime.now()
-            print(f"Current timestamp: {current_timestamp}")
-        except Exception as e:
-            print(f"Error with datetime: {str(e)}")
+        with firestore_call('save_chat_summary', 'write'):
+            get_chat_ref(user_id, chat_id).set({
+                'summary': summary,
+                'summarized_until': summarized_until
+            }, merge=True)
+        # The summary is part of a chat's pages but not of the chat listings
+        invalidate_history(user_id, chat_id, listings=False)
+        return True
+    except Exception as e:
+        logger.error("Error saving chat summary to Firestore: %s", e)
+        return False
 
-        # Create message objects
-        user_message_data = {
+def save_chat_documents(user_id, chat_id, documents):
+    """
+    List indexed documents on a chat, so any instance can search them.
+    
+    Args:
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat document
+        documents (list): Dicts of sha256, mime_type and uri (None for
+            documents that were not stored through /upload)
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        with firestore_call('save_chat_documents', 'write'):
+            get_chat_ref(user_id, chat_id).set({'documents': firestore.ArrayUnion(documents)}, merge=True)
+        return True
+    except Exception as e:
+        logger.error("Error saving chat documents to Firestore: %s", e)
+        return False
+
+def build_exchange_messages(user_message, ai_response, asked_at=None, answered_at=None):
+    """
+    Create the message objects stored for one exchange.
+    
+    Args:
+        user_message (str): The message sent by the user
+        ai_response (str): The response generated by the AI
+        asked_at (datetime, optional): When the question was received
+        answered_at (datetime, optional): When the answer finished streaming
+    
+    Returns:
+        list: The user message and AI message dicts
+    """
+    answered_at = answered_at or datetime.now(timezone.utc)
+    return [
+        {
             'role': 'user',
             'message': user_message,
-            'timestamp': current_timestamp
-        }
-        
-        ai_message_data = {
+            'timestamp': asked_at or answered_at
+        },
+        {
             'role': 'ai',
             'message': ai_response,
-            'timestamp': current_timestamp
+            'timestamp': answered_at
         }
-        
-        # Check if user exists
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        if not user_doc.exists:
-            print(f"User document {user_id} doesn't exist, will be created implicitly")
-        
-        # Reference to chat document
-        chat_ref = user_ref.collection('chats').document(chat_title)
-        
-        # Check if chat document exists
-        chat_doc = chat_ref.get()
-        if chat_doc.exists:
-            print(f"Updating existing chat document: {chat_title}")
-        else:
-            print(f"Creating new chat document: {chat_title}")
-        
-        # Update in transaction
-        transaction = db.transaction()
-        
-        @firestore.transactional
-        def update_in_transaction(transaction, doc_ref):
-            doc = doc_ref.get(transaction=transaction)
-            
-            if doc.exists:
-                transaction.update(doc_ref, {
-                    'messages': firestore.ArrayUnion([user_message_data, ai_message_data]),
-                    'last_updated': current_timestamp
-                })
-            else:
-                transaction.set(doc_ref, {
-                    'title': chat_title,
-                    'createdAt': current_timestamp,
-                    'last_updated': current_timestamp,
-                    'messages': [user_message_data, ai_message_data]
-                })
-        
-        update_in_transaction(transaction, chat_ref)
-        print(f"Successfully saved chat for user {user_id}")
+    ]
+
+def message_id(user_id, chat_id, message):
+    """
+    The document ID of a stored message, derived from its contents.
+
+    Messages are built once per exchange (build_exchange_messages), so a
+    batch sent again after an ambiguous failure overwrites the same
+    documents instead of adding copies.
+    """
+    key = "\0".join((user_id, chat_id, message['role'], message['timestamp'].isoformat(), message['message']))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def add_chat_messages_to_batch(batch, user_id, chat_id, chat_title, messages, is_new_chat=False):
+    """
+    Add the writes appending messages to a chat to a write batch.
+    
+    Each message becomes a document in the chat's messages subcollection,
+    with an ID from message_id(), and the chat document is updated with a
+    merge set, so nothing has to be read first. Adds 1 + len(messages)
+    writes to the batch. `message_count` is incremented, so a batch must
+    not be committed again once it has landed (see batch_committed()).
+    
+    Args:
+        batch: A Firestore WriteBatch
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat document
+        chat_title (str): The title to set, or None to keep the current one
+        messages (list): Message dicts, oldest first
+        is_new_chat (bool): Whether the server created the chat with these
+            messages; only then is createdAt stamped
+    """
+    chat_ref = get_chat_ref(user_id, chat_id)
+    messages_ref = chat_ref.collection('messages')
+    for message in messages:
+        batch.set(messages_ref.document(message_id(user_id, chat_id, message)), message)
+
+    chat_data = {
+        'last_updated': max(message['timestamp'] for message in messages),
+        'message_count': firestore.Increment(len(messages))
+    }
+    # Only new chats carry a (provisional) title; later writes must not
+    # overwrite the one generated by the title job
+    if chat_title:
+        chat_data['title'] = chat_title
+    if is_new_chat:
+        chat_data['createdAt'] = messages[0]['timestamp']
+    batch.set(chat_ref, chat_data, merge=True)
+
+def batch_committed(user_id, chat_id, messages):
+    """
+    Whether a batch holding these messages already landed.
+
+    Batches are atomic, so one message document tells for the whole
+    batch. Used before retrying a commit whose outcome is unknown (a
+    timeout or UNAVAILABLE may come after the write was applied).
+    """
+    messages_ref = get_chat_ref(user_id, chat_id).collection('messages')
+    with firestore_call('batch_committed', 'read'):
+        return messages_ref.document(message_id(user_id, chat_id, messages[0])).get().exists
+
+def save_chat_to_firestore(user_id, chat_id, user_message, ai_response, asked_at=None, is_new_chat=False,
+                           chat_title=None):
+    """
+    Save a chat exchange (user message and AI response) to Firestore.
+    
+    This writes synchronously; the /ask routes use the write-behind queue
+    in chat_writer instead.
+    
+    Args:
+        user_id (str): The ID of the user
+        chat_id (str): The ID of the chat document
+        user_message (str): The message sent by the user
+        ai_response (str): The response generated by the AI
+        asked_at (datetime, optional): When the question was received
+        is_new_chat (bool): Whether the server created the chat with this exchange
+        chat_title (str, optional): The title to set, or None to keep the current one
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        db = get_firestore_client()
+        batch = db.batch()
+        messages = build_exchange_messages(user_message, ai_response, asked_at)
+        add_chat_messages_to_batch(batch, user_id, chat_id, chat_title, messages, is_new_chat)
+        with firestore_call('save_chat_to_firestore', 'write'):
+            batch.commit()
+        invalidate_history(user_id, chat_id)
         return True
     except Exception as e:
-        print(f"Error saving chat to Firestore: {e}")
+        logger.error("Error saving chat to Firestore: %s", e)
         return False
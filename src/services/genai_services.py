@@ -1,108 +1,854 @@
-from google.genai import types
-from google import genai
-import os
 import json
-from google.oauth2.credentials import Credentials as UserCredentials
-from google.auth.transport.requests import Request
-from config import MODEL_NAME, PROJECT_ID, LOCATION, DEBUG, LAW_ASSISTANT_INSTRUCTION, SAFETY_SETTINGS
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from config import (
+    MODEL_NAME, PROJECT_ID, LOCATION, DEBUG, LAW_ASSISTANT_INSTRUCTION,
+    GENAI_CREDENTIALS_PATH, GENAI_TOKEN_REFRESH_MARGIN, GENAI_TOKEN_CHECK_INTERVAL,
+    SUMMARY_INSTRUCTION, HISTORY_SUMMARY_MAX_TOKENS, GENAI_BACKEND,
+    FAKE_GENAI_TTFT, FAKE_GENAI_CHUNK_DELAY, FAKE_GENAI_CHUNKS, FAKE_GENAI_ERROR_RATE,
+    FAKE_GENAI_MODEL_TTFT, FAKE_GENAI_MODEL_ERROR_RATE, GENAI_MAX_RETRIES, GENAI_HEDGE_ENABLED,
+    GENAI_HEDGE_DEFAULT_DELAY, GENAI_HEDGE_MIN_DELAY, GENAI_HEDGE_WORKERS, GENAI_FALLBACK_MODEL,
+    GENAI_FALLBACK_LOCATION, TITLE_INSTRUCTION, CHAT_TITLE_MODEL, MODEL_TIERS,
+    GENAI_FIRST_TOKEN_TIMEOUT_FACTOR
+)
+from src.services.context_cache import get_context_cache
+from src.services.document_service import format_excerpts
+from src.services.statute_index import format_statutes
+from src.services.model_router import get_model_router, default_route
+from src.services.resilience import (
+    GenerationError, is_retryable, backoff_delay, get_circuit_breaker, hedge_budget
+)
+from src.services.metrics import (
+    GENAI_REQUESTS, GENAI_TIME_TO_FIRST_TOKEN, GENAI_STREAM_DURATION, GENAI_STREAM_CHUNKS,
+    GENAI_TOKENS, GENAI_RETRIES
+)
+from src.services.tracing import span
+from src.utils.lazy_import import lazy_import
 
-def initialize_genai_client():
-    """Initialize and return a Google Generative AI client."""
+# The client libraries take over a second to import, so they load on first use
+genai = lazy_import('google.genai')
+types = lazy_import('google.genai.types')
+errors = lazy_import('google.genai.errors')
+google_auth = lazy_import('google.auth')
+oauth2_credentials = lazy_import('google.oauth2.credentials')
+auth_requests = lazy_import('google.auth.transport.requests')
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the error text shown to plain-text clients when generation fails
+GENERATION_ERROR_PREFIX = "Error generating response:"
+
+CLOUD_PLATFORM_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+
+# One client per worker process, built lazily on first use so that it is
+# created after gunicorn forks and its connection pool is never shared
+# across processes.
+_client = None
+_credentials = None
+_fallback_client = None
+_client_lock = threading.Lock()
+_refresh_thread = None
+_client_status = {
+    "ready": False,
+    "healthy": True,
+    "created_at": None,
+    "last_refresh": None,
+    "token_expiry": None,
+    "last_error": None,
+}
+
+def _load_credentials():
+    """Load the credentials used by the GenAI client.
+
+    In production the application default credentials of the Cloud Run
+    service account are used. For local development, the authorized user
+    credentials file in ./secrets is loaded instead.
+    """
     if not DEBUG:
-        # Let the Google client library handle authentication
-        return genai.Client(
-            vertexai=True,
-            project=PROJECT_ID,
-            location=LOCATION,
-        )
-    else:
-        # For local development, load credentials from file
+        credentials, _ = google_auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+        return credentials
+
+    try:
+        with open(GENAI_CREDENTIALS_PATH, 'r') as f:
+            credentials_info = json.load(f)
+    except Exception as e:
+        raise Exception(f"Error loading credentials: {str(e)}")
+
+    # Make sure it's an authorized_user type
+    if credentials_info.get('type') != 'authorized_user':
+        raise ValueError("Invalid credentials format in application_default_credentials.json")
+
+    return oauth2_credentials.Credentials(
+        token=None,  # No token initially
+        refresh_token=credentials_info.get('refresh_token'),
+        client_id=credentials_info.get('client_id'),
+        client_secret=credentials_info.get('client_secret'),
+        token_uri='https://oauth2.googleapis.com/token',
+        scopes=[CLOUD_PLATFORM_SCOPE]
+    )
+
+def _refresh_credentials(credentials):
+    """Refresh the OAuth token and record the new expiry."""
+    credentials.refresh(auth_requests.Request())
+    _client_status["last_refresh"] = datetime.now(timezone.utc).isoformat()
+    _client_status["token_expiry"] = credentials.expiry.isoformat() if credentials.expiry else None
+
+def _needs_refresh(credentials):
+    """Check whether the token is missing or about to expire."""
+    if not credentials.token or credentials.expiry is None:
+        return True
+    expiry = credentials.expiry
+    if expiry.tzinfo is None:
+        # google-auth stores expiry as a naive UTC datetime
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    margin = timedelta(seconds=GENAI_TOKEN_REFRESH_MARGIN)
+    return datetime.now(timezone.utc) + margin >= expiry
+
+def _refresh_loop():
+    """Background loop that refreshes the token before it expires.
+
+    Keeps the blocking OAuth round trip off the request path. Failures mark
+    the client unhealthy and are retried on the next tick; the SDK will
+    still refresh on demand if the token actually expires.
+    """
+    while True:
+        time.sleep(GENAI_TOKEN_CHECK_INTERVAL)
+        credentials = _credentials
+        if credentials is None:
+            continue
         try:
-            credentials_path = './secrets/application_default_credentials.json'
-            with open(credentials_path, 'r') as f:
-                credentials_info = json.load(f)
-
-            # Make sure it's an authorized_user type
-            if credentials_info.get('type') == 'authorized_user':
-                app_default_credentials = UserCredentials(
-                    token=None,  # No token initially
-                    refresh_token=credentials_info.get('refresh_token'),
-                    client_id=credentials_info.get('client_id'),
-                    client_secret=credentials_info.get('client_secret'),
-                    token_uri='https://oauth2.googleapis.com/token',
-                    scopes=['https://www.googleapis.com/auth/cloud-platform']
-                )
-                
-                # Refresh the token
-                request_obj = Request()
-                app_default_credentials.refresh(request_obj)
-                
-                return genai.Client(
-                    credentials=app_default_credentials,
+            if _needs_refresh(credentials):
+                _refresh_credentials(credentials)
+            _client_status["healthy"] = True
+            _client_status["last_error"] = None
+        except Exception as e:
+            _client_status["healthy"] = False
+            _client_status["last_error"] = f"Token refresh failed: {str(e)}"
+            logger.warning("GenAI token refresh failed: %s", e)
+
+def _start_refresh_thread():
+    global _refresh_thread
+    if _refresh_thread is None or not _refresh_thread.is_alive():
+        _refresh_thread = threading.Thread(
+            target=_refresh_loop, name="genai-token-refresh", daemon=True
+        )
+        _refresh_thread.start()
+
+def initialize_genai_client():
+    """Initialize and return a new Google Generative AI client and its credentials."""
+    if GENAI_BACKEND == 'fake':
+        from src.testing.fake_genai import FakeGenAIClient
+        client = FakeGenAIClient(
+            ttft=FAKE_GENAI_TTFT,
+            chunk_delay=FAKE_GENAI_CHUNK_DELAY,
+            chunks=FAKE_GENAI_CHUNKS,
+            error_rate=FAKE_GENAI_ERROR_RATE,
+            model_ttft=FAKE_GENAI_MODEL_TTFT,
+            model_error_rate=FAKE_GENAI_MODEL_ERROR_RATE,
+        )
+        return client, None
+
+    credentials = _load_credentials()
+    _refresh_credentials(credentials)
+    client = genai.Client(
+        credentials=credentials,
+        vertexai=True,
+        project=PROJECT_ID,
+        location=LOCATION,
+    )
+    return client, credentials
+
+def get_genai_client():
+    """
+    Return the process-wide GenAI client, building it on first use.
+
+    The client (and the HTTP connection pool it holds) is shared by all
+    request threads of the worker. Its token is kept fresh by a background
+    thread so requests never wait on an OAuth refresh.
+
+    Returns:
+        genai.Client: The shared client
+    """
+    global _client, _credentials
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            try:
+                client, credentials = initialize_genai_client()
+            except Exception as e:
+                _client_status["healthy"] = False
+                _client_status["last_error"] = str(e)
+                raise
+            _credentials = credentials
+            _client = client
+            _client_status.update({
+                "ready": True,
+                "healthy": True,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "last_error": None,
+            })
+            if credentials is not None:
+                _start_refresh_thread()
+    return _client
+
+def get_fallback_genai_client():
+    """
+    Return the client for GENAI_FALLBACK_LOCATION, used while the primary
+    region's circuit breaker is open. It shares the primary client's
+    credentials and token refresher.
+    """
+    global _fallback_client
+    if _fallback_client is not None:
+        return _fallback_client
+
+    primary = get_genai_client()
+    with _client_lock:
+        if _fallback_client is None:
+            if _credentials is None:
+                # The fake backend has no regions
+                _fallback_client = primary
+            else:
+                _fallback_client = genai.Client(
+                    credentials=_credentials,
                     vertexai=True,
                     project=PROJECT_ID,
-                    location=LOCATION,
+                    location=GENAI_FALLBACK_LOCATION,
                 )
-            else:
-                raise ValueError("Invalid credentials format in application_default_credentials.json")
-        except Exception as e:
-            raise Exception(f"Error loading credentials: {str(e)}")
+    return _fallback_client
+
+def reset_genai_client():
+    """Drop the shared clients so the next request builds fresh ones."""
+    global _client, _credentials, _fallback_client
+    with _client_lock:
+        _client = None
+        _credentials = None
+        _fallback_client = None
+        _client_status["ready"] = False
+
+def get_genai_client_status():
+    """
+    Report the state of the shared GenAI client for health checks.
+
+    Returns:
+        dict: Copy of the client status flags
+    """
+    return dict(_client_status)
+
+# Threads that wait for first tokens so a slow request can be hedged
+_hedge_executor = ThreadPoolExecutor(max_workers=GENAI_HEDGE_WORKERS, thread_name_prefix="genai-hedge")
+
+def _is_missing_cache_error(error):
+    """Check whether the model rejected a request because its cached content is gone."""
+    if not isinstance(error, errors.APIError):
+        return False
+    message = str(error).lower()
+    return error.code in (400, 403, 404) and ('cache' in message or 'cached' in message)
+
+def _build_generation_config(cached_content=None, max_output_tokens=8192):
+    """Create the generation config, referencing cached content when available."""
+    if cached_content:
+        # The system prompt lives in the cached content
+        return types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            max_output_tokens=max_output_tokens,
+            response_modalities=["TEXT"],
+            cached_content=cached_content,
+        )
+    return types.GenerateContentConfig(
+        temperature=1,
+        top_p=0.95,
+        max_output_tokens=max_output_tokens,
+        response_modalities=["TEXT"],
+        system_instruction=[types.Part.from_text(text=LAW_ASSISTANT_INSTRUCTION)],
+    )
 
-def generate_legal_response(question):
+def generate_legal_response(question, history=None, attachments=None, excerpts=None,
+                            statutes=None, usage=None):
     """
     Generate a streamed response to a legal question using Gemini.
     
+    The model and output limit are chosen per request by the model router.
+    The system prompt and any attachments are served from the context cache
+    when possible; if the cached content has expired on the model side, the
+    request is sent again with everything inline. Quota and server errors
+    are retried before the first token, a hedged request is sent when the
+    first token is slower than the tier's p95, and while the model's circuit
+    breaker is open the fallback model or region answers instead.
+    
     Args:
         question (str): The legal question text
+        history (list, optional): Earlier turns as types.Content objects
+        attachments (list, optional): types.Part objects for attached media
+        excerpts (list, optional): Retrieved document chunks sent with the
+            question instead of the whole documents
+        statutes (list, optional): Statute index hits to ground citations in
+        usage (dict, optional): Filled in with the token counts the model
+            reports (prompt_tokens, completion_tokens, total_tokens, cached_tokens)
         
     Yields:
         str: Chunks of the generated response as they become available
+
+    Raises:
+        GenerationError: If no answer could be produced or the stream broke
+            off; nothing the model did not write is ever yielded
     """
-    client = initialize_genai_client()
-    
-    # Create content for the model
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(text=question)
-            ]
-        )
+    prompt = _prompt(question, history, attachments, excerpts, statutes)
+    router, route = _route_request(prompt)
+    usage = usage if usage is not None else {}
+
+    context_cache = get_context_cache(get_genai_client)
+    cached_content = None
+    if context_cache is not None:
+        cached_content = context_cache.get(route['model'], LAW_ASSISTANT_INSTRUCTION, prompt['attachments'])
+
+    timing = _start_timing(route)
+    try:
+        for text in _resilient_stream(route, prompt, cached_content, context_cache, usage, _hedge_delay(router, route)):
+            timing['first_token_at'] = timing['first_token_at'] or time.monotonic()
+            timing['chunks'] += 1
+            yield text
+        timing['completed'] = True
+    except GenerationError as e:
+        timing['failed'] = e
+        raise
+    finally:
+        _record_call(router, route, timing, usage)
+
+def _prompt(question, history, attachments, excerpts, statutes):
+    """Everything that goes into the user turn, bundled for the call helpers."""
+    return {
+        'question': question,
+        'history': history,
+        'attachments': list(attachments or []),
+        'excerpts': excerpts,
+        'statutes': statutes,
+    }
+
+def _route_request(prompt):
+    """Pick the model for a request; the standard model when routing is disabled."""
+    router = get_model_router()
+    if router is None:
+        return None, default_route()
+    return router, router.route(
+        prompt['question'], prompt['history'], prompt['attachments'], prompt['excerpts'], prompt['statutes']
+    )
+
+def _start_timing(route):
+    """Timing of one streamed answer, in a span that stays open until it is recorded."""
+    return {
+        'started_at': time.monotonic(), 'first_token_at': None, 'chunks': 0,
+        'completed': False, 'failed': None,
+        'span': span('genai.generate', model=route['model'], tier=route['tier']),
+    }
+
+def _record_call(router, route, timing, usage):
+    """Report a finished call's latency and token usage to the metrics and the router."""
+    now = time.monotonic()
+    failed = timing['failed'] is not None
+    labels = {'model': route['model'], 'tier': route['tier']}
+    if failed:
+        outcome = 'error'
+    elif timing['completed']:
+        outcome = 'ok'
+    else:
+        # The client went away before the answer was finished
+        outcome = 'cancelled'
+    GENAI_REQUESTS.labels(outcome=outcome, **labels).inc()
+    if timing['first_token_at'] is not None:
+        GENAI_TIME_TO_FIRST_TOKEN.labels(**labels).observe(timing['first_token_at'] - timing['started_at'])
+    if outcome == 'ok':
+        GENAI_STREAM_DURATION.labels(**labels).observe(now - timing['started_at'])
+        GENAI_STREAM_CHUNKS.labels(**labels).observe(timing['chunks'])
+    for direction, key in (('input', 'prompt_tokens'), ('output', 'completion_tokens'), ('cached', 'cached_tokens')):
+        if usage.get(key):
+            GENAI_TOKENS.labels(direction=direction, **labels).inc(usage[key])
+    timing['span'].set(outcome=outcome, chunks=timing['chunks'], **{
+        key: usage[key] for key in ('prompt_tokens', 'completion_tokens') if key in usage
+    })
+    timing['span'].finish(timing['failed'])
+
+    if router is None:
+        return
+    if timing['first_token_at'] is None and not failed:
+        # The client went away before the model answered
+        return
+    ttft = (timing['first_token_at'] or now) - timing['started_at']
+    router.record(route, ttft, now - timing['started_at'], usage, failed)
+
+def _hedge_delay(router, route):
+    """Seconds to wait for the first token before hedging, or None to never hedge."""
+    if not GENAI_HEDGE_ENABLED:
+        return None
+    p95 = router.ttft_p95(route['tier']) if router is not None else None
+    return max(GENAI_HEDGE_MIN_DELAY, p95 or GENAI_HEDGE_DEFAULT_DELAY)
+
+def _first_token_timeout(route):
+    """Seconds to wait for the first token of one request, or None to wait indefinitely."""
+    budget = MODEL_TIERS.get(route['tier'], {}).get('p95_budget')
+    if not budget or GENAI_FIRST_TOKEN_TIMEOUT_FACTOR <= 0:
+        return None
+    return budget * GENAI_FIRST_TOKEN_TIMEOUT_FACTOR
+
+def _call_targets(route, cached_content):
+    """The routed model, then the fallbacks used while its circuit breaker is open."""
+    targets = [_target(get_genai_client, LOCATION, route, cached_content)]
+    if GENAI_FALLBACK_MODEL and GENAI_FALLBACK_MODEL != route['model']:
+        # Cached content belongs to the model it was created for
+        targets.append(_target(get_genai_client, LOCATION, dict(route, model=GENAI_FALLBACK_MODEL), None))
+    if GENAI_FALLBACK_LOCATION and GENAI_FALLBACK_LOCATION != LOCATION:
+        targets.append(_target(get_fallback_genai_client, GENAI_FALLBACK_LOCATION, route, None))
+    return targets
+
+def _target(client_factory, location, route, cached_content):
+    return {
+        'breaker': get_circuit_breaker(f"{location or 'default'}/{route['model']}"),
+        'client': client_factory,
+        'route': route,
+        'cached_content': cached_content,
+    }
+
+def _available_target(targets):
+    """The first target whose circuit breaker lets a request through."""
+    for target in targets:
+        if target['breaker'].allow():
+            return target
+    raise GenerationError("The model is temporarily unavailable, please try again shortly", retryable=True)
+
+def _resilient_stream(route, prompt, cached_content, context_cache, usage, hedge_delay):
+    """Stream one answer, retrying and failing over until the first token arrives."""
+    targets = _call_targets(route, cached_content)
+    retries = 0
+    while True:
+        target = _available_target(targets)
+        client = target['client']()
+
+        def start(attempt_usage, client=client, target=target):
+            return _stream_response(client, target['route'], prompt, target['cached_content'], attempt_usage)
+
+        try:
+            chunks, first, attempt_usage = _first_chunk(start, hedge_delay, _first_token_timeout(target['route']))
+        except Exception as e:
+            if target['cached_content'] and _is_missing_cache_error(e):
+                # Send the prompt inline instead; the next request recreates the cache
+                context_cache.invalidate(target['cached_content'])
+                target['cached_content'] = None
+                continue
+            if not is_retryable(e):
+                raise GenerationError(str(e)) from e
+            target['breaker'].record(False)
+            if retries >= GENAI_MAX_RETRIES:
+                raise GenerationError(str(e), retryable=True) from e
+            retries += 1
+            GENAI_RETRIES.labels(model=target['route']['model']).inc()
+            time.sleep(backoff_delay(retries))
+            continue
+
+        target['breaker'].record(True)
+        try:
+            if first is not None:
+                yield first
+            for text in chunks:
+                yield text
+        except Exception as e:
+            # Text already sent cannot be taken back, so a broken stream is not retried
+            if is_retryable(e):
+                target['breaker'].record(False)
+            raise GenerationError(f"The answer was interrupted: {str(e)}", retryable=is_retryable(e)) from e
+        finally:
+            usage.update(attempt_usage)
+        return
+
+
+class _Attempt:
+    """One request racing for the first token on a hedge thread."""
+
+    def __init__(self, start):
+        self.start = start
+        self.usage = {}
+        self.chunks = None
+        self.first = None
+        self.error = None
+        self._done = False
+        self._abandoned = False
+        self._lock = threading.Lock()
+
+    def run(self, results):
+        with self._lock:
+            if self._abandoned:
+                # Given up on while waiting for a free hedge thread
+                return
+        try:
+            self.chunks = self.start(self.usage)
+            self.first = next(self.chunks, None)
+        except Exception as e:
+            self.error = e
+        results.put(self)
+        with self._lock:
+            self._done = True
+            abandoned = self._abandoned
+        if abandoned:
+            self._close()
+
+    def abandon(self):
+        """Close the losing request, now or as soon as its first token arrives."""
+        with self._lock:
+            self._abandoned = True
+            done = self._done
+        if done:
+            self._close()
+
+    def _close(self):
+        if self.chunks is not None and self.error is None:
+            self.chunks.close()
+
+def _first_token_timed_out(timeout):
+    return TimeoutError(f"No response from the model within {timeout:.1f}s")
+
+def _first_chunk(start, hedge_delay, timeout=None):
+    """
+    Start a request and wait for its first text chunk.
+
+    If none arrives within `hedge_delay` seconds, an identical request is
+    sent and whichever answers first is used; the other is closed. If
+    neither has answered after `timeout` seconds, both are closed.
+
+    Returns:
+        tuple: (remaining chunks, first chunk or None, usage of the request used)
+
+    Raises:
+        TimeoutError: If no request answered within `timeout`
+    """
+    if hedge_delay is None and timeout is None:
+        attempt_usage = {}
+        chunks = start(attempt_usage)
+        return chunks, next(chunks, None), attempt_usage
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def wait(seconds=None):
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            seconds = remaining if seconds is None else min(seconds, remaining)
+        try:
+            return results.get(timeout=seconds)
+        except queue.Empty:
+            return None
+
+    if timeout is not None and hedge_delay is not None and hedge_delay >= timeout:
+        hedge_delay = None
+
+    results = queue.Queue()
+    attempts = [_Attempt(start)]
+    _hedge_executor.submit(attempts[0].run, results)
+    winner = wait(hedge_delay) if hedge_delay is not None else None
+    try:
+        if winner is None and hedge_delay is not None and hedge_budget.try_acquire():
+            attempts.append(_Attempt(start))
+            _hedge_executor.submit(attempts[1].run, results)
+            winner = wait()
+            if winner is not None and winner.error is not None:
+                # The other request may still answer
+                winner = wait() or winner
+            hedge_budget.release(won=winner is attempts[1] and winner.error is None)
+        elif winner is None:
+            winner = wait()
+    finally:
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.abandon()
+    if winner is None:
+        raise _first_token_timed_out(timeout)
+    if winner.error is not None:
+        raise winner.error
+    return winner.chunks, winner.first, winner.usage
+
+def _record_usage(usage, metadata):
+    """Copy the model's token counts; later chunks carry the running totals."""
+    usage['prompt_tokens'] = metadata.prompt_token_count or 0
+    usage['completion_tokens'] = metadata.candidates_token_count or 0
+    usage['total_tokens'] = metadata.total_token_count or 0
+    usage['cached_tokens'] = metadata.cached_content_token_count or 0
+
+def _user_parts(prompt, cached_content):
+    """Parts of the user turn: attachments, retrieved excerpts and statutes, then the question."""
+    parts = []
+    # Cached attachments are already part of the cached content
+    if not cached_content:
+        parts += prompt['attachments']
+    if prompt['excerpts']:
+        parts.append(types.Part.from_text(text=format_excerpts(prompt['excerpts'])))
+    if prompt['statutes']:
+        parts.append(types.Part.from_text(text=format_statutes(prompt['statutes'])))
+    parts.append(types.Part.from_text(text=prompt['question']))
+    return parts
+
+def _contents(prompt, cached_content):
+    """Earlier turns of the chat, then the user turn."""
+    return list(prompt['history'] or []) + [
+        types.Content(role="user", parts=_user_parts(prompt, cached_content))
     ]
+
+def _stream_response(client, route, prompt, cached_content, usage):
+    """Stream text chunks for one generate_content_stream call."""
+    # Generate response as a stream
+    for chunk in client.models.generate_content_stream(
+        model=route['model'],
+        contents=_contents(prompt, cached_content),
+        config=_build_generation_config(cached_content, route['max_output_tokens']),
+    ):
+        if usage is not None and chunk.usage_metadata:
+            _record_usage(usage, chunk.usage_metadata)
+
+        # Skip empty chunks
+        if not chunk.candidates or not chunk.candidates[0].content.parts:
+            continue
+            
+        # Yield each chunk of text as it arrives
+        if hasattr(chunk, 'text'):
+            yield chunk.text
+        elif hasattr(chunk.candidates[0].content.parts[0], 'text'):
+            yield chunk.candidates[0].content.parts[0].text
+
+async def generate_legal_response_async(question, history=None, attachments=None, excerpts=None,
+                                        statutes=None, usage=None):
+    """
+    Async version of generate_legal_response for the ASGI server.
     
-    # Create generation config
-    generate_content_config = types.GenerateContentConfig(
-        temperature=1,
-        top_p=0.95,
-        max_output_tokens=8192,
-        response_modalities=["TEXT"],
-        system_instruction=[types.Part.from_text(text=LAW_ASSISTANT_INSTRUCTION)],
-    )
+    Streams with the GenAI async API, so a slow generation only holds an
+    event loop task rather than a worker thread. Retries, hedging and
+    failover behave as in generate_legal_response.
+    
+    Args:
+        question (str): The legal question text
+        history (list, optional): Earlier turns as types.Content objects
+        attachments (list, optional): types.Part objects for attached media
+        excerpts (list, optional): Retrieved document chunks sent with the
+            question instead of the whole documents
+        statutes (list, optional): Statute index hits to ground citations in
+        usage (dict, optional): Filled in with the token counts the model
+            reports (prompt_tokens, completion_tokens, total_tokens, cached_tokens)
+        
+    Yields:
+        str: Chunks of the generated response as they become available
 
+    Raises:
+        GenerationError: If no answer could be produced or the stream broke off
+    """
+    # The first call builds the client and refreshes its token, so keep it off the loop
+    if _client is None:
+        await asyncio.to_thread(get_genai_client)
+    prompt = _prompt(question, history, attachments, excerpts, statutes)
+    router, route = _route_request(prompt)
+    usage = usage if usage is not None else {}
+
+    context_cache = get_context_cache(get_genai_client)
+    cached_content = None
+    if context_cache is not None:
+        cached_content = await asyncio.to_thread(
+            context_cache.get, route['model'], LAW_ASSISTANT_INSTRUCTION, prompt['attachments']
+        )
+
+    timing = _start_timing(route)
     try:
-        # Generate response as a stream
-        for chunk in client.models.generate_content_stream(
-            model=MODEL_NAME,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            # Skip empty chunks
-            if not chunk.candidates or not chunk.candidates[0].content.parts:
+        async for text in _resilient_stream_async(route, prompt, cached_content, context_cache, usage, _hedge_delay(router, route)):
+            timing['first_token_at'] = timing['first_token_at'] or time.monotonic()
+            timing['chunks'] += 1
+            yield text
+        timing['completed'] = True
+    except GenerationError as e:
+        timing['failed'] = e
+        raise
+    finally:
+        _record_call(router, route, timing, usage)
+
+async def _resilient_stream_async(route, prompt, cached_content, context_cache, usage, hedge_delay):
+    """Async version of _resilient_stream()."""
+    targets = _call_targets(route, cached_content)
+    retries = 0
+    while True:
+        target = _available_target(targets)
+        client = target['client']()
+
+        def start(attempt_usage, client=client, target=target):
+            return _stream_response_async(client, target['route'], prompt, target['cached_content'], attempt_usage)
+
+        try:
+            chunks, first, attempt_usage = await _first_chunk_async(start, hedge_delay, _first_token_timeout(target['route']))
+        except Exception as e:
+            if target['cached_content'] and _is_missing_cache_error(e):
+                context_cache.invalidate(target['cached_content'])
+                target['cached_content'] = None
                 continue
-                
-            # Yield each chunk of text as it arrives
-            if hasattr(chunk, 'text'):
-                yield chunk.text
-            elif hasattr(chunk.candidates[0].content.parts[0], 'text'):
-                yield chunk.candidates[0].content.parts[0].text
-    except Exception as e:
-        # Yield the error as part of the stream
-        yield f"Error generating response: {str(e)}"
+            if not is_retryable(e):
+                raise GenerationError(str(e)) from e
+            target['breaker'].record(False)
+            if retries >= GENAI_MAX_RETRIES:
+                raise GenerationError(str(e), retryable=True) from e
+            retries += 1
+            GENAI_RETRIES.labels(model=target['route']['model']).inc()
+            await asyncio.sleep(backoff_delay(retries))
+            continue
+
+        target['breaker'].record(True)
+        try:
+            if first is not None:
+                yield first
+            async for text in chunks:
+                yield text
+        except Exception as e:
+            if is_retryable(e):
+                target['breaker'].record(False)
+            raise GenerationError(f"The answer was interrupted: {str(e)}", retryable=is_retryable(e)) from e
+        finally:
+            usage.update(attempt_usage)
+        return
+
+async def _first_chunk_async(start, hedge_delay, timeout=None):
+    """Async version of _first_chunk(); the racing requests are tasks."""
+    async def run(attempt_usage):
+        chunks = start(attempt_usage)
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return chunks, first, attempt_usage
+
+    if hedge_delay is None and timeout is None:
+        return await run({})
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if timeout is not None and hedge_delay is not None and hedge_delay >= timeout:
+        hedge_delay = None
+    tasks = [asyncio.ensure_future(run({}))]
+    hedged, winner = False, None
+    try:
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and hedge_budget.try_acquire():
+                hedged = True
+                tasks.append(asyncio.ensure_future(run({})))
+        pending, error = set(tasks), None
+        while pending:
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise _first_token_timed_out(timeout)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        if hedged:
+            hedge_budget.release(won=winner is not None and winner is not tasks[0])
+        for task in tasks:
+            if task is not winner:
+                _abandon_task(task)
+
+def _abandon_task(task):
+    """Cancel a losing request, or close its stream if it already answered."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result()[0].aclose())
+
+async def _stream_response_async(client, route, prompt, cached_content, usage):
+    """Stream text chunks for one async generate_content_stream call."""
+    stream = await client.aio.models.generate_content_stream(
+        model=route['model'],
+        contents=_contents(prompt, cached_content),
+        config=_build_generation_config(cached_content, route['max_output_tokens']),
+    )
+    async for chunk in stream:
+        if usage is not None and chunk.usage_metadata:
+            _record_usage(usage, chunk.usage_metadata)
+        if not chunk.candidates or not chunk.candidates[0].content.parts:
+            continue
+        if hasattr(chunk, 'text'):
+            yield chunk.text
+        elif hasattr(chunk.candidates[0].content.parts[0], 'text'):
+            yield chunk.candidates[0].content.parts[0].text
+
+def summarize_conversation(previous_summary, messages):
+    """
+    Fold older chat messages into the rolling conversation summary.
+    
+    Args:
+        previous_summary (str): The current summary, if any
+        messages (list): Stored messages to add to the summary, oldest first
+        
+    Returns:
+        str: The updated summary
+    """
+    client = get_genai_client()
+
+    transcript = "\n".join(
+        f"{'User' if message.get('role') == 'user' else 'Assistant'}: {message.get('message', '')}"
+        for message in messages
+    )
+    prompt = f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+
+    response = client.models.generate_content(
+        model=MODEL_NAME,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt)])],
+        config=types.GenerateContentConfig(
+            temperature=0.2,
+            max_output_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+            system_instruction=[types.Part.from_text(text=SUMMARY_INSTRUCTION)],
+        ),
+    )
+    return response.text
+
+def generate_chat_titles(exchanges):
+    """
+    Name several new chats with one model call.
+    
+    Args:
+        exchanges (list): (question, answer) pairs, the first exchange of each chat
+        
+    Returns:
+        list: One title per exchange, in order
+
+    Raises:
+        ValueError: If the model does not return one title per exchange
+    """
+    client = get_genai_client()
+
+    # Long answers add cost but little to a title
+    conversations = [
+        {'question': question[:1000], 'answer': answer[:1000]}
+        for question, answer in exchanges
+    ]
+    response = client.models.generate_content(
+        model=CHAT_TITLE_MODEL,
+        contents=[types.Content(role="user", parts=[
+            types.Part.from_text(text=json.dumps(conversations, ensure_ascii=False))
+        ])],
+        config=types.GenerateContentConfig(
+            temperature=0.2,
+            max_output_tokens=32 * len(exchanges) + 64,
+            response_mime_type="application/json",
+            system_instruction=[types.Part.from_text(text=TITLE_INSTRUCTION)],
+        ),
+    )
+    titles = json.loads(response.text)
+    if not isinstance(titles, list) or len(titles) != len(exchanges):
+        raise ValueError(f"Expected {len(exchanges)} titles from the model")
+    return [str(title) for title in titles]
 
 # Non-streaming version (commented out as streaming is now the standard)
 """
 def generate_legal_response_non_stream(question):
-    client = initialize_genai_client()
+    client = get_genai_client()
     
     # Create content for the model
     contents = [
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    HISTORY_CACHE_ENABLED, HISTORY_CACHE_MAX_ENTRIES, HISTORY_CACHE_MAX_BYTES,
+    HISTORY_CACHE_MAX_ENTRY_BYTES, HISTORY_CACHE_TTL, HISTORY_CACHE_BACKEND, HISTORY_CACHE_REDIS_URL
+)
+from src.services.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Sets every scope's generation to a fresh value of one global counter, so a
+# generation is never reused even after a scope's key expires
+_REDIS_BUMP = """
+local generation = redis.call('INCR', KEYS[1])
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], generation, 'EX', ARGV[1])
+end
+return generation
+"""
+
+
+def etag_for(body):
+    """Strong ETag of a serialised response body."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _scopes(user_id, chat_id):
+    """A write to a chat changes its pages and the user's chat listings."""
+    return [(user_id, None), (user_id, chat_id)] if chat_id else [(user_id, None)]
+
+
+class MemoryGenerations:
+    """
+    Generation number of each (user_id, chat_id) scope in this process.
+
+    Cached bodies are keyed by the generation of their scope, and a write
+    moves the scope to a new generation, so stale bodies are never found
+    again and age out of the LRU. The map is bounded: scopes not in it
+    report `_floor`, which is raised past every generation handed out
+    whenever a scope is evicted.
+    """
+
+    def __init__(self, max_scopes):
+        self.max_scopes = max_scopes
+        self._generations = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def current(self, scope):
+        with self._lock:
+            generation = self._generations.get(scope)
+            if generation is None:
+                return self._floor
+            self._generations.move_to_end(scope)
+            return generation
+
+    def bump(self, scopes):
+        with self._lock:
+            for scope in scopes:
+                self._counter += 1
+                self._generations[scope] = self._counter
+                self._generations.move_to_end(scope)
+            while len(self._generations) > self.max_scopes:
+                self._generations.popitem(last=False)
+                self._counter += 1
+                self._floor = self._counter
+
+
+class RedisHistoryBackend:
+    """Generations and bodies shared by every instance through Redis (e.g. Memorystore)."""
+
+    def __init__(self, url=HISTORY_CACHE_REDIS_URL, prefix="litigence:history:"):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._bump = self._client.register_script(_REDIS_BUMP)
+
+    def _scope_key(self, scope):
+        return self.prefix + 'generation:' + json.dumps(scope)
+
+    def current(self, scope):
+        return int(self._client.get(self._scope_key(scope)) or 0)
+
+    def bump(self, scopes, ttl_seconds):
+        # Generation keys outlive every body cached under them
+        self._bump(keys=[self.prefix + 'counter'] + [self._scope_key(scope) for scope in scopes],
+                   args=[ttl_seconds])
+
+    def get(self, key):
+        value = self._client.get(self.prefix + 'body:' + key)
+        if value is None:
+            return None
+        etag, _, body = value.partition(b'\n')
+        return etag.decode('ascii'), body
+
+    def set(self, key, etag, body, ttl_seconds):
+        self._client.set(self.prefix + 'body:' + key, etag.encode('ascii') + b'\n' + body, ex=ttl_seconds)
+
+
+class HistoryCache:
+    """
+    Read-through cache of serialised /chat_history and /chat_titles pages.
+
+    Each entry holds the JSON body and its ETag, so a hit is sent as-is,
+    or as a 304 if the client already has it. The in-process tier is an
+    LRU bounded by entry count and total bytes, with a TTL. An optional
+    shared tier (Redis) lets instances share bodies and see each other's
+    writes; without it, a write on one worker reaches the others only
+    when their entries expire, so listings (chat_id None), which change
+    whenever a chat is started on any worker, are not cached and are
+    only given an ETag.
+
+    Writes call invalidate() once committed, which moves the chat and the
+    user's listings to new generations. Bodies are keyed by the
+    generation read before they were loaded, so a page loaded while a
+    write was committing is never served after it.
+    """
+
+    def __init__(self, shared=None, max_entries=HISTORY_CACHE_MAX_ENTRIES, max_bytes=HISTORY_CACHE_MAX_BYTES,
+                 max_entry_bytes=HISTORY_CACHE_MAX_ENTRY_BYTES, ttl_seconds=HISTORY_CACHE_TTL,
+                 cache_listings=None):
+        self.shared = shared
+        self.cache_listings = shared is not None if cache_listings is None else cache_listings
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl_seconds = ttl_seconds
+        self.generations = MemoryGenerations(max_entries * 4)
+
+        # key -> {'etag', 'body', 'expires_at'}, in LRU order
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, kind, user_id, chat_id, params, load):
+        """
+        Return a page's body from the cache, or load and cache it.
+
+        Args:
+            kind (str): The endpoint, e.g. "chat_history"
+            user_id (str): The ID of the user
+            chat_id (str): The chat the page belongs to, or None for a listing
+            params (tuple): Everything else the page depends on (limit, cursor)
+            load (callable): Returns (body bytes, HTTP status) on a miss;
+                only 200 responses are cached
+
+        Returns:
+            tuple: (body, status, ETag or None)
+        """
+        if chat_id is None and not self.cache_listings:
+            body, status = load()
+            return body, status, etag_for(body) if status == 200 else None
+
+        scope = (user_id, chat_id)
+        try:
+            shared_generation = self.shared.current(scope) if self.shared else 0
+        except Exception as e:
+            # Without the shared generation a hit could be stale; read through
+            logger.warning("History cache generation lookup failed: %s", e)
+            body, status = load()
+            return body, status, None
+        key = json.dumps([kind, user_id, chat_id, list(params), self.generations.current(scope), shared_generation])
+
+        entry = self._get(key)
+        if entry is not None:
+            CACHE_LOOKUPS.labels(cache='history', result='memory_hit').inc()
+            return entry['body'], 200, entry['etag']
+
+        shared_key = hashlib.sha256(json.dumps([kind, user_id, chat_id, list(params), shared_generation])
+                                    .encode('utf-8')).hexdigest()
+        if self.shared:
+            try:
+                found = self.shared.get(shared_key)
+            except Exception as e:
+                logger.warning("History cache read failed: %s", e)
+                found = None
+            if found is not None:
+                etag, body = found
+                self._put(key, etag, body)
+                CACHE_LOOKUPS.labels(cache='history', result='shared_hit').inc()
+                return body, 200, etag
+
+        with self._lock:
+            self.misses += 1
+        CACHE_LOOKUPS.labels(cache='history', result='miss').inc()
+        body, status = load()
+        if status != 200:
+            return body, status, None
+        etag = etag_for(body)
+        if len(body) <= self.max_entry_bytes:
+            self._put(key, etag, body)
+            if self.shared:
+                try:
+                    self.shared.set(shared_key, etag, body, self.ttl_seconds)
+                except Exception as e:
+                    logger.warning("History cache write failed: %s", e)
+        return body, status, etag
+
+    def invalidate(self, user_id, chat_id=None, listings=True):
+        """
+        Drop the cached pages of a chat after a write to it.
+
+        Args:
+            user_id (str): The ID of the user
+            chat_id (str, optional): The chat written to
+            listings (bool): Whether the write also changes the user's chat
+                listings (False e.g. for a new summary, which they do not show)
+        """
+        scopes = _scopes(user_id, chat_id) if listings else [(user_id, chat_id)]
+        self.generations.bump(scopes)
+        if self.shared:
+            try:
+                self.shared.bump(scopes, self.ttl_seconds)
+            except Exception as e:
+                logger.warning("History cache invalidation failed; other instances may serve stale pages "
+                               "for up to %ss: %s", self.ttl_seconds, e)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key, etag, body):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'etag': etag, 'body': body, 'expires_at': time.monotonic() + self.ttl_seconds}
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Remove an entry (lock held)."""
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry['body'])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def create_shared_backend():
+    if HISTORY_CACHE_BACKEND == 'redis':
+        return RedisHistoryBackend()
+    return None
+
+def get_history_cache():
+    """
+    Return the process-wide history cache.
+
+    Returns:
+        HistoryCache: The cache, or None when it is disabled
+    """
+    global _cache
+    if not HISTORY_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HistoryCache(create_shared_backend())
+    return _cache
+
+def invalidate_history(user_id, chat_id=None, listings=True):
+    """Invalidate a chat's cached pages, if the cache is enabled; see HistoryCache.invalidate."""
+    cache = get_history_cache()
+    if cache is not None:
+        cache.invalidate(user_id, chat_id, listings)
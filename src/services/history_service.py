@@ -0,0 +1,140 @@
+from datetime import timezone
+from config import HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MIN_MESSAGES
+from src.utils.lazy_import import lazy_import
+
+types = lazy_import('google.genai.types')
+
+# Firestore stores the assistant role as 'ai', Gemini expects 'model'
+ROLE_MAP = {
+    'user': 'user',
+    'ai': 'model',
+    'model': 'model',
+}
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for budgeting."""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+def select_history_window(messages, token_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Pick the newest messages that fit in the token budget.
+
+    Args:
+        messages (list): Stored chat messages, oldest first
+        token_budget (int): Approximate number of tokens allowed
+
+    Returns:
+        int: Index of the first message inside the window
+    """
+    used = 0
+    start = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(messages[index].get('message', ''))
+        if used + cost > token_budget:
+            break
+        used += cost
+        start = index
+    return start
+
+def build_history_contents(chat, token_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Build the Gemini conversation history for a stored chat.
+
+    The newest turns that fit in the budget are sent verbatim. Older turns
+    are represented by the rolling summary cached on the chat document;
+    turns that have left the window but are not in the summary yet are
+    still sent verbatim, so nothing drops out of the prompt before the
+    next summary refresh folds it in.
+
+    Args:
+        chat (dict): The chat (recent messages, summary, summarized_until)
+        token_budget (int): Approximate token budget for the history
+
+    Returns:
+        list: types.Content objects, oldest first
+    """
+    if not chat:
+        return []
+
+    messages = chat.get('messages') or []
+    summary = chat.get('summary')
+    contents = []
+
+    if summary:
+        budget_left = token_budget - estimate_tokens(summary)
+        contents.append(types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=f"Summary of our earlier conversation: {summary}")]
+        ))
+        contents.append(types.Content(
+            role="model",
+            parts=[types.Part.from_text(text="Understood, I will keep that context in mind.")]
+        ))
+    else:
+        budget_left = token_budget
+
+    start = min(
+        select_history_window(messages, max(budget_left, 0)),
+        _first_unsummarized(messages, chat.get('summarized_until')),
+    )
+    for message in messages[start:]:
+        text = message.get('message')
+        if not text:
+            continue
+        contents.append(types.Content(
+            role=ROLE_MAP.get(message.get('role'), 'user'),
+            parts=[types.Part.from_text(text=text)]
+        ))
+
+    return contents
+
+def _as_utc(timestamp):
+    """Firestore returns aware datetimes; treat naive ones as UTC so they compare."""
+    if timestamp is not None and timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+def _first_unsummarized(messages, summarized_until):
+    """Index of the first message newer than the summary."""
+    summarized_until = _as_utc(summarized_until)
+    if summarized_until is None:
+        return 0
+    for index, message in enumerate(messages):
+        if _as_utc(message.get('timestamp')) > summarized_until:
+            return index
+    return len(messages)
+
+def pending_summary_messages(chat, token_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Find the messages that have left the window but are not summarised yet.
+
+    Only returns messages once at least HISTORY_SUMMARY_MIN_MESSAGES have
+    accumulated, so the summary is refreshed in batches rather than on
+    every turn.
+
+    Args:
+        chat (dict): The chat (recent messages, summary, summarized_until)
+            after the latest exchange was added
+        token_budget (int): Approximate token budget for the history
+
+    Returns:
+        tuple: (messages to fold into the summary, timestamp of the last
+        one, which becomes the new summarized_until)
+    """
+    if not chat:
+        return [], None
+
+    messages = chat.get('messages') or []
+    summarized_until = _as_utc(chat.get('summarized_until'))
+    budget_left = token_budget - estimate_tokens(chat.get('summary'))
+    window_start = select_history_window(messages, max(budget_left, 0))
+
+    pending = [
+        message for message in messages[:window_start]
+        if summarized_until is None or _as_utc(message.get('timestamp')) > summarized_until
+    ]
+    if len(pending) < HISTORY_SUMMARY_MIN_MESSAGES:
+        return [], summarized_until
+    return pending, pending[-1].get('timestamp')
@@ -1,8 +1,106 @@
 import base64
-from google.genai import types
+import io
+import zipfile
+from src.services.attachment_store import get_attachment_store, AttachmentNotFound
+from src.utils.lazy_import import lazy_import
+
+types = lazy_import('google.genai.types')
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Leading bytes of the file formats we accept
+MAGIC_NUMBERS = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# Number of leading bytes needed by sniff_mime_type
+SNIFF_BYTES = 32
+
+def sniff_mime_type(header, fileobj=None):
+    """
+    Detect a file's MIME type from its leading bytes.
+    
+    Args:
+        header (bytes): At least the first SNIFF_BYTES bytes of the file
+        fileobj (file, optional): Seekable file, used to look inside ZIP
+            containers to tell DOCX apart from other ZIP files
+    
+    Returns:
+        str: The detected MIME type, or None if the format is not recognised
+    """
+    for magic, mime_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    if header.startswith(b"PK\x03\x04"):
+        if fileobj is None:
+            return None
+        position = fileobj.tell()
+        try:
+            fileobj.seek(0)
+            with zipfile.ZipFile(fileobj) as archive:
+                if "word/document.xml" in archive.namelist():
+                    return DOCX_MIME_TYPE
+        except zipfile.BadZipFile:
+            return None
+        finally:
+            fileobj.seek(position)
+    return None
+
+def attachment_part(digest):
+    """
+    Build the content part for an attachment the client referred to by hash.
+
+    Args:
+        digest (str): SHA-256 hex digest of the file's bytes
+
+    Returns:
+        types.Part: The stored file, by URI if it was uploaded, else inline
+
+    Raises:
+        AttachmentNotFound: If the hash is unknown (the client should resend
+            the file contents)
+    """
+    store = get_attachment_store()
+    entry = store.get(digest) if store is not None and isinstance(digest, str) else None
+    if entry is None:
+        raise AttachmentNotFound(f"Unknown attachment {digest}; send the file contents instead")
+    if entry['file_uri']:
+        return _uploaded_part(entry)
+    return types.Part.from_bytes(data=entry['data'], mime_type=entry['mime_type'])
+
+def _uploaded_part(entry):
+    # Imported here because upload_service depends on this module
+    from src.services.upload_service import resolve_file_reference
+    return resolve_file_reference({'uri': entry['file_uri'], 'mime_type': entry['mime_type']})
+
+def _store_attachment(data, declared_mime_type):
+    """
+    Keep decoded bytes in the attachment store so later requests can send the hash.
+
+    The MIME type is sniffed from the bytes; the type the client declared
+    is only used for formats sniff_mime_type does not recognise.
+    """
+    mime_type = sniff_mime_type(data[:SNIFF_BYTES], io.BytesIO(data)) or declared_mime_type
+    store = get_attachment_store()
+    if store is not None:
+        _, entry = store.put(data, mime_type)
+        # Content uploaded before is sent by URI instead of inline
+        if entry['file_uri']:
+            return _uploaded_part(entry)
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
 
 def process_image(img_data):
-    """Process base64 encoded image data"""
+    """Process base64 encoded image data, or a {"sha256": ...} reference"""
+    if isinstance(img_data, dict):
+        return attachment_part(img_data.get('sha256'))
     try:
         # Extract MIME type and base64 content
         if ";" in img_data and "," in img_data:
@@ -14,32 +112,24 @@ def process_image(img_data):
             base64_content = img_data
         
         # Create image part
-        return types.Part.from_bytes(
-            data=base64.b64decode(base64_content),
-            mime_type=mime_type
-        )
+        return _store_attachment(base64.b64decode(base64_content), mime_type)
     except Exception as e:
         raise ValueError(f"Error processing image: {str(e)}")
 
 def process_document(doc_data):
-    """Process base64 encoded document data (PDF or DOCX)"""
+    """Process base64 encoded document data (PDF or DOCX), or a {"sha256": ...} reference"""
+    if isinstance(doc_data, dict):
+        return attachment_part(doc_data.get('sha256'))
     try:
         # Extract MIME type and base64 content
         if ";" in doc_data and "," in doc_data:
             mime_type = doc_data.split(";")[0].split(":")[1]
             base64_content = doc_data.split(",")[1]
         else:
-            # Check file signature or assume file type
-            if doc_data.startswith("UEsDB"):  # DOCX file signature check
-                mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            else:
-                mime_type = "application/pdf"
+            mime_type = None
             base64_content = doc_data
-        
-        # Create document part
-        return types.Part.from_bytes(
-            data=base64.b64decode(base64_content),
-            mime_type=mime_type
-        )
+
+        # Create document part, falling back to PDF if the signature is not recognised
+        return _store_attachment(base64.b64decode(base64_content), mime_type or "application/pdf")
     except Exception as e:
         raise ValueError(f"Error processing document: {str(e)}")
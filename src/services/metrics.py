@@ -0,0 +1,407 @@
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from config import METRICS_MULTIPROCESS_DIR, METRICS_SNAPSHOT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STREAM_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+CHUNK_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterValue:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the seconds its block took."""
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + (('le', _format_value(float(bound))),), cumulative))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started_at')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._started_at)
+        return False
+
+
+class _Metric:
+    """
+    A metric family: one value per combination of label values.
+
+    Unlabelled metrics are used directly (counter.inc()); labelled ones
+    through labels(), which caches the value for each combination.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._values[()] = self._new_value()
+        (registry or REGISTRY).register(self)
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        samples = []
+        for key, value in values:
+            samples += value.samples(self.name, tuple(zip(self.labelnames, key)))
+        return samples
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """
+    Metrics of this worker process.
+
+    Collectors are called at scrape time for values that already live
+    elsewhere (queue lengths, breaker states), so the request path does
+    not pay to keep a second copy of them up to date. A collector returns
+    (name, kind, documentation, [(labels dict, value), ...]) tuples.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def collect(self):
+        """
+        Current values of every metric.
+
+        Returns:
+            list: (name, kind, documentation, [(sample name, labels, value), ...])
+            per metric family
+        """
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples()) for metric in metrics]
+        for collector in collectors:
+            try:
+                for name, kind, documentation, values in collector():
+                    samples = [(name, tuple(sorted(labels.items())), value) for labels, value in values]
+                    families.append((name, kind, documentation, samples))
+            except Exception as e:
+                # One broken source must not take down the whole scrape
+                logger.warning("Metrics collector %s failed: %s", collector.__name__, e)
+        return families
+
+
+def render(families):
+    """Metric families in the Prometheus text exposition format."""
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Requests
+HTTP_REQUESTS = Counter(
+    'litigence_http_requests_total', 'HTTP requests by route, method and status',
+    ('route', 'method', 'status')
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'litigence_http_request_duration_seconds',
+    'Seconds until the response started; streamed bodies are timed by the genai metrics',
+    ('route', 'method')
+)
+
+# Model calls, labelled with the routed model and tier
+GENAI_REQUESTS = Counter(
+    'litigence_genai_requests_total', 'Streamed model calls by outcome (ok, error, cancelled)',
+    ('model', 'tier', 'outcome')
+)
+GENAI_TIME_TO_FIRST_TOKEN = Histogram(
+    'litigence_genai_time_to_first_token_seconds', 'Seconds from the call to the first text chunk',
+    ('model', 'tier')
+)
+GENAI_STREAM_DURATION = Histogram(
+    'litigence_genai_stream_duration_seconds', 'Seconds from the call to the end of the stream',
+    ('model', 'tier'), buckets=STREAM_BUCKETS
+)
+GENAI_STREAM_CHUNKS = Histogram(
+    'litigence_genai_stream_chunks', 'Text chunks per streamed answer',
+    ('model', 'tier'), buckets=CHUNK_BUCKETS
+)
+GENAI_TOKENS = Counter(
+    'litigence_genai_tokens_total', 'Tokens reported by the model (input, output, cached)',
+    ('model', 'tier', 'direction')
+)
+GENAI_RETRIES = Counter(
+    'litigence_genai_retries_total', 'Model calls sent again after a retryable error', ('model',)
+)
+
+# Firestore
+FIRESTORE_LATENCY = Histogram(
+    'litigence_firestore_operation_seconds', 'Firestore round trips by call site and operation (read, write)',
+    ('site', 'operation')
+)
+FIRESTORE_ERRORS = Counter(
+    'litigence_firestore_errors_total', 'Failed Firestore round trips by call site and operation',
+    ('site', 'operation')
+)
+
+# Caches: hit rate = hits / all lookups of a cache
+CACHE_LOOKUPS = Counter(
+    'litigence_cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result')
+)
+
+
+def _service_stats():
+    """Queue depths and states owned by the services, read at scrape time."""
+    # Imported here: the services import this module to record their metrics
+    from src.services.admission_service import get_admission_controller
+    from src.services.single_flight import get_single_flight
+    from src.services.chat_writer import get_chat_writer
+    from src.services.stream_buffer import get_stream_registry
+    from src.services.resilience import circuit_breaker_stats, hedge_budget
+
+    admission = get_admission_controller()
+    if admission is not None:
+        gates = admission.stats()
+        yield ('litigence_admission_active_requests', 'gauge', 'Requests holding an /ask slot',
+               [({'mode': mode}, gate['active']) for mode, gate in gates.items()])
+        yield ('litigence_admission_queue_depth', 'gauge', 'Requests waiting for an /ask slot',
+               [({'mode': mode}, gate['queued']) for mode, gate in gates.items()])
+        yield ('litigence_admission_rejected_total', 'counter', 'Requests turned away as busy',
+               [({'mode': mode}, gate['rejected']) for mode, gate in gates.items()])
+
+    writer = get_chat_writer()
+    if writer is not None:
+        yield ('litigence_chat_writer_queue_depth', 'gauge', 'Exchanges waiting to be written to Firestore',
+               [({}, writer.queue_depth())])
+        yield ('litigence_chat_writer_exchanges_total', 'counter', 'Exchanges by write-behind outcome',
+               [({'outcome': outcome}, writer.stats[outcome]) for outcome in ('queued', 'written', 'dropped')])
+
+    single_flight = get_single_flight()
+    if single_flight is not None:
+        flights = single_flight.stats()
+        yield ('litigence_single_flight_in_flight', 'gauge', 'Model calls currently shared by identical questions',
+               [({}, flights['in_flight'])])
+        yield ('litigence_single_flight_requests_total', 'counter', 'Coalescable requests by role',
+               [({'role': 'leader'}, flights['leaders']), ({'role': 'follower'}, flights['followers'])])
+
+    yield ('litigence_sse_streams', 'gauge', 'Resumable SSE streams held in memory',
+           [({}, len(get_stream_registry()))])
+
+    yield ('litigence_circuit_breaker_open', 'gauge', 'Whether a model endpoint breaker is not closed (1) or closed (0)',
+           [({'endpoint': name, 'state': stats['state']}, int(stats['state'] != 'closed'))
+            for name, stats in circuit_breaker_stats().items()])
+
+    hedges = hedge_budget.stats()
+    yield ('litigence_genai_hedged_requests_total', 'counter', 'Hedged model requests by result',
+           [({'result': 'sent'}, hedges['sent']), ({'result': 'won'}, hedges['won'])])
+
+REGISTRY.register_collector(_service_stats)
+
+
+def _snapshot_dir():
+    """Per server: workers of the same gunicorn master share a directory."""
+    return os.path.join(METRICS_MULTIPROCESS_DIR, str(os.getppid()))
+
+def _write_snapshot():
+    """Publish this worker's metrics for the worker that serves the next scrape."""
+    directory = _snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(REGISTRY.collect(), f)
+    os.replace(temp_path, os.path.join(directory, f"{os.getpid()}.json"))
+
+def _snapshot_loop():
+    while True:
+        time.sleep(METRICS_SNAPSHOT_INTERVAL)
+        try:
+            _write_snapshot()
+        except Exception as e:
+            logger.warning("Failed to write metrics snapshot: %s", e)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _other_workers():
+    """Snapshots of the other workers; gauges of workers that have exited are dropped."""
+    directory = _snapshot_dir()
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        pid, extension = os.path.splitext(filename)
+        if extension != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                families = json.load(f)
+        except (OSError, ValueError):
+            # Being replaced right now; its totals are in the next scrape
+            continue
+        alive = _process_alive(int(pid))
+        yield [family for family in families if alive or family[1] != 'gauge']
+
+def _merge(family_sets):
+    """Sum samples with the same name and labels across workers."""
+    merged = {}
+    for families in family_sets:
+        for name, kind, documentation, samples in families:
+            _, _, _, totals = merged.setdefault(name, (name, kind, documentation, {}))
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(tuple(label) for label in labels))
+                totals[key] = totals.get(key, 0) + value
+    return [
+        (name, kind, documentation, [(sample_name, labels, value) for (sample_name, labels), value in totals.items()])
+        for name, kind, documentation, totals in merged.values()
+    ]
+
+_snapshot_thread = None
+
+def start_snapshot_writer():
+    """
+    Share this worker's metrics through METRICS_MULTIPROCESS_DIR.
+
+    Gunicorn workers are separate processes and a scrape reaches only one
+    of them, so with the directory set each worker writes its metrics
+    there every METRICS_SNAPSHOT_INTERVAL seconds and /metrics adds up
+    all of them. Call once per worker, after the fork.
+    """
+    global _snapshot_thread
+    if not METRICS_MULTIPROCESS_DIR or _snapshot_thread is not None:
+        return
+    _snapshot_thread = threading.Thread(target=_snapshot_loop, name="metrics-snapshot", daemon=True)
+    _snapshot_thread.start()
+
+def render_metrics():
+    """The /metrics body: this worker's metrics, plus the other workers' when shared."""
+    families = REGISTRY.collect()
+    if METRICS_MULTIPROCESS_DIR:
+        families = _merge([families, *_other_workers()])
+    return render(families)
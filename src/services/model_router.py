@@ -0,0 +1,272 @@
+import random
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+from config import (
+    MODEL_NAME, MODEL_ROUTER_ENABLED, MODEL_TIERS, MODEL_ROUTER_WINDOW_SECONDS,
+    MODEL_ROUTER_WINDOW_SIZE, MODEL_ROUTER_MIN_SAMPLES, MODEL_ROUTER_MAX_ERROR_RATE,
+    MODEL_ROUTER_PROBE_RATE
+)
+
+# Tiers from cheapest to most capable
+TIER_ORDER = ('fast', 'standard', 'heavy')
+
+# Where traffic goes when a tier is degraded, in order of preference
+FALLBACK_TIERS = {
+    'fast': ('standard', 'heavy'),
+    'standard': ('fast', 'heavy'),
+    'heavy': ('standard', 'fast'),
+}
+
+# "What is bail?", "Define culpable homicide", "Full form of FIR"
+_DEFINITIONAL = re.compile(
+    r"^\s*(what\s+(is|are|does)|define|definition\s+of|meaning\s+of|full\s+form\s+of|who\s+is|expand)\b",
+    re.IGNORECASE
+)
+# Requests for drafting or reasoning over several facts or documents
+_ANALYSIS_KEYWORDS = re.compile(
+    r"\b(analy[sz]e|analysis|compare|comparison|contrast|draft|review|evaluate|assess|strategy|"
+    r"implications?|contradictions?|inconsisten\w*|arguments?|cross[- ]examination|"
+    r"step[- ]by[- ]step|in detail|pros and cons|merits|precedents?)\b",
+    re.IGNORECASE
+)
+
+def question_features(question, history=None, attachments=None, excerpts=None, statutes=None):
+    """Cheap features of a request, computed without calling any model."""
+    return {
+        'words': len(question.split()),
+        'questions': question.count('?'),
+        'definitional': bool(_DEFINITIONAL.match(question)),
+        'analysis_keywords': len(_ANALYSIS_KEYWORDS.findall(question)),
+        'history_turns': len(history or []),
+        'attachments': len(attachments or []),
+        'excerpts': len(excerpts or []),
+        'statutes': len(statutes or []),
+    }
+
+def classify_features(features):
+    """
+    Pick a tier from request features.
+
+    Returns:
+        tuple: (tier, reasons), where reasons lists the features that
+        moved the score
+    """
+    score = 0
+    reasons = []
+    if features['attachments'] >= 2 or features['excerpts'] >= 4:
+        score += 4
+        reasons.append('multi_document')
+    elif features['attachments'] or features['excerpts']:
+        score += 2
+        reasons.append('document')
+    if features['words'] > 150:
+        score += 2
+        reasons.append('long_question')
+    elif features['words'] > 40:
+        score += 1
+        reasons.append('medium_question')
+    if features['analysis_keywords']:
+        score += min(2, features['analysis_keywords'])
+        reasons.append('analysis')
+    if features['questions'] > 2:
+        score += 1
+        reasons.append('multi_question')
+    if features['history_turns'] > 6:
+        score += 1
+        reasons.append('long_history')
+    if features['definitional'] and features['words'] <= 12 and score == 0:
+        score -= 1
+        reasons.append('definitional')
+
+    if score >= 4:
+        return 'heavy', reasons
+    if score < 0:
+        return 'fast', reasons
+    return 'standard', reasons
+
+
+class TierStats:
+    """
+    Sliding window of one tier's recent calls.
+
+    Keeps at most `max_samples` calls from the last `window_seconds`, each
+    as (finished at, time to first token, duration, prompt tokens,
+    completion tokens, failed).
+    """
+
+    def __init__(self, window_seconds=MODEL_ROUTER_WINDOW_SECONDS, max_samples=MODEL_ROUTER_WINDOW_SIZE):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, now, ttft, duration, prompt_tokens=0, completion_tokens=0, failed=False):
+        with self._lock:
+            self._samples.append((now, ttft, duration, prompt_tokens, completion_tokens, failed))
+
+    def snapshot(self, now):
+        with self._lock:
+            while self._samples and now - self._samples[0][0] > self.window_seconds:
+                self._samples.popleft()
+            samples = list(self._samples)
+        if not samples:
+            return {'requests': 0, 'errors': 0, 'error_rate': 0.0}
+
+        errors = sum(1 for sample in samples if sample[5])
+        summary = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': errors / len(samples),
+            'prompt_tokens': sum(sample[3] for sample in samples),
+            'completion_tokens': sum(sample[4] for sample in samples),
+        }
+        succeeded = np.array([sample[1:3] for sample in samples if not sample[5]], dtype=np.float64)
+        if len(succeeded):
+            ttft_p50, ttft_p95 = np.percentile(succeeded[:, 0], [50, 95])
+            duration_p50, duration_p95 = np.percentile(succeeded[:, 1], [50, 95])
+            summary.update({
+                'ttft_p50': round(float(ttft_p50), 3),
+                'ttft_p95': round(float(ttft_p95), 3),
+                'duration_p50': round(float(duration_p50), 3),
+                'duration_p95': round(float(duration_p95), 3),
+            })
+        return summary
+
+
+class ModelRouter:
+    """
+    Routes each request to a model tier and its generation settings.
+
+    A local classifier picks the tier from the request's features. Every
+    call is recorded per tier, and a tier whose p95 time to first token
+    exceeds its budget, whose error rate is too high, or which has used
+    its token budget for the window is treated as degraded: its traffic
+    moves to the next tier in FALLBACK_TIERS, except for a small probe
+    share that detects recovery.
+
+    Args:
+        tiers (dict): tier -> {'model', 'max_output_tokens', 'p95_budget',
+            'token_budget'}; tiers without a model are skipped
+        clock (callable): Monotonic time source, replaceable in tests
+    """
+
+    def __init__(self, tiers=MODEL_TIERS, window_seconds=MODEL_ROUTER_WINDOW_SECONDS,
+                 max_samples=MODEL_ROUTER_WINDOW_SIZE, min_samples=MODEL_ROUTER_MIN_SAMPLES,
+                 max_error_rate=MODEL_ROUTER_MAX_ERROR_RATE, probe_rate=MODEL_ROUTER_PROBE_RATE,
+                 clock=time.monotonic, seed=None):
+        self.tiers = {tier: settings for tier, settings in tiers.items() if settings.get('model')}
+        if 'standard' not in self.tiers:
+            raise ValueError("The standard model tier must be configured")
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.probe_rate = probe_rate
+        self.clock = clock
+        self.stats = {tier: TierStats(window_seconds, max_samples) for tier in self.tiers}
+        self.routed = {tier: 0 for tier in self.tiers}
+        self.shifted = {tier: 0 for tier in self.tiers}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def route(self, question, history=None, attachments=None, excerpts=None, statutes=None):
+        """
+        Choose the model for a request.
+
+        Returns:
+            dict: tier, model, max_output_tokens, reasons, and the tier the
+            classifier picked if traffic was shifted away from it
+        """
+        features = question_features(question, history, attachments, excerpts, statutes)
+        wanted, reasons = classify_features(features)
+        if wanted not in self.tiers:
+            wanted = 'standard'
+
+        tier, shifted_from = wanted, None
+        if self.degraded(wanted) and self._random.random() >= self.probe_rate:
+            for fallback in FALLBACK_TIERS[wanted]:
+                if fallback in self.tiers and not self.degraded(fallback):
+                    tier, shifted_from = fallback, wanted
+                    break
+
+        with self._lock:
+            self.routed[tier] += 1
+            if shifted_from:
+                self.shifted[shifted_from] += 1
+        settings = self.tiers[tier]
+        return {
+            'tier': tier,
+            'model': settings['model'],
+            'max_output_tokens': settings['max_output_tokens'],
+            'reasons': reasons,
+            'shifted_from': shifted_from,
+        }
+
+    def degraded(self, tier):
+        """Whether a tier is over its latency, error or token budget in the current window."""
+        settings = self.tiers[tier]
+        summary = self.stats[tier].snapshot(self.clock())
+        if summary['requests'] < self.min_samples:
+            return False
+        if summary['error_rate'] > self.max_error_rate:
+            return True
+        if settings.get('p95_budget') and summary.get('ttft_p95', 0) > settings['p95_budget']:
+            return True
+        tokens = summary['prompt_tokens'] + summary['completion_tokens']
+        return bool(settings.get('token_budget')) and tokens > settings['token_budget']
+
+    def ttft_p95(self, tier):
+        """A tier's p95 time to first token, or None until it has enough calls."""
+        summary = self.stats[tier].snapshot(self.clock())
+        if summary['requests'] < self.min_samples:
+            return None
+        return summary.get('ttft_p95')
+
+    def record(self, route, ttft, duration, usage=None, failed=False):
+        """Feed one finished call back into its tier's window."""
+        usage = usage or {}
+        self.stats[route['tier']].record(
+            self.clock(), ttft, duration,
+            usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), failed
+        )
+
+    def report(self):
+        """Per-tier window statistics and routing counters, for the health check."""
+        now = self.clock()
+        with self._lock:
+            routed, shifted = dict(self.routed), dict(self.shifted)
+        return {
+            tier: dict(
+                self.stats[tier].snapshot(now),
+                model=settings['model'],
+                degraded=self.degraded(tier),
+                routed=routed[tier],
+                shifted_away=shifted[tier],
+            )
+            for tier, settings in self.tiers.items()
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router():
+    """Return the process-wide model router, or None if routing is disabled."""
+    global _router
+    if not MODEL_ROUTER_ENABLED:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
+
+def default_route():
+    """The route used when routing is disabled: the standard model, as before."""
+    return {
+        'tier': 'standard',
+        'model': MODEL_NAME,
+        'max_output_tokens': MODEL_TIERS['standard']['max_output_tokens'],
+        'reasons': [],
+        'shifted_from': None,
+    }
@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from config import (
+    GENAI_RETRY_BASE_DELAY, GENAI_RETRY_MAX_DELAY, GENAI_HEDGE_MAX_IN_FLIGHT,
+    GENAI_BREAKER_WINDOW, GENAI_BREAKER_MIN_CALLS, GENAI_BREAKER_FAILURE_RATE, GENAI_BREAKER_OPEN_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: quota exhaustion and server-side failures
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class GenerationError(Exception):
+    """
+    The model could not produce (or finish) an answer.
+
+    Raised instead of yielding error text, so a failure can never be
+    mistaken for, or saved as, part of an answer.
+
+    Args:
+        message (str): What went wrong, safe to show to the client
+        retryable (bool): Whether the client may retry the question later
+    """
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def error_status(error):
+    """The HTTP status code of a model error, if it has one."""
+    code = getattr(error, 'code', None)
+    return code if isinstance(code, int) else None
+
+def is_retryable(error):
+    """Whether a failed model call may succeed if it is simply sent again."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # httpx transport errors (connection reset, read timeout) from the GenAI SDK
+    if type(error).__module__.startswith('httpx') and type(error).__name__.endswith(('Error', 'Timeout')):
+        return True
+    return error_status(error) in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt, base=GENAI_RETRY_BASE_DELAY, cap=GENAI_RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff before retry number `attempt` (from 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a model endpoint that is failing.
+
+    Closed: requests flow and outcomes are recorded over the last `window`
+    calls. Once at least `min_calls` are recorded and the failure rate
+    reaches `failure_rate`, the breaker opens and allow() fails fast for
+    `open_seconds`. It then lets a single probe through (half-open): a
+    success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, name, window=GENAI_BREAKER_WINDOW, min_calls=GENAI_BREAKER_MIN_CALLS,
+                 failure_rate=GENAI_BREAKER_FAILURE_RATE, open_seconds=GENAI_BREAKER_OPEN_SECONDS,
+                 clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.opened_at = None
+        self.probe_started_at = None
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may be sent now."""
+        now = self.clock()
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and now - self.opened_at < self.open_seconds:
+                return False
+            # Half-open: one probe at a time; a probe that never reported is replaced
+            if self.probe_started_at is not None and now - self.probe_started_at < self.open_seconds:
+                return False
+            self.state = 'half_open'
+            self.probe_started_at = now
+            return True
+
+    def record(self, success):
+        with self._lock:
+            if self.state == 'half_open':
+                if success:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                self.probe_started_at = None
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        """Lock held."""
+        self.state = 'open'
+        self.opened_at = self.clock()
+        self._outcomes.clear()
+        logger.warning("Circuit breaker for %s opened", self.name)
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'recent_calls': len(self._outcomes),
+                    'recent_failures': self._outcomes.count(False)}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name):
+    """Return the process-wide breaker for a model endpoint ("<location>/<model>")."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+def circuit_breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+class HedgeBudget:
+    """Caps the hedged requests in flight, so a slow model is not sent twice the load."""
+
+    def __init__(self, max_in_flight=GENAI_HEDGE_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.sent = 0
+        self.won = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            self.sent += 1
+            return True
+
+    def release(self, won=False):
+        with self._lock:
+            self.in_flight -= 1
+            if won:
+                self.won += 1
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': self.in_flight, 'sent': self.sent, 'won': self.won}
+
+
+hedge_budget = HedgeBudget()
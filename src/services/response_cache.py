@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES, RESPONSE_CACHE_SIMILARITY
+)
+from src.services.embedding_service import get_embedder
+from src.services.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+# Section/article numbers such as 302 or 498a
+_NUMBER_TOKEN = re.compile(r"\b\d+[a-z]*\b")
+
+def normalize_question(question):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+def question_numbers(question):
+    """Numeric tokens of a question; "Section 302" and "Section 304" must never match."""
+    return frozenset(_NUMBER_TOKEN.findall(normalize_question(question)))
+
+def question_key(question):
+    """Hash of the normalised question, used by the exact-match tier."""
+    return hashlib.sha256(normalize_question(question).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of complete answers to single-turn questions.
+
+    The exact tier matches on a hash of the normalised question. The
+    semantic tier keeps one embedding per entry in a preallocated NumPy
+    matrix and returns the best match above the similarity threshold,
+    provided both questions cite the same section numbers.
+    Entries are evicted least-recently-used first, and expire after the TTL.
+    """
+
+    def __init__(self, embedder, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds=RESPONSE_CACHE_TTL, max_entry_bytes=RESPONSE_CACHE_MAX_ENTRY_BYTES,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self.similarity_threshold = similarity_threshold
+
+        # key -> {'answer', 'expires_at', 'numbers', 'slot'}, in LRU order
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._slot_keys = [None] * max_entries
+        # Expiry of the entry in each slot, so expired and free slots never win a lookup
+        self._slot_expires = np.full(max_entries, -np.inf)
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = {'exact': 0, 'semantic': 0}
+        self.misses = 0
+
+    def lookup(self, question):
+        """
+        Find a cached answer for a question.
+
+        Args:
+            question (str): The user's question
+
+        Returns:
+            tuple: (answer or None, embedding of the question or None). The
+            embedding can be passed back to store() to avoid recomputing it.
+        """
+        key = question_key(question)
+        with self._lock:
+            answer = self._get_entry(key)
+            if answer is not None:
+                self.hits['exact'] += 1
+                CACHE_LOOKUPS.labels(cache='response', result='exact_hit').inc()
+                return answer, None
+            has_vectors = bool(self._entries)
+
+        if self.similarity_threshold >= 1 or self.embedder is None:
+            with self._lock:
+                self.misses += 1
+            CACHE_LOOKUPS.labels(cache='response', result='miss').inc()
+            return None, None
+
+        try:
+            embedding = self.embedder.embed([normalize_question(question)])[0]
+        except Exception as e:
+            logger.warning("Failed to embed question for response cache: %s", e)
+            CACHE_LOOKUPS.labels(cache='response', result='miss').inc()
+            return None, None
+
+        with self._lock:
+            if has_vectors and self._vectors is not None:
+                scores = np.where(self._slot_expires > time.monotonic(), self._vectors @ embedding, -np.inf)
+                slot = int(np.argmax(scores))
+                candidate = self._slot_keys[slot]
+                if (scores[slot] >= self.similarity_threshold and candidate is not None
+                        and self._entries[candidate]['numbers'] == question_numbers(question)):
+                    answer = self._get_entry(candidate)
+                    if answer is not None:
+                        self.hits['semantic'] += 1
+                        CACHE_LOOKUPS.labels(cache='response', result='semantic_hit').inc()
+                        return answer, embedding
+            self.misses += 1
+        CACHE_LOOKUPS.labels(cache='response', result='miss').inc()
+        return None, embedding
+
+    def store(self, question, answer, embedding=None):
+        """
+        Cache the answer to a question.
+
+        Answers larger than max_entry_bytes are not cached.
+
+        Args:
+            question (str): The user's question
+            answer (str): The complete generated answer
+            embedding (numpy.ndarray, optional): Embedding from lookup()
+
+        Returns:
+            bool: True if the answer was cached
+        """
+        if not answer or len(answer.encode('utf-8')) > self.max_entry_bytes:
+            return False
+
+        if embedding is None and self.similarity_threshold < 1 and self.embedder is not None:
+            try:
+                embedding = self.embedder.embed([normalize_question(question)])[0]
+            except Exception as e:
+                logger.warning("Failed to embed question for response cache: %s", e)
+
+        key = question_key(question)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+            slot = None
+            expires_at = time.monotonic() + self.ttl_seconds
+            if embedding is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = embedding
+                self._slot_keys[slot] = key
+                self._slot_expires[slot] = expires_at
+
+            self._entries[key] = {
+                'answer': answer,
+                'expires_at': expires_at,
+                'numbers': question_numbers(question),
+                'slot': slot,
+            }
+        return True
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.hits['exact'],
+                'semantic_hits': self.hits['semantic'],
+                'misses': self.misses,
+            }
+
+    def _get_entry(self, key):
+        """Return a live entry's answer and mark it recently used (lock held)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry['answer']
+
+    def _remove(self, key):
+        """Drop an entry and free its vector slot (lock held)."""
+        entry = self._entries.pop(key)
+        slot = entry['slot']
+        if slot is not None:
+            self._vectors[slot] = 0
+            self._slot_keys[slot] = None
+            self._slot_expires[slot] = -np.inf
+            self._free_slots.append(slot)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Return the process-wide response cache.
+
+    Returns:
+        ResponseCache: The cache, or None when disabled
+    """
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(get_embedder())
+    return _cache
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import threading
+from config import SINGLE_FLIGHT_ENABLED
+from src.services.genai_services import (
+    generate_legal_response, generate_legal_response_async, GenerationError
+)
+from src.services.response_cache import question_key
+from src.services.stream_buffer import StreamBuffer
+
+
+class _Flight:
+    """One in-flight generation: its chunk buffer and how many requests follow it."""
+
+    def __init__(self, key):
+        self.key = key
+        self.buffer = StreamBuffer()
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight questions onto one model call.
+
+    The first request for a key becomes the leader and streams from the
+    model, appending every chunk to the flight's buffer. Requests for the
+    same key that arrive while it is running become followers: they read
+    the buffer, so they get the chunks produced so far and then the live
+    tail, without calling the model themselves. A flight is forgotten as
+    soon as it finishes; later requests are served by the response cache.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """
+        Returns:
+            tuple: (flight, is_leader)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(key)
+                self.leaders += 1
+                return flight, True
+            flight.followers += 1
+            self.followers += 1
+            return flight, False
+
+    def finish(self, flight, usage=None):
+        """Publish the leader's token usage and release the key."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        # An abandoned flight's buffer is already closed
+        if flight.buffer.finished:
+            return
+        if usage:
+            flight.buffer.append('usage', dict(usage))
+        flight.buffer.close()
+
+    def abandon(self, flight):
+        """Release a flight its leader stopped reading, unless someone follows it."""
+        with self._lock:
+            if flight.followers:
+                return False
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.buffer.close()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._flights), 'leaders': self.leaders, 'followers': self.followers}
+
+
+def flight_key(exchange):
+    """
+    Key shared by questions whose answers are interchangeable, or None.
+
+    Only stateless, attachment-free questions qualify: anything with chat
+    history, attachments or document excerpts gets a prompt of its own.
+    """
+    if exchange['cached_answer'] is not None or exchange['history'] \
+            or exchange['attachments'] or exchange['excerpts']:
+        return None
+    # The statutes are part of the prompt; they follow from the question but
+    # are keyed anyway so a reloaded statute index cannot mix answers
+    sections = "|".join(f"{s['act']}:{s['section']}" for s in exchange['statutes'] or [])
+    return hashlib.sha256(f"{question_key(exchange['question'])}\0{sections}".encode('utf-8')).hexdigest()
+
+def _generation_kwargs(exchange, usage):
+    return {
+        'history': exchange['history'],
+        'attachments': exchange['attachments'],
+        'excerpts': exchange['excerpts'],
+        'statutes': exchange['statutes'],
+        'usage': usage,
+    }
+
+def _follow_usage(usage, data):
+    if usage is not None:
+        usage.update(data)
+        usage['coalesced'] = True
+
+def _publish_error(flight, error):
+    """Pass the leader's failure on to its followers."""
+    retryable = getattr(error, 'retryable', False)
+    flight.buffer.append('error', {'message': str(error), 'retryable': retryable})
+
+def stream_answer(exchange, usage=None):
+    """
+    generate_legal_response() for an exchange, coalesced with identical
+    questions already being answered.
+
+    Args:
+        exchange (dict): The exchange returned by prepare_exchange
+        usage (dict, optional): Filled in with the model's token counts;
+            followers get the leader's counts with "coalesced" set
+
+    Yields:
+        str: Chunks of the response
+
+    Raises:
+        GenerationError: If the answer (the leader's, for a follower) failed
+    """
+    single_flight = get_single_flight()
+    key = flight_key(exchange) if single_flight is not None else None
+    if key is None:
+        yield from generate_legal_response(exchange['question'], **_generation_kwargs(exchange, usage))
+        return
+
+    flight, is_leader = single_flight.join(key)
+    if is_leader:
+        yield from _lead(single_flight, flight, exchange, usage)
+        return
+    for _, event, data in flight.buffer.iter_events():
+        if event == 'chunk':
+            yield data
+        elif event == 'usage':
+            _follow_usage(usage, data)
+        elif event == 'error':
+            raise GenerationError(data['message'], retryable=data['retryable'])
+
+def _lead(single_flight, flight, exchange, usage):
+    """Stream from the model inline, publishing each chunk to the followers."""
+    usage = usage if usage is not None else {}
+    chunks = generate_legal_response(exchange['question'], **_generation_kwargs(exchange, usage))
+    finished = False
+    try:
+        for chunk in chunks:
+            flight.buffer.append('chunk', chunk)
+            yield chunk
+        finished = True
+    except Exception as e:
+        finished = True
+        _publish_error(flight, e)
+        raise
+    finally:
+        if finished:
+            single_flight.finish(flight, usage)
+        elif not single_flight.abandon(flight):
+            # The leader's client went away; finish the stream for the followers
+            threading.Thread(
+                target=_drain, args=(single_flight, flight, chunks, usage),
+                name="single-flight-drain", daemon=True
+            ).start()
+
+def _drain(single_flight, flight, chunks, usage):
+    try:
+        for chunk in chunks:
+            flight.buffer.append('chunk', chunk)
+    except Exception as e:
+        _publish_error(flight, e)
+    finally:
+        single_flight.finish(flight, usage)
+
+# Leader tasks on the ASGI event loop; referenced so they are not garbage collected
+_leader_tasks = set()
+
+async def stream_answer_async(exchange, usage=None):
+    """
+    Async version of stream_answer() for the ASGI server.
+
+    The leader's model stream runs as its own task, so a leader that
+    disconnects (and is cancelled) does not cut its followers off.
+    """
+    single_flight = get_single_flight()
+    key = flight_key(exchange) if single_flight is not None else None
+    if key is None:
+        async for chunk in generate_legal_response_async(exchange['question'], **_generation_kwargs(exchange, usage)):
+            yield chunk
+        return
+
+    flight, is_leader = single_flight.join(key)
+    if is_leader:
+        task = asyncio.ensure_future(_lead_async(single_flight, flight, exchange))
+        _leader_tasks.add(task)
+        task.add_done_callback(_leader_tasks.discard)
+    try:
+        async for _, event, data in flight.buffer.aiter_events():
+            if event == 'chunk':
+                yield data
+            elif event == 'usage':
+                if is_leader:
+                    if usage is not None:
+                        usage.update(data)
+                else:
+                    _follow_usage(usage, data)
+            elif event == 'error':
+                raise GenerationError(data['message'], retryable=data['retryable'])
+    finally:
+        # A leader that disconnected with nobody following stops the model call
+        if is_leader and not flight.buffer.finished and single_flight.abandon(flight):
+            task.cancel()
+
+async def _lead_async(single_flight, flight, exchange):
+    usage = {}
+    try:
+        async for chunk in generate_legal_response_async(exchange['question'], **_generation_kwargs(exchange, usage)):
+            flight.buffer.append('chunk', chunk)
+    except Exception as e:
+        _publish_error(flight, e)
+    finally:
+        single_flight.finish(flight, usage)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Return the process-wide single-flight group, or None if disabled."""
+    global _single_flight
+    if not SINGLE_FLIGHT_ENABLED:
+        return None
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
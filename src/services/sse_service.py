@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config import SSE_HEARTBEAT_INTERVAL, SSE_RETRY_MS, SSE_PRODUCER_WORKERS
+from src.services.chat_service import replay_cached_answer, complete_exchange
+from src.services.history_service import estimate_tokens
+from src.services.single_flight import stream_answer, stream_answer_async
+from src.services.stream_buffer import get_stream_registry
+from src.services.tracing import propagate
+
+logger = logging.getLogger(__name__)
+
+SSE_CONTENT_TYPE = "text/event-stream"
+
+# Headers that keep proxies (and Cloud Run's front end) from buffering the stream
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+# Comment line sent when no event has been sent for SSE_HEARTBEAT_INTERVAL seconds
+HEARTBEAT = ": heartbeat\n\n"
+
+# Generation runs here, decoupled from the connection, so a dropped client
+# can reconnect to the same stream
+_producer_executor = ThreadPoolExecutor(max_workers=SSE_PRODUCER_WORKERS, thread_name_prefix="sse-producer")
+
+def wants_sse(accept_header, data=None):
+    """Whether the client asked for the SSE protocol (Accept header or "stream": "sse")."""
+    if isinstance(data, dict) and data.get('stream') == 'sse':
+        return True
+    return SSE_CONTENT_TYPE in (accept_header or '')
+
+def parse_last_event_id(value):
+    """
+    Split a Last-Event-ID of the form "<stream id>:<sequence>".
+
+    Returns:
+        tuple: (stream_id, sequence), or (None, 0) if the header is missing
+        or malformed
+    """
+    if not value or ':' not in value:
+        return None, 0
+    stream_id, _, sequence = value.rpartition(':')
+    try:
+        return stream_id, max(0, int(sequence))
+    except ValueError:
+        return None, 0
+
+def format_event(stream_id, sequence, event, data):
+    """Frame one event on the wire."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {stream_id}:{sequence}\nevent: {event}\ndata: {payload}\n\n"
+
+def format_preamble():
+    """Reconnection delay hint sent once at the start of every response."""
+    return f"retry: {SSE_RETRY_MS}\n\n"
+
+def _citation_events(exchange):
+    """The sources the answer was grounded in, sent before the first delta."""
+    for section in exchange.get('statutes') or []:
+        yield {
+            'type': 'statute',
+            'act': section['act'],
+            'act_name': section['act_name'],
+            'section': section['section'],
+            'title': section['title'],
+        }
+    for chunk in exchange.get('excerpts') or []:
+        yield {'type': 'document', 'page': chunk['page'], 'section': chunk.get('section')}
+
+
+class _Producer:
+    """Turns the chunks of one answer into buffer events; shared by the sync and async paths."""
+
+    def __init__(self, exchange, buffer):
+        self.exchange = exchange
+        self.buffer = buffer
+        self.complete_response = ""
+        self.usage = {}
+
+    def begin(self):
+        for citation in _citation_events(self.exchange):
+            self.buffer.append('citation', citation)
+
+    def add(self, chunk):
+        self.complete_response += chunk
+        self.buffer.append('delta', {'text': chunk})
+
+    def usage_event(self):
+        usage = self.usage or {
+            'prompt_tokens': estimate_tokens(self.exchange['question']),
+            'completion_tokens': estimate_tokens(self.complete_response),
+            'estimated': True,
+        }
+        usage['cached'] = self.exchange['cached_answer'] is not None
+        self.buffer.append('usage', usage)
+
+    def done(self):
+        self.buffer.append('done', {'stream_id': self.buffer.stream_id, 'chat_id': self.exchange['chat_id']})
+
+    def fail(self, error):
+        """Send an error event; nothing is saved for a failed answer."""
+        logger.error("Error producing stream %s: %s", self.buffer.stream_id, error)
+        self.buffer.append('error', {'message': str(error), 'retryable': getattr(error, 'retryable', False)})
+
+
+def start_stream(exchange, on_finish=None):
+    """
+    Start producing an answer into a new resumable stream.
+
+    Generation runs on a producer thread, not the request thread, so it
+    carries on (and the answer is saved) if the client disconnects.
+
+    Args:
+        exchange (dict): The exchange returned by prepare_exchange
+        on_finish (callable, optional): Called once the answer is complete
+            or has failed, e.g. to release an admission slot
+
+    Returns:
+        StreamBuffer: The buffer readers follow; its stream_id is what the
+        client reconnects with
+    """
+    buffer = get_stream_registry().create()
+    # The producer's spans nest under the request that started it
+    _producer_executor.submit(propagate(_produce), exchange, buffer, on_finish)
+    return buffer
+
+def _produce(exchange, buffer, on_finish=None):
+    producer = _Producer(exchange, buffer)
+    try:
+        producer.begin()
+        if exchange['cached_answer'] is not None:
+            chunks = replay_cached_answer(exchange['cached_answer'])
+        else:
+            chunks = stream_answer(exchange, usage=producer.usage)
+        for chunk in chunks:
+            producer.add(chunk)
+        producer.usage_event()
+        # Saved even if the client has gone, since it can resume
+        complete_exchange(exchange, producer.complete_response)
+        producer.done()
+    except Exception as e:
+        producer.fail(e)
+    finally:
+        buffer.close()
+        if on_finish is not None:
+            on_finish()
+
+# Producer tasks on the ASGI event loop; referenced so they are not garbage collected
+_producer_tasks = set()
+
+def start_stream_async(exchange, on_finish=None):
+    """
+    start_stream() for the ASGI server: the producer is an event loop task
+    using the async GenAI API instead of a thread.
+    """
+    buffer = get_stream_registry().create()
+    task = asyncio.ensure_future(_produce_async(exchange, buffer, on_finish))
+    _producer_tasks.add(task)
+    task.add_done_callback(_producer_tasks.discard)
+    return buffer
+
+async def _produce_async(exchange, buffer, on_finish=None):
+    producer = _Producer(exchange, buffer)
+    try:
+        producer.begin()
+        if exchange['cached_answer'] is not None:
+            for chunk in replay_cached_answer(exchange['cached_answer']):
+                producer.add(chunk)
+        else:
+            async for chunk in stream_answer_async(exchange, usage=producer.usage):
+                producer.add(chunk)
+        producer.usage_event()
+        await asyncio.to_thread(complete_exchange, exchange, producer.complete_response)
+        producer.done()
+    except Exception as e:
+        producer.fail(e)
+    finally:
+        buffer.close()
+        if on_finish is not None:
+            on_finish()
+
+def iter_sse(buffer, after=0):
+    """Yield the SSE wire format of a stream from a position, with heartbeats."""
+    yield format_preamble()
+    for item in buffer.iter_events(after, timeout=SSE_HEARTBEAT_INTERVAL):
+        if item is None:
+            yield HEARTBEAT
+            continue
+        sequence, event, data = item
+        yield format_event(buffer.stream_id, sequence, event, data)
+
+async def aiter_sse(buffer, after=0):
+    """Async version of iter_sse() for the ASGI server."""
+    yield format_preamble()
+    async for item in buffer.aiter_events(after, timeout=SSE_HEARTBEAT_INTERVAL):
+        if item is None:
+            yield HEARTBEAT
+            continue
+        sequence, event, data = item
+        yield format_event(buffer.stream_id, sequence, event, data)
+
+def find_stream(stream_id):
+    """Buffer of a live or recently finished stream, or None if it has expired."""
+    return get_stream_registry().get(stream_id) if stream_id else None
@@ -0,0 +1,411 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from config import (
+    STATUTE_INDEX_DIR, STATUTE_TOP_K, STATUTE_MIN_BM25, STATUTE_MIN_SIMILARITY,
+    STATUTE_DIRECT_ANSWERS, EMBEDDING_BATCH_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal rank fusion constant for combining the BM25 and dense rankings
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "which with shall any such may under where who whom whoever if not no".split()
+)
+
+# Common names for the acts in the corpus; the corpus can add its own
+ACT_ALIASES = {
+    "ipc": "IPC", "indian penal code": "IPC", "penal code": "IPC",
+    "bns": "BNS", "bharatiya nyaya sanhita": "BNS",
+    "crpc": "CrPC", "cr.p.c": "CrPC", "code of criminal procedure": "CrPC",
+    "bnss": "BNSS", "bharatiya nagarik suraksha sanhita": "BNSS",
+    "iea": "IEA", "evidence act": "IEA", "indian evidence act": "IEA",
+    "bsa": "BSA", "bharatiya sakshya adhiniyam": "BSA",
+    "cpc": "CPC", "code of civil procedure": "CPC",
+    "constitution": "COI", "constitution of india": "COI",
+}
+
+# What the numbered provisions of each document type are called
+PROVISION_LABELS = {"act": "Section", "constitution": "Article"}
+# Code of the Constitution in the corpus, which is a constitution even without a doc_type
+CONSTITUTION_ACT = "COI"
+
+# Questions that only ask for the text of one provision, e.g. "Section 302 IPC",
+# "what is section 498A of the IPC?", "IPC 302", "Article 21"
+_LOOKUP_PATTERNS = [
+    re.compile(r"^(?:what\s+is\s+|what\s+does\s+)?(?:the\s+)?article\s+(?P<number>\d+[a-z]{0,2})"
+               r"(?:\s+of\s+the\s+constitution(?:\s+of\s+india)?)?(?:\s+say)?\s*\??$"),
+    re.compile(r"^(?:what\s+is\s+|what\s+does\s+|show\s+(?:me\s+)?|text\s+of\s+)?(?:the\s+)?"
+               r"(?:section|sec\.?|s\.)\s*(?P<number>\d+[a-z]{0,2})"
+               r"(?:\s+(?:of\s+)?(?:the\s+)?(?P<act>[a-z][a-z.\s]*?))?(?:\s+say)?\s*\??$"),
+    re.compile(r"^(?P<act>[a-z][a-z.]*)\s+(?:section\s+|s\.\s*)?(?P<number>\d+[a-z]{0,2})\s*\??$"),
+]
+# Section references anywhere in a question, used to boost exact matches in search
+_SECTION_MENTION = re.compile(r"\b(?:section|sec\.?|s\.|article)\s*(\d+[a-z]{0,2})\b")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def provision_label(section):
+    """What a section record's provisions are called ("Section" or "Article"), from its document type."""
+    doc_type = section.get('doc_type') or ("constitution" if section['act'] == CONSTITUTION_ACT else "act")
+    return PROVISION_LABELS.get(doc_type, "Section")
+
+def resolve_act(name, aliases=ACT_ALIASES):
+    """Map an act name or abbreviation from a question to its corpus code."""
+    if not name:
+        return None
+    key = " ".join(name.lower().replace("the ", " ").split()).rstrip(".")
+    return aliases.get(key) or aliases.get(key.replace(".", ""))
+
+def parse_section_lookup(question, aliases=ACT_ALIASES):
+    """
+    Recognise questions that only ask for the text of a provision.
+
+    Returns:
+        tuple: (act code or None, section number), or None if the question
+        asks for more than the text of one section
+    """
+    text = " ".join(question.lower().split())
+    for pattern in _LOOKUP_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        if 'act' not in groups:
+            return "COI", groups['number']
+        if groups['act'] is None:
+            return None, groups['number']
+        act = resolve_act(groups['act'], aliases)
+        # Anything other than an act name after the number makes it a real question
+        if act is not None:
+            return act, groups['number']
+    return None
+
+
+def build_statute_index(records, directory, embedder=None):
+    """
+    Build the statute index from a corpus of sections.
+
+    Args:
+        records (iterable): Dicts with act, act_name, section, title and
+            text (optionally aliases, a list of other names for the act, and
+            doc_type, "act" or "constitution")
+        directory (str): Output directory; existing index files are replaced
+        embedder (optional): Embedder for the dense tier; None skips it
+
+    Returns:
+        int: Number of sections indexed
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "index.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    docs = []
+    lookup = {}
+    aliases = dict(ACT_ALIASES)
+    postings = defaultdict(list)
+    lengths = []
+    texts = []
+
+    for record in records:
+        doc_id = len(docs)
+        act, section = record['act'], str(record['section']).lower()
+        docs.append({
+            'act': act,
+            'act_name': record.get('act_name') or act,
+            'section': record['section'],
+            'title': record.get('title') or "",
+            'doc_type': record.get('doc_type') or ("constitution" if act == CONSTITUTION_ACT else "act"),
+        })
+        lookup[f"{act}:{section}"] = doc_id
+        aliases.setdefault(act.lower(), act)
+        if record.get('act_name'):
+            aliases.setdefault(record['act_name'].lower(), act)
+        for alias in record.get('aliases') or []:
+            aliases.setdefault(alias.lower(), act)
+
+        # The act, number and title are indexed with the text, so "ipc 302" and
+        # "punishment for murder" both find Section 302
+        tokens = tokenize(f"{act} {section} {record.get('title') or ''} {record['text']}")
+        for term, count in Counter(tokens).items():
+            postings[term].append((doc_id, count))
+        lengths.append(len(tokens))
+        texts.append(record['text'])
+
+    vocabulary = {}
+    doc_ids, term_counts = [], []
+    for term in sorted(postings):
+        entries = postings[term]
+        vocabulary[term] = [len(doc_ids), len(entries)]
+        doc_ids.extend(doc_id for doc_id, _ in entries)
+        term_counts.extend(min(count, 65535) for _, count in entries)
+
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+
+    np.save(os.path.join(directory, "postings_docs.npy"), np.asarray(doc_ids, dtype=np.int32))
+    np.save(os.path.join(directory, "postings_tf.npy"), np.asarray(term_counts, dtype=np.uint16))
+    np.save(os.path.join(directory, "doc_lengths.npy"), np.asarray(lengths, dtype=np.int32))
+    np.save(os.path.join(directory, "text_offsets.npy"), offsets)
+    with open(os.path.join(directory, "text.bin"), 'wb') as f:
+        for text in encoded:
+            f.write(text)
+
+    dimensions = None
+    if embedder is not None and docs:
+        vectors = np.zeros((len(docs), embedder.dimensions), dtype=np.float16)
+        for start in range(0, len(docs), EMBEDDING_BATCH_SIZE):
+            batch = [
+                f"{docs[i]['act_name']} {provision_label(docs[i])} {docs[i]['section']} {docs[i]['title']}\n{texts[i]}"
+                for i in range(start, min(start + EMBEDDING_BATCH_SIZE, len(docs)))
+            ]
+            vectors[start:start + len(batch)] = embedder.embed(batch, task_type="RETRIEVAL_DOCUMENT")
+        np.save(os.path.join(directory, "vectors.npy"), vectors)
+        dimensions = embedder.dimensions
+    elif os.path.exists(os.path.join(directory, "vectors.npy")):
+        os.remove(os.path.join(directory, "vectors.npy"))
+
+    meta = {
+        'version': INDEX_VERSION,
+        'count': len(docs),
+        'average_length': (sum(lengths) / len(lengths)) if lengths else 0.0,
+        'dimensions': dimensions,
+        'docs': docs,
+        'lookup': lookup,
+        'aliases': aliases,
+        'vocabulary': vocabulary,
+    }
+    # Written last so a half-built index is never loaded
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return len(docs)
+
+
+class StatuteIndex:
+    """
+    Read-only hybrid index over bare acts.
+
+    Three tiers answer a query: a (act, section) lookup table for exact
+    references, a BM25 inverted index, and optionally dense vectors; the
+    BM25 and dense rankings are combined with reciprocal rank fusion.
+    Postings, document lengths, vectors and section texts are NumPy/raw
+    files opened memory-mapped, so a worker only pages in what it reads.
+    """
+
+    def __init__(self, directory, embedder=None):
+        with open(os.path.join(directory, "index.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Statute index version {meta.get('version')} is not supported")
+
+        self.count = meta['count']
+        self.average_length = meta['average_length'] or 1.0
+        self.docs = meta['docs']
+        self.lookup_table = meta['lookup']
+        self.aliases = meta['aliases']
+        self.vocabulary = meta['vocabulary']
+
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode='r')
+        self.postings_docs = load("postings_docs.npy")
+        self.postings_tf = load("postings_tf.npy")
+        self.doc_lengths = load("doc_lengths.npy")
+        self.text_offsets = load("text_offsets.npy")
+        text_path = os.path.join(directory, "text.bin")
+        self.texts = np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else None
+
+        self.vectors = None
+        self.embedder = None
+        vectors_path = os.path.join(directory, "vectors.npy")
+        if embedder is not None and meta['dimensions'] == getattr(embedder, 'dimensions', None) \
+                and os.path.exists(vectors_path):
+            self.vectors = load("vectors.npy")
+            self.embedder = embedder
+
+    def section(self, doc_id):
+        """Full record of one section, including its text."""
+        start, end = int(self.text_offsets[doc_id]), int(self.text_offsets[doc_id + 1])
+        text = bytes(self.texts[start:end]).decode('utf-8') if self.texts is not None else ""
+        return dict(self.docs[doc_id], text=text)
+
+    def lookup(self, act, section):
+        """
+        Find a section by number.
+
+        Args:
+            act (str): Act code (e.g. "IPC"), or None to search every act
+            section (str): Section number such as "302" or "498a"
+
+        Returns:
+            list: Matching sections (one per act when act is None)
+        """
+        section = section.lower()
+        if act:
+            doc_id = self.lookup_table.get(f"{act}:{section}")
+            return [self.section(doc_id)] if doc_id is not None else []
+        suffix = f":{section}"
+        return [self.section(doc_id) for key, doc_id in self.lookup_table.items() if key.endswith(suffix)]
+
+    def bm25(self, query):
+        """BM25 score of every section for a query, as a float32 array."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            ids = self.postings_docs[offset:offset + df]
+            tf = self.postings_tf[offset:offset + df].astype(np.float32)
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[ids] / self.average_length)
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=STATUTE_TOP_K, query_vector=None):
+        """
+        Find the sections most relevant to a question.
+
+        Sections cited by number in the question come first. The rest are
+        ranked by fusing BM25 and dense similarity, and only sections that
+        clear STATUTE_MIN_BM25 or STATUTE_MIN_SIMILARITY are returned, so
+        off-topic questions get no statutes rather than weak matches.
+
+        Args:
+            query (str): The user's question
+            top_k (int): Maximum number of sections to return
+            query_vector (numpy.ndarray, optional): Precomputed query embedding
+
+        Returns:
+            list: Section dicts (act, act_name, section, title, text)
+        """
+        if not self.count:
+            return []
+
+        cited = self._cited_sections(query)
+        bm25 = self.bm25(query)
+        dense = None
+        if self.vectors is not None:
+            try:
+                if query_vector is None:
+                    query_vector = self.embedder.embed([query])[0]
+                dense = np.asarray(self.vectors @ query_vector.astype(np.float16), dtype=np.float32)
+            except Exception as e:
+                logger.warning("Dense statute search failed, using BM25 only: %s", e)
+
+        fused = np.zeros(self.count, dtype=np.float32)
+        eligible = bm25 >= STATUTE_MIN_BM25
+        for scores in (bm25, dense):
+            if scores is None:
+                continue
+            candidates = min(self.count, top_k * 10)
+            best = np.argpartition(-scores, candidates - 1)[:candidates]
+            ranked = best[np.argsort(-scores[best])]
+            fused[ranked] += 1.0 / (RRF_K + np.arange(1, len(ranked) + 1))
+        if dense is not None:
+            eligible |= dense >= STATUTE_MIN_SIMILARITY
+
+        results = list(cited)
+        for doc_id in np.argsort(-fused):
+            if len(results) >= top_k or fused[doc_id] <= 0:
+                break
+            if eligible[doc_id] and doc_id not in results:
+                results.append(int(doc_id))
+        return [self.section(doc_id) for doc_id in results[:top_k]]
+
+    def _cited_sections(self, query):
+        """IDs of sections referenced by number, narrowed to acts named in the query."""
+        text = query.lower()
+        numbers = _SECTION_MENTION.findall(text)
+        if not numbers:
+            return []
+        named_acts = {act for alias, act in self.aliases.items()
+                      if re.search(r"\b" + re.escape(alias) + r"\b", text)}
+        cited = []
+        for number in numbers:
+            for key, doc_id in self.lookup_table.items():
+                act, section = key.split(":", 1)
+                if section == number and (not named_acts or act in named_acts) and doc_id not in cited:
+                    cited.append(doc_id)
+        return cited
+
+
+def format_statutes(sections):
+    """Render statute hits as the text passed to the model with the question."""
+    lines = ["Text of statutory provisions relevant to the question (cite these where they apply):"]
+    for section in sections:
+        lines.append(f"[{section['act_name']}, {provision_label(section)} {section['section']}: {section['title']}]\n"
+                     f"{section['text']}")
+    return "\n\n".join(lines)
+
+def format_section_answer(sections):
+    """The direct answer to a lookup question, without a model call."""
+    parts = []
+    for section in sections:
+        heading = f"{section['act_name']}, {provision_label(section)} {section['section']}"
+        if section['title']:
+            heading += f": {section['title']}"
+        parts.append(f"{heading}\n\n{section['text']}")
+    if len(sections) > 1:
+        parts.insert(0, f"{provision_label(sections[0])} {sections[0]['section']} appears in {len(sections)} acts:")
+    return "\n\n".join(parts)
+
+def answer_section_lookup(index, question):
+    """
+    Answer "Section 302 IPC"-style questions straight from the index.
+
+    Returns:
+        str: The section text, or None if the question is not a plain lookup
+        or the section is not in the corpus
+    """
+    if not STATUTE_DIRECT_ANSWERS:
+        return None
+    parsed = parse_section_lookup(question, index.aliases)
+    if parsed is None:
+        return None
+    sections = index.lookup(*parsed)
+    return format_section_answer(sections) if sections else None
+
+
+_index = None
+_index_lock = threading.Lock()
+_index_unavailable = False
+
+def get_statute_index():
+    """
+    Return the process-wide statute index, loading it on first use.
+
+    Returns:
+        StatuteIndex: The index, or None if none has been built
+    """
+    global _index, _index_unavailable
+    if _index is None and not _index_unavailable:
+        with _index_lock:
+            if _index is None and not _index_unavailable:
+                if not STATUTE_INDEX_DIR or not os.path.exists(os.path.join(STATUTE_INDEX_DIR, "index.json")):
+                    _index_unavailable = True
+                    return None
+                try:
+                    # Imported here to avoid loading the embedder when there is no index
+                    from src.services.embedding_service import get_embedder
+                    _index = StatuteIndex(STATUTE_INDEX_DIR, get_embedder())
+                    logger.info("Loaded statute index with %d sections", _index.count)
+                except Exception as e:
+                    _index_unavailable = True
+                    logger.warning("Failed to load statute index: %s", e)
+    return _index
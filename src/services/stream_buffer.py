@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config import STREAM_BUFFER_TTL, STREAM_BUFFER_MAX_STREAMS
+
+
+class StreamBuffer:
+    """
+    Append-only log of the events of one answer stream.
+
+    A producer appends events while any number of readers follow along,
+    each from its own position. Readers that start late (or reconnect)
+    get every event after the position they ask for, then the live tail.
+    Sync readers block on a condition; async readers register an event
+    that the producer sets through the reader's loop, so they never hold
+    a thread while waiting.
+
+    Events are (sequence number, event type, data) tuples, numbered from 1.
+    """
+
+    def __init__(self, stream_id=None):
+        self.stream_id = stream_id or uuid.uuid4().hex
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self._events = []
+        self._condition = threading.Condition()
+        self._async_waiters = set()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def append(self, event, data):
+        with self._condition:
+            if self.finished:
+                raise RuntimeError(f"Stream {self.stream_id} is already closed")
+            self._events.append((len(self._events) + 1, event, data))
+            self._notify()
+
+    def close(self):
+        """Mark the stream as complete; readers drain what is left and stop."""
+        with self._condition:
+            if self.finished:
+                return
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    def _notify(self):
+        """Wake sync and async readers (lock held)."""
+        self._condition.notify_all()
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def snapshot(self, after=0):
+        """Events after a sequence number, and whether the stream has finished."""
+        with self._condition:
+            return self._events[after:], self.finished
+
+    def read(self, after=0, timeout=None):
+        """
+        Wait for events after a sequence number.
+
+        Returns:
+            tuple: (new events, finished). Both are empty/False when the
+            timeout passes with nothing new, so callers can send a heartbeat.
+        """
+        with self._condition:
+            if len(self._events) <= after and not self.finished:
+                self._condition.wait(timeout)
+            return self._events[after:], self.finished
+
+    async def read_async(self, after=0, timeout=None):
+        """Async version of read() for the ASGI server."""
+        waiter = asyncio.Event()
+        entry = (asyncio.get_running_loop(), waiter)
+        with self._condition:
+            if len(self._events) > after or self.finished:
+                return self._events[after:], self.finished
+            self._async_waiters.add(entry)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(entry)
+        return self.snapshot(after)
+
+    def iter_events(self, after=0, timeout=None):
+        """
+        Yield events after a sequence number until the stream finishes.
+
+        Yields None whenever `timeout` seconds pass without an event.
+        """
+        while True:
+            events, finished = self.read(after, timeout)
+            if not events and not finished:
+                yield None
+            for item in events:
+                after = item[0]
+                yield item
+            if finished and not self._has_more(after):
+                return
+
+    async def aiter_events(self, after=0, timeout=None):
+        """Async version of iter_events()."""
+        while True:
+            events, finished = await self.read_async(after, timeout)
+            if not events and not finished:
+                yield None
+            for item in events:
+                after = item[0]
+                yield item
+            if finished and not self._has_more(after):
+                return
+
+    def _has_more(self, after):
+        with self._condition:
+            return len(self._events) > after
+
+
+class StreamRegistry:
+    """
+    Process-wide map of stream IDs to their buffers.
+
+    Finished streams are kept for `ttl_seconds` so a client that lost its
+    connection can resume; the oldest streams are dropped beyond
+    `max_streams`.
+    """
+
+    def __init__(self, ttl_seconds=STREAM_BUFFER_TTL, max_streams=STREAM_BUFFER_MAX_STREAMS):
+        self.ttl_seconds = ttl_seconds
+        self.max_streams = max_streams
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self):
+        buffer = StreamBuffer()
+        with self._lock:
+            self._expire()
+            self._streams[buffer.stream_id] = buffer
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+        return buffer
+
+    def get(self, stream_id):
+        with self._lock:
+            self._expire()
+            return self._streams.get(stream_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._streams)
+
+    def _expire(self):
+        """Drop finished streams past their TTL (lock held)."""
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, buffer in self._streams.items()
+            if buffer.finished_at is not None and now - buffer.finished_at > self.ttl_seconds
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_stream_registry():
+    """Return the process-wide stream registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = StreamRegistry()
+    return _registry
@@ -0,0 +1,238 @@
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    CHAT_TITLE_BACKEND, CHAT_TITLE_BATCH_SIZE, CHAT_TITLE_BATCH_INTERVAL, CHAT_TITLE_MAX_QUEUE,
+    CHAT_TITLE_MAX_CHARS
+)
+from src.services.firebase_services import get_firestore_client, get_chat_ref, firestore_call
+from src.services.genai_services import generate_chat_titles
+from src.services.history_cache import invalidate_history
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = "New chat"
+
+_WHITESPACE = re.compile(r'\s+')
+# Quotes and trailing punctuation models like to wrap titles in
+_STRIP_CHARS = ' "\'`“”‘’*#.,;:!?'
+
+
+def clean_title(text, max_chars=CHAT_TITLE_MAX_CHARS):
+    """
+    Normalise a title for display: one line, no wrapping quotes, at most
+    `max_chars` characters, cut at a word boundary where possible.
+    """
+    title = _WHITESPACE.sub(' ', text or '').strip(_STRIP_CHARS)
+    if len(title) > max_chars:
+        cut = title[:max_chars + 1].rsplit(' ', 1)[0]
+        title = (cut if len(cut) >= max_chars // 2 else title[:max_chars]).rstrip(_STRIP_CHARS)
+    return title or DEFAULT_TITLE
+
+def stub_title(question, max_chars=CHAT_TITLE_MAX_CHARS):
+    """The provisional title of a new chat: the start of its first question."""
+    return clean_title(question, max_chars)
+
+
+class TitleGenerator:
+    """
+    Background job naming new chats after their first exchange.
+
+    Chats are queued once their first exchange is saved and titled in
+    batches, with one model call per batch of up to `batch_size` chats,
+    once `batch_size` are waiting or the oldest has waited
+    `batch_interval` seconds. Titles are written in one Firestore batch.
+    With the "stub" backend no model is called and chats keep the start
+    of their first question. If the model call fails, the batch keeps its
+    provisional titles; nothing here ever delays an /ask response.
+    """
+
+    def __init__(self, db_factory=get_firestore_client, backend=CHAT_TITLE_BACKEND,
+                 batch_size=CHAT_TITLE_BATCH_SIZE, batch_interval=CHAT_TITLE_BATCH_INTERVAL,
+                 max_queue=CHAT_TITLE_MAX_QUEUE, max_chars=CHAT_TITLE_MAX_CHARS):
+        self._db_factory = db_factory
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_queue = max_queue
+        self.max_chars = max_chars
+
+        # (user_id, chat_id) -> (question, answer), oldest first
+        self._pending = OrderedDict()
+        self._oldest_at = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {'queued': 0, 'generated': 0, 'fallbacks': 0, 'written': 0, 'batches': 0, 'dropped': 0}
+
+    def start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="chat-titles", daemon=True)
+                self._thread.start()
+
+    def request(self, user_id, chat_id, question, answer):
+        """
+        Queue a new chat for titling.
+
+        Args:
+            user_id (str): The ID of the user
+            chat_id (str): The ID of the chat document
+            question (str): The first question of the chat
+            answer (str): The answer to it
+
+        Returns:
+            bool: False if the queue is full and the chat keeps its provisional title
+        """
+        with self._condition:
+            key = (user_id, chat_id)
+            if key in self._pending:
+                return True
+            if len(self._pending) >= self.max_queue:
+                self.stats['dropped'] += 1
+                logger.warning("Chat title queue full, keeping the provisional title of chat %s", chat_id)
+                return False
+            self._pending[key] = (question, answer)
+            self.stats['queued'] += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+                self._condition.notify()
+            elif len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def flush(self):
+        """Title everything currently queued, blocking until done."""
+        while True:
+            with self._condition:
+                chats = self._take_batch()
+            if not chats:
+                return
+            self._process(chats)
+
+    def stop(self, timeout=10):
+        """Stop the background thread after draining the queue."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._should_flush():
+                    if self._stopping and not self._pending:
+                        return
+                    self._condition.wait(self._time_to_flush())
+                chats = self._take_batch()
+            if chats:
+                self._process(chats)
+
+    def _should_flush(self):
+        """Check the size/time triggers (lock held)."""
+        if not self._pending:
+            return False
+        if self._stopping or len(self._pending) >= self.batch_size:
+            return True
+        return time.monotonic() - self._oldest_at >= self.batch_interval
+
+    def _time_to_flush(self):
+        if self._oldest_at is None:
+            return None if not self._stopping else 0.1
+        return max(0.0, self.batch_interval - (time.monotonic() - self._oldest_at))
+
+    def _take_batch(self):
+        """Remove up to `batch_size` chats from the queue (lock held)."""
+        chats = []
+        while self._pending and len(chats) < self.batch_size:
+            chats.append(self._pending.popitem(last=False))
+        self._oldest_at = time.monotonic() if self._pending else None
+        return chats
+
+    def _process(self, chats):
+        titles = self._generate([exchange for _, exchange in chats])
+        # A title equal to the provisional one is already stored
+        updates = [
+            (key, title) for (key, (question, _)), title in zip(chats, titles)
+            if title != stub_title(question, self.max_chars)
+        ]
+        if not updates:
+            return
+        try:
+            db = self._db_factory()
+            batch = db.batch()
+            for (user_id, chat_id), title in updates:
+                batch.set(get_chat_ref(user_id, chat_id), {'title': title}, merge=True)
+            with firestore_call('chat_titles', 'write'):
+                batch.commit()
+        except Exception as e:
+            logger.error("Error saving chat titles to Firestore: %s", e)
+            with self._condition:
+                self.stats['dropped'] += len(updates)
+            return
+        for (user_id, chat_id), _ in updates:
+            invalidate_history(user_id, chat_id)
+        with self._condition:
+            self.stats['written'] += len(updates)
+            self.stats['batches'] += 1
+
+    def _generate(self, exchanges):
+        """One title per exchange, falling back to the provisional titles."""
+        titles, fallback = None, False
+        if self.backend == 'genai':
+            try:
+                titles = [clean_title(title, self.max_chars) for title in generate_chat_titles(exchanges)]
+            except Exception as e:
+                logger.warning("Chat title generation failed for %d chats: %s", len(exchanges), e)
+                fallback = True
+        if titles is None:
+            titles = [stub_title(question, self.max_chars) for question, _ in exchanges]
+        if self.backend == 'genai':
+            with self._condition:
+                self.stats['fallbacks' if fallback else 'generated'] += len(exchanges)
+        return titles
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_title_generator():
+    """
+    Return the process-wide title generator, starting it on first use.
+
+    Returns:
+        TitleGenerator: The generator, or None when CHAT_TITLE_BACKEND is "off"
+    """
+    global _generator
+    if CHAT_TITLE_BACKEND == 'off':
+        return None
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = TitleGenerator()
+                _generator.start()
+                atexit.register(_generator.stop)
+    return _generator
+
+def stop_title_generator():
+    """
+    Drain and stop the title generator, if it was started.
+
+    Safe to call again after its own exit hook ran: the chat writer calls
+    it once its final flush has queued the last new chats.
+    """
+    if _generator is not None:
+        _generator.stop()
+
+def request_chat_title(user_id, chat_id, question, answer):
+    """Queue a chat whose first exchange has been saved for titling, if enabled."""
+    generator = get_title_generator()
+    if generator is not None:
+        generator.request(user_id, chat_id, question, answer)
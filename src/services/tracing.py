@@ -0,0 +1,168 @@
+import contextvars
+import logging
+import os
+import random
+import re
+import time
+from config import TRACING_ENABLED, TRACE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context: version-trace_id-parent_id-flags
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    One timed operation in a trace, with OpenTelemetry-style IDs.
+
+    Used as a context manager, the span becomes the current one for its
+    block, so spans opened by the services it calls nest under it. Spans
+    that outlive a block (a streamed model call) are finished explicitly
+    instead. Finished spans are written to the log, where Cloud Logging
+    groups them by trace.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'error',
+                 '_started_at', '_start_time', '_token', '_finished')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.error = None
+        self._started_at = time.perf_counter()
+        self._start_time = time.time()
+        self._token = None
+        self._finished = False
+
+    @property
+    def traceparent(self):
+        """This span as a W3C traceparent header, for outgoing calls."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def activate(self):
+        """Make this the current span until deactivate()."""
+        self._token = _current_span.set(self)
+        return self
+
+    def deactivate(self):
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from another context (e.g. a stream closed by the server); nothing to restore
+                pass
+            self._token = None
+
+    def finish(self, error=None):
+        if self._finished:
+            return
+        self._finished = True
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        duration_ms = (time.perf_counter() - self._started_at) * 1000
+        logger.info("span %s", self.name, extra={'fields': {
+            'span': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'start_time': self._start_time,
+            'duration_ms': round(duration_ms, 3),
+            'error': self.error,
+            'attributes': self.attributes,
+        }})
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.deactivate()
+        self.finish(exc)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span outside a sampled trace; costs one attribute lookup."""
+
+    __slots__ = ()
+    traceparent = None
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def activate(self):
+        return self
+
+    def deactivate(self):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(header):
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None."""
+    match = _TRACEPARENT.match((header or '').strip().lower())
+    if match is None or match.group(1) == '0' * 32:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Root span of a request.
+
+    A caller's traceparent continues its trace (and its sampling
+    decision); otherwise TRACE_SAMPLE_RATE of requests are traced. When
+    tracing is off or the request is not sampled, a no-op span is returned
+    and every span() under it is a no-op too.
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return NOOP_SPAN
+    return Span(name, trace_id, parent_id, attributes)
+
+def span(name, **attributes):
+    """
+    A child of the current span; a no-op outside a sampled trace.
+
+    Use it as a `with` block, or call finish() on it for work that does
+    not fit in one (it is then never made current).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+def current_span():
+    """The active span, or None outside a sampled trace."""
+    return _current_span.get()
+
+def propagate(function):
+    """Wrap a callable to run in the current context, for work handed to another thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
@@ -0,0 +1,347 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from config import (
+    UPLOAD_BACKEND, UPLOAD_BUCKET, UPLOAD_LOCAL_DIR, UPLOAD_LOCAL_MAX_BYTES, UPLOAD_LOCAL_MAX_AGE,
+    UPLOAD_MAX_BYTES, UPLOAD_SPOOL_MEMORY_BYTES, UPLOAD_ALLOWED_MIME_TYPES, ON_CLOUD_RUN
+)
+from src.services.media_service import sniff_mime_type, SNIFF_BYTES, attachment_part
+from src.services.attachment_store import get_attachment_store
+from src.utils.lazy_import import lazy_import
+
+types = lazy_import('google.genai.types')
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks read from the request body
+COPY_CHUNK_BYTES = 64 * 1024
+
+LOCAL_URI_PREFIX = "local://"
+
+
+class UploadError(ValueError):
+    """Raised for uploads that are rejected; carries the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def spool_upload(stream, max_bytes=UPLOAD_MAX_BYTES):
+    """
+    Copy an upload stream into a spooled temporary file.
+
+    Only the first UPLOAD_SPOOL_MEMORY_BYTES are kept in memory; the rest
+    goes to disk, so large uploads never sit in memory as a whole.
+
+    Args:
+        stream: Readable binary stream (request body or multipart file)
+        max_bytes (int): Maximum accepted size
+
+    Returns:
+        tuple: (spooled file positioned at 0, size in bytes, SHA-256 hex digest)
+
+    Raises:
+        UploadError: If the upload is empty or larger than max_bytes
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(COPY_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            spooled.close()
+            raise UploadError(f"File exceeds the {max_bytes} byte upload limit", status=413)
+        spooled.write(chunk)
+
+    if size == 0:
+        spooled.close()
+        raise UploadError("Uploaded file is empty")
+    spooled.seek(0)
+    return spooled, size, digest.hexdigest()
+
+def detect_upload_mime_type(spooled):
+    """
+    Sniff the MIME type of a spooled upload from its magic bytes.
+
+    Raises:
+        UploadError: If the type is unknown or not allowed
+    """
+    header = spooled.read(SNIFF_BYTES)
+    spooled.seek(0)
+    mime_type = sniff_mime_type(header, spooled)
+    if mime_type is None or mime_type not in UPLOAD_ALLOWED_MIME_TYPES:
+        raise UploadError("Unsupported file type", status=415)
+    return mime_type
+
+
+class LocalUploadBackend:
+    """
+    Stores uploads on local disk; stands in for GCS or the Files API offline.
+
+    Files older than `max_age` seconds are deleted, and then the least
+    recently used ones until the directory holds at most `max_bytes`.
+    """
+
+    def __init__(self, directory=UPLOAD_LOCAL_DIR, max_bytes=UPLOAD_LOCAL_MAX_BYTES, max_age=UPLOAD_LOCAL_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._evict_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def store(self, spooled, mime_type, size, filename):
+        file_id = uuid.uuid4().hex
+        with open(os.path.join(self.directory, file_id), 'wb') as f:
+            shutil.copyfileobj(spooled, f, COPY_CHUNK_BYTES)
+        self.evict()
+        return f"{LOCAL_URI_PREFIX}{file_id}"
+
+    def evict(self):
+        """Delete expired uploads, then the least recently used beyond max_bytes."""
+        with self._evict_lock:
+            now = time.time()
+            files = []
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            for used_at, size, path in files:
+                if now - used_at <= self.max_age and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def owns(self, uri):
+        return uri.startswith(LOCAL_URI_PREFIX)
+
+    def read(self, uri, min_bytes=0):
+        """The bytes of an upload, or None if it is smaller than `min_bytes`."""
+        file_id = uri[len(LOCAL_URI_PREFIX):]
+        if not file_id.isalnum():
+            raise UploadError("Invalid file reference")
+        path = os.path.join(self.directory, file_id)
+        if not os.path.exists(path):
+            raise UploadError("Uploaded file not found", status=404)
+        if os.path.getsize(path) < min_bytes:
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Reading counts as use, so eviction takes the least recently used first
+        os.utime(path)
+        return data
+
+    def to_part(self, uri, mime_type):
+        # The stub has no remote store the model can read, so send the bytes inline
+        return types.Part.from_bytes(data=self.read(uri), mime_type=mime_type)
+
+
+class GCSUploadBackend:
+    """Uploads to a Cloud Storage bucket; Vertex AI reads gs:// URIs directly."""
+
+    def __init__(self, bucket_name=UPLOAD_BUCKET):
+        if not bucket_name:
+            raise ValueError("UPLOAD_BUCKET must be set for the gcs upload backend")
+        from google.cloud import storage
+        self.bucket_name = bucket_name
+        self.bucket = storage.Client().bucket(bucket_name)
+
+    def store(self, spooled, mime_type, size, filename):
+        blob = self.bucket.blob(f"uploads/{uuid.uuid4().hex}")
+        # Resumable upload in chunks, streamed from the spooled file
+        blob.chunk_size = 8 * 1024 * 1024
+        blob.upload_from_file(spooled, size=size, content_type=mime_type)
+        return f"gs://{self.bucket_name}/{blob.name}"
+
+    def owns(self, uri):
+        return uri.startswith(f"gs://{self.bucket_name}/uploads/")
+
+    def read(self, uri, min_bytes=0):
+        """The bytes of an upload, or None if it is smaller than `min_bytes` (not downloaded then)."""
+        blob = self.bucket.get_blob(uri[len(f"gs://{self.bucket_name}/"):])
+        if blob is None:
+            raise UploadError("Uploaded file not found", status=404)
+        if blob.size < min_bytes:
+            return None
+        return blob.download_as_bytes()
+
+    def to_part(self, uri, mime_type):
+        return types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+
+
+class GenAIFilesBackend:
+    """Uploads through the GenAI Files API (Gemini Developer API only)."""
+
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+
+    def store(self, spooled, mime_type, size, filename):
+        uploaded = self._client_factory().files.upload(
+            file=spooled,
+            config=types.UploadFileConfig(mime_type=mime_type, display_name=filename),
+        )
+        return uploaded.uri
+
+    def owns(self, uri):
+        return "/files/" in uri
+
+    def read(self, uri, min_bytes=0):
+        # The Files API does not let uploaded files be downloaded again
+        return None
+
+    def to_part(self, uri, mime_type):
+        return types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def upload_config_error():
+    """
+    Why the configured upload backend cannot work here, if it cannot.
+
+    The local backend is refused on Cloud Run, where /tmp is memory and
+    other instances cannot read the files.
+
+    Returns:
+        str: The problem, or None if uploads are usable
+    """
+    if UPLOAD_BACKEND not in ('gcs', 'files', 'local'):
+        return f"Unknown UPLOAD_BACKEND: {UPLOAD_BACKEND}"
+    if UPLOAD_BACKEND == 'local' and ON_CLOUD_RUN:
+        return "UPLOAD_BACKEND=local is for development; set UPLOAD_BACKEND=gcs and UPLOAD_BUCKET"
+    if UPLOAD_BACKEND == 'gcs' and not UPLOAD_BUCKET:
+        return "UPLOAD_BUCKET must be set for the gcs upload backend"
+    return None
+
+def check_upload_config():
+    """
+    Warn at start-up when uploads are misconfigured. Uploads are optional,
+    so the app still starts; /upload and file references answer 503.
+    """
+    error = upload_config_error()
+    if error:
+        logger.warning("File uploads are disabled: %s", error)
+
+def get_upload_backend():
+    """
+    Return the process-wide upload backend selected by UPLOAD_BACKEND.
+
+    Raises:
+        UploadError: With status 503 if uploads are misconfigured
+    """
+    global _backend
+    if upload_config_error():
+        raise UploadError("File uploads are not available on this server", status=503)
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if UPLOAD_BACKEND == 'gcs':
+                    _backend = GCSUploadBackend()
+                elif UPLOAD_BACKEND == 'files':
+                    # Imported here to avoid a circular import with genai_services
+                    from src.services.genai_services import get_genai_client
+                    _backend = GenAIFilesBackend(get_genai_client)
+                else:
+                    _backend = LocalUploadBackend()
+    return _backend
+
+def store_upload(stream, filename=None):
+    """
+    Spool, validate and store an uploaded file.
+
+    Args:
+        stream: Readable binary stream of the file contents
+        filename (str, optional): Original file name, for display only
+
+    Content that was uploaded before is not stored again; the existing
+    reference is returned.
+
+    Returns:
+        dict: File reference (uri, mime_type, size, name, sha256) to pass
+        to /ask
+
+    Raises:
+        UploadError: If the file is rejected
+    """
+    spooled, size, digest = spool_upload(stream)
+    try:
+        mime_type = detect_upload_mime_type(spooled)
+        backend = get_upload_backend()
+        store = get_attachment_store()
+        entry = store.get(digest) if store is not None else None
+        if entry is not None and entry['file_uri'] and backend.owns(entry['file_uri']):
+            uri = entry['file_uri']
+        else:
+            uri = backend.store(spooled, mime_type, size, filename)
+            if store is not None:
+                store.put_handle(digest, mime_type, size, uri)
+    finally:
+        spooled.close()
+    return {
+        'uri': uri,
+        'mime_type': mime_type,
+        'size': size,
+        'name': filename,
+        'sha256': digest,
+    }
+
+def read_uploaded_file(uri, min_bytes=0):
+    """
+    The bytes of a file stored by /upload, for server-side processing.
+
+    Returns:
+        bytes: The contents, or None if the file is smaller than
+        `min_bytes` or the backend cannot read files back
+
+    Raises:
+        UploadError: If the file is not one of our uploads or is gone
+    """
+    backend = get_upload_backend()
+    if not backend.owns(uri):
+        raise UploadError("File reference was not issued by /upload")
+    return backend.read(uri, min_bytes)
+
+def resolve_file_reference(reference):
+    """
+    Turn a file reference from /upload into a content part for Gemini.
+
+    Args:
+        reference (dict): The reference returned by store_upload, or just
+            {"sha256": ...} for content the server has seen before
+
+    Returns:
+        types.Part: Part pointing at the stored file
+
+    Raises:
+        ValueError: If the reference is malformed or not one of our uploads
+    """
+    if not isinstance(reference, dict):
+        raise ValueError("Each entry in files must be an object with uri and mime_type")
+    if 'uri' not in reference and 'sha256' in reference:
+        return attachment_part(reference['sha256'])
+    uri = reference.get('uri')
+    mime_type = reference.get('mime_type')
+    if not uri or mime_type not in UPLOAD_ALLOWED_MIME_TYPES:
+        raise ValueError("Each entry in files needs a uri and a supported mime_type")
+
+    backend = get_upload_backend()
+    if not backend.owns(uri):
+        raise ValueError("File reference was not issued by /upload")
+    return backend.to_part(uri, mime_type)
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from config import STARTUP_MODE
+from src.services import firebase_services, genai_services
+from src.services.statute_index import get_statute_index
+from src.utils.lazy_import import load
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MODES = ('background', 'lazy', 'eager')
+
+
+def _warm_firestore():
+    load(firebase_services.firestore)
+    firebase_services.get_firestore_client()
+
+def _warm_genai():
+    load(genai_services.types)
+    load(genai_services.errors)
+    genai_services.get_genai_client()
+
+# Everything a cold worker would otherwise do on its first requests, the
+# slowest first: /ask needs the GenAI client before anything else
+WARM_UP_STEPS = [
+    ('genai', _warm_genai),
+    ('firestore', _warm_firestore),
+    ('statute_index', get_statute_index),
+]
+
+def warm_services():
+    """
+    Import the client libraries and build the shared clients.
+
+    A failed step is logged and skipped; the first request that needs it
+    tries again.
+    """
+    started_at = time.perf_counter()
+    for name, step in WARM_UP_STEPS:
+        step_started_at = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)
+            continue
+        logger.info("Warmed up %s", name, extra={'fields': {
+            'warmup_step': name,
+            'duration_ms': round((time.perf_counter() - step_started_at) * 1000, 1),
+        }})
+    logger.info("Warm-up finished", extra={'fields': {
+        'duration_ms': round((time.perf_counter() - started_at) * 1000, 1),
+    }})
+
+def start_warm_up(mode=STARTUP_MODE):
+    """
+    Warm the services according to STARTUP_MODE.
+
+    In "background" mode the app is returned straight away, so the worker
+    answers health checks while the libraries load; a request that needs
+    one of them first waits for the import in progress.
+    """
+    if mode not in STARTUP_MODES:
+        raise ValueError(f"STARTUP_MODE must be one of {', '.join(STARTUP_MODES)}")
+    if mode == 'eager':
+        warm_services()
+    elif mode == 'background':
+        threading.Thread(target=warm_services, name="service-warm-up", daemon=True).start()
@@ -0,0 +1,2 @@
+# Deterministic stand-ins for external services, used for offline
+# development, load tests and benchmarks.
@@ -0,0 +1,393 @@
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the Firestore client.
+
+    Covers the subset of the API this service uses: documents and nested
+    collections, set/update/delete with the ArrayUnion, Increment and
+    SERVER_TIMESTAMP transforms, batched writes, and queries with where,
+    order_by, limit, start_after and select.
+
+    Args:
+        read_latency (float): Seconds added to every document or query read
+        write_latency (float): Seconds added to every write or batch commit
+    """
+
+    def __init__(self, read_latency=0.0, write_latency=0.0):
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.reads = 0
+        self.writes = 0
+        self._documents = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return FakeCollectionReference(self, (name,))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def collections(self):
+        names = sorted({path[0] for path in self._documents})
+        return [self.collection(name) for name in names]
+
+    def seed_chats(self, users=1, chats=1, messages=0):
+        """
+        Fill the store with deterministic chats for load tests.
+
+        Creates users bench-user-0.. with chats chat-0.. (chat-0 the most
+        recently updated), each holding `messages` alternating user/ai
+        messages in its messages subcollection, in the layout the chat
+        writer produces. Bypasses the injected write latency.
+        """
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        text = "Under the Limitation Act, 1963 the period runs from the date of the cause of action. " * 4
+        with self._lock:
+            for user in range(users):
+                chats_path = ('users', f'bench-user-{user}', 'chats')
+                for chat in range(chats):
+                    # Older chats end earlier, so chat-0 sorts first by last_updated
+                    started = base + timedelta(days=chats - chat)
+                    chat_path = chats_path + (f'chat-{chat}',)
+                    for index in range(messages):
+                        self._documents[chat_path + ('messages', f'message-{index:06d}')] = {
+                            'role': 'user' if index % 2 == 0 else 'ai',
+                            'message': text,
+                            'timestamp': started + timedelta(seconds=index),
+                        }
+                    self._documents[chat_path] = {
+                        'title': f'Benchmark chat {chat}',
+                        'createdAt': started,
+                        'last_updated': started + timedelta(seconds=max(0, messages - 1)),
+                        'message_count': messages,
+                    }
+
+    def reset(self):
+        with self._lock:
+            self._documents.clear()
+            self.reads = 0
+            self.writes = 0
+
+    # Internal helpers used by references and batches
+
+    def _read(self, count=1):
+        with self._lock:
+            self.reads += count
+        if self.read_latency:
+            time.sleep(self.read_latency)
+
+    def _apply_write(self, operation, path, data=None, merge=False):
+        """Apply one write. Caller holds the lock."""
+        self.writes += 1
+        existing = self._documents.get(path)
+        if operation == 'delete':
+            self._documents.pop(path, None)
+        elif operation == 'set':
+            base = copy.deepcopy(existing) if (merge and existing is not None) else {}
+            self._documents[path] = _apply_fields(base, data, nested=True)
+        elif operation == 'update':
+            if existing is None:
+                raise NotFound(f"No document to update: {'/'.join(path)}")
+            self._documents[path] = _apply_fields(copy.deepcopy(existing), data, nested=False)
+
+    def _commit(self, operations):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            for operation in operations:
+                self._apply_write(*operation)
+
+
+class NotFound(Exception):
+    """Raised when updating a document that does not exist."""
+
+
+def _apply_fields(document, data, nested):
+    """Apply field values and transforms to a document dict."""
+    for key, value in data.items():
+        # update() takes dotted field paths; set(merge=True) merges nested dicts
+        parts = key.split('.') if not nested else [key]
+        target = document
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        field = parts[-1]
+
+        if value is transforms.DELETE_FIELD:
+            target.pop(field, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            target[field] = datetime.now(timezone.utc)
+        elif isinstance(value, transforms.ArrayUnion):
+            current = list(target.get(field) or [])
+            for item in value.values:
+                if item not in current:
+                    current.append(copy.deepcopy(item))
+            target[field] = current
+        elif isinstance(value, transforms.ArrayRemove):
+            target[field] = [item for item in target.get(field) or [] if item not in value.values]
+        elif isinstance(value, transforms.Increment):
+            target[field] = (target.get(field) or 0) + value.value
+        elif nested and isinstance(value, dict) and isinstance(target.get(field), dict):
+            target[field] = _apply_fields(target[field], value, nested=True)
+        else:
+            target[field] = copy.deepcopy(value)
+    return document
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        value = self._data
+        for part in field.split('.'):
+            value = value[part]
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self._path = path
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    @property
+    def path(self):
+        return '/'.join(self._path)
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._db, self._path[:-1])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._db, self._path + (name,))
+
+    def collections(self):
+        depth = len(self._path)
+        with self._db._lock:
+            names = sorted({
+                path[depth] for path in self._db._documents
+                if len(path) > depth + 1 and path[:depth] == self._path
+            })
+        return [self.collection(name) for name in names]
+
+    def get(self, field_paths=None, transaction=None):
+        self._db._read()
+        with self._db._lock:
+            data = copy.deepcopy(self._db._documents.get(self._path))
+        if data is not None and field_paths:
+            data = _project(data, field_paths)
+        return FakeDocumentSnapshot(self, data)
+
+    def set(self, document_data, merge=False):
+        self._db._commit([('set', self._path, document_data, merge)])
+
+    def update(self, field_updates):
+        self._db._commit([('update', self._path, field_updates)])
+
+    def delete(self):
+        self._db._commit([('delete', self._path)])
+
+
+def _project(data, fields):
+    projected = {}
+    for field in fields:
+        if field in data:
+            projected[field] = data[field]
+    return projected
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        values = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'start_after': self._start_after,
+            'fields': self._fields,
+        }
+        values.update(changes)
+        return FakeQuery(self._collection, **values)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            if not isinstance(filter, FieldFilter):
+                raise NotImplementedError("Only FieldFilter filters are supported")
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def stream(self, transaction=None):
+        db = self._collection._db
+        parent = self._collection._path
+        # Writes replace stored dicts rather than mutating them, so rows can be
+        # copied after filtering and paging instead of up front
+        with db._lock:
+            rows = [
+                (path[-1], data) for path, data in db._documents.items()
+                if len(path) == len(parent) + 1 and path[:-1] == parent
+            ]
+
+        rows = [row for row in rows if all(_matches(row[1], *f) for f in self._filters)]
+        # Like Firestore, ordering on a field excludes documents without it
+        for field, _ in self._orders:
+            rows = [row for row in rows if field in row[1]]
+        # Ties are broken by document ID, in the direction of the last ordering
+        last_direction = self._orders[-1][1] if self._orders else ASCENDING
+        rows.sort(key=lambda row: row[0], reverse=(last_direction == DESCENDING))
+        for field, direction in reversed(self._orders):
+            rows.sort(key=lambda row: row[1][field], reverse=(direction == DESCENDING))
+
+        if self._start_after is not None:
+            rows = self._after_cursor(rows)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        db._read(max(1, len(rows)))
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = _project(data, self._fields)
+            yield FakeDocumentSnapshot(self._collection.document(doc_id), copy.deepcopy(data))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def _after_cursor(self, rows):
+        cursor = self._start_after
+        if isinstance(cursor, FakeDocumentSnapshot):
+            # Rows are already sorted, so resume right after the snapshot
+            for index, (doc_id, _) in enumerate(rows):
+                if doc_id == cursor.id:
+                    return rows[index + 1:]
+            cursor = cursor.to_dict() or {}
+        return [row for row in rows if self._is_after(row[1], cursor)]
+
+    def _is_after(self, data, cursor):
+        """Compare a document with cursor values in query order."""
+        for field, direction in self._orders:
+            value, cursor_value = data.get(field), cursor.get(field)
+            if value == cursor_value:
+                continue
+            if direction == DESCENDING:
+                return value < cursor_value
+            return value > cursor_value
+        return False
+
+
+def _matches(data, field, op, value):
+    if field not in data:
+        return False
+    actual = data[field]
+    if op == '==':
+        return actual == value
+    if op == '!=':
+        return actual != value
+    if op == '<':
+        return actual < value
+    if op == '<=':
+        return actual <= value
+    if op == '>':
+        return actual > value
+    if op == '>=':
+        return actual >= value
+    if op == 'in':
+        return actual in value
+    if op == 'array_contains':
+        return value in (actual or [])
+    raise NotImplementedError(f"Unsupported operator: {op}")
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path):
+        self._db = db
+        self._path = path
+        super().__init__(self)
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._db, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, document_data):
+        reference = self.document()
+        reference.set(document_data)
+        return None, reference
+
+    def list_documents(self):
+        with self._db._lock:
+            ids = sorted({
+                path[len(self._path)] for path in self._db._documents
+                if len(path) > len(self._path) and path[:len(self._path)] == self._path
+            })
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._operations = []
+
+    def __len__(self):
+        return len(self._operations)
+
+    def set(self, reference, document_data, merge=False):
+        self._operations.append(('set', reference._path, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._operations.append(('update', reference._path, field_updates))
+
+    def delete(self, reference):
+        self._operations.append(('delete', reference._path))
+
+    def commit(self):
+        # Batches are atomic: validate updates before applying anything
+        with self._db._lock:
+            for operation in self._operations:
+                if operation[0] == 'update' and operation[1] not in self._db._documents:
+                    raise NotFound(f"No document to update: {'/'.join(operation[1])}")
+        self._db._commit(self._operations)
+        operations, self._operations = self._operations, []
+        return operations
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import threading
+import time
+from google.genai import types
+from src.services.embedding_service import HashingEmbedder
+
+FILLER = (
+    "Under Indian law the answer depends on the facts of the case and the "
+    "relevant provisions of the applicable statute, read with the settled "
+    "principles laid down by the Supreme Court and the High Courts. "
+)
+
+
+class FakeGenAIError(Exception):
+    """Injected model failure, shaped like an APIError (has a status code)."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+def _chunk_response(text, prompt_tokens=0, output_tokens=0):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(role="model", parts=[types.Part.from_text(text=text)])
+        )],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+    )
+
+def _prompt_text(contents):
+    """Flatten the text parts of a contents list."""
+    texts = []
+    for content in contents or []:
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content.parts or []:
+            if part.text:
+                texts.append(part.text)
+    return " ".join(texts)
+
+
+class FakeModels:
+    """Synchronous stand-in for client.models."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content_stream(self, model, contents, config=None):
+        client = self._client
+        client.record_call(model)
+        error = client.pick_error(model)
+        time.sleep(client.ttft_for(model))
+        if error:
+            raise error
+        prompt_tokens = len(_prompt_text(contents)) // 4
+        for index, text in enumerate(client.answer_chunks(contents)):
+            if index:
+                time.sleep(client.chunk_delay)
+            yield _chunk_response(text, prompt_tokens, index + 1)
+
+    def generate_content(self, model, contents, config=None):
+        return _chunk_response("".join(
+            chunk.text for chunk in self.generate_content_stream(model, contents, config)
+        ))
+
+    def embed_content(self, model, contents, config=None):
+        dimensions = getattr(config, 'output_dimensionality', None) or 256
+        vectors = HashingEmbedder(dimensions).embed(list(contents))
+        return types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding(values=row.tolist()) for row in vectors]
+        )
+
+
+class FakeAsyncModels:
+    """Asynchronous stand-in for client.aio.models."""
+
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content_stream(self, model, contents, config=None):
+        client = self._client
+        client.record_call(model)
+        error = client.pick_error(model)
+
+        async def stream():
+            await asyncio.sleep(client.ttft_for(model))
+            if error:
+                raise error
+            prompt_tokens = len(_prompt_text(contents)) // 4
+            for index, text in enumerate(client.answer_chunks(contents)):
+                if index:
+                    await asyncio.sleep(client.chunk_delay)
+                yield _chunk_response(text, prompt_tokens, index + 1)
+
+        return stream()
+
+
+class FakeAio:
+    def __init__(self, client):
+        self.models = FakeAsyncModels(client)
+
+
+class FakeGenAIClient:
+    """
+    Drop-in replacement for genai.Client that streams canned answers.
+
+    Args:
+        ttft (float): Seconds before the first chunk
+        chunk_delay (float): Seconds between chunks
+        chunks (int): Number of chunks per answer
+        error_rate (float): Probability that a call fails before streaming
+        error_code (int): Status code of injected failures
+        seed (int): Seed for the error injection, for reproducible runs
+        model_ttft (dict, optional): Seconds before the first chunk for
+            specific models, to simulate a slow or degraded tier
+        model_error_rate (dict, optional): Failure probability for specific
+            models, to simulate an outage that trips the circuit breaker
+    """
+
+    def __init__(self, ttft=0.5, chunk_delay=0.05, chunks=40, error_rate=0.0,
+                 error_code=503, seed=None, model_ttft=None, model_error_rate=None):
+        self.ttft = ttft
+        self.model_ttft = dict(model_ttft or {})
+        self.model_error_rate = dict(model_error_rate or {})
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.models = FakeModels(self)
+        self.aio = FakeAio(self)
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def record_call(self, model):
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+
+    def ttft_for(self, model):
+        return self.model_ttft.get(model, self.ttft)
+
+    def pick_error(self, model=None):
+        error_rate = self.model_error_rate.get(model, self.error_rate)
+        with self._lock:
+            failed = error_rate and self._random.random() < error_rate
+        if failed:
+            return FakeGenAIError(self.error_code, "Injected failure from fake model")
+        return None
+
+    def answer_chunks(self, contents):
+        """Split a deterministic answer into the configured number of chunks."""
+        question = _prompt_text(contents[-1:] if contents else [])[:80]
+        answer = f"Regarding \"{question}\": " + FILLER * max(1, self.chunks // 4)
+        size = max(1, len(answer) // self.chunks)
+        return [answer[start:start + size] for start in range(0, size * self.chunks, size)]
@@ -0,0 +1,112 @@
+import zlib
+from flask import request
+from config import (
+    COMPRESSION_ENABLED, COMPRESSION_MIN_BYTES, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_EXCLUDED_PATHS
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only JSON is compressed: /ask streams text and SSE, which must reach the client as it is generated
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson')
+
+
+def available_encodings():
+    """Encodings this process can produce, preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def negotiate_encoding(accept_encodings):
+    """
+    The encoding to use for a request, or None for the identity encoding.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+            (werkzeug's `request.accept_encodings`), honouring q-values
+    """
+    return accept_encodings.best_match(available_encodings())
+
+
+class _Compressor:
+    """One incremental gzip or brotli stream."""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._brotli.process(data) if self._brotli else self._zlib.compress(data)
+
+    def flush(self):
+        """Everything compressed so far, so a streamed chunk is not held back."""
+        return self._brotli.flush() if self._brotli else self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._brotli.finish() if self._brotli else self._zlib.flush()
+
+def _compress_stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+def compress_response(response):
+    """
+    after_request hook compressing JSON responses the client accepts compressed.
+
+    Buffered bodies under COMPRESSION_MIN_BYTES are left alone; streamed
+    JSON is compressed chunk by chunk and flushed after each chunk.
+    COMPRESSION_EXCLUDED_PATHS (/ask by default) are never touched, so
+    answers stream without waiting for a compressor.
+    """
+    if not COMPRESSION_ENABLED or request.path.startswith(COMPRESSION_EXCLUDED_PATHS):
+        return response
+    if response.status_code == 304:
+        # Revalidates a body that was sent compressed, and carries its (weak) ETag
+        if negotiate_encoding(request.accept_encodings) is not None:
+            _weaken_etag(response)
+        return response
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200 or response.status_code == 204
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_BYTES:
+            return response
+        compressor = _Compressor(encoding)
+        response.set_data(compressor.compress(body) + compressor.finish())
+
+    response.headers['Content-Encoding'] = encoding
+    _weaken_etag(response)
+    return response
+
+def _weaken_etag(response):
+    # The compressed bytes are a different representation, so a strong ETag must not match them
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
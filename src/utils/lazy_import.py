@@ -0,0 +1,45 @@
+import importlib
+import sys
+
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is used.
+
+    The Google client libraries take well over a second to import, which
+    every cold start would otherwise pay before the worker can answer a
+    request. Modules bind them with `types = lazy_import('google.genai.types')`
+    and use them as usual; the first attribute access imports the real
+    module (under Python's import lock, so concurrent first uses wait for
+    one import).
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """The module `name`, imported on first use unless it already is."""
+    return sys.modules.get(name) or LazyModule(name)
+
+def load(module):
+    """Import a lazily bound module now, e.g. to warm it off the request path."""
+    return module._load() if isinstance(module, LazyModule) else module
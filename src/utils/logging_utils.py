@@ -0,0 +1,68 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from config import LOG_FORMAT, LOG_LEVEL, PROJECT_ID
+from src.services.tracing import current_span
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, in the shape Cloud Logging parses.
+
+    `severity` and `message` become the entry's level and summary, and
+    inside a trace the entry is linked to the current span. Structured
+    fields are passed as logger.info(..., extra={'fields': {...}}).
+    """
+
+    def format(self, record):
+        entry = {
+            'severity': record.levelname,
+            'message': record.getMessage(),
+            'logger': record.name,
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+
+        # Span records carry their own IDs; anything else belongs to the current span
+        span = current_span()
+        trace_id = entry.get('trace_id') or (span.trace_id if span is not None else None)
+        span_id = entry.get('span_id') or (span.span_id if span is not None else None)
+        if trace_id:
+            entry['logging.googleapis.com/trace'] = f"projects/{PROJECT_ID}/traces/{trace_id}" if PROJECT_ID else trace_id
+            entry['logging.googleapis.com/spanId'] = span_id
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain lines for local development, with any structured fields appended."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + json.dumps(fields, default=str)
+        return line
+
+
+_configured = False
+
+def configure_logging(log_format=LOG_FORMAT, level=LOG_LEVEL):
+    """Send the application's log records to stdout; safe to call more than once."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    _configured = True
@@ -0,0 +1,40 @@
+def parse_limit(args, default, maximum):
+    """
+    Read the `limit` query parameter for paginated endpoints.
+
+    Args:
+        args: The request's query arguments
+        default (int): Limit used when the parameter is absent
+        maximum (int): Upper bound the limit is clamped to
+
+    Returns:
+        int: The page size
+
+    Raises:
+        ValueError: If the parameter is not a positive integer
+    """
+    limit = args.get("limit", default)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+RESPONSE_FORMATS = ('full', 'compact')
+
+def parse_format(args):
+    """
+    Read the `format` query parameter of the chat history endpoints.
+
+    "compact" asks for timestamps as epoch milliseconds and short role
+    codes, for clients on slow connections.
+
+    Raises:
+        ValueError: If the format is not one of RESPONSE_FORMATS
+    """
+    response_format = args.get("format", "full")
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(RESPONSE_FORMATS)}")
+    return response_format
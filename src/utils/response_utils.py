@@ -1,3 +1,7 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
 def clean_response(response):
     """Extract and clean text from the model response"""
     try:
@@ -13,5 +17,5 @@ def clean_response(response):
         # Handle simple string or other object types
         return str(response)
     except Exception as e:
-        print(f"Error cleaning response: {e}")
+        logger.error("Error cleaning response: %s", e)
         return {"answer": str(response), "error": str(e)}
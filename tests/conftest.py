@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Offline settings, applied before config is first imported by the tests
+os.environ.update({
+    'FIRESTORE_BACKEND': 'memory',
+    'GENAI_BACKEND': 'fake',
+    'FAKE_GENAI_TTFT': '0',
+    'FAKE_GENAI_CHUNK_DELAY': '0',
+    'CONTEXT_CACHE_BACKEND': 'off',
+    'EMBEDDING_BACKEND': 'hashing',
+    'METRICS_MULTIPROCESS_DIR': '',
+    'LOG_LEVEL': 'WARNING',
+    'STARTUP_MODE': 'lazy',
+    'ATTACHMENT_CACHE_DIR': tempfile.mkdtemp(prefix='attachments-'),
+    'UPLOAD_LOCAL_DIR': tempfile.mkdtemp(prefix='uploads-'),
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A test client with fresh rate limits, so earlier tests' requests do not count."""
+    from src.services import admission_service
+    from main import create_app
+    monkeypatch.setattr(admission_service, '_controller', None)
+    return create_app().test_client()
@@ -0,0 +1,148 @@
+import threading
+import time
+import pytest
+from src.services.admission_service import (
+    AdmissionRejected, ConcurrencyGate, MemoryRateLimitBackend, RateLimiter, PRIORITY_ANONYMOUS, PRIORITY_USER
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    backend = MemoryRateLimitBackend(clock=clock)
+    assert [backend.take('k', 1.0, 3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.take('k', 1.0, 3) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert backend.take('k', 1.0, 3) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take('k', 1.0, 3) == 0.0
+
+
+def test_token_bucket_evicts_least_recently_used_keys():
+    backend = MemoryRateLimitBackend(max_keys=2, clock=FakeClock())
+    backend.take('a', 1.0, 1)
+    backend.take('b', 1.0, 1)
+    backend.take('c', 1.0, 1)
+    # 'a' was evicted, so it starts again with a full bucket
+    assert backend.take('a', 1.0, 1) == 0.0
+    assert backend.take('c', 1.0, 1) > 0
+
+
+def test_rate_limiter_ignores_changing_identities_behind_one_ip():
+    limiter = RateLimiter(MemoryRateLimitBackend(clock=FakeClock()), user_rate=1, user_burst=10,
+                          anonymous_rate=1, anonymous_burst=10, ip_rate=1, ip_burst=2)
+    limiter.check('user-1', '10.0.0.1')
+    limiter.check('user-2', '10.0.0.1')
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check('user-3', '10.0.0.1')
+    assert rejected.value.status == 429
+    limiter.check('user-3', '10.0.0.2')
+
+
+def test_rate_limiter_limits_anonymous_callers_by_ip():
+    limiter = RateLimiter(MemoryRateLimitBackend(clock=FakeClock()), user_rate=1, user_burst=10,
+                          anonymous_rate=1, anonymous_burst=1, ip_rate=1, ip_burst=10)
+    limiter.check(None, '10.0.0.1')
+    with pytest.raises(AdmissionRejected):
+        limiter.check(None, '10.0.0.1')
+    # A verified user behind the same IP has a bucket of their own
+    limiter.check('user-1', '10.0.0.1')
+
+
+def test_rate_limiter_lets_requests_through_when_the_backend_fails():
+    class BrokenBackend:
+        def take(self, key, rate, burst):
+            raise ConnectionError("redis down")
+
+    RateLimiter(BrokenBackend()).check(None, '10.0.0.1')
+
+
+def _acquire_in_thread(gate, priority, results, name):
+    def run():
+        try:
+            permit = gate.acquire(priority)
+            results.append(name)
+            permit.release()
+        except AdmissionRejected:
+            results.append(f'{name}:rejected')
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_gate_admits_users_before_anonymous_callers():
+    gate = ConcurrencyGate(max_concurrent=1, max_queue=2, max_wait=5)
+    permit = gate.acquire(PRIORITY_ANONYMOUS)
+    results = []
+    anonymous = _acquire_in_thread(gate, PRIORITY_ANONYMOUS, results, 'anonymous')
+    wait_until(lambda: gate.stats()['queued'] == 1)
+    user = _acquire_in_thread(gate, PRIORITY_USER, results, 'user')
+    wait_until(lambda: gate.stats()['queued'] == 2)
+
+    permit.release()
+    for thread in (anonymous, user):
+        thread.join(2)
+    assert results == ['user', 'anonymous']
+    assert gate.stats() == {'active': 0, 'queued': 0, 'rejected': 0}
+
+
+def test_gate_user_displaces_anonymous_waiter_when_full():
+    gate = ConcurrencyGate(max_concurrent=1, max_queue=1, max_wait=5)
+    permit = gate.acquire(PRIORITY_USER)
+    results = []
+    anonymous = _acquire_in_thread(gate, PRIORITY_ANONYMOUS, results, 'anonymous')
+    wait_until(lambda: gate.stats()['queued'] == 1)
+    user = _acquire_in_thread(gate, PRIORITY_USER, results, 'user')
+    anonymous.join(2)
+    assert results == ['anonymous:rejected']
+
+    # A full queue of users turns away everyone else at once
+    with pytest.raises(AdmissionRejected) as rejected:
+        gate.acquire(PRIORITY_USER)
+    assert rejected.value.status == 503
+
+    permit.release()
+    user.join(2)
+    assert results == ['anonymous:rejected', 'user']
+
+
+def test_gate_rejects_after_max_wait():
+    gate = ConcurrencyGate(max_concurrent=1, max_queue=1, max_wait=0.05, retry_after=7)
+    permit = gate.acquire(PRIORITY_USER)
+    with pytest.raises(AdmissionRejected) as rejected:
+        gate.acquire(PRIORITY_USER)
+    assert rejected.value.retry_after == 7
+    assert gate.stats()['queued'] == 0
+    permit.release()
+    permit.release()
+    assert gate.stats()['active'] == 0
+
+
+def test_async_gate_hands_slot_to_waiter():
+    import asyncio
+
+    async def scenario():
+        gate = ConcurrencyGate(max_concurrent=1, max_queue=1, max_wait=2)
+        permit = await gate.acquire_async(PRIORITY_ANONYMOUS)
+        waiter = asyncio.ensure_future(gate.acquire_async(PRIORITY_USER))
+        await asyncio.sleep(0.01)
+        assert gate.stats()['queued'] == 1
+        permit.release()
+        (await waiter).release()
+        return gate.stats()
+
+    assert asyncio.run(scenario()) == {'active': 0, 'queued': 0, 'rejected': 0}
@@ -0,0 +1,60 @@
+import asyncio
+import httpx
+import pytest
+from asgi import application
+from src.services import admission_service
+from src.services.firebase_services import get_firestore_client
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    monkeypatch.setattr(admission_service, '_controller', None)
+    db = get_firestore_client()
+    db.reset()
+    yield db
+    db.reset()
+
+
+def _asgi_post(path, body, headers):
+    async def post():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await client.post(path, content=body, headers=headers)
+    return asyncio.run(post())
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('{"question": "What is bail?"}', 'application/json'),
+    ('{"question": "What is bail?"}', 'application/json; charset=utf-8'),
+    ('{"question": "What is bail?"}', 'text/plain'),
+    ('{"question": ', 'application/json'),
+    ('question=hello', 'application/x-www-form-urlencoded'),
+    ('', 'application/json'),
+    ('[]', 'application/json'),
+    ('{"question": 42}', 'application/json'),
+    ('{"question": "q", "images": "not a list"}', 'application/json'),
+])
+def test_asgi_and_flask_answer_ask_alike(client, body, content_type):
+    # Read in full first: an unread Flask stream would hold the question's single flight open
+    flask_response = client.post('/ask', data=body, content_type=content_type, buffered=True)
+    asgi_response = _asgi_post('/ask', body, {'Content-Type': content_type})
+
+    assert asgi_response.status_code == flask_response.status_code
+    if flask_response.status_code == 200:
+        assert asgi_response.text == flask_response.get_data(as_text=True)
+        assert asgi_response.headers['Content-Type'].startswith('text/plain')
+    else:
+        assert asgi_response.json() == flask_response.get_json()
+
+
+def test_asgi_and_flask_stream_sse_alike(client):
+    headers = {'Content-Type': 'application/json', 'Accept': 'text/event-stream'}
+    body = '{"question": "What is bail?"}'
+    flask_response = client.post('/ask', data=body, headers=headers, buffered=True)
+    asgi_response = _asgi_post('/ask', body, headers)
+
+    assert asgi_response.status_code == flask_response.status_code == 200
+    assert asgi_response.headers['Content-Type'] == flask_response.headers['Content-Type']
+    flask_events = [line for line in flask_response.get_data(as_text=True).splitlines() if line.startswith('event:')]
+    asgi_events = [line for line in asgi_response.text.splitlines() if line.startswith('event:')]
+    assert asgi_events == flask_events and flask_events[-1] == 'event: done'
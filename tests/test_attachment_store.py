@@ -0,0 +1,56 @@
+import base64
+import os
+import subprocess
+import sys
+from src.services.attachment_store import AttachmentStore, content_hash
+from src.services.media_service import process_document, process_image
+
+PDF = b'%PDF-1.4\n' + b'0' * 200
+PNG = b'\x89PNG\r\n\x1a\n' + b'0' * 200
+
+
+def test_disk_entries_survive_a_restart_and_are_evicted_least_recently_used(tmp_path):
+    store = AttachmentStore(memory_max_bytes=0, disk_max_bytes=700, directory=str(tmp_path))
+    first, _ = store.put(PDF, 'application/pdf')
+    second, _ = store.put(PNG, 'image/png')
+    assert store.get(first)['data'] == PDF
+
+    restarted = AttachmentStore(memory_max_bytes=0, disk_max_bytes=700, directory=str(tmp_path))
+    assert restarted.get(second)['mime_type'] == 'image/png'
+    third, _ = restarted.put(b'GIF89a' + b'0' * 200, 'image/gif')
+    # The first file was used least recently, so its files are gone
+    assert restarted.get(first) is None
+    assert not os.path.exists(os.path.join(str(tmp_path), first[:2], first))
+    assert restarted.get(third) is not None
+
+
+def test_handle_is_recorded_without_the_bytes(tmp_path):
+    store = AttachmentStore(memory_max_bytes=10 ** 6, disk_max_bytes=10 ** 6, directory=str(tmp_path))
+    digest = content_hash(PDF)
+    store.put_handle(digest, 'application/pdf', len(PDF), 'local://upload.pdf')
+    restarted = AttachmentStore(memory_max_bytes=10 ** 6, disk_max_bytes=10 ** 6, directory=str(tmp_path))
+    entry = restarted.get(digest)
+    assert entry['data'] is None and entry['file_uri'] == 'local://upload.pdf'
+
+
+def test_mime_type_is_sniffed_not_taken_from_the_client():
+    encoded = base64.b64encode(PDF).decode('ascii')
+    assert process_image(f"data:image/png;base64,{encoded}").inline_data.mime_type == 'application/pdf'
+    assert process_document(f"data:image/jpeg;base64,{encoded}").inline_data.mime_type == 'application/pdf'
+    # Formats the sniffer does not know keep the declared type
+    text = base64.b64encode(b'plain text').decode('ascii')
+    assert process_document(f"data:text/plain;base64,{text}").inline_data.mime_type == 'text/plain'
+
+
+def test_disk_tier_is_off_by_default_on_cloud_run():
+    env = {k: v for k, v in os.environ.items() if k not in ('ATTACHMENT_CACHE_DISK_BYTES', 'K_SERVICE')}
+    script = 'import config; print(config.ATTACHMENT_CACHE_DISK_BYTES)'
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def disk_bytes(**extra):
+        output = subprocess.check_output([sys.executable, '-c', script], env={**env, **extra}, cwd=cwd)
+        return int(output)
+
+    assert disk_bytes(K_SERVICE='legal-assistant') == 0
+    assert disk_bytes(K_SERVICE='legal-assistant', ATTACHMENT_CACHE_DISK_BYTES='4096') == 4096
+    assert disk_bytes() > 0
@@ -0,0 +1,63 @@
+import pytest
+from src.services.chat_service import prepare_exchange
+from src.services.firebase_services import get_firestore_client
+
+
+@pytest.fixture(autouse=True)
+def db():
+    db = get_firestore_client()
+    db.reset()
+    yield db
+    db.reset()
+
+
+def test_new_chat_gets_server_id_and_provisional_title():
+    exchange = prepare_exchange({'question': 'Is a verbal contract valid?', 'user_id': 'u1'})
+    assert exchange['is_new_chat']
+    assert len(exchange['chat_id']) == 32
+    assert exchange['chat_title'] == 'Is a verbal contract valid'
+
+
+def test_client_chat_id_is_never_new_even_if_not_stored_yet():
+    # e.g. the first exchange is still queued by another worker's writer
+    exchange = prepare_exchange({'question': 'And a follow-up?', 'user_id': 'u1', 'chat_id': 'abc123'})
+    assert not exchange['is_new_chat']
+    assert exchange['chat_title'] is None
+
+
+@pytest.mark.parametrize('chat_id', ['a/b', '..', '__x__', 'x' * 129, 'tab\there', 42])
+def test_invalid_chat_id_is_rejected(chat_id):
+    with pytest.raises(ValueError):
+        prepare_exchange({'question': 'q', 'user_id': 'u1', 'chat_id': chat_id})
+
+
+@pytest.mark.parametrize('data', [
+    None, [], 'question', {}, {'question': None}, {'question': 42}, {'question': '   '},
+    {'question': ['a']}, {'question': 'q', 'user_id': 7},
+])
+def test_invalid_body_is_rejected(data):
+    with pytest.raises(ValueError):
+        prepare_exchange(data)
+
+
+@pytest.mark.parametrize('field, value', [('images', 'data:image/png;base64,AA=='), ('documents', {}), ('files', 'abc')])
+def test_attachment_fields_must_be_lists(field, value):
+    with pytest.raises(ValueError, match=f"{field} must be a list"):
+        prepare_exchange({'question': 'q', 'user_id': 'u1', field: value})
+
+
+@pytest.mark.parametrize('body', ['[]', '"question"', '{"question": 42}', '{"question": ""}'])
+def test_ask_answers_400_for_an_invalid_body(client, body):
+    response = client.post('/ask', data=body, content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('{"question": ', 'application/json'),
+    ('question=hello', 'text/plain'),
+    ('', 'application/json'),
+])
+def test_ask_answers_400_for_an_unparsable_body(client, body, content_type):
+    response = client.post('/ask', data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Request body must be a JSON object"}
@@ -0,0 +1,111 @@
+import pytest
+from src.services.chat_writer import ChatWriter
+from src.services.firebase_services import get_firestore_client, get_chat_ref
+
+
+@pytest.fixture
+def db():
+    db = get_firestore_client()
+    db.reset()
+    yield db
+    db.reset()
+
+
+class FlakyDatabase:
+    """Fails the first `failures` commits, optionally after applying them (a lost acknowledgement)."""
+
+    def __init__(self, db, failures, applied):
+        self._db = db
+        self.failures = failures
+        self.applied = applied
+        self.commits = 0
+
+    def batch(self):
+        batch = self._db.batch()
+        commit = batch.commit
+
+        def flaky_commit():
+            self.commits += 1
+            if self.failures:
+                self.failures -= 1
+                if self.applied:
+                    commit()
+                raise TimeoutError("deadline exceeded")
+            return commit()
+        batch.commit = flaky_commit
+        return batch
+
+
+def _stored(user_id, chat_id):
+    chat = get_chat_ref(user_id, chat_id)
+    messages = [doc.to_dict() for doc in chat.collection('messages').stream()]
+    return chat.get().to_dict(), messages
+
+
+@pytest.mark.parametrize('applied', [False, True])
+def test_retry_after_failed_commit_writes_each_message_once(db, applied):
+    flaky = FlakyDatabase(db, failures=1, applied=applied)
+    writer = ChatWriter(db_factory=lambda: flaky, retry_base_delay=0)
+    writer.enqueue('u1', 'c1', 'Title', 'question', 'answer', is_new_chat=True)
+    writer.flush()
+
+    chat, messages = _stored('u1', 'c1')
+    assert sorted(m['role'] for m in messages) == ['ai', 'user']
+    assert chat['message_count'] == 2
+    # A commit that landed is not sent again
+    assert flaky.commits == (1 if applied else 2)
+    assert writer.stats['written'] == 1 and writer.stats['retries'] == 1
+
+
+def test_existing_chat_keeps_created_at_and_title(db):
+    writer = ChatWriter(db_factory=lambda: db)
+    writer.enqueue('u1', 'c1', 'First title', 'q1', 'a1', is_new_chat=True)
+    writer.flush()
+    created_at = get_chat_ref('u1', 'c1').get().to_dict()['createdAt']
+
+    writer.enqueue('u1', 'c1', None, 'q2', 'a2')
+    writer.flush()
+    chat, messages = _stored('u1', 'c1')
+    assert chat['createdAt'] == created_at
+    assert chat['title'] == 'First title'
+    assert chat['message_count'] == 4 and len(messages) == 4
+
+
+def test_exchanges_are_coalesced_per_chat_into_one_batch(db):
+    counting = FlakyDatabase(db, failures=0, applied=False)
+    writer = ChatWriter(db_factory=lambda: counting)
+    writer.enqueue('u1', 'c1', 'Title', 'q1', 'a1', is_new_chat=True)
+    writer.enqueue('u1', 'c1', None, 'q2', 'a2')
+    writer.enqueue('u1', 'c2', 'Other', 'q3', 'a3', is_new_chat=True)
+    assert writer.queue_depth() == 3
+    # Queued messages are visible to the next question before they are written
+    assert [m['message'] for m in writer.pending_messages('u1', 'c1')] == ['q1', 'a1', 'q2', 'a2']
+
+    writer.flush()
+    assert counting.commits == 1
+    assert writer.stats['written'] == 3 and writer.stats['batches'] == 1
+    assert writer.queue_depth() == 0 and writer.pending_messages('u1', 'c1') == []
+    chat, messages = _stored('u1', 'c1')
+    assert chat['message_count'] == 4 and len(messages) == 4
+    assert _stored('u1', 'c2')[0]['message_count'] == 2
+
+
+def test_batches_are_split_at_the_firestore_write_limit(db):
+    counting = FlakyDatabase(db, failures=0, applied=False)
+    writer = ChatWriter(db_factory=lambda: counting)
+    # Three writes per chat: the chat document and two messages
+    for i in range(200):
+        writer.enqueue('u1', f'c{i}', None, 'q', 'a')
+    writer.flush()
+    assert counting.commits == 2
+    assert writer.stats['written'] == 200
+
+
+def test_batch_is_dropped_after_the_last_retry(db):
+    flaky = FlakyDatabase(db, failures=10, applied=False)
+    writer = ChatWriter(db_factory=lambda: flaky, max_retries=2, retry_base_delay=0)
+    writer.enqueue('u1', 'c1', 'Title', 'question', 'answer', is_new_chat=True)
+    writer.flush()
+    assert flaky.commits == 3
+    assert writer.stats['dropped'] == 1 and writer.stats['written'] == 0
+    assert not get_chat_ref('u1', 'c1').get().exists
@@ -0,0 +1,93 @@
+import gzip
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+import pytest
+from werkzeug.http import parse_accept_header
+from src.services.firebase_services import get_firestore_client, get_chat_ref
+from src.utils import compression
+from src.utils.compression import _compress_stream, negotiate_encoding
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def user_id():
+    db = get_firestore_client()
+    db.reset()
+    user_id = f"user-{uuid.uuid4().hex[:8]}"
+    # Enough chats for the listing to pass COMPRESSION_MIN_BYTES
+    for i in range(30):
+        get_chat_ref(user_id, f"chat-{i}").set({
+            'title': f"Anticipatory bail under section 438, question {i}",
+            'last_updated': START + timedelta(minutes=i),
+            'message_count': 2,
+        })
+    yield user_id
+    db.reset()
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0', None),
+    ('identity', None),
+    ('*', compression.available_encodings()[0]),
+    ('', None),
+])
+def test_negotiate_encoding_honours_q_values(header, expected):
+    assert negotiate_encoding(parse_accept_header(header)) == expected
+
+
+def test_negotiate_encoding_prefers_brotli_when_installed(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', object())
+    assert negotiate_encoding(parse_accept_header('gzip, br')) == 'br'
+    assert negotiate_encoding(parse_accept_header('gzip, br;q=0.5')) == 'gzip'
+
+
+def test_json_listing_is_gzipped_when_accepted(client, user_id):
+    query = {'user_id': user_id, 'limit': 30}
+    plain = client.get('/chat_history', query_string=query)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get('/chat_history', query_string=query, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    # The compressed bytes are another representation: only a weak ETag may cover them
+    assert compressed.headers['ETag'].startswith('W/')
+    assert not plain.headers['ETag'].startswith('W/')
+
+    revalidated = client.get('/chat_history', query_string=query, headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == compressed.headers['ETag']
+
+
+def test_small_bodies_and_ask_are_left_alone(client):
+    small = client.get('/chat_history', headers={'Accept-Encoding': 'gzip'})
+    assert small.status_code == 400
+    assert 'Content-Encoding' not in small.headers and 'Accept-Encoding' in small.headers['Vary']
+
+    answer = client.post('/ask', json={'question': 'What is bail?'},
+                         headers={'Accept-Encoding': 'gzip'}, buffered=True)
+    assert answer.status_code == 200
+    assert 'Content-Encoding' not in answer.headers
+
+
+def test_streamed_chunks_can_be_decoded_as_they_arrive():
+    chunks = [b'{"id": 1}\n', '{"id": 2}\n', b'{"id": 3}\n']
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    stream = _compress_stream(iter(chunks), 'gzip')
+    # Each chunk is flushed, so it decodes before the stream has finished
+    for chunk in chunks:
+        expected = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        assert decoder.decompress(next(stream)) == expected
+    assert decoder.decompress(b''.join(stream)) == b''
+    assert decoder.eof
+
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip('brotli')
+    stream = _compress_stream([b'{"id": 1}\n', b'{"id": 2}\n'], 'br')
+    assert brotli.decompress(b''.join(stream)) == b'{"id": 1}\n{"id": 2}\n'
@@ -0,0 +1,38 @@
+from google.genai import types
+from src.services.context_cache import ContextCacheManager, LocalCacheBackend
+
+
+def _manager(**kwargs):
+    kwargs.setdefault('min_tokens', 1)
+    return ContextCacheManager(LocalCacheBackend(), ttl_seconds=3600, refresh_margin=60, **kwargs)
+
+
+def test_entries_are_bounded_least_recently_used_first():
+    manager = _manager(max_entries=2)
+    first = manager.get('model', 'prompt one')
+    manager.get('model', 'prompt two')
+    # Using the first prompt again makes the second the least recently used
+    assert manager.get('model', 'prompt one') == first
+    manager.get('model', 'prompt three')
+    assert len(manager._entries) == 2
+    assert manager.get('model', 'prompt one') == first
+
+
+def test_failures_are_bounded():
+    class FailingBackend(LocalCacheBackend):
+        def create(self, *args, **kwargs):
+            raise RuntimeError("unavailable")
+
+    manager = ContextCacheManager(FailingBackend(), min_tokens=1, retry_after=60, max_entries=3)
+    for i in range(10):
+        assert manager.get('model', f'prompt {i}') is None
+    assert len(manager._failures) == 3
+
+
+def test_small_inline_media_is_not_cached():
+    manager = _manager(min_tokens=2048)
+    image = types.Part.from_bytes(data=b'\x89PNG' + b'\0' * 1000, mime_type='image/png')
+    assert manager.get('model', 'prompt', [image]) is None
+
+    pdf = types.Part.from_bytes(data=b'%PDF' + b'\0' * 2048 * 64, mime_type='application/pdf')
+    assert manager.get('model', 'prompt', [pdf]) is not None
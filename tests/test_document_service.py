@@ -0,0 +1,58 @@
+import io
+import os
+import zipfile
+from src.services.document_service import DocumentIndex
+from src.services.embedding_service import HashingEmbedder
+from src.services.media_service import DOCX_MIME_TYPE
+
+
+def _docx(text):
+    """A minimal DOCX with one paragraph per line of text."""
+    paragraphs = "".join(f'<w:p><w:r><w:t>{line}</w:t></w:r></w:p>' for line in text.splitlines())
+    document = ('<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{paragraphs}</w:body></w:document>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def _index(directory, max_bytes):
+    return DocumentIndex(HashingEmbedder(dimensions=64), directory=str(directory), max_bytes=max_bytes)
+
+
+def _document_bytes(index, digest):
+    return sum(os.path.getsize(path) for path in index._document_paths(digest))
+
+
+def test_documents_beyond_the_budget_are_evicted_least_recently_used(tmp_path):
+    documents = [_docx(f"Section {n}. Offence number {n}\nThe punishment for offence {n}.") for n in range(3)]
+    probe = _index(tmp_path / 'probe', 10 ** 9)
+    size = _document_bytes(probe, probe.ingest(documents[0], DOCX_MIME_TYPE)[0])
+
+    index = _index(tmp_path / 'index', int(size * 2.5))
+    first, _ = index.ingest(documents[0], DOCX_MIME_TYPE)
+    second, _ = index.ingest(documents[1], DOCX_MIME_TYPE)
+    assert index.is_indexed(first)
+    index._open.clear()
+    assert index.is_indexed(first)
+
+    third, _ = index.ingest(documents[2], DOCX_MIME_TYPE)
+    # The second document was used least recently, so its files are gone
+    assert not index.is_indexed(second)
+    assert not any(os.path.exists(path) for path in index._document_paths(second))
+    assert index.is_indexed(first) and index.is_indexed(third)
+
+
+def test_chat_lists_only_documents_still_indexed_and_the_budget_survives_a_restart(tmp_path):
+    documents = [_docx(f"Article {n}. Right number {n}") for n in range(2)]
+    index = _index(tmp_path, 10 ** 9)
+    digests = [index.ingest(document, DOCX_MIME_TYPE)[0] for document in documents]
+    for digest in digests:
+        index.attach('u1', 'chat1', digest)
+    assert index.chat_documents('u1', 'chat1') == digests
+
+    # A smaller budget after a restart evicts the oldest files first
+    restarted = _index(tmp_path, _document_bytes(index, digests[1]) + 200)
+    assert restarted.chat_documents('u1', 'chat1') == [digests[1]]
+    assert restarted._bytes <= restarted.max_bytes
@@ -0,0 +1,71 @@
+import io
+import pytest
+from src.services.chat_writer import ChatWriter
+from src.services.export_service import (
+    ChatImporter, WriteThrottle, decode_cursor, encode_cursor, export_user, gzip_ndjson, header_record,
+    read_records
+)
+from src.services.firebase_services import get_firestore_client
+
+
+@pytest.fixture
+def db():
+    db = get_firestore_client()
+    db.reset()
+    writer = ChatWriter(db_factory=lambda: db)
+    for chat in range(3):
+        for exchange in range(3):
+            writer.enqueue('u1', f'chat{chat}', f'Chat {chat}', f'q{exchange}', f'a{exchange}',
+                           is_new_chat=exchange == 0)
+        writer.flush()
+    writer.enqueue('u2', 'chat0', 'Other user', 'q', 'a', is_new_chat=True)
+    writer.flush()
+    yield db
+    db.reset()
+
+
+def _documents(records):
+    return [(r['type'], r['chat_id'], r.get('message_id')) for r in records if r['type'] != 'cursor']
+
+
+@pytest.mark.parametrize('cursor', [
+    encode_cursor('u1', 'chat0'),
+    encode_cursor('u1', 'chat0', 'message-id'),
+])
+def test_cursor_round_trip(cursor):
+    user_id, chat_id, message_id = decode_cursor(cursor)
+    assert encode_cursor(user_id, chat_id, message_id) == cursor
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24=', encode_cursor(1, 'chat0')])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_export_resumes_after_every_cursor(db):
+    full = list(export_user('u1', page_size=2))
+    assert len([r for r in full if r['type'] == 'chat']) == 3
+    assert len([r for r in full if r['type'] == 'message']) == 18
+
+    for position, record in enumerate(full):
+        if record['type'] != 'cursor':
+            continue
+        resumed = list(export_user('u1', cursor=record['cursor'], page_size=2))
+        assert _documents(full[:position]) + _documents(resumed) == _documents(full)
+
+
+def test_cursor_of_another_user_is_rejected(db):
+    cursor = next(r['cursor'] for r in export_user('u2') if r['type'] == 'cursor')
+    with pytest.raises(ValueError):
+        export_user('u1', cursor=cursor)
+
+
+def test_archive_imports_back_unchanged(db):
+    archive = b''.join(gzip_ndjson([header_record()] + list(export_user('u1', page_size=2))))
+    exported = [r for r in export_user('u1') if r['type'] != 'cursor']
+
+    db.reset()
+    stats = ChatImporter(throttle=WriteThrottle(0), user_id='u1').import_records(read_records(io.BytesIO(archive)))
+    assert stats['chats'] == 3 and stats['messages'] == 18
+    assert [r for r in export_user('u1') if r['type'] != 'cursor'] == exported
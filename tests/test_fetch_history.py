@@ -0,0 +1,135 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from src.cli.migrate_messages import migrate_chat
+from src.services.firebase_services import get_firestore_client, get_chat_ref
+from src.services.history_cache import invalidate_history
+from src.testing.fake_firestore import FakeDocumentReference
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def user_id():
+    db = get_firestore_client()
+    db.reset()
+    # Each test has its own user, so no page is served from another test's cache
+    yield f"user-{uuid.uuid4().hex[:8]}"
+    db.reset()
+
+
+def _messages(count):
+    return [
+        {'role': 'user' if i % 2 == 0 else 'ai', 'message': f"message {i}", 'timestamp': START + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+def _store_chat(user_id, chat_id, messages, legacy=False, **fields):
+    chat_ref = get_chat_ref(user_id, chat_id)
+    chat = dict({'title': chat_id, 'last_updated': messages[-1]['timestamp'], 'message_count': len(messages)}, **fields)
+    if legacy:
+        chat['messages'] = messages
+    else:
+        for i, message in enumerate(messages):
+            chat_ref.collection('messages').document(f"m{i}").set(message)
+    chat_ref.set(chat)
+    return chat_ref
+
+
+def _pages(client, user_id, **params):
+    """Every page of a listing, following next_before until it runs out."""
+    pages, before = [], None
+    while True:
+        query = dict(params, user_id=user_id, **({'before': before} if before else {}))
+        payload = client.get('/chat_history', query_string=query).get_json()
+        assert payload['status'] == 'success', payload
+        pages.append(payload)
+        before = payload['next_before']
+        if before is None:
+            return pages
+
+
+def _texts(pages):
+    # Pages run newest first, each page oldest first
+    return [message['message'] for page in reversed(pages) for message in page['chat']['messages']]
+
+
+def test_chat_messages_are_paged_newest_page_first(client, user_id):
+    _store_chat(user_id, 'c1', _messages(5))
+    pages = _pages(client, user_id, chat_id='c1', limit=2)
+    assert [len(page['chat']['messages']) for page in pages] == [2, 2, 1]
+    assert _texts(pages) == [f"message {i}" for i in range(5)]
+    assert pages[0]['chat']['message_count'] == 5
+
+
+def test_invalid_cursor_and_missing_chat_are_reported(client, user_id):
+    _store_chat(user_id, 'c1', _messages(3))
+    response = client.get('/chat_history', query_string={'user_id': user_id, 'chat_id': 'c1', 'before': 'nope'})
+    assert response.status_code == 400
+    assert client.get('/chat_history', query_string={'user_id': user_id, 'chat_id': 'c2'}).status_code == 404
+    assert client.get('/chat_history', query_string={'user_id': user_id, 'limit': 0}).status_code == 400
+
+
+def test_chat_list_is_paged_by_last_update(client, user_id):
+    for i in range(5):
+        _store_chat(user_id, f"c{i}", _messages(i + 1))
+    pages = _pages(client, user_id, limit=2)
+    chats = [chat for page in pages for chat in page['chats']]
+    assert [chat['id'] for chat in chats] == ['c4', 'c3', 'c2', 'c1', 'c0']
+    # Listings carry the chat metadata only
+    assert all('messages' not in chat for chat in chats)
+
+
+def test_chat_list_cursor_reads_only_last_updated(client, user_id, monkeypatch):
+    for i in range(3):
+        _store_chat(user_id, f"c{i}", _messages(i + 1), legacy=True)
+    reads = []
+    get = FakeDocumentReference.get
+
+    def recording_get(self, field_paths=None, transaction=None):
+        reads.append((self.id, field_paths))
+        return get(self, field_paths, transaction)
+
+    monkeypatch.setattr(FakeDocumentReference, 'get', recording_get)
+    page = client.get('/chat_history', query_string={'user_id': user_id, 'limit': 1, 'before': 'c2'}).get_json()
+    assert [chat['id'] for chat in page['chats']] == ['c1']
+    # The cursor document is projected, so a legacy chat's messages are not read
+    assert reads == [('c2', ['last_updated'])]
+
+
+def test_legacy_chat_pages_the_same_before_and_after_migration(client, user_id):
+    messages = _messages(5)
+    chat_ref = _store_chat(user_id, 'c1', messages[:4], legacy=True, summarized_count=2)
+    # Written after the deploy, straight into the subcollection
+    chat_ref.collection('messages').document('new').set(messages[4])
+
+    before = _pages(client, user_id, chat_id='c1', limit=2)
+    assert _texts(before) == [f"message {i}" for i in range(5)]
+    cursor = before[0]['next_before']
+
+    assert migrate_chat(chat_ref, chat_ref.get().to_dict()) == 4
+    invalidate_history(user_id, 'c1')
+    migrated = chat_ref.get().to_dict()
+    assert 'messages' not in migrated and 'summarized_count' not in migrated
+    assert migrated['message_count'] == 5
+    assert migrated['summarized_until'] == messages[1]['timestamp']
+
+    after = _pages(client, user_id, chat_id='c1', limit=2)
+    assert _texts(after) == _texts(before)
+    assert [m['id'] for m in after[1]['chat']['messages']] == [m['id'] for m in before[1]['chat']['messages']]
+    # A cursor handed out before the migration still pages on after it
+    page = client.get('/chat_history', query_string={'user_id': user_id, 'chat_id': 'c1', 'limit': 2,
+                                                     'before': cursor}).get_json()
+    assert page['chat']['messages'] == after[1]['chat']['messages']
+
+
+def test_migration_can_be_run_again_after_a_partial_failure(user_id):
+    chat_ref = _store_chat(user_id, 'c1', _messages(3), legacy=True)
+    chat_data = chat_ref.get().to_dict()
+    # A run that wrote the messages but failed before updating the chat
+    chat_ref.collection('messages').document('legacy-000000').set(chat_data['messages'][0])
+
+    assert migrate_chat(chat_ref, chat_data, dry_run=True) == 3
+    assert migrate_chat(chat_ref, chat_data) == 3
+    assert len(list(chat_ref.collection('messages').stream())) == 3
+    assert chat_ref.get().to_dict()['message_count'] == 3
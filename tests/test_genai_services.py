@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from src.services.genai_services import _first_chunk, _first_chunk_async, _needs_refresh
+
+
+def _slow_stream(release, attempt_usage):
+    release.wait(5)
+    yield "late"
+
+
+def test_first_chunk_times_out_and_closes_the_request():
+    release = threading.Event()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        _first_chunk(lambda usage: _slow_stream(release, usage), hedge_delay=None, timeout=0.2)
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_first_chunk_uses_the_hedge_that_answers_within_the_timeout():
+    release = threading.Event()
+    calls = []
+
+    def start(usage):
+        calls.append(usage)
+        if len(calls) == 1:
+            return _slow_stream(release, usage)
+        return iter(["fast", "rest"])
+
+    chunks, first, _ = _first_chunk(start, hedge_delay=0.05, timeout=2)
+    assert first == "fast" and list(chunks) == ["rest"]
+    release.set()
+
+
+def test_async_first_chunk_times_out():
+    async def slow(usage):
+        await asyncio.sleep(5)
+        yield "late"
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await _first_chunk_async(slow, hedge_delay=0.05, timeout=0.2)
+
+    started = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize('expires_in, expected', [(timedelta(hours=1), False), (timedelta(seconds=5), True)])
+def test_needs_refresh_before_the_token_expires(expires_in, expected):
+    expiry = datetime.now(timezone.utc) + expires_in
+    # google-auth hands out naive UTC expiries; aware ones compare the same way
+    for value in (expiry.replace(tzinfo=None), expiry):
+        assert _needs_refresh(SimpleNamespace(token='t', expiry=value)) is expected
+    assert _needs_refresh(SimpleNamespace(token=None, expiry=expiry)) is True
@@ -0,0 +1,134 @@
+import pytest
+from src.routes.fetch_data.cached_response import etag_matches
+from src.services.history_cache import HistoryCache, etag_for
+
+
+class Loader:
+    """Counts loads and serves a body that changes with every write."""
+
+    def __init__(self):
+        self.version = 0
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        return f'{{"version": {self.version}}}'.encode('utf-8'), 200
+
+
+class SharedBackend:
+    """In-process stand-in for RedisHistoryBackend."""
+
+    def __init__(self):
+        self.generations = {}
+        self.bodies = {}
+
+    def current(self, scope):
+        return self.generations.get(scope, 0)
+
+    def bump(self, scopes, ttl_seconds):
+        for scope in scopes:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+
+    def get(self, key):
+        return self.bodies.get(key)
+
+    def set(self, key, etag, body, ttl_seconds):
+        self.bodies[key] = (etag, body)
+
+
+def test_listings_bypass_the_memory_only_cache():
+    cache = HistoryCache()
+    load = Loader()
+    first = cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    second = cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    assert load.loads == 2
+    assert first[2] == second[2] is not None
+
+
+def test_listings_are_cached_with_a_shared_tier():
+    shared = SharedBackend()
+    load = Loader()
+    cache = HistoryCache(shared)
+    cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    assert load.loads == 1
+
+    # A chat started on another worker bumps the shared generation
+    load.version += 1
+    HistoryCache(shared).invalidate('user', 'other-chat')
+    body, _, _ = cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    assert body == b'{"version": 1}'
+
+
+def test_chat_pages_are_cached_until_invalidated():
+    cache = HistoryCache()
+    load = Loader()
+    body, status, etag = cache.get_or_load('chat_history', 'user', 'chat', (50, None), load)
+    assert (status, etag) == (200, etag_for(body))
+    assert cache.get_or_load('chat_history', 'user', 'chat', (50, None), load) == (body, 200, etag)
+    assert load.loads == 1
+
+    load.version += 1
+    cache.invalidate('user', 'other-chat')
+    assert cache.get_or_load('chat_history', 'user', 'chat', (50, None), load)[0] == body
+    cache.invalidate('user', 'chat')
+    new_body, _, new_etag = cache.get_or_load('chat_history', 'user', 'chat', (50, None), load)
+    assert new_body == b'{"version": 1}' and new_etag != etag
+    assert load.loads == 2
+
+
+def test_summary_invalidation_leaves_listings_cached():
+    cache = HistoryCache(SharedBackend())
+    load = Loader()
+    cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    cache.invalidate('user', 'chat', listings=False)
+    cache.get_or_load('chat_titles', 'user', None, (50, None), load)
+    assert load.loads == 1
+
+
+def test_errors_and_large_pages_are_not_cached():
+    cache = HistoryCache(max_entry_bytes=8)
+    calls = []
+
+    def missing():
+        calls.append(1)
+        return b'{"error": "Chat not found"}', 404
+
+    assert cache.get_or_load('chat_history', 'user', 'chat', (50, None), missing)[1:] == (404, None)
+    cache.get_or_load('chat_history', 'user', 'chat', (50, None), missing)
+    load = Loader()
+    cache.get_or_load('chat_history', 'user', 'other', (50, None), load)
+    cache.get_or_load('chat_history', 'user', 'other', (50, None), load)
+    assert len(calls) == 2 and load.loads == 2
+
+
+@pytest.mark.parametrize('header, matches', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ('*', True),
+    ('"xyz"', False),
+    ('abc', False),
+    (None, False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+
+def test_chat_history_revalidates_with_if_none_match():
+    from main import create_app
+    from src.services.chat_writer import ChatWriter
+    client = create_app().test_client()
+    writer = ChatWriter()
+    writer.enqueue('etag-user', 'chat', 'Title', 'question', 'answer', is_new_chat=True)
+    writer.flush()
+
+    url = '/chat_history?user_id=etag-user&chat_id=chat'
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    writer.enqueue('etag-user', 'chat', None, 'follow-up', 'answer')
+    writer.flush()
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
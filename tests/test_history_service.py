@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+from src.services.history_service import build_history_contents, pending_summary_messages
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _chat(count, summarized=0):
+    messages = [
+        {'role': 'user' if i % 2 == 0 else 'ai', 'message': f"message {i} " + 'x' * 396,
+         'timestamp': START + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+    chat = {'messages': messages}
+    if summarized:
+        chat['summary'] = "Earlier messages"
+        chat['summarized_until'] = messages[summarized - 1]['timestamp']
+    return chat
+
+
+def _texts(contents):
+    return [content.parts[0].text for content in contents]
+
+
+def test_messages_outside_the_window_are_sent_until_summarised():
+    # Each message is ~100 tokens: the window holds 3 of the 6 messages
+    chat = _chat(6)
+    assert pending_summary_messages(chat, token_budget=300) == ([], None)
+    texts = _texts(build_history_contents(chat, token_budget=300))
+    assert len(texts) == 6 and texts[0].startswith("message 0 ")
+
+
+def test_summarised_messages_are_replaced_by_the_summary():
+    chat = _chat(10, summarized=4)
+    texts = _texts(build_history_contents(chat, token_budget=300))
+    assert texts[0].startswith("Summary of our earlier conversation")
+    assert [text.split(' ')[1] for text in texts[2:]] == ['4', '5', '6', '7', '8', '9']
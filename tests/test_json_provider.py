@@ -0,0 +1,68 @@
+import json
+from datetime import date, datetime, timezone
+import pytest
+from flask import Flask
+from src.utils import json_provider
+from src.utils.json_provider import FastJSONProvider
+
+WHEN = datetime(2026, 10, 18, 14, 15, 54, 123456, tzinfo=timezone.utc)
+PAYLOAD = {
+    'title': 'जमानत क्या है',
+    'last_updated': WHEN,
+    'day': date(2026, 10, 18),
+    'message_count': 3,
+    'scores': [0.5, None, True],
+    1: 'non-string key',
+}
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.mark.parametrize('datetime_format, expected', [
+    ('http', ('Sun, 18 Oct 2026 14:15:54 GMT', 'Sun, 18 Oct 2026 00:00:00 GMT')),
+    ('iso', ('2026-10-18T14:15:54.123456+00:00', '2026-10-18')),
+    ('epoch_ms', (1792332954123, 1792281600000)),
+])
+def test_orjson_and_stdlib_write_the_same_json(app, datetime_format, expected):
+    fast = FastJSONProvider(app, backend='orjson', datetime_format=datetime_format)
+    stdlib = FastJSONProvider(app, backend='stdlib', datetime_format=datetime_format)
+    assert fast.backend == 'orjson' and stdlib.backend == 'stdlib'
+
+    decoded = json.loads(fast.dump_bytes(PAYLOAD))
+    assert decoded == json.loads(stdlib.dump_bytes(PAYLOAD))
+    assert (decoded['last_updated'], decoded['day']) == expected
+    assert json.loads(fast.dumps(PAYLOAD)) == decoded
+    assert fast.loads(fast.dumps(PAYLOAD)) == decoded
+
+
+def test_orjson_writes_utf8_and_stdlib_keeps_escapes(app):
+    body = FastJSONProvider(app, backend='orjson').dump_bytes({'title': 'जमानत'})
+    assert 'जमानत'.encode('utf-8') in body
+    assert b'\\u091c' in FastJSONProvider(app, backend='stdlib').dump_bytes({'title': 'जमानत'})
+
+
+def test_per_call_format_and_indent(app):
+    provider = FastJSONProvider(app, backend='orjson')
+    assert json.loads(provider.dump_bytes({'at': WHEN}, 'epoch_ms')) == {'at': 1792332954123}
+    assert provider.dumps({'a': 1}, indent=2) == '{\n  "a": 1\n}'
+    # Arguments orjson has no equivalent for go to the standard library
+    assert provider.dumps({'b': 1, 'a': 2}, sort_keys=True) == '{"a": 2, "b": 1}'
+
+
+def test_falls_back_to_the_standard_library(app, monkeypatch):
+    monkeypatch.setattr(json_provider, 'orjson', None)
+    assert FastJSONProvider(app, backend='orjson').backend == 'stdlib'
+    assert FastJSONProvider(app, backend='simplejson').backend == 'stdlib'
+    with pytest.raises(ValueError):
+        FastJSONProvider(app, datetime_format='rfc822')
+
+
+def test_app_responses_use_the_provider(client):
+    from main import app
+    assert isinstance(app.json, FastJSONProvider)
+    response = client.get('/chat_history')
+    assert response.status_code == 400
+    assert response.get_json() == {'status': 'error', 'error': 'user_id is required'}
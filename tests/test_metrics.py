@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+from src.services import metrics
+from src.services.metrics import Counter, Histogram, Registry, render
+
+
+def _samples(text):
+    return {line.rsplit(' ', 1)[0]: line.rsplit(' ', 1)[1] for line in text.splitlines() if not line.startswith('#')}
+
+
+def test_counters_and_histograms_render_in_the_text_format():
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests', ('route',), registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=registry)
+    requests.labels(route='/ask').inc()
+    requests.labels(route='/ask').inc(2)
+    requests.labels(route='say "hi"\n').inc()
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    text = render(registry.collect())
+    assert "# TYPE requests_total counter" in text and "# TYPE latency_seconds histogram" in text
+    assert _samples(text) == {
+        'requests_total{route="/ask"}': '3',
+        'requests_total{route="say \\"hi\\"\\n"}': '1',
+        'latency_seconds_bucket{le="0.1"}': '2',
+        'latency_seconds_bucket{le="1"}': '3',
+        'latency_seconds_bucket{le="+Inf"}': '4',
+        'latency_seconds_sum': '3.65',
+        'latency_seconds_count': '4',
+    }
+
+
+def test_a_failing_collector_does_not_break_the_scrape():
+    registry = Registry()
+    Counter('kept_total', 'Kept', registry=registry).inc()
+
+    @registry.register_collector
+    def broken():
+        raise RuntimeError("source unavailable")
+
+    @registry.register_collector
+    def queue_length():
+        return [('queue_length', 'gauge', 'Queued items', [({'queue': 'titles'}, 4)])]
+
+    assert _samples(render(registry.collect())) == {'kept_total': '1', 'queue_length{queue="titles"}': '4'}
+
+
+def test_scrape_adds_up_the_workers_and_drops_gauges_of_exited_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROCESS_DIR', str(tmp_path))
+    directory = metrics._snapshot_dir()
+    os.makedirs(directory)
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    for pid in (os.getppid(), exited.pid):
+        with open(os.path.join(directory, f"{pid}.json"), 'w') as f:
+            json.dump([
+                ['litigence_http_requests_total', 'counter', 'Requests',
+                 [['litigence_http_requests_total', [['route', '/merged'], ['method', 'GET'], ['status', '200']], 2]]],
+                ['queue_length', 'gauge', 'Queued items', [['queue_length', [], 5]]],
+            ], f)
+
+    samples = _samples(metrics.render_metrics())
+    # Counters of both workers are added up; only the live worker's gauge is kept
+    assert samples['litigence_http_requests_total{route="/merged",method="GET",status="200"}'] == '4'
+    assert samples['queue_length'] == '5'
+
+
+def test_requests_are_counted_by_route_template(client):
+    client.get('/chat_history', query_string={'user_id': 'metrics-user', 'chat_id': 'chat-42'})
+    client.post('/ask', json={'question': 'What is bail?'}, buffered=True)
+
+    response = client.get('/metrics')
+    assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+    samples = _samples(response.get_data(as_text=True))
+    assert int(samples['litigence_http_requests_total{route="/chat_history",method="GET",status="404"}']) >= 1
+    assert int(samples['litigence_http_requests_total{route="/ask",method="POST",status="200"}']) >= 1
+    assert not any('chat-42' in name for name in samples)
+    assert any(name.startswith('litigence_genai_requests_total{') and 'outcome="ok"' in name for name in samples)
@@ -0,0 +1,112 @@
+import random
+import pytest
+from src.services import genai_services
+from src.services.genai_services import generate_legal_response
+from src.services.model_router import ModelRouter, classify_features, question_features
+from src.testing.fake_genai import FakeGenAIClient
+
+TIERS = {
+    'fast': {'model': 'fast-model', 'max_output_tokens': 2048, 'p95_budget': 1.0, 'token_budget': 0},
+    'standard': {'model': 'standard-model', 'max_output_tokens': 8192, 'p95_budget': 4.0, 'token_budget': 0},
+    'heavy': {'model': 'heavy-model', 'max_output_tokens': 8192, 'p95_budget': 12.0, 'token_budget': 1000},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _router(**kwargs):
+    settings = dict(tiers=TIERS, window_seconds=60, min_samples=5, max_error_rate=0.2,
+                    probe_rate=0.0, clock=FakeClock(), seed=1)
+    settings.update(kwargs)
+    return ModelRouter(**settings)
+
+
+def _record(router, tier, count, ttft=0.1, failed=False, usage=None):
+    for _ in range(count):
+        router.record({'tier': tier}, ttft, ttft + 1, usage, failed)
+
+
+@pytest.mark.parametrize('question, context, tier, reasons', [
+    ("What is bail?", {}, 'fast', ['definitional']),
+    ("Is a verbal contract for the sale of land valid?", {}, 'standard', []),
+    ("What is bail?", {'attachments': ['judgment']}, 'standard', ['document']),
+    ("Compare the precedents and draft arguments", {'attachments': ['a', 'b']}, 'heavy',
+     ['multi_document', 'analysis']),
+    (" ".join(["word"] * 160), {'history': list(range(8))}, 'standard', ['long_question', 'long_history']),
+])
+def test_classify_features(question, context, tier, reasons):
+    assert classify_features(question_features(question, **context)) == (tier, reasons)
+
+
+def test_route_uses_the_tier_settings_and_falls_back_to_standard():
+    route = _router().route("What is bail?")
+    assert (route['tier'], route['model'], route['max_output_tokens']) == ('fast', 'fast-model', 2048)
+    assert route['shifted_from'] is None
+
+    without_fast = _router(tiers=dict(TIERS, fast={'model': None}))
+    assert without_fast.route("What is bail?")['tier'] == 'standard'
+    with pytest.raises(ValueError):
+        _router(tiers={'fast': TIERS['fast']})
+
+
+@pytest.mark.parametrize('calls', [
+    {'ttft': 3.0},
+    {'failed': True},
+])
+def test_degraded_tier_shifts_traffic_until_the_window_passes(calls):
+    router = _router()
+    _record(router, 'fast', 4, **calls)
+    # Too few calls to judge the tier yet
+    assert not router.degraded('fast')
+    _record(router, 'fast', 1, **calls)
+    assert router.degraded('fast')
+
+    route = router.route("What is bail?")
+    assert (route['tier'], route['shifted_from']) == ('standard', 'fast')
+    assert router.report()['fast']['shifted_away'] == 1
+
+    router.clock.now += 61
+    assert router.route("What is bail?")['tier'] == 'fast'
+
+
+def test_token_budget_degrades_a_tier_and_a_degraded_fallback_is_skipped():
+    router = _router()
+    question = "Compare the precedents and draft arguments"
+    _record(router, 'heavy', 5, usage={'prompt_tokens': 150, 'completion_tokens': 60})
+    _record(router, 'standard', 5, failed=True)
+    route = router.route(question, attachments=['a', 'b'])
+    assert (route['tier'], route['shifted_from']) == ('fast', 'heavy')
+
+
+def test_probe_share_of_a_degraded_tier_still_reaches_it():
+    router = _router(probe_rate=0.25, seed=7)
+    _record(router, 'fast', 5, ttft=3.0)
+    tiers = [router.route("What is bail?")['tier'] for _ in range(400)]
+
+    # The router draws one number per request while the tier is degraded
+    draws = random.Random(7)
+    probes = sum(draws.random() < 0.25 for _ in range(400))
+    assert tiers.count('fast') == probes and 60 < probes < 140
+    assert tiers.count('standard') == 400 - probes
+
+
+def test_generation_calls_the_routed_model_and_reports_back(monkeypatch):
+    client = FakeGenAIClient(ttft=0, chunk_delay=0, chunks=4)
+    router = _router()
+    monkeypatch.setattr(genai_services, '_client', client)
+    monkeypatch.setattr(genai_services, 'get_model_router', lambda: router)
+
+    answer = "".join(generate_legal_response("What is bail?"))
+    assert answer.startswith("Regarding")
+    assert client.calls == {'fast-model': 1}
+    assert router.stats['fast'].snapshot(router.clock())['requests'] == 1
+
+    _record(router, 'fast', 5, ttft=3.0)
+    list(generate_legal_response("What is bail?"))
+    assert client.calls == {'fast-model': 1, 'standard-model': 1}
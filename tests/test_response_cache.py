@@ -0,0 +1,30 @@
+import numpy as np
+from src.services.response_cache import ResponseCache, normalize_question
+
+
+class TableEmbedder:
+    """Embeds the questions of a test with fixed unit vectors."""
+
+    def __init__(self, vectors):
+        self.vectors = {normalize_question(text): np.array(vector, dtype=np.float32) / np.linalg.norm(vector)
+                        for text, vector in vectors.items()}
+
+    def embed(self, texts, task_type="RETRIEVAL_QUERY"):
+        return [self.vectors[text] for text in texts]
+
+
+def test_expired_entries_do_not_hide_a_live_semantic_match():
+    embedder = TableEmbedder({
+        'what is a tort': [1, 0],
+        'define a tort': [1, 0.1],
+        'explain what a tort is': [1, 0.3],
+    })
+    cache = ResponseCache(embedder, max_entries=4, similarity_threshold=0.9)
+    cache.store('define a tort', 'stale answer')
+    cache.store('explain what a tort is', 'live answer')
+    stale = cache._entries[next(iter(cache._entries))]
+    stale['expires_at'] = 0
+    cache._slot_expires[stale['slot']] = 0
+
+    answer, _ = cache.lookup('What is a tort?')
+    assert answer == 'live answer'
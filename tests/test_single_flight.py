@@ -0,0 +1,182 @@
+import asyncio
+import queue
+import threading
+import time
+import pytest
+from src.services import single_flight
+from src.services.genai_services import GenerationError
+from src.services.single_flight import SingleFlight, flight_key, stream_answer, stream_answer_async
+
+DONE = object()
+
+
+class QueuedModel:
+    """A model stream that yields what the test puts on its queue; exceptions are raised."""
+
+    def __init__(self):
+        self.items = queue.Queue()
+        self.calls = 0
+
+    def __call__(self, question, usage=None, **kwargs):
+        self.calls += 1
+        return self._stream(usage)
+
+    def _stream(self, usage):
+        while True:
+            item = self.items.get(timeout=5)
+            if item is DONE:
+                usage.update(prompt_tokens=10, completion_tokens=3)
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def stream_async(self, question, usage=None, **kwargs):
+        self.calls += 1
+        for item in self._stream(usage):
+            await asyncio.sleep(0)
+            yield item
+
+
+class Reader(threading.Thread):
+    """Reads one answer on its own thread, keeping the chunks and any error."""
+
+    def __init__(self, exchange):
+        super().__init__(daemon=True)
+        self.exchange = exchange
+        self.usage = {}
+        self.chunks = []
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            for chunk in stream_answer(self.exchange, usage=self.usage):
+                self.chunks.append(chunk)
+        except Exception as e:
+            self.error = e
+
+
+def _exchange(question="What is bail?", **fields):
+    exchange = {'question': question, 'cached_answer': None, 'history': [], 'attachments': [],
+                'excerpts': [], 'statutes': []}
+    exchange.update(fields)
+    return exchange
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = QueuedModel()
+    group = SingleFlight()
+    monkeypatch.setattr(single_flight, 'generate_legal_response', model)
+    monkeypatch.setattr(single_flight, 'generate_legal_response_async', model.stream_async)
+    monkeypatch.setattr(single_flight, 'get_single_flight', lambda: group)
+    model.group = group
+    return model
+
+
+def test_only_stateless_questions_share_a_flight():
+    assert flight_key(_exchange("What is bail?")) == flight_key(_exchange("what is bail"))
+    assert flight_key(_exchange(history=['earlier turn'])) is None
+    assert flight_key(_exchange(attachments=['file'])) is None
+    assert flight_key(_exchange(cached_answer="cached")) is None
+    assert flight_key(_exchange(statutes=[{'act': 'CrPC', 'section': '436'}])) != flight_key(_exchange())
+
+
+def test_followers_share_the_leaders_model_call(model):
+    leader = Reader(_exchange())
+    _wait_for(lambda: model.calls == 1)
+    follower = Reader(_exchange())
+    _wait_for(lambda: model.group.stats()['followers'] == 1)
+    for item in ("Bail ", "is ", "release.", DONE):
+        model.items.put(item)
+    leader.join(5)
+    follower.join(5)
+
+    assert leader.chunks == follower.chunks == ["Bail ", "is ", "release."]
+    assert model.calls == 1
+    assert leader.usage == {'prompt_tokens': 10, 'completion_tokens': 3}
+    assert follower.usage == dict(leader.usage, coalesced=True)
+    assert model.group.stats() == {'in_flight': 0, 'leaders': 1, 'followers': 1}
+
+
+def test_late_joiner_gets_the_chunks_produced_before_it_joined(model):
+    leader = Reader(_exchange())
+    model.items.put("Bail ")
+    model.items.put("is ")
+    _wait_for(lambda: leader.chunks == ["Bail ", "is "])
+    follower = Reader(_exchange())
+    _wait_for(lambda: model.group.stats()['followers'] == 1)
+    model.items.put("release.")
+    model.items.put(DONE)
+    leader.join(5)
+    follower.join(5)
+    assert follower.chunks == ["Bail ", "is ", "release."]
+
+    # Once finished the flight is forgotten; the next question calls the model again
+    model.items.put(DONE)
+    Reader(_exchange()).join(5)
+    assert model.calls == 2
+
+
+def test_leader_failure_is_raised_to_its_followers(model):
+    leader = Reader(_exchange())
+    _wait_for(lambda: model.calls == 1)
+    follower = Reader(_exchange())
+    _wait_for(lambda: model.group.stats()['followers'] == 1)
+    model.items.put("Bail ")
+    model.items.put(GenerationError("model overloaded", retryable=True))
+    leader.join(5)
+    follower.join(5)
+
+    assert follower.chunks == ["Bail "]
+    assert isinstance(leader.error, GenerationError)
+    assert isinstance(follower.error, GenerationError)
+    assert str(follower.error) == "model overloaded" and follower.error.retryable
+    assert model.group.stats()['in_flight'] == 0
+
+
+def test_followers_are_served_after_the_leader_disconnects(model):
+    chunks = stream_answer(_exchange())
+    model.items.put("Bail ")
+    assert next(chunks) == "Bail "
+    follower = Reader(_exchange())
+    _wait_for(lambda: model.group.stats()['followers'] == 1)
+    # The leader's client goes away; the rest of the answer is drained for the follower
+    chunks.close()
+    model.items.put("is release.")
+    model.items.put(DONE)
+    follower.join(5)
+    assert follower.chunks == ["Bail ", "is release."] and follower.error is None
+
+
+def test_async_followers_share_the_answer_and_its_failure(model):
+    async def read(usage):
+        chunks = []
+        try:
+            async for chunk in stream_answer_async(_exchange(), usage=usage):
+                chunks.append(chunk)
+        except GenerationError as e:
+            return chunks, e
+        return chunks, None
+
+    async def main():
+        # Both join before the leader's model task first runs
+        leader = asyncio.ensure_future(read({}))
+        follower = asyncio.ensure_future(read({}))
+        return await leader, await follower
+
+    for item in ("Bail ", GenerationError("model overloaded")):
+        model.items.put(item)
+
+    (leader_chunks, leader_error), (follower_chunks, follower_error) = asyncio.run(main())
+    assert leader_chunks == follower_chunks == ["Bail "]
+    assert str(leader_error) == str(follower_error) == "model overloaded"
+    assert model.calls == 1
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+import pytest
+from src.services import sse_service
+from src.services.admission_service import get_admission_controller
+from src.services.firebase_services import get_firestore_client
+from src.services.sse_service import HEARTBEAT, find_stream, iter_sse, parse_last_event_id
+from src.services.stream_buffer import StreamBuffer, StreamRegistry
+
+SSE = {'Accept': 'text/event-stream'}
+
+
+@pytest.fixture(autouse=True)
+def db():
+    db = get_firestore_client()
+    db.reset()
+    yield db
+    db.reset()
+
+
+def _events(body):
+    """(id, event, data) of each event frame of an SSE body."""
+    events = []
+    for frame in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if 'event' in fields:
+            events.append((fields['id'], fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def _finished(stream_id, timeout=5):
+    buffer = find_stream(stream_id)
+    for _ in buffer.iter_events(timeout=timeout):
+        pass
+    return buffer
+
+
+@pytest.mark.parametrize('value, parsed', [
+    ('abc:3', ('abc', 3)), ('a:b:7', ('a:b', 7)), ('abc:-2', ('abc', 0)),
+    ('abc', (None, 0)), ('abc:x', (None, 0)), (None, (None, 0)),
+])
+def test_parse_last_event_id(value, parsed):
+    assert parse_last_event_id(value) == parsed
+
+
+def test_stream_resumes_after_the_last_event_id(client):
+    response = client.post('/ask', json={'question': 'What is bail?'}, headers=SSE)
+    stream_id = response.headers['X-Stream-Id']
+    events = _events(response.get_data(as_text=True))
+    assert events[-1][1] == 'done'
+    assert [event_id for event_id, _, _ in events] == [f"{stream_id}:{n}" for n in range(1, len(events) + 1)]
+
+    resumed = client.get(f'/ask/stream/{stream_id}', headers={'Last-Event-ID': f"{stream_id}:2"})
+    assert _events(resumed.get_data(as_text=True)) == events[2:]
+    resumed = client.get(f'/ask/stream/{stream_id}?last_event_id={stream_id}:3')
+    assert _events(resumed.get_data(as_text=True)) == events[3:]
+    # Resuming through /ask replays the buffer instead of asking again
+    again = client.post('/ask', json={'question': 'What is bail?'},
+                        headers=dict(SSE, **{'Last-Event-ID': f"{stream_id}:1"}))
+    assert again.headers['X-Stream-Id'] == stream_id
+    assert _events(again.get_data(as_text=True)) == events[1:]
+
+
+def test_resume_of_an_unknown_or_mismatched_stream_is_refused(client):
+    stream_id = client.post('/ask', json={'question': 'What is bail?'}, headers=SSE).headers['X-Stream-Id']
+    assert client.get('/ask/stream/missing').status_code == 404
+    mismatched = client.get(f'/ask/stream/{stream_id}', headers={'Last-Event-ID': 'other:1'})
+    assert mismatched.status_code == 400
+
+
+def test_producer_drains_and_releases_its_slot_after_a_disconnect(client):
+    response = client.post('/ask', json={'question': 'What is bail?', 'user_id': 'u1'}, headers=SSE,
+                           buffered=False)
+    frames = iter(response.response)
+    assert next(frames).startswith(b"retry:")
+    response.close()
+
+    buffer = _finished(response.headers['X-Stream-Id'])
+    events, finished = buffer.snapshot()
+    assert finished and events[-1][1] == 'done'
+    # The slot is released just after the buffer closes
+    gate = get_admission_controller().gate
+    deadline = time.monotonic() + 5
+    while gate.stats()['active'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gate.stats()['active'] == 0
+
+
+def test_heartbeat_is_sent_while_no_event_arrives(monkeypatch):
+    monkeypatch.setattr(sse_service, 'SSE_HEARTBEAT_INTERVAL', 0.01)
+    buffer = StreamBuffer('s1')
+    frames = iter_sse(buffer)
+    assert next(frames).startswith("retry:")
+    assert next(frames) == HEARTBEAT
+    buffer.append('delta', {'text': 'Hi'})
+    buffer.close()
+    assert list(frames) == ['id: s1:1\nevent: delta\ndata: {"text": "Hi"}\n\n']
+
+
+def test_async_reader_gets_heartbeats_then_the_live_tail():
+    buffer = StreamBuffer('s1')
+    buffer.append('delta', {'text': 'a'})
+
+    async def main():
+        items = []
+
+        async def produce():
+            await asyncio.sleep(0.05)
+            buffer.append('delta', {'text': 'b'})
+            buffer.close()
+
+        producer = asyncio.ensure_future(produce())
+        async for item in buffer.aiter_events(after=1, timeout=0.01):
+            items.append(item)
+        await producer
+        return items
+
+    items = asyncio.run(main())
+    assert items[0] is None
+    assert [item for item in items if item is not None] == [(2, 'delta', {'text': 'b'})]
+
+
+def test_registry_expires_finished_streams_and_bounds_their_number():
+    registry = StreamRegistry(ttl_seconds=60, max_streams=2)
+    live, finished = registry.create(), registry.create()
+    finished.close()
+    assert registry.get(finished.stream_id) is finished
+    finished.finished_at -= 61
+    assert registry.get(finished.stream_id) is None
+    # Live streams never expire, but the oldest go beyond max_streams
+    newer = [registry.create(), registry.create()]
+    assert registry.get(live.stream_id) is None
+    assert all(registry.get(buffer.stream_id) is buffer for buffer in newer)
+    assert len(registry) == 2
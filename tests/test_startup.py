@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from benchmarks.startup import DEFERRED_MODULES
+from src.services import warmup
+from src.utils.lazy_import import LazyModule, lazy_import, load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_lazy_module_imports_on_first_attribute_use():
+    module = LazyModule('colorsys')
+    sys.modules.pop('colorsys', None)
+    assert 'not loaded' in repr(module) and 'colorsys' not in sys.modules
+    assert module.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert 'colorsys' in sys.modules and 'not loaded' not in repr(module)
+    # Already imported modules are returned as they are
+    assert lazy_import('colorsys') is sys.modules['colorsys']
+    assert load(module) is sys.modules['colorsys'] and load(json) is json
+
+
+@pytest.mark.parametrize('mode, loaded', [('lazy', False), ('eager', True)])
+def test_import_main_defers_the_client_libraries(mode, loaded):
+    script = (
+        "import json, sys; import main; "
+        f"print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))"
+    )
+    env = dict(os.environ, STARTUP_MODE=mode)
+    output = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=ROOT, text=True)
+    deferred_loaded = json.loads(output.strip().splitlines()[-1])
+    assert bool(deferred_loaded) == loaded, deferred_loaded
+
+
+def test_warm_up_skips_a_failed_step(monkeypatch, caplog):
+    ran = []
+
+    def broken():
+        raise ConnectionError("metadata server unreachable")
+
+    monkeypatch.setattr(warmup, 'WARM_UP_STEPS', [('genai', broken), ('firestore', lambda: ran.append('firestore'))])
+    with caplog.at_level(logging.WARNING, logger=warmup.__name__):
+        warmup.start_warm_up('eager')
+    assert ran == ['firestore']
+    assert "Warm-up of genai failed" in caplog.text
+
+
+def test_background_warm_up_returns_before_the_steps_finish(monkeypatch):
+    release, done = threading.Event(), threading.Event()
+
+    def slow():
+        release.wait(5)
+        done.set()
+
+    monkeypatch.setattr(warmup, 'WARM_UP_STEPS', [('genai', slow)])
+    warmup.start_warm_up('background')
+    assert not done.is_set()
+    release.set()
+    assert done.wait(5)
+
+    warmup.start_warm_up('lazy')
+    with pytest.raises(ValueError):
+        warmup.start_warm_up('sometimes')
@@ -0,0 +1,15 @@
+from src.services.statute_index import StatuteIndex, answer_section_lookup, build_statute_index
+
+RECORDS = [
+    {'act': 'COI', 'act_name': 'Constitution of India', 'section': '21',
+     'title': 'Protection of life and personal liberty', 'text': 'No person shall be deprived of his life.'},
+    {'act': 'IPC', 'act_name': 'Indian Penal Code, 1860', 'section': '21',
+     'title': 'Public servant', 'text': 'The words public servant denote a person.'},
+]
+
+
+def test_constitution_provisions_are_labelled_articles(tmp_path):
+    build_statute_index(RECORDS, str(tmp_path))
+    index = StatuteIndex(str(tmp_path))
+    assert answer_section_lookup(index, "Article 21").startswith("Constitution of India, Article 21: ")
+    assert answer_section_lookup(index, "Section 21 IPC").startswith("Indian Penal Code, 1860, Section 21: ")
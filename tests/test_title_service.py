@@ -0,0 +1,72 @@
+import pytest
+from src.services import chat_writer, title_service
+from src.services.chat_writer import ChatWriter
+from src.services.firebase_services import get_firestore_client, get_chat_ref
+from src.services.title_service import TitleGenerator
+
+
+@pytest.fixture
+def db():
+    db = get_firestore_client()
+    db.reset()
+    yield db
+    db.reset()
+
+
+class CountingDatabase:
+    """Counts the batches committed through it."""
+
+    def __init__(self, db):
+        self._db = db
+        self.commits = 0
+
+    def batch(self):
+        batch = self._db.batch()
+        commit = batch.commit
+
+        def counted_commit():
+            self.commits += 1
+            return commit()
+        batch.commit = counted_commit
+        return batch
+
+
+def test_stub_titles_are_not_written_again(db):
+    counting = CountingDatabase(db)
+    generator = TitleGenerator(db_factory=lambda: counting, backend='stub')
+    generator.request('u1', 'c1', 'Is a verbal contract valid?', 'Usually, yes.')
+    generator.flush()
+    assert counting.commits == 0
+    assert generator.stats['generated'] == 0 and generator.stats['written'] == 0
+
+
+def test_only_changed_titles_are_written(db, monkeypatch):
+    monkeypatch.setattr(title_service, 'generate_chat_titles',
+                        lambda exchanges: ['Verbal contracts', 'What is a tort'])
+    counting = CountingDatabase(db)
+    generator = TitleGenerator(db_factory=lambda: counting, backend='genai')
+    generator.request('u1', 'c1', 'Is a verbal contract valid?', 'Usually, yes.')
+    generator.request('u1', 'c2', 'What is a tort?', 'A civil wrong.')
+    generator.flush()
+    assert counting.commits == 1
+    assert get_chat_ref('u1', 'c1').get().to_dict()['title'] == 'Verbal contracts'
+    assert not get_chat_ref('u1', 'c2').get().exists
+    assert generator.stats['generated'] == 2 and generator.stats['written'] == 1
+
+
+def test_shutdown_titles_chats_saved_by_the_final_flush(db, monkeypatch):
+    monkeypatch.setattr(title_service, 'generate_chat_titles', lambda exchanges: ['Verbal contracts'])
+    generator = TitleGenerator(db_factory=lambda: db, backend='genai', batch_interval=60)
+    generator.start()
+    writer = ChatWriter(db_factory=lambda: db, flush_interval=60)
+    writer.start()
+    monkeypatch.setattr(title_service, 'CHAT_TITLE_BACKEND', 'genai')
+    monkeypatch.setattr(title_service, '_generator', generator)
+    monkeypatch.setattr(chat_writer, '_writer', writer)
+
+    writer.enqueue('u1', 'c1', 'Is a verbal contract valid', 'Is a verbal contract valid?', 'Usually, yes.',
+                   is_new_chat=True)
+    # Exit hooks run last registered first, so the generator's own hook has already run
+    generator.stop()
+    chat_writer._shutdown()
+    assert get_chat_ref('u1', 'c1').get().to_dict()['title'] == 'Verbal contracts'
@@ -0,0 +1,73 @@
+import logging
+import threading
+import pytest
+from src.services import tracing
+from src.services.tracing import NOOP_SPAN, current_span, parse_traceparent, propagate, span, start_trace
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+@pytest.fixture
+def spans(monkeypatch, caplog):
+    """Turn tracing on and collect the fields of every finished span."""
+    monkeypatch.setattr(tracing, 'TRACING_ENABLED', True)
+    monkeypatch.setattr(tracing, 'TRACE_SAMPLE_RATE', 1.0)
+    caplog.set_level(logging.INFO, logger=tracing.__name__)
+    return lambda: [record.fields for record in caplog.records if record.name == tracing.__name__]
+
+
+@pytest.mark.parametrize('header, parsed', [
+    (f'00-{TRACE_ID}-{PARENT_ID}-01', (TRACE_ID, PARENT_ID, True)),
+    (f' 00-{TRACE_ID.upper()}-{PARENT_ID}-00 ', (TRACE_ID, PARENT_ID, False)),
+    (f'00-{"0" * 32}-{PARENT_ID}-01', None),
+    ('00-abc-def-01', None),
+    (None, None),
+])
+def test_parse_traceparent(header, parsed):
+    assert parse_traceparent(header) == parsed
+
+
+def test_spans_nest_under_the_request_and_continue_the_callers_trace(spans):
+    with start_trace('POST /ask', f'00-{TRACE_ID}-{PARENT_ID}-01') as root:
+        assert current_span() is root
+        with span('firestore.read', site='chat') as child:
+            assert current_span() is child
+        streamed = span('genai.generate', tier='fast')
+    streamed.finish(RuntimeError("stream broke off"))
+    assert current_span() is None
+
+    recorded = {fields['span']: fields for fields in spans()}
+    assert recorded['POST /ask']['trace_id'] == TRACE_ID
+    assert recorded['POST /ask']['parent_span_id'] == PARENT_ID
+    assert recorded['firestore.read']['parent_span_id'] == root.span_id
+    assert recorded['firestore.read']['attributes'] == {'site': 'chat'}
+    assert recorded['genai.generate']['parent_span_id'] == root.span_id
+    assert recorded['genai.generate']['error'] == "RuntimeError: stream broke off"
+
+
+def test_unsampled_and_disabled_traces_cost_nothing(spans, monkeypatch):
+    assert start_trace('GET /health', f'00-{TRACE_ID}-{PARENT_ID}-00') is NOOP_SPAN
+    monkeypatch.setattr(tracing, 'TRACE_SAMPLE_RATE', 0.0)
+    with start_trace('GET /health') as root:
+        assert root is NOOP_SPAN and span('child') is NOOP_SPAN
+    monkeypatch.setattr(tracing, 'TRACING_ENABLED', False)
+    assert start_trace('GET /health', f'00-{TRACE_ID}-{PARENT_ID}-01') is NOOP_SPAN
+    assert spans() == []
+
+
+def test_work_handed_to_another_thread_stays_in_the_trace(spans):
+    with start_trace('POST /ask') as root:
+        thread = threading.Thread(target=propagate(lambda: span('sse.produce').finish()))
+        thread.start()
+        thread.join()
+    recorded = {fields['span']: fields for fields in spans()}
+    assert recorded['sse.produce']['parent_span_id'] == root.span_id
+
+
+def test_flask_request_span_records_the_route_and_status(client, spans):
+    client.get('/chat_history', query_string={'user_id': 'u1', 'chat_id': 'missing'},
+               headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+    request_span = next(fields for fields in spans() if fields['span'] == 'GET /chat_history')
+    assert request_span['trace_id'] == TRACE_ID and request_span['parent_span_id'] == PARENT_ID
+    assert request_span['attributes']['status'] == 404
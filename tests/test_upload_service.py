@@ -0,0 +1,61 @@
+import io
+import os
+import time
+import pytest
+from src.routes import upload as upload_route
+from src.services import upload_service
+from src.services.admission_service import AdmissionRejected, get_admission_controller
+from src.services.upload_service import LocalUploadBackend
+
+PDF = b'%PDF-1.4\n' + b'0' * 100
+
+
+def _store(backend, size):
+    uri = backend.store(io.BytesIO(b'x' * size), 'application/pdf', size, None)
+    return os.path.join(backend.directory, uri.rsplit('/', 1)[-1])
+
+
+def test_local_backend_evicts_least_recently_used_beyond_max_bytes(tmp_path):
+    backend = LocalUploadBackend(str(tmp_path), max_bytes=250, max_age=3600)
+    first = _store(backend, 100)
+    second = _store(backend, 100)
+    os.utime(first, (time.time() - 20, time.time() - 20))
+    os.utime(second, (time.time() - 10, time.time() - 10))
+    # Reading the first upload makes the second the least recently used
+    backend.to_part('local://' + os.path.basename(first), 'application/pdf')
+    third = _store(backend, 100)
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
+
+
+def test_local_backend_evicts_expired_uploads(tmp_path):
+    backend = LocalUploadBackend(str(tmp_path), max_bytes=10 ** 6, max_age=60)
+    old = _store(backend, 10)
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    new = _store(backend, 10)
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+
+
+def test_missing_bucket_disables_uploads_without_stopping_the_app(monkeypatch):
+    monkeypatch.setattr(upload_service, 'UPLOAD_BACKEND', 'gcs')
+    monkeypatch.setattr(upload_service, 'UPLOAD_BUCKET', None)
+    from main import create_app
+    client = create_app().test_client()
+    response = client.post('/upload', data=PDF, content_type='application/pdf')
+    assert response.status_code == 503
+
+
+def test_upload_passes_admission_and_releases_its_slot(client):
+    response = client.post('/upload', data=PDF, content_type='application/pdf', headers={'X-Filename': 'a.pdf'})
+    assert response.status_code == 200
+    assert response.get_json()['file']['mime_type'] == 'application/pdf'
+    assert get_admission_controller().gate.stats()['active'] == 0
+
+
+def test_rejected_upload_answers_with_retry_after(client, monkeypatch):
+    def reject():
+        raise AdmissionRejected("Too many requests", 429, 3)
+    monkeypatch.setattr(upload_route, 'admit', reject)
+    response = client.post('/upload', data=PDF, content_type='application/pdf')
+    assert response.status_code == 429 and response.headers['Retry-After'] == '3'